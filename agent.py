@@ -12,13 +12,10 @@ from typing import Any, Awaitable, Coroutine, Dict
 from enum import Enum
 import models
 
-from python.helpers import extract_tools, files, errors, history, tokens, context as context_helper
-from python.helpers import dirty_json
+from python.helpers import extract_tools, files, errors, history, context as context_helper, context_window
+from python.helpers import dirty_json, prompt_cache
 from python.helpers.print_style import PrintStyle
 
-from langchain_core.prompts import (
-    ChatPromptTemplate,
-)
 from langchain_core.messages import SystemMessage, BaseMessage
 
 import python.helpers.log as Log
@@ -499,36 +496,42 @@ class Agent:
         system_text = "\n\n".join(loop_data.system)
 
         # join extras
-        extras = history.Message(
-            False,
-            content=self.read_prompt(
-                "agent.context.extras.md",
-                extras=dirty_json.stringify(
-                    {**loop_data.extras_persistent, **loop_data.extras_temporary}
-                ),
+        extras_text = self.read_prompt(
+            "agent.context.extras.md",
+            extras=dirty_json.stringify(
+                {**loop_data.extras_persistent, **loop_data.extras_temporary}
             ),
-        ).output()
+        )
         loop_data.extras_temporary.clear()
 
-        # convert history + extras to LLM format
-        history_langchain: list[BaseMessage] = history.output_langchain(
-            loop_data.history_output + extras
-        )
+        if prompt_cache.PROMPT_LAYOUT == "cache":
+            # stable system prompt, append-only history and volatile extras as the tail,
+            # so the prompt of the previous iteration stays a cacheable prefix
+            prompt_cache.track_prefix(self, system_text)
+            full_prompt: list[BaseMessage] = prompt_cache.append_tail(
+                [
+                    SystemMessage(content=system_text),
+                    *self.history.output_langchain(loop_data.history_output),
+                ],
+                extras_text,
+            )
+        else:
+            # convert history + extras to LLM format, reusing conversions of the unchanged prefix
+            extras = history.Message(False, content=extras_text).output()
+            history_langchain: list[BaseMessage] = self.history.output_langchain(
+                loop_data.history_output + extras
+            )
 
-        # build full prompt from system prompt, message history and extrS
-        full_prompt: list[BaseMessage] = [
-            SystemMessage(content=system_text),
-            *history_langchain,
-        ]
-        full_text = ChatPromptTemplate.from_messages(full_prompt).format()
+            # build full prompt from system prompt, message history and extrS
+            full_prompt = [
+                SystemMessage(content=system_text),
+                *history_langchain,
+            ]
 
-        # store as last context window content
+        # store as last context window content, the text is rendered when requested
         self.set_data(
             Agent.DATA_NAME_CTX_WINDOW,
-            {
-                "text": full_text,
-                "tokens": tokens.approximate_tokens(full_text),
-            },
+            context_window.get_tracker(self.context).snapshot(full_prompt, owner=self.number),
         )
 
         return full_prompt
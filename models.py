@@ -19,7 +19,7 @@ import litellm
 import openai
 
 from python.helpers import dotenv
-from python.helpers import settings, dirty_json
+from python.helpers import settings, dirty_json, prompt_cache
 from python.helpers.dotenv import load_dotenv
 from python.helpers.providers import get_provider_config
 from python.helpers.rate_limiter import RateLimiter
@@ -362,6 +362,12 @@ class LiteLLMChatWrapper(SimpleChatModel):
                 message_dict["tool_call_id"] = tool_call_id
 
             result.append(message_dict)
+
+        # cache breakpoints after the stable prefix, for providers needing explicit markers
+        if prompt_cache.supports_markers(self.provider, self.model_name):
+            result = prompt_cache.add_markers(messages, result)
+        else:
+            result = prompt_cache.merge_tails(messages, result)
         return result
 
     def _call(
@@ -488,6 +494,8 @@ class LiteLLMChatWrapper(SimpleChatModel):
         max_retries: int = int(call_kwargs.pop("a0_retry_attempts", 2))
         retry_delay_s: float = float(call_kwargs.pop("a0_retry_delay_seconds", 1.5))
         stream = reasoning_callback is not None or response_callback is not None or tokens_callback is not None
+        if stream and self.provider in prompt_cache.STREAM_USAGE_PROVIDERS:
+            call_kwargs.setdefault("stream_options", {"include_usage": True})
 
         # results
         result = ChatGenerationResult()
@@ -495,6 +503,7 @@ class LiteLLMChatWrapper(SimpleChatModel):
         attempt = 0
         while True:
             got_any_chunk = False
+            usage = None
             try:
                 # call model
                 _completion = await acompletion(
@@ -508,6 +517,7 @@ class LiteLLMChatWrapper(SimpleChatModel):
                     # iterate over chunks
                     async for chunk in _completion:  # type: ignore
                         got_any_chunk = True
+                        usage = prompt_cache.get_usage(chunk) or usage
                         # parse chunk
                         parsed = _parse_chunk(chunk)
                         output = result.add_chunk(parsed)
@@ -539,6 +549,7 @@ class LiteLLMChatWrapper(SimpleChatModel):
 
                 # non-stream response
                 else:
+                    usage = prompt_cache.get_usage(_completion)
                     parsed = _parse_chunk(_completion)
                     output = result.add_chunk(parsed)
                     if limiter:
@@ -548,6 +559,7 @@ class LiteLLMChatWrapper(SimpleChatModel):
                             limiter.add(output=approximate_tokens(output["reasoning_delta"]))
 
                 # Successful completion of stream
+                prompt_cache.track_usage(usage)
                 return result.response, result.reasoning
 
             except Exception as e:
@@ -799,6 +811,9 @@ def _get_litellm_embedding(
 
 
 def _parse_chunk(chunk: Any) -> ChatChunk:
+    # usage only chunk at the end of a stream
+    if not chunk["choices"]:
+        return ChatChunk(reasoning_delta="", response_delta="")
     delta = chunk["choices"][0].get("delta", {})
     message = chunk["choices"][0].get("message", {}) or chunk["choices"][0].get(
         "model_extra", {}
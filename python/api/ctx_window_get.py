@@ -1,4 +1,5 @@
 from python.helpers.api import ApiHandler, Input, Output, Request
+from python.helpers.context_window import ContextWindow
 
 
 
@@ -8,6 +9,12 @@ class GetCtxWindow(ApiHandler):
         context = self.use_context(ctxid)
         agent = context.streaming_agent or context.agent0
         window = agent.get_data(agent.DATA_NAME_CTX_WINDOW)
+
+        # rendered on demand
+        if isinstance(window, ContextWindow):
+            return {"content": window.text, "tokens": window.tokens}
+
+        # windows stored as text by earlier versions
         if not window or not isinstance(window, dict):
             return {"content": "", "tokens": 0}
 
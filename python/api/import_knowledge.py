@@ -36,8 +36,8 @@ class ImportKnowledge(ApiHandler):
                 file.save(os.path.join(KNOWLEDGE_FOLDER, filename))
                 saved_filenames.append(filename)
 
-        #reload memory to re-import knowledge
-        await memory.Memory.reload(context.agent0)
+        #reload memory to re-import knowledge, a running knowledge watcher picks up the new files
+        await memory.Memory.reload(context.agent0, rescan=False)
         context.log.set_initial_progress()
 
         return {
@@ -147,10 +147,13 @@ class MemoryDashboard(ApiHandler):
             search_query = input.get("search", "")  # Full-text search query
             limit = input.get("limit", 100)  # Number of results to return
             threshold = input.get("threshold", 0.6)  # Similarity threshold
+            knowledge_source = input.get("knowledge_source")  # True, False or None for both
+            cursor = input.get("cursor", "")  # Continue after the page returned with this cursor
 
             memory = await Memory.get_by_subdir(memory_subdir, preload_knowledge=False)
 
             memories = []
+            next_cursor = ""
 
             if search_query:
                 docs = await memory.search_similarity_threshold(
@@ -160,46 +163,50 @@ class MemoryDashboard(ApiHandler):
                     filter=f"area == '{area_filter}'" if area_filter else "",
                 )
                 memories = docs
+                if knowledge_source is not None:
+                    memories = [
+                        m for m in memories
+                        if bool(m.metadata.get("knowledge_source")) == knowledge_source
+                    ]
+                total_memories = len(memories)
+                knowledge_count = sum(1 for m in memories if m.metadata.get("knowledge_source"))
+                conversation_count = total_memories - knowledge_count
             else:
-                # If no search query, get all memories from specified area(s)
-                all_docs = memory.db.get_all_docs()
-                for doc_id, doc in all_docs.items():
-                    # Apply area filter if specified
-                    if area_filter and doc.metadata.get("area", "") != area_filter:
-                        continue
-                    memories.append(doc)
-
-                # sort by timestamp
-                def get_sort_key(m):
-                    timestamp = m.metadata.get("timestamp", "0000-00-00 00:00:00")
-                    return timestamp
-
-                memories.sort(key=get_sort_key, reverse=True)
+                # newest memories from the area, paged through the docstore index
+                memories, next_cursor = memory.browse_documents(
+                    limit=limit,
+                    area=area_filter,
+                    knowledge_source=knowledge_source,
+                    cursor=cursor,
+                )
 
-                # Apply limit AFTER sorting to get the newest entries
-                if limit and len(memories) > limit:
-                    memories = memories[:limit]
+                # counts of the whole filtered set, not only of this page
+                counts = memory.get_document_counts()
+                knowledge_count = sum(
+                    count for (area, knowledge), count in counts.items()
+                    if knowledge and (not area_filter or area == area_filter)
+                )
+                conversation_count = sum(
+                    count for (area, knowledge), count in counts.items()
+                    if not knowledge and (not area_filter or area == area_filter)
+                )
+                if knowledge_source is True:
+                    conversation_count = 0
+                elif knowledge_source is False:
+                    knowledge_count = 0
+                total_memories = knowledge_count + conversation_count
 
             # Format memories for the dashboard
             formatted_memories = [self._format_memory_for_dashboard(m) for m in memories]
 
-            # Get summary statistics
-            total_memories = len(formatted_memories)
-            knowledge_count = sum(
-                1 for m in formatted_memories if m["knowledge_source"]
-            )
-            conversation_count = total_memories - knowledge_count
-
-            # Get total count of all memories in database (unfiltered)
-            total_db_count = len(memory.db.get_all_docs())
-
             return {
                 "success": True,
                 "memories": formatted_memories,
                 "total_count": total_memories,
-                "total_db_count": total_db_count,
+                "total_db_count": memory.count_documents(),
                 "knowledge_count": knowledge_count,
                 "conversation_count": conversation_count,
+                "next_cursor": next_cursor,
                 "search_query": search_query,
                 "area_filter": area_filter,
                 "memory_subdir": memory_subdir,
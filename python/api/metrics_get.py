@@ -0,0 +1,13 @@
+from python.helpers.api import ApiHandler, Request, Response
+from python.helpers import metrics
+
+
+class GetMetrics(ApiHandler):
+
+    @classmethod
+    def get_methods(cls) -> list[str]:
+        return ["GET", "POST"]
+
+    async def process(self, input: dict, request: Request) -> dict | Response:
+        prefix = input.get("prefix", "")
+        return {"metrics": metrics.collect(prefix)}
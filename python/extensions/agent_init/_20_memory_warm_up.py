@@ -0,0 +1,13 @@
+from python.helpers.extension import Extension
+from python.helpers.memory import Memory
+from python.helpers.print_style import PrintStyle
+
+
+class MemoryWarmUp(Extension):
+
+    async def execute(self, **kwargs):
+        # load memory and knowledge in the background, so the first message does not wait for it
+        try:
+            Memory.warm_up(self.agent)
+        except Exception as e:
+            PrintStyle.error(f"Failed to start memory initialization: {e}")
@@ -7,6 +7,7 @@ from python.helpers import dirty_json, errors, settings, log
 
 DATA_NAME_TASK = "_recall_memories_task"
 DATA_NAME_ITER = "_recall_memories_iter"
+INIT_TIMEOUT = 5  # seconds to wait for memory still initializing before skipping recall
 
 
 class RecallMemories(Extension):
@@ -110,28 +111,39 @@ class RecallMemories(Extension):
             )
             return
 
-        # get memory database
-        db = await Memory.get(self.agent)
-
-        # search for general memories and fragments
-        memories = await db.search_similarity_threshold(
-            query=query,
-            limit=set["memory_recall_memories_max_search"],
-            threshold=set["memory_recall_similarity_threshold"],
-            filter=f"area == '{Memory.Area.MAIN.value}' or area == '{Memory.Area.FRAGMENTS.value}'",  # exclude solutions
-        )
-
-        # search for solutions
-        solutions = await db.search_similarity_threshold(
-            query=query,
-            limit=set["memory_recall_solutions_max_search"],
+        # get memory database, do not stall the turn while it is still initializing
+        db = await Memory.get_ready(self.agent, timeout=INIT_TIMEOUT)
+        if not db:
+            log_item.update(
+                heading="Memory is still loading, recall skipped",
+                warming=True,
+            )
+            return
+        warming = Memory.is_warming(db.memory_subdir)
+        if warming:
+            # knowledge is still being imported, results may be incomplete
+            log_item.update(warming=True)
+
+        # search for general memories and fragments, and for solutions, in one batch
+        memories_scored, solutions_scored = await db.search_similarity_multi(
+            queries=[query, query],
+            limit=[
+                set["memory_recall_memories_max_search"],
+                set["memory_recall_solutions_max_search"],
+            ],
             threshold=set["memory_recall_similarity_threshold"],
-            filter=f"area == '{Memory.Area.SOLUTIONS.value}'",  # exclude solutions
+            filters=[
+                f"area == '{Memory.Area.MAIN.value}' or area == '{Memory.Area.FRAGMENTS.value}'",  # exclude solutions
+                f"area == '{Memory.Area.SOLUTIONS.value}'",
+            ],
         )
+        memories = [doc for doc, _score in memories_scored]
+        solutions = [doc for doc, _score in solutions_scored]
 
         if not memories and not solutions:
             log_item.update(
-                heading="No memories or solutions found",
+                heading="No memories or solutions found"
+                + (" (memory still loading)" if warming else ""),
             )
             return
 
@@ -190,7 +202,8 @@ class RecallMemories(Extension):
 
         # log the search result
         log_item.update(
-            heading=f"{len(memories)} memories and {len(solutions)} relevant solutions found",
+            heading=f"{len(memories)} memories and {len(solutions)} relevant solutions found"
+            + (" (memory still loading)" if warming else ""),
         )
 
         memories_txt = "\n\n".join([mem.page_content for mem in memories]) if memories else ""
@@ -6,7 +6,5 @@ from python.helpers import memory
 class MemoryInit(Extension):
 
     async def execute(self, loop_data: LoopData = LoopData(), **kwargs):
-        db = await memory.Memory.get(self.agent)
-        
-
-   
\ No newline at end of file
+        # make sure initialization runs (e.g. after a project switch), without waiting for it
+        memory.Memory.warm_up(self.agent)
@@ -3,7 +3,7 @@ from python.helpers.extension import Extension
 from python.helpers.mcp_handler import MCPConfig
 from agent import Agent, LoopData
 from python.helpers.settings import get_settings
-from python.helpers import projects
+from python.helpers import files, projects, prompt_sections
 
 
 class SystemPrompt(Extension):
@@ -15,11 +15,32 @@ class SystemPrompt(Extension):
         **kwargs: Any
     ):
         # append main system prompt and tools
-        main = get_main_prompt(self.agent)
-        tools = get_tools_prompt(self.agent)
-        mcp_tools = get_mcp_tools_prompt(self.agent)
-        secrets_prompt = get_secrets_prompt(self.agent)
-        project_prompt = get_project_prompt(self.agent)
+        # sections are rendered again only when their inputs change
+        agent = self.agent
+        prompt_files = prompt_sections.prompt_files_state(agent)
+        main = prompt_sections.get_section(
+            "main", prompt_files, lambda: get_main_prompt(agent)
+        )
+        tools = prompt_sections.get_section(
+            "tools",
+            (prompt_files, agent.config.chat_model.vision),
+            lambda: get_tools_prompt(agent),
+        )
+        mcp_tools = prompt_sections.get_section(
+            "mcp_tools",
+            get_mcp_tools_state(),
+            lambda: get_mcp_tools_prompt(agent),
+        )
+        secrets_prompt = prompt_sections.get_section(
+            "secrets",
+            (prompt_files, get_secrets_state(agent)),
+            lambda: get_secrets_prompt(agent),
+        )
+        project_prompt = prompt_sections.get_section(
+            "project",
+            (prompt_files, get_project_state(agent)),
+            lambda: get_project_prompt(agent),
+        )
 
         system_prompt.append(main)
         system_prompt.append(tools)
@@ -55,6 +76,12 @@ def get_mcp_tools_prompt(agent: Agent):
     return ""
 
 
+def get_mcp_tools_state():
+    # waits for a pending update of the servers, like the tools prompt does
+    MCPConfig.wait_for_lock()
+    return MCPConfig.get_instance().get_tools_version()
+
+
 def get_secrets_prompt(agent: Agent):
     try:
         # Use lazy import to avoid circular dependencies
@@ -69,6 +96,31 @@ def get_secrets_prompt(agent: Agent):
         return ""
 
 
+def get_secrets_state(agent: Agent):
+    try:
+        from python.helpers.secrets import get_secrets_manager
+
+        secrets_manager = get_secrets_manager(agent.context)
+        secrets_files = [files.get_abs_path(f) for f in secrets_manager.get_files()]
+        return (prompt_sections.paths_state(*secrets_files), get_settings()["variables"])
+    except Exception:
+        # secrets prompt is empty in this case, nothing to track
+        return None
+
+
+def get_project_state(agent: Agent):
+    project_name = agent.context.get_data(projects.CONTEXT_DATA_KEY_PROJECT)
+    if not project_name:
+        return None
+    return (
+        project_name,
+        prompt_sections.paths_state(
+            projects.get_project_meta_folder(project_name, projects.PROJECT_HEADER_FILE),
+            projects.get_project_meta_folder(project_name, projects.PROJECT_INSTRUCTIONS_DIR),
+        ),
+    )
+
+
 def get_project_prompt(agent: Agent):
     result = agent.read_prompt("agent.system.projects.main.md")
     project_name = agent.context.get_data(projects.CONTEXT_DATA_KEY_PROJECT)
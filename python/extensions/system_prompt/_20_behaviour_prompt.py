@@ -1,12 +1,20 @@
 from python.helpers.extension import Extension
 from agent import Agent, LoopData
-from python.helpers import files, memory
+from python.helpers import files, memory, prompt_sections
 
 
 class BehaviourPrompt(Extension):
 
     async def execute(self, system_prompt: list[str]=[], loop_data: LoopData = LoopData(), **kwargs):
-        prompt = read_rules(self.agent)
+        agent = self.agent
+        prompt = prompt_sections.get_section(
+            "behaviour",
+            (
+                prompt_sections.prompt_files_state(agent),
+                prompt_sections.paths_state(get_custom_rules_file(agent)),
+            ),
+            lambda: read_rules(agent),
+        )
         system_prompt.insert(0, prompt) #.append(prompt)
 
 def get_custom_rules_file(agent: Agent):
@@ -0,0 +1,93 @@
+import itertools
+import threading
+from collections import OrderedDict
+from typing import Any
+
+from langchain_core.messages import BaseMessage, get_buffer_string
+
+from python.helpers import tokens
+
+RENDERED_SNAPSHOTS = 4  # rendered texts kept per context
+
+# data key of the tracker in the agent context, not persisted
+DATA_NAME_TRACKER = "_ctx_window_tracker"
+
+
+class ContextWindow:
+    """
+    Prompt of the last agent iteration, kept as references to its messages.
+
+    The text is rendered only when requested, the token count is the sum of the
+    counts of the individual messages.
+    """
+
+    def __init__(self, tracker: "ContextWindowTracker", messages: list[BaseMessage], tokens: int):
+        self.id = next(_ids)
+        self.tracker = tracker
+        self.messages = messages
+        self.tokens = tokens
+
+    @property
+    def text(self) -> str:
+        return self.tracker.render(self)
+
+
+class ContextWindowTracker:
+    """
+    Snapshots of the prompts of one context, token counts of unchanged messages are reused.
+
+    Counts are kept per owner, the agents of a context take turns in prompting.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tokens: dict[Any, dict[Any, tuple[BaseMessage, int]]] = {}
+        self._rendered: OrderedDict[int, str] = OrderedDict()
+
+    def snapshot(self, messages: list[BaseMessage], owner: Any = None) -> ContextWindow:
+        with self._lock:
+            previous = self._tokens.get(owner, {})
+            counts: dict[Any, tuple[BaseMessage, int]] = {}
+            total = 0
+            for message in messages:
+                key = _message_key(message)
+                entry = counts.get(key) or previous.get(key)
+                if entry is None:
+                    entry = (message, tokens.approximate_tokens(get_buffer_string([message])))
+                counts[key] = entry
+                total += entry[1]
+            # only counts of the latest prompt are kept
+            self._tokens[owner] = counts
+        return ContextWindow(self, list(messages), total)
+
+    def render(self, window: ContextWindow) -> str:
+        with self._lock:
+            text = self._rendered.get(window.id)
+            if text is not None:
+                self._rendered.move_to_end(window.id)
+                return text
+        # same text as ChatPromptTemplate.from_messages(messages).format()
+        text = get_buffer_string(window.messages)
+        with self._lock:
+            self._rendered[window.id] = text
+            while len(self._rendered) > RENDERED_SNAPSHOTS:
+                self._rendered.popitem(last=False)
+        return text
+
+
+def get_tracker(context) -> ContextWindowTracker:
+    tracker = context.get_data(DATA_NAME_TRACKER)
+    if tracker is None:
+        tracker = ContextWindowTracker()
+        context.set_data(DATA_NAME_TRACKER, tracker)
+    return tracker
+
+
+_ids = itertools.count()
+
+
+def _message_key(message: BaseMessage):
+    # text messages are matched by content, the system prompt is rebuilt every iteration
+    if isinstance(message.content, str):
+        return (message.type, message.content)
+    return id(message)
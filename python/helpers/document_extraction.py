@@ -0,0 +1,234 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Awaitable, Callable
+
+from python.helpers import metrics
+from python.helpers.print_style import PrintStyle
+
+# extraction defaults
+EXTRACTION_WORKERS = min(4, os.cpu_count() or 1)  # extraction processes, 0 extracts in threads
+PAGES_PER_TASK = 4  # pages extracted together by one worker
+OCR_MIN_TEXT = 16  # pages with images and less text than this are OCR'd
+OCR_DPI = 300
+CHECK_INTERVAL = 0.5  # seconds between cancellation checks while waiting for pages
+RECENT_PAGES = 100  # per page timings kept for metrics
+
+
+@dataclass
+class ExtractedPage:
+    number: int  # zero based
+    pages: int  # total pages of the document
+    text: str
+    seconds: float
+    ocr: bool = False
+
+
+_executors: dict[int, Executor] = {}
+_executors_lock = threading.Lock()
+
+_stats_lock = threading.Lock()
+_stats: dict[str, Any] = {
+    "documents": 0,
+    "pages": 0,
+    "ocr_pages": 0,
+    "cancelled": 0,
+    "page_seconds": 0.0,
+    "max_page_seconds": 0.0,
+    "recent_pages": [],
+}
+
+
+def get_executor(workers: int = -1) -> Executor:
+    """Shared process pool of the given size, a thread pool for 0 workers."""
+    workers = EXTRACTION_WORKERS if workers < 0 else workers
+    with _executors_lock:
+        if workers not in _executors:
+            if workers <= 0:
+                _executors[workers] = ThreadPoolExecutor(thread_name_prefix="DocumentExtraction")
+            else:
+                # spawn, the agent process runs many threads which does not mix well with fork
+                _executors[workers] = ProcessPoolExecutor(
+                    max_workers=workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+        return _executors[workers]
+
+
+def _discard_executor(workers: int, executor: Executor):
+    """Drop a pool broken by a crashed worker, the next call creates a new one."""
+    workers = EXTRACTION_WORKERS if workers < 0 else workers
+    with _executors_lock:
+        if _executors.get(workers) is executor:
+            del _executors[workers]
+    executor.shutdown(wait=False)
+    PrintStyle.error("Document extraction worker crashed, starting a new pool")
+
+
+def _submit(workers: int, function: Callable[..., Any], *args) -> tuple[Executor, Future]:
+    executor = get_executor(workers)
+    try:
+        return executor, executor.submit(function, *args)
+    except BrokenProcessPool:
+        # broken by a worker crash seen by an earlier call
+        _discard_executor(workers, executor)
+        executor = get_executor(workers)
+        return executor, executor.submit(function, *args)
+
+
+async def run(
+    function: Callable[..., Any],
+    *args,
+    workers: int = -1,
+    check: Callable[[], Awaitable[Any]] | None = None,
+):
+    """Run a blocking extraction function off the event loop, cancelled when check raises."""
+    executor, future = _submit(workers, function, *args)
+    try:
+        return await _wait(future, check)
+    except BrokenProcessPool:
+        # the worker died, e.g. killed for running out of memory by OCR
+        _discard_executor(workers, executor)
+        raise
+    finally:
+        if not future.done():
+            future.cancel()
+            _count("cancelled", 1)
+
+
+async def extract_pdf(
+    path: str,
+    workers: int = -1,
+    check: Callable[[], Awaitable[Any]] | None = None,
+) -> AsyncIterator[ExtractedPage]:
+    """
+    Extract the text of a PDF page by page, pages are processed in parallel and yielded in order.
+
+    Text comes from the text layer and tables of each page, pages without one are OCR'd.
+    Pending pages are cancelled when check raises or the iteration is closed early,
+    use contextlib.aclosing to close it deterministically.
+    """
+    executor, future = _submit(workers, pdf_page_count, path)
+    futures: list[Future] = []
+    try:
+        count = await _wait(future, check)
+        futures = [
+            executor.submit(extract_pdf_pages, path, start, min(start + PAGES_PER_TASK, count))
+            for start in range(0, count, PAGES_PER_TASK)
+        ]
+        _count("documents", 1)
+        for future in futures:
+            for page in await _wait(future, check):
+                _track(page)
+                yield page
+    except BrokenProcessPool:
+        _discard_executor(workers, executor)
+        raise
+    finally:
+        cancelled = sum(1 for future in futures if future.cancel())
+        if cancelled:
+            _count("cancelled", 1)
+            PrintStyle.debug(f"Cancelled extraction of {cancelled * PAGES_PER_TASK} pages of {path}")
+
+
+def pdf_page_count(path: str) -> int:
+    import fitz
+
+    with fitz.open(path) as document:
+        return document.page_count
+
+
+def extract_pdf_pages(path: str, start: int, end: int) -> list[ExtractedPage]:
+    """Text of pages start to end, runs in an extraction worker."""
+    import fitz
+
+    result: list[ExtractedPage] = []
+    with fitz.open(path) as document:
+        for number in range(start, end):
+            t = time.perf_counter()
+            page = document[number]
+            text = page.get_text().strip()
+            ocr = len(text) < OCR_MIN_TEXT and bool(page.get_images())
+            if ocr:
+                text = ocr_page(page)
+            else:
+                tables = [table.to_markdown() for table in page.find_tables().tables]
+                text = "\n".join([text, *tables]).strip()
+            result.append(
+                ExtractedPage(number, document.page_count, text, time.perf_counter() - t, ocr)
+            )
+    return result
+
+
+def ocr_page(page) -> str:
+    import pytesseract
+    from PIL import Image
+
+    pixmap = page.get_pixmap(dpi=OCR_DPI)
+    image = Image.frombytes("RGB", (pixmap.width, pixmap.height), pixmap.samples)
+    return pytesseract.image_to_string(image).strip()
+
+
+def ocr_pdf(path: str) -> str:
+    """OCR of all pages rendered by poppler, for files PyMuPDF can not open."""
+    import pdf2image
+    import pytesseract
+
+    return "\n\n".join(
+        pytesseract.image_to_string(page) for page in pdf2image.convert_from_path(path)
+    )
+
+
+def extract_unstructured(path: str) -> str:
+    """Text of any document Unstructured can partition, runs in an extraction worker."""
+    from langchain_unstructured import UnstructuredLoader
+
+    loader = UnstructuredLoader(
+        file_path=path,
+        mode="single",
+        partition_via_api=False,
+        strategy="hi_res",
+    )
+    return "\n".join([element.page_content for element in loader.load()])
+
+
+def get_stats() -> dict[str, Any]:
+    with _stats_lock:
+        stats = dict(_stats)
+        stats["recent_pages"] = list(_stats["recent_pages"])
+    stats["avg_page_seconds"] = stats["page_seconds"] / stats["pages"] if stats["pages"] else 0
+    stats["workers"] = EXTRACTION_WORKERS
+    return stats
+
+
+async def _wait(future: Future, check: Callable[[], Awaitable[Any]] | None):
+    waiter = asyncio.wrap_future(future)
+    while not waiter.done():
+        await asyncio.wait([waiter], timeout=CHECK_INTERVAL)
+        if check and not waiter.done():
+            await check()
+    return waiter.result()
+
+
+def _count(key: str, value: int):
+    with _stats_lock:
+        _stats[key] += value
+
+
+def _track(page: ExtractedPage):
+    with _stats_lock:
+        _stats["pages"] += 1
+        _stats["ocr_pages"] += int(page.ocr)
+        _stats["page_seconds"] += page.seconds
+        _stats["max_page_seconds"] = max(_stats["max_page_seconds"], page.seconds)
+        recent = _stats["recent_pages"]
+        recent.append({"page": page.number, "seconds": round(page.seconds, 4), "ocr": page.ocr})
+        del recent[:-RECENT_PAGES]
+
+
+metrics.register("document_extraction", get_stats)
@@ -0,0 +1,408 @@
+import asyncio
+import codecs
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import IO, Any, Awaitable, Callable, Iterator, Protocol
+
+import aiohttp
+from bs4 import BeautifulSoup
+from bs4.builder._htmlparser import BeautifulSoupHTMLParser
+from markdownify import MarkdownConverter
+
+from python.helpers import files, metrics
+from python.helpers.print_style import PrintStyle
+
+# fetch defaults
+MAX_DOCUMENT_BYTES = 50 * 1024 * 1024
+SPOOL_BYTES = 4 * 1024 * 1024  # larger bodies are spooled to disk
+CHUNK_SIZE = 64 * 1024
+CONNECTIONS = 32
+CONNECTIONS_PER_HOST = 8
+TIMEOUT = aiohttp.ClientTimeout(total=120, sock_connect=10, sock_read=30)
+RETRIES = 3
+RETRY_DELAY = 1.0
+USER_AGENT = "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0 Safari/537.36"
+# bodies with validators are kept for conditional requests
+CACHE_DIR = "tmp/document_query/downloads"
+CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+
+class Parser(Protocol):
+    def feed(self, data: bytes) -> None: ...
+
+    def close(self) -> str: ...
+
+
+@dataclass
+class RemoteDocument:
+    url: str
+    content_type: str  # without parameters
+    charset: str | None
+    size: int
+    body: IO[bytes]
+    text: str | None = None  # parsed while downloading, if a parser was given
+    not_modified: bool = False  # served from the download cache after a 304
+
+    def read(self) -> bytes:
+        self.body.seek(0)
+        return self.body.read()
+
+    def save(self, path: str):
+        self.body.seek(0)
+        with open(path, "wb") as file:
+            shutil.copyfileobj(self.body, file)
+
+    def close(self):
+        self.body.close()
+
+
+class TextParser:
+    """Incremental decoding of text bodies."""
+
+    def __init__(self, charset: str | None = None):
+        self._decoder = codecs.getincrementaldecoder(_codec(charset))(errors="replace")
+        self._parts: list[str] = []
+
+    def feed(self, data: bytes):
+        self._parts.append(self._decoder.decode(data))
+
+    def close(self) -> str:
+        self._parts.append(self._decoder.decode(b"", final=True))
+        return "".join(self._parts)
+
+
+class HtmlParser:
+    """
+    Incremental HTML to markdown conversion.
+
+    The BeautifulSoup tree is built while chunks arrive and converted by markdownify
+    once complete, with the same output as markdownify of the whole page.
+    """
+
+    def __init__(self, charset: str | None = None):
+        self._decoder = codecs.getincrementaldecoder(_codec(charset))(errors="replace")
+        self._soup = BeautifulSoup("", "html.parser")
+        args, kwargs = self._soup.builder.parser_args  # type: ignore
+        self._parser = BeautifulSoupHTMLParser(self._soup, *args, **kwargs)
+
+    def feed(self, data: bytes):
+        self._parser.feed(self._decoder.decode(data))
+
+    def close(self) -> str:
+        self._parser.feed(self._decoder.decode(b"", final=True))
+        self._parser.close()
+        self._soup.endData()
+        while self._soup.currentTag and self._soup.currentTag.name != self._soup.ROOT_TAG_NAME:
+            self._soup.popTag()
+        return html_to_markdown(self._soup)
+
+
+def html_to_markdown(html: "str | BeautifulSoup") -> str:
+    soup = html if isinstance(html, BeautifulSoup) else BeautifulSoup(html, "html.parser")
+    markdown = MarkdownConverter(heading_style="ATX", autolinks=True).convert_soup(soup)
+    return re.sub(r"\n\s*\n", "\n\n", markdown.replace("\xa0", " ").strip())
+
+
+def get_parser(content_type: str, charset: str | None = None) -> Parser | None:
+    """Incremental parser producing the text of a document type, None for binary documents."""
+    if content_type == "text/html":
+        return HtmlParser(charset)
+    if content_type.startswith("text/") or content_type == "application/json":
+        return TextParser(charset)
+    return None
+
+
+_sessions: dict[asyncio.AbstractEventLoop, aiohttp.ClientSession] = {}
+_sessions_lock = threading.Lock()
+
+_stats_lock = threading.Lock()
+_stats: dict[str, int] = {
+    "requests": 0,
+    "not_modified": 0,
+    "retries": 0,
+    "bytes": 0,
+    "spooled": 0,
+    "rejected": 0,
+    "cache_errors": 0,
+}
+
+
+def get_session() -> aiohttp.ClientSession:
+    """Pooled session of the running event loop, each agent context runs its own loop."""
+    loop = asyncio.get_running_loop()
+    with _sessions_lock:
+        for closed in [loop for loop in _sessions if loop.is_closed()]:
+            del _sessions[closed]
+        session = _sessions.get(loop)
+        if session is None or session.closed:
+            session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=CONNECTIONS, limit_per_host=CONNECTIONS_PER_HOST, ttl_dns_cache=300
+                ),
+                timeout=TIMEOUT,
+            )
+            _sessions[loop] = session
+        return session
+
+
+async def close_session():
+    with _sessions_lock:
+        session = _sessions.pop(asyncio.get_running_loop(), None)
+    if session:
+        await session.close()
+
+
+async def fetch(
+    url: str,
+    parser: Callable[[str, str | None], Parser | None] | None = None,
+    max_bytes: int = MAX_DOCUMENT_BYTES,
+    check: Callable[[], Awaitable[Any]] | None = None,
+) -> RemoteDocument:
+    """
+    Download a document with a streaming GET request.
+
+    parser is called with the content type and charset once headers arrive, the parser
+    it returns is fed the body chunk by chunk while it downloads. Bodies larger than
+    SPOOL_BYTES are spooled to disk, bodies larger than max_bytes are rejected.
+    Documents with an ETag or Last-Modified header are cached and revalidated with
+    conditional requests. check is awaited between chunks, to interrupt the download.
+    """
+    entry = _cache_entry(url)
+    for attempt in range(RETRIES):
+        try:
+            return await _fetch(url, entry, parser, max_bytes, check)
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError, _ServerError) as e:
+            if attempt == RETRIES - 1:
+                raise ValueError(f"Document fetch error: {url} ({e})") from e
+            _count("retries")
+            await asyncio.sleep(RETRY_DELAY)
+    raise AssertionError("unreachable")
+
+
+def get_stats() -> dict[str, int]:
+    with _stats_lock:
+        return dict(_stats)
+
+
+class _ServerError(Exception):
+    pass
+
+
+async def _fetch(
+    url: str,
+    entry: dict[str, Any] | None,
+    parser_factory: Callable[[str, str | None], Parser | None] | None,
+    max_bytes: int,
+    check: Callable[[], Awaitable[Any]] | None,
+) -> RemoteDocument:
+    headers = {"User-Agent": USER_AGENT}
+    if entry and entry.get("etag"):
+        headers["If-None-Match"] = entry["etag"]
+    if entry and entry.get("last_modified"):
+        headers["If-Modified-Since"] = entry["last_modified"]
+
+    _count("requests")
+    async with get_session().get(url, headers=headers, allow_redirects=True) as response:
+        if response.status != 304 or not entry:
+            return await _download(url, response, parser_factory, max_bytes, check)
+        try:
+            document = await _from_cache(url, entry, parser_factory, check)
+            _count("not_modified")
+            return document
+        except FileNotFoundError:
+            pass  # removed by a concurrent prune since the entry was read
+    # the cached body is gone, download it again
+    return await _fetch(url, None, parser_factory, max_bytes, check)
+
+
+async def _download(
+    url: str,
+    response: aiohttp.ClientResponse,
+    parser_factory: Callable[[str, str | None], Parser | None] | None,
+    max_bytes: int,
+    check: Callable[[], Awaitable[Any]] | None,
+) -> RemoteDocument:
+    if response.status >= 500:
+        raise _ServerError(f"HTTP {response.status}")
+    if response.status >= 400:
+        raise ValueError(f"Document fetch error: {url} (HTTP {response.status})")
+    if response.content_length and response.content_length > max_bytes:
+        _count("rejected")
+        raise ValueError(_too_large(url, response.content_length, max_bytes))
+
+    content_type = response.content_type or "application/octet-stream"
+    charset = response.charset
+    parser = parser_factory(content_type, charset) if parser_factory else None
+    body = tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES)
+    size = 0
+    try:
+        async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+            size += len(chunk)
+            if size > max_bytes:
+                _count("rejected")
+                raise ValueError(_too_large(url, size, max_bytes))
+            body.write(chunk)
+            if parser:
+                parser.feed(chunk)
+            if check:
+                await check()
+    except BaseException:
+        body.close()
+        raise
+    _count("bytes", size)
+    if getattr(body, "_rolled", False):
+        _count("spooled")
+
+    document = RemoteDocument(
+        url=url,
+        content_type=content_type,
+        charset=charset,
+        size=size,
+        body=body,
+        text=parser.close() if parser else None,
+    )
+    etag, last_modified = response.headers.get("ETag"), response.headers.get("Last-Modified")
+    if etag or last_modified:
+        await asyncio.to_thread(_cache_store, url, document, etag, last_modified)
+    return document
+
+
+async def _from_cache(
+    url: str,
+    entry: dict[str, Any],
+    parser_factory: Callable[[str, str | None], Parser | None] | None,
+    check: Callable[[], Awaitable[Any]] | None,
+) -> RemoteDocument:
+    body = open(_cache_path(url, ".body"), "rb")
+    try:
+        parser = parser_factory(entry["content_type"], entry["charset"]) if parser_factory else None
+        if parser:
+            while chunk := body.read(CHUNK_SIZE):
+                parser.feed(chunk)
+                if check:
+                    await check()
+    except BaseException:
+        body.close()
+        raise
+    try:
+        os.utime(_cache_path(url, ".json"))  # recently used
+    except OSError:
+        pass
+    return RemoteDocument(
+        url=url,
+        content_type=entry["content_type"],
+        charset=entry["charset"],
+        size=entry["size"],
+        body=body,
+        text=parser.close() if parser else None,
+        not_modified=True,
+    )
+
+
+def _cache_path(url: str, suffix: str) -> str:
+    name = hashlib.sha256(url.encode()).hexdigest()
+    return files.get_abs_path(CACHE_DIR, name + suffix)
+
+
+def _cache_entry(url: str) -> dict[str, Any] | None:
+    try:
+        with open(_cache_path(url, ".json")) as file:
+            entry = json.load(file)
+        if entry.get("url") == url and os.path.exists(_cache_path(url, ".body")):
+            return entry
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def _cache_store(url: str, document: RemoteDocument, etag: str | None, last_modified: str | None):
+    # the download cache is an optimization, failing to store an entry does not fail the fetch
+    if document.size > CACHE_MAX_BYTES:
+        return
+    try:
+        body_path = _cache_path(url, ".body")
+        os.makedirs(os.path.dirname(body_path), exist_ok=True)
+        # body first and both atomically, a reader never sees an entry without its body
+        with _atomic_file(body_path) as file:
+            document.body.seek(0)
+            shutil.copyfileobj(document.body, file)
+        entry = {
+            "url": url,
+            "etag": etag,
+            "last_modified": last_modified,
+            "content_type": document.content_type,
+            "charset": document.charset,
+            "size": document.size,
+        }
+        with _atomic_file(_cache_path(url, ".json")) as file:
+            file.write(json.dumps(entry).encode())
+        _cache_prune()
+    except OSError as e:
+        _count("cache_errors")
+        PrintStyle.error(f"Document cache store failed for {url}: {e}")
+
+
+@contextmanager
+def _atomic_file(path: str) -> Iterator[IO[bytes]]:
+    # a temporary file of its own per writer, concurrent stores of one url do not collide
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as file:
+            yield file
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+def _cache_prune():
+    # least recently used entries beyond the cache size are removed
+    folder = files.get_abs_path(CACHE_DIR)
+    entries = []
+    for name in os.listdir(folder):
+        if name.endswith(".json"):
+            meta = os.path.join(folder, name)
+            body = meta.removesuffix(".json") + ".body"
+            try:
+                entries.append((os.path.getmtime(meta), os.path.getsize(body), meta, body))
+            except OSError:
+                continue
+    total = sum(size for _, size, _, _ in entries)
+    for _, size, meta, body in sorted(entries):
+        if total <= CACHE_MAX_BYTES:
+            break
+        for path in (meta, body):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        total -= size
+
+
+def _codec(charset: str | None) -> str:
+    try:
+        return codecs.lookup(charset or "utf-8").name
+    except LookupError:
+        return "utf-8"
+
+
+def _too_large(url: str, size: int, max_bytes: int) -> str:
+    return f"Document content length exceeds max. {max_bytes / 1024 / 1024:.0f}MB: {size / 1024 / 1024:.1f} MB ({url})"
+
+
+def _count(key: str, value: int = 1):
+    with _stats_lock:
+        _stats[key] += value
+
+
+metrics.register("document_fetch", get_stats)
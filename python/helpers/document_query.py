@@ -1,29 +1,24 @@
 import mimetypes
 import os
 import asyncio
-import aiohttp
 import json
+import tempfile
 
 from python.helpers.vector_db import VectorDB
 
 os.environ["USER_AGENT"] = "@mixedbread-ai/unstructured"  # noqa E402
-from langchain_unstructured import UnstructuredLoader  # noqa E402
 
+from contextlib import aclosing
 from urllib.parse import urlparse
 from typing import Callable, Sequence, List, Optional, Tuple
 from datetime import datetime
 
-from langchain_community.document_loaders import AsyncHtmlLoader
-from langchain_community.document_loaders.pdf import PyMuPDFLoader
-from langchain_community.document_transformers import MarkdownifyTransformer
-from langchain_community.document_loaders.parsers.images import TesseractBlobParser
-
 from langchain_core.documents import Document
 from langchain_core.messages import SystemMessage, HumanMessage
 
 from python.helpers.print_style import PrintStyle
-from python.helpers import files, errors
-from agent import Agent
+from python.helpers import files, errors, document_extraction, document_fetch
+from agent import Agent, InterventionException
 
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 
@@ -60,7 +55,8 @@ class DocumentQueryStore:
     ):
         """Initialize a DocumentQueryStore instance."""
         self.agent = agent
-        self.vector_db: VectorDB | None = None
+        # one index per document, shared with other stores holding the same content
+        self.documents: dict[str, VectorDB] = {}
 
     @staticmethod
     def normalize_uri(uri: str) -> str:
@@ -96,6 +92,15 @@ class DocumentQueryStore:
     def init_vector_db(self):
         return VectorDB(self.agent, cache=True)
 
+    def _document_key(self, text: str, document_uri: str, metadata: dict) -> str:
+        return VectorDB.document_key(
+            self.agent,
+            document_uri,
+            json.dumps(metadata, sort_keys=True, default=str),
+            f"{self.DEFAULT_CHUNK_SIZE}:{self.DEFAULT_CHUNK_OVERLAP}",
+            text,
+        )
+
     async def add_document(
         self, text: str, document_uri: str, metadata: dict | None = None
     ) -> tuple[bool, list[str]]:
@@ -116,6 +121,13 @@ class DocumentQueryStore:
         # Delete existing document if it exists to avoid duplicates
         await self.delete_document(document_uri)
 
+        # the same content may already be indexed for another context
+        key = self._document_key(text, document_uri, metadata or {})
+        shared = VectorDB.get_shared(key)
+        if shared:
+            self.documents[document_uri] = shared
+            return True, list(shared.db.index_to_docstore_id.values())
+
         # Initialize metadata
         doc_metadata = metadata or {}
         doc_metadata["document_uri"] = document_uri
@@ -140,15 +152,14 @@ class DocumentQueryStore:
             return False, []
 
         try:
-            # Initialize vector db if not already initialized
-            if not self.vector_db:
-                self.vector_db = self.init_vector_db()
-
-            ids = await self.vector_db.insert_documents(docs)
+            vector_db = self.init_vector_db()
+            await vector_db.insert_documents(docs)
+            vector_db = VectorDB.share(key, vector_db)
+            self.documents[document_uri] = vector_db
             PrintStyle.standard(
                 f"Added document '{document_uri}' with {len(docs)} chunks"
             )
-            return True, ids
+            return True, list(vector_db.db.index_to_docstore_id.values())
         except Exception as e:
             err_text = errors.format_error(e)
             PrintStyle.error(f"Error adding document '{document_uri}': {err_text}")
@@ -165,10 +176,6 @@ class DocumentQueryStore:
             The complete document if found, None otherwise
         """
 
-        # DB not initialized, no documents inside
-        if not self.vector_db:
-            return None
-
         # Normalize the URI
         document_uri = self.normalize_uri(document_uri)
 
@@ -200,18 +207,13 @@ class DocumentQueryStore:
             List of document chunks
         """
 
-        # DB not initialized, no documents inside
-        if not self.vector_db:
-            return []
-
         # Normalize the URI
         document_uri = self.normalize_uri(document_uri)
 
-        # get docs from vector db
-
-        chunks = await self.vector_db.search_by_metadata(
-            filter=f"document_uri == '{document_uri}'",
-        )
+        vector_db = self.documents.get(document_uri)
+        if not vector_db:
+            return []
+        chunks = list(vector_db.db.get_all_docs().values())
 
         PrintStyle.standard(f"Found {len(chunks)} chunks for document: {document_uri}")
         return chunks
@@ -227,15 +229,9 @@ class DocumentQueryStore:
             True if the document exists, False otherwise
         """
 
-        # DB not initialized, no documents inside
-        if not self.vector_db:
-            return False
-
         # Normalize the URI
         document_uri = self.normalize_uri(document_uri)
-
-        chunks = await self._get_document_chunks(document_uri)
-        return len(chunks) > 0
+        return document_uri in self.documents
 
     async def delete_document(self, document_uri: str) -> bool:
         """
@@ -247,32 +243,17 @@ class DocumentQueryStore:
         Returns:
             True if deleted, False if not found
         """
-
-        # DB not initialized, no documents inside
-        if not self.vector_db:
-            return False
-
         # Normalize the URI
         document_uri = self.normalize_uri(document_uri)
 
-        chunks = await self.vector_db.search_by_metadata(
-            filter=f"document_uri == '{document_uri}'",
-        )
-        if not chunks:
+        # the index itself may still serve other contexts
+        vector_db = self.documents.pop(document_uri, None)
+        if not vector_db:
             return False
-
-        # Collect IDs to delete
-        ids_to_delete = [chunk.metadata["id"] for chunk in chunks]
-
-        # Delete from vector store
-        if ids_to_delete:
-            dels = await self.vector_db.delete_documents_by_ids(ids_to_delete)
-            PrintStyle.standard(
-                f"Deleted document '{document_uri}' with {len(dels)} chunks"
-            )
-            return True
-
-        return False
+        PrintStyle.standard(
+            f"Deleted document '{document_uri}' with {len(vector_db.db.index_to_docstore_id)} chunks"
+        )
+        return True
 
     async def search_documents(
         self, query: str, limit: int = 10, threshold: float = 0.5, filter: str = ""
@@ -289,26 +270,82 @@ class DocumentQueryStore:
             List of matching documents
         """
 
-        # DB not initialized, no documents inside
-        if not self.vector_db:
+        # No documents inside
+        if not self.documents:
             return []
 
         # Handle empty query
         if not query:
             return []
 
-        # Perform search
+        # Perform search, the query is embedded once for all document indexes
         try:
-            results = await self.vector_db.search_by_similarity_threshold(
-                query=query, limit=limit, threshold=threshold, filter=filter
-            )
-
+            vector_dbs = list({id(db): db for db in self.documents.values()}.values())
+            embedding = await vector_dbs[0].embeddings.aembed_query(query)
+            scored = [
+                result
+                for vector_db in vector_dbs
+                for result in vector_db.search_by_vector(embedding, limit, threshold, filter)
+            ]
+            results = [doc for doc, _score in sorted(scored, key=self._rank)[:limit]]
             PrintStyle.standard(f"Search '{query}' returned {len(results)} results")
             return results
         except Exception as e:
             PrintStyle.error(f"Error searching documents: {str(e)}")
             return []
 
+    async def search_documents_multi(
+        self,
+        queries: Sequence[str],
+        document_uris: Sequence[str],
+        limit: int = 10,
+        threshold: float = 0.5,
+    ) -> List[List[Document]]:
+        """
+        Search several queries in the given documents at once.
+
+        All queries are embedded in one batch and every document index is searched
+        once with all of them.
+
+        Args:
+            queries: The search query strings
+            document_uris: URIs of the documents to search in
+            limit: Maximum number of results per query
+            threshold: Minimum similarity score threshold (0-1)
+
+        Returns:
+            List of matching documents for each query, best first
+        """
+        results: List[List[Document]] = [[] for _ in queries]
+        uris = [self.normalize_uri(uri) for uri in document_uris]
+        vector_dbs = list(
+            {id(db): db for uri in uris if (db := self.documents.get(uri))}.values()
+        )
+        if not vector_dbs or not queries:
+            return results
+
+        try:
+            embeddings = await vector_dbs[0].embed_queries(queries)
+            scored: List[List[tuple[Document, float]]] = [[] for _ in queries]
+            for vector_db in vector_dbs:
+                for found, matches in zip(
+                    scored, vector_db.search_by_vectors(embeddings, limit, threshold)
+                ):
+                    found.extend(matches)
+            for query, found, result in zip(queries, scored, results):
+                result.extend(doc for doc, _score in sorted(found, key=self._rank)[:limit])
+                PrintStyle.standard(f"Search '{query}' returned {len(result)} results")
+            return results
+        except Exception as e:
+            PrintStyle.error(f"Error searching documents: {str(e)}")
+            return results
+
+    @staticmethod
+    def _rank(result: tuple[Document, float]):
+        # ties are broken by position in the document, so results do not depend on index order
+        doc, score = result
+        return -score, doc.metadata.get("document_uri", ""), doc.metadata.get("chunk_index", 0)
+
     async def search_document(
         self, document_uri: str, query: str, limit: int = 10, threshold: float = 0.5
     ) -> List[Document]:
@@ -335,19 +372,7 @@ class DocumentQueryStore:
         Returns:
             List of document URIs
         """
-        # DB not initialized, no documents inside
-        if not self.vector_db:
-            return []
-
-        # Extract unique URIs
-        uris = set()
-        for doc in self.vector_db.db.get_all_docs().values():
-            if isinstance(doc.metadata, dict):
-                uri = doc.metadata.get("document_uri")
-                if uri:
-                    uris.add(uri)
-
-        return sorted(list(uris))
+        return sorted(self.documents)
 
 
 class DocumentQueryHelper:
@@ -372,40 +397,30 @@ class DocumentQueryHelper:
             *[self.document_get_content(uri, True) for uri in document_uris]
         )
         await self.agent.handle_intervention()
-        selected_chunks = {}
-        for question in questions:
-            self.progress_callback(f"Optimizing query: {question}")
-            await self.agent.handle_intervention()
-            human_content = f'Search Query: "{question}"'
-            system_content = self.agent.parse_prompt(
-                "fw.document_query.optmimize_query.md"
-            )
-
-            optimized_query = (
-                await self.agent.call_utility_model(
-                    system=system_content, message=human_content
-                )
-            ).strip()
-
-            await self.agent.handle_intervention()
-            self.progress_callback(f"Searching documents with query: {optimized_query}")
-
-            normalized_uris = [self.store.normalize_uri(uri) for uri in document_uris]
-            doc_filter = " or ".join(
-                [f"document_uri == '{uri}'" for uri in normalized_uris]
-            )
 
-            chunks = await self.store.search_documents(
-                query=optimized_query,
-                limit=100,
-                threshold=DEFAULT_SEARCH_THRESHOLD,
-                filter=doc_filter,
-            )
+        # optimize all queries concurrently, then search them in one batch
+        unique_questions = list(dict.fromkeys(questions))
+        optimized_queries = await asyncio.gather(
+            *[self.optimize_query(question) for question in unique_questions]
+        )
+        await self.agent.handle_intervention()
 
-            self.progress_callback(f"Found {len(chunks)} chunks")
+        queries = list(dict.fromkeys(query for query in optimized_queries if query))
+        self.progress_callback(
+            f"Searching documents with queries: {json.dumps(queries)}"
+        )
+        results = await self.store.search_documents_multi(
+            queries=queries,
+            document_uris=document_uris,
+            limit=100,
+            threshold=DEFAULT_SEARCH_THRESHOLD,
+        )
 
+        selected_chunks = {}
+        for chunks in results:
             for chunk in chunks:
                 selected_chunks[chunk.metadata["id"]] = chunk
+        self.progress_callback(f"Found {len(selected_chunks)} chunks")
 
         if not selected_chunks:
             self.progress_callback("No relevant content found in the documents")
@@ -438,6 +453,16 @@ class DocumentQueryHelper:
 
         return True, str(ai_response)
 
+    async def optimize_query(self, question: str) -> str:
+        self.progress_callback(f"Optimizing query: {question}")
+        human_content = f'Search Query: "{question}"'
+        system_content = self.agent.parse_prompt("fw.document_query.optmimize_query.md")
+        return (
+            await self.agent.call_utility_model(
+                system=system_content, message=human_content
+            )
+        ).strip()
+
     async def document_get_content(
         self, document_uri: str, add_to_db: bool = False
     ) -> str:
@@ -448,45 +473,6 @@ class DocumentQueryHelper:
         mimetype, encoding = mimetypes.guess_type(document_uri)
         mimetype = mimetype or "application/octet-stream"
 
-        if mimetype == "application/octet-stream":
-            if url.scheme in ["http", "https"]:
-                response: aiohttp.ClientResponse | None = None
-                retries = 0
-                last_error = ""
-                while not response and retries < 3:
-                    try:
-                        async with aiohttp.ClientSession() as session:
-                            response = await session.head(
-                                document_uri,
-                                timeout=aiohttp.ClientTimeout(total=2.0),
-                                allow_redirects=True,
-                            )
-                            if response.status > 399:
-                                raise Exception(response.status)
-                            break
-                    except Exception as e:
-                        await asyncio.sleep(1)
-                        last_error = str(e)
-                    retries += 1
-                    await self.agent.handle_intervention()
-
-                if not response:
-                    raise ValueError(
-                        f"DocumentQueryHelper::document_get_content: Document fetch error: {document_uri} ({last_error})"
-                    )
-
-                mimetype = response.headers["content-type"]
-                if "content-length" in response.headers:
-                    content_length = (
-                        float(response.headers["content-length"]) / 1024 / 1024
-                    )  # MB
-                    if content_length > 50.0:
-                        raise ValueError(
-                            f"Document content length exceeds max. 50MB: {content_length} MB ({document_uri})"
-                        )
-                if mimetype and "; charset=" in mimetype:
-                    mimetype = mimetype.split("; charset=")[0]
-
         if scheme == "file":
             try:
                 document_uri = files.fix_dev_path(url.path)
@@ -498,200 +484,161 @@ class DocumentQueryHelper:
                 f"Compressed documents are unsupported '{encoding}' ({document_uri})"
             )
 
-        if mimetype == "application/octet-stream":
-            raise ValueError(
-                f"Unsupported document mimetype '{mimetype}' ({document_uri})"
-            )
-
         # Use the store's normalization method
         document_uri_norm = self.store.normalize_uri(document_uri)
 
         await self.agent.handle_intervention()
-        exists = await self.store.document_exists(document_uri_norm)
-        document_content = ""
-        if not exists:
+        if await self.store.document_exists(document_uri_norm):
+            doc = await self.store.get_document(document_uri_norm)
+            if doc:
+                return doc.page_content
+            raise ValueError(
+                f"DocumentQueryHelper::document_get_content: Document not found: {document_uri_norm}"
+            )
+
+        remote: document_fetch.RemoteDocument | None = None
+        if scheme in ["http", "https"]:
+            # one streaming request, text documents are parsed while they download
+            known_type = mimetype if mimetype != "application/octet-stream" else None
+            remote = await document_fetch.fetch(
+                document_uri,
+                parser=lambda content_type, charset: document_fetch.get_parser(
+                    known_type or content_type, charset
+                ),
+                check=self.agent.handle_intervention,
+            )
+            mimetype = known_type or remote.content_type
+        elif scheme != "file":
+            raise ValueError(f"Unsupported scheme: {scheme}")
+
+        try:
+            if mimetype == "application/octet-stream":
+                raise ValueError(
+                    f"Unsupported document mimetype '{mimetype}' ({document_uri})"
+                )
+
             await self.agent.handle_intervention()
             if mimetype.startswith("image/"):
-                document_content = self.handle_image_document(document_uri, scheme)
+                document_content = await self.handle_image_document(document_uri, remote)
             elif mimetype == "text/html":
-                document_content = self.handle_html_document(document_uri, scheme)
+                document_content = self.handle_html_document(document_uri, remote)
             elif mimetype.startswith("text/") or mimetype == "application/json":
-                document_content = self.handle_text_document(document_uri, scheme)
+                document_content = self.handle_text_document(document_uri, remote)
             elif mimetype == "application/pdf":
-                document_content = self.handle_pdf_document(document_uri, scheme)
+                document_content = await self.handle_pdf_document(document_uri, remote)
             else:
-                document_content = self.handle_unstructured_document(
-                    document_uri, scheme
+                document_content = await self.handle_unstructured_document(
+                    document_uri, remote
                 )
-            if add_to_db:
-                self.progress_callback("Indexing document")
-                await self.agent.handle_intervention()
-                success, ids = await self.store.add_document(
-                    document_content, document_uri_norm
-                )
-                if not success:
-                    self.progress_callback("Failed to index document")
-                    raise ValueError(
-                        f"DocumentQueryHelper::document_get_content: Failed to index document: {document_uri_norm}"
-                    )
-                self.progress_callback(f"Indexed {len(ids)} chunks")
-        else:
+        finally:
+            if remote:
+                remote.close()
+
+        if add_to_db:
+            self.progress_callback("Indexing document")
             await self.agent.handle_intervention()
-            doc = await self.store.get_document(document_uri_norm)
-            if doc:
-                document_content = doc.page_content
-            else:
+            success, ids = await self.store.add_document(
+                document_content, document_uri_norm
+            )
+            if not success:
+                self.progress_callback("Failed to index document")
                 raise ValueError(
-                    f"DocumentQueryHelper::document_get_content: Document not found: {document_uri_norm}"
+                    f"DocumentQueryHelper::document_get_content: Failed to index document: {document_uri_norm}"
                 )
+            self.progress_callback(f"Indexed {len(ids)} chunks")
         return document_content
 
-    def handle_image_document(self, document: str, scheme: str) -> str:
-        return self.handle_unstructured_document(document, scheme)
-
-    def handle_html_document(self, document: str, scheme: str) -> str:
-        if scheme in ["http", "https"]:
-            loader = AsyncHtmlLoader(web_path=document)
-            parts: list[Document] = loader.load()
-        elif scheme == "file":
-            # Use RFC file operations instead of TextLoader
-            file_content_bytes = files.read_file_bin(document)
-            file_content = file_content_bytes.decode("utf-8")
-            # Create Document manually since we're not using TextLoader
-            parts = [Document(page_content=file_content, metadata={"source": document})]
-        else:
-            raise ValueError(f"Unsupported scheme: {scheme}")
-
-        return "\n".join(
-            [
-                element.page_content
-                for element in MarkdownifyTransformer().transform_documents(parts)
-            ]
-        )
-
-    def handle_text_document(self, document: str, scheme: str) -> str:
-        if scheme in ["http", "https"]:
-            loader = AsyncHtmlLoader(web_path=document)
-            elements: list[Document] = loader.load()
-        elif scheme == "file":
-            # Use RFC file operations instead of TextLoader
-            file_content_bytes = files.read_file_bin(document)
-            file_content = file_content_bytes.decode("utf-8")
-            # Create Document manually since we're not using TextLoader
-            elements = [
-                Document(page_content=file_content, metadata={"source": document})
-            ]
-        else:
-            raise ValueError(f"Unsupported scheme: {scheme}")
-
-        return "\n".join([element.page_content for element in elements])
-
-    def handle_pdf_document(self, document: str, scheme: str) -> str:
-        temp_file_path = ""
-        if scheme == "file":
-            # Use RFC file operations to read the PDF file as binary
-            file_content_bytes = files.read_file_bin(document)
-            # Create a temporary file for PyMuPDFLoader since it needs a file path
-            import tempfile
-
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as temp_file:
-                temp_file.write(file_content_bytes)
-                temp_file_path = temp_file.name
-        elif scheme in ["http", "https"]:
-            # download the file from the web url to a temporary file using python libraries for downloading
-            import requests
-            import tempfile
-
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as temp_file:
-                response = requests.get(document, timeout=10.0)
-                if response.status_code != 200:
-                    raise ValueError(
-                        f"DocumentQueryHelper::handle_pdf_document: Failed to download PDF from {document}: {response.status_code}"
-                    )
-                temp_file.write(response.content)
-                temp_file_path = temp_file.name
-        else:
-            raise ValueError(f"Unsupported scheme: {scheme}")
+    async def handle_image_document(
+        self, document: str, remote: document_fetch.RemoteDocument | None = None
+    ) -> str:
+        return await self.handle_unstructured_document(document, remote)
 
-        if not os.path.exists(temp_file_path):
-            raise ValueError(
-                f"DocumentQueryHelper::handle_pdf_document: Temporary file not found: {temp_file_path}"
-            )
+    def handle_html_document(
+        self, document: str, remote: document_fetch.RemoteDocument | None = None
+    ) -> str:
+        if remote:
+            return remote.text or ""
+        # Use RFC file operations
+        file_content_bytes = files.read_file_bin(document)
+        return document_fetch.html_to_markdown(file_content_bytes.decode("utf-8"))
+
+    def handle_text_document(
+        self, document: str, remote: document_fetch.RemoteDocument | None = None
+    ) -> str:
+        if remote:
+            return remote.text or ""
+        # Use RFC file operations
+        file_content_bytes = files.read_file_bin(document)
+        return file_content_bytes.decode("utf-8")
+
+    async def handle_pdf_document(
+        self, document: str, remote: document_fetch.RemoteDocument | None = None
+    ) -> str:
+        # PyMuPDF needs a file path
+        temp_file_path = await self._save_temp_file(document, remote, ".pdf")
 
+        # pages are extracted in worker processes and arrive in order
         try:
+            pages: list[str] = []
             try:
-                loader = PyMuPDFLoader(
-                    temp_file_path,
-                    mode="single",
-                    extract_tables="markdown",
-                    extract_images=True,
-                    images_inner_format="text",
-                    images_parser=TesseractBlobParser(),
-                    pages_delimiter="\n",
-                )
-                elements: list[Document] = loader.load()
-                contents = "\n".join([element.page_content for element in elements])
+                async with aclosing(
+                    document_extraction.extract_pdf(
+                        temp_file_path, check=self.agent.handle_intervention
+                    )
+                ) as extracted:
+                    async for page in extracted:
+                        pages.append(page.text)
+                        self.progress_callback(
+                            f"Extracted page {page.number + 1}/{page.pages}"
+                            + (" (OCR)" if page.ocr else "")
+                        )
+                return "\n".join(pages)
+            except InterventionException:
+                raise
             except Exception as e:
                 PrintStyle.error(
                     f"DocumentQueryHelper::handle_pdf_document: Error loading with PyMuPDF: {e}"
                 )
-                contents = ""
-
-            if not contents:
-                import pdf2image
-                import pytesseract
-
-                PrintStyle.debug(
-                    f"DocumentQueryHelper::handle_pdf_document: FALLBACK Converting PDF to images: {temp_file_path}"
-                )
-
-                # Convert PDF to images
-                pages = pdf2image.convert_from_path(temp_file_path)
-                for page in pages:
-                    contents += pytesseract.image_to_string(page) + "\n\n"
 
-            return contents
+            PrintStyle.debug(
+                f"DocumentQueryHelper::handle_pdf_document: FALLBACK Converting PDF to images: {temp_file_path}"
+            )
+            return await document_extraction.run(
+                document_extraction.ocr_pdf,
+                temp_file_path,
+                check=self.agent.handle_intervention,
+            )
         finally:
             os.unlink(temp_file_path)
 
-    def handle_unstructured_document(self, document: str, scheme: str) -> str:
-        elements: list[Document] = []
-        if scheme in ["http", "https"]:
-            # loader = UnstructuredURLLoader(urls=[document], mode="single")
-            loader = UnstructuredLoader(
-                web_url=document,
-                mode="single",
-                partition_via_api=False,
-                # chunking_strategy="by_page",
-                strategy="hi_res",
+    async def handle_unstructured_document(
+        self, document: str, remote: document_fetch.RemoteDocument | None = None
+    ) -> str:
+        # UnstructuredLoader needs a file path, with the extension for proper processing
+        _, ext = os.path.splitext(urlparse(document).path)
+        if remote and not ext:
+            ext = mimetypes.guess_extension(remote.content_type) or ""
+        temp_file_path = await self._save_temp_file(document, remote, ext)
+        try:
+            return await document_extraction.run(
+                document_extraction.extract_unstructured,
+                temp_file_path,
+                check=self.agent.handle_intervention,
             )
-            elements = loader.load()
-        elif scheme == "file":
+        finally:
+            # Clean up temporary file
+            os.unlink(temp_file_path)
+
+    async def _save_temp_file(
+        self, document: str, remote: document_fetch.RemoteDocument | None, suffix: str
+    ) -> str:
+        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as temp_file:
+            temp_file_path = temp_file.name
+        if remote:
+            await asyncio.to_thread(remote.save, temp_file_path)
+        else:
             # Use RFC file operations to read the file as binary
             file_content_bytes = files.read_file_bin(document)
-            # Create a temporary file for UnstructuredLoader since it needs a file path
-            import tempfile
-            import os
-
-            # Get file extension to preserve it for proper processing
-            _, ext = os.path.splitext(document)
-            with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as temp_file:
+            with open(temp_file_path, "wb") as temp_file:
                 temp_file.write(file_content_bytes)
-                temp_file_path = temp_file.name
-
-            try:
-                loader = UnstructuredLoader(
-                    file_path=temp_file_path,
-                    mode="single",
-                    partition_via_api=False,
-                    # chunking_strategy="by_page",
-                    strategy="hi_res",
-                )
-                elements = loader.load()
-            finally:
-                # Clean up temporary file
-                os.unlink(temp_file_path)
-        else:
-            raise ValueError(f"Unsupported scheme: {scheme}")
-
-        return "\n".join([element.page_content for element in elements])
+        return temp_file_path
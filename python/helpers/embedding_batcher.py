@@ -0,0 +1,206 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Any
+
+from langchain_core.embeddings import Embeddings
+
+from python.helpers import metrics
+
+MAX_BATCH_SIZE = 64
+MAX_WAIT = 0.01  # seconds to wait for more requests before dispatching a batch
+
+
+class _Request:
+    def __init__(self, texts: list[str]):
+        self.texts = texts
+        self.results: list[list[float] | None] = [None] * len(texts)
+        self.next = 0  # index of the next text to dispatch
+        self.done = 0
+        self.future: Future[list[list[float]]] = Future()
+        self.created = time.perf_counter()
+
+
+class EmbeddingBatcher:
+    """
+    Coalesces concurrent embedding requests for one model into batched calls.
+
+    Every model has its own queue served by a worker thread, so requests coming from
+    different event loops (each agent context runs its own) can be batched together.
+    Batches are filled round-robin across pending requests, so a large document import
+    does not hold back short queries of other contexts.
+    """
+
+    _instances: dict[str, "EmbeddingBatcher"] = {}
+    _lock = threading.Lock()
+
+    @staticmethod
+    def get(key: str, model: Embeddings) -> "EmbeddingBatcher":
+        with EmbeddingBatcher._lock:
+            if key not in EmbeddingBatcher._instances:
+                EmbeddingBatcher._instances[key] = EmbeddingBatcher(key, model)
+            else:
+                # always serve with the most recently configured model instance
+                EmbeddingBatcher._instances[key].model = model
+            return EmbeddingBatcher._instances[key]
+
+    def __init__(
+        self,
+        key: str,
+        model: Embeddings,
+        max_batch_size: int = MAX_BATCH_SIZE,
+        max_wait: float = MAX_WAIT,
+    ):
+        self.key = key
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._pending: deque[_Request] = deque()
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(
+            target=self._run, daemon=True, name=f"EmbeddingBatcher-{key}"
+        )
+        self._thread.start()
+
+        self.batches = 0
+        self.texts = 0
+        self.requests = 0
+        self.max_batch = 0
+        self.queue_latency_total = 0.0
+        self.queue_latency_max = 0.0
+        metrics.register(f"embedding_batcher/{key}", self.get_stats)
+
+    def submit(self, texts: list[str]) -> Future[list[list[float]]]:
+        request = _Request(list(texts))
+        if not request.texts:
+            request.future.set_result([])
+            return request.future
+        with self._cond:
+            self._pending.append(request)
+            self.requests += 1
+            self._cond.notify()
+        return request.future
+
+    def get_stats(self) -> dict[str, Any]:
+        with self._cond:
+            queued = self._queued()
+            return {
+                "requests": self.requests,
+                "batches": self.batches,
+                "texts": self.texts,
+                "queued_texts": queued,
+                "avg_batch_size": self.texts / self.batches if self.batches else 0,
+                "max_batch_size": self.max_batch,
+                "avg_queue_latency_ms": (
+                    self.queue_latency_total / self.batches * 1000 if self.batches else 0
+                ),
+                "max_queue_latency_ms": self.queue_latency_max * 1000,
+            }
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                # give concurrent callers a short window to join this batch
+                deadline = time.perf_counter() + self.max_wait
+                while self._queued() < self.max_batch_size:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = self._take_batch()
+
+            self._dispatch(batch)
+
+    def _queued(self) -> int:
+        return sum(len(r.texts) - r.next for r in self._pending)
+
+    def _take_batch(self) -> list[tuple[_Request, int]]:
+        # round-robin over pending requests, one text each per pass
+        batch: list[tuple[_Request, int]] = []
+        while self._pending and len(batch) < self.max_batch_size:
+            request = self._pending.popleft()
+            batch.append((request, request.next))
+            request.next += 1
+            if request.next < len(request.texts):
+                self._pending.append(request)
+        return batch
+
+    def _dispatch(self, batch: list[tuple[_Request, int]]):
+        now = time.perf_counter()
+        latency = max(now - request.created for request, _ in batch)
+        with self._cond:
+            self.batches += 1
+            self.texts += len(batch)
+            self.max_batch = max(self.max_batch, len(batch))
+            self.queue_latency_total += latency
+            self.queue_latency_max = max(self.queue_latency_max, latency)
+
+        try:
+            vectors = self._embed(batch)
+        except Exception as e:
+            requests = list(dict.fromkeys(request for request, _ in batch))
+            if len(requests) == 1:
+                self._fail(requests[0], e)
+                return
+            # one bad text fails the whole call, retry every request on its own
+            # so only the request causing the error gets it
+            for request in requests:
+                own = [(r, i) for r, i in batch if r is request]
+                try:
+                    self._deliver(own, self._embed(own))
+                except Exception as error:
+                    self._fail(request, error)
+            return
+
+        self._deliver(batch, vectors)
+
+    def _embed(self, batch: list[tuple[_Request, int]]) -> list[list[float]]:
+        return self.model.embed_documents([r.texts[i] for r, i in batch])
+
+    def _deliver(self, batch: list[tuple[_Request, int]], vectors: list[list[float]]):
+        for (request, i), vector in zip(batch, vectors):
+            if request.future.done():
+                continue
+            request.results[i] = vector
+            request.done += 1
+            if request.done == len(request.texts):
+                request.future.set_result(request.results)  # type: ignore
+
+    def _fail(self, request: _Request, error: Exception):
+        if not request.future.done():
+            request.future.set_exception(error)
+        with self._cond:
+            # drop the rest of the failed request
+            if request in self._pending:
+                self._pending.remove(request)
+
+
+class BatchedEmbeddings(Embeddings):
+    """Embeddings wrapper that routes all calls through the shared batcher of its model."""
+
+    def __init__(self, model: Embeddings, key: str):
+        self.model = model
+        self.model_name = getattr(model, "model_name", key)
+        self.batcher = EmbeddingBatcher.get(key, model)
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self.batcher.submit(texts).result()
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.batcher.submit([text]).result()[0]
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        return await asyncio.wrap_future(self.batcher.submit(texts))
+
+    async def aembed_query(self, text: str) -> list[float]:
+        return (await asyncio.wrap_future(self.batcher.submit([text])))[0]
+
+
+def batched(model: Embeddings, key: str = "") -> BatchedEmbeddings:
+    if isinstance(model, BatchedEmbeddings):
+        return model
+    return BatchedEmbeddings(model, key or getattr(model, "model_name", "default"))
@@ -0,0 +1,303 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Iterator, Sequence
+
+import numpy as np
+from langchain_classic.embeddings import CacheBackedEmbeddings
+from langchain_classic.storage.encoder_backed import EncoderBackedStore
+from langchain_classic.embeddings.cache import _make_default_key_encoder
+from langchain_core.embeddings import Embeddings
+from langchain_core.stores import ByteStore
+
+from python.helpers.print_style import PrintStyle
+
+DB_FILE_NAME = "embeddings.db"
+MEMORY_PATH = ":memory:"
+
+# rows per IN (...) query, stays well below SQLite's host parameter limit
+_BATCH_SIZE = 500
+
+
+class EmbeddingCacheStore(ByteStore):
+    """
+    Packed key-value store for cached embeddings.
+
+    All entries live in a single SQLite database instead of one file per vector.
+    Reads and writes are batched, and the store can be capped by total value size,
+    in which case the least recently used entries are evicted first.
+    Evicted entries can spill into a second, usually larger on-disk store, which
+    serves misses of this one and moves its hits back.
+    """
+
+    def __init__(
+        self,
+        path: str = MEMORY_PATH,
+        max_bytes: int = 0,
+        spill: "EmbeddingCacheStore | None" = None,
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.spill = spill
+        self._lock = threading.RLock()
+
+        if path != MEMORY_PATH:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        if path != MEMORY_PATH:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, value BLOB NOT NULL, "
+            "size INTEGER NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache(accessed)")
+
+        row = self._conn.execute("SELECT COALESCE(SUM(size), 0), COUNT(*) FROM cache").fetchone()
+        self.total_bytes: int = row[0]
+        self.count: int = row[1]
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.spill_hits = 0
+
+    def mget(self, keys: Sequence[str]) -> list[bytes | None]:
+        found: dict[str, bytes] = {}
+        now = time.time()
+        with self._lock:
+            for chunk in _chunks(list(keys)):
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, value FROM cache WHERE key IN ({placeholders})", chunk
+                ).fetchall()
+                found.update(rows)
+                if rows and self.max_bytes:
+                    # access time only matters when eviction is enabled
+                    self._conn.executemany(
+                        "UPDATE cache SET accessed = ? WHERE key = ?",
+                        [(now, key) for key, _ in rows],
+                    )
+            missing = [key for key in dict.fromkeys(keys) if key not in found]
+            if missing and self.spill:
+                spilled = {
+                    key: value
+                    for key, value in zip(missing, self.spill.mget(missing))
+                    if value is not None
+                }
+                if spilled:
+                    self.spill.mdelete(list(spilled))
+                    self.mset(list(spilled.items()))
+                    found.update(spilled)
+                    self.spill_hits += len(spilled)
+            self.hits += sum(1 for key in keys if key in found)
+            self.misses += sum(1 for key in keys if key not in found)
+        return [found.get(key) for key in keys]
+
+    def mset(self, key_value_pairs: Sequence[tuple[str, bytes]]) -> None:
+        if not key_value_pairs:
+            return
+        now = time.time()
+        with self._lock:
+            keys = [key for key, _ in key_value_pairs]
+            replaced = self._sizes(keys)
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO cache (key, value, size, accessed) VALUES (?, ?, ?, ?)",
+                    [(key, value, len(value), now) for key, value in key_value_pairs],
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            # recount from the stored values so duplicate keys in one batch are handled
+            stored = self._sizes(list(dict.fromkeys(keys)))
+            self.total_bytes += sum(stored.values()) - sum(replaced.values())
+            self.count += len(stored) - len(replaced)
+            if self.max_bytes and self.total_bytes > self.max_bytes:
+                self._evict()
+
+    def mdelete(self, keys: Sequence[str]) -> None:
+        with self._lock:
+            existing = self._sizes(list(keys))
+            for chunk in _chunks(list(existing.keys())):
+                placeholders = ",".join("?" * len(chunk))
+                self._conn.execute(f"DELETE FROM cache WHERE key IN ({placeholders})", chunk)
+            self.total_bytes -= sum(existing.values())
+            self.count -= len(existing)
+
+    def yield_keys(self, *, prefix: str | None = None) -> Iterator[str]:
+        with self._lock:
+            if prefix:
+                rows = self._conn.execute(
+                    "SELECT key FROM cache WHERE substr(key, 1, ?) = ?", (len(prefix), prefix)
+                ).fetchall()
+            else:
+                rows = self._conn.execute("SELECT key FROM cache").fetchall()
+        for (key,) in rows:
+            yield key
+
+    def get_stats(self) -> dict[str, Any]:
+        stats: dict[str, Any] = {
+            "count": self.count,
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+        if self.spill:
+            stats["spill_hits"] = self.spill_hits
+            stats["spill"] = self.spill.get_stats()
+        return stats
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+        if self.spill:
+            self.spill.close()
+
+    def _sizes(self, keys: list[str]) -> dict[str, int]:
+        sizes: dict[str, int] = {}
+        for chunk in _chunks(keys):
+            placeholders = ",".join("?" * len(chunk))
+            sizes.update(
+                self._conn.execute(
+                    f"SELECT key, size FROM cache WHERE key IN ({placeholders})", chunk
+                ).fetchall()
+            )
+        return sizes
+
+    def _evict(self):
+        # evict down to 90% of the budget so a full cache does not evict on every write
+        target = int(self.max_bytes * 0.9)
+        remove: list[str] = []
+        freed = 0
+        cursor = self._conn.execute("SELECT key, size FROM cache ORDER BY accessed ASC")
+        while self.total_bytes - freed > target:
+            rows = cursor.fetchmany(_BATCH_SIZE)
+            if not rows:
+                break
+            for key, size in rows:
+                if self.total_bytes - freed <= target:
+                    break
+                remove.append(key)
+                freed += size
+        cursor.close()
+        for chunk in _chunks(remove):
+            placeholders = ",".join("?" * len(chunk))
+            if self.spill:
+                self.spill.mset(
+                    self._conn.execute(
+                        f"SELECT key, value FROM cache WHERE key IN ({placeholders})", chunk
+                    ).fetchall()
+                )
+            self._conn.execute(f"DELETE FROM cache WHERE key IN ({placeholders})", chunk)
+        self.total_bytes -= freed
+        self.count -= len(remove)
+        self.evictions += len(remove)
+
+
+def serialize_float16(value: Sequence[float]) -> bytes:
+    return np.asarray(value, dtype=np.float16).tobytes()
+
+
+def serialize_float32(value: Sequence[float]) -> bytes:
+    return np.asarray(value, dtype=np.float32).tobytes()
+
+
+def deserialize_float16(value: bytes) -> list[float]:
+    return np.frombuffer(value, dtype=np.float16).astype(np.float32).tolist()
+
+
+def deserialize_float32(value: bytes) -> list[float]:
+    return np.frombuffer(value, dtype=np.float32).tolist()
+
+
+def create_cached_embeddings(
+    embeddings_model: Embeddings,
+    store: ByteStore,
+    namespace: str,
+    float16: bool = True,
+) -> CacheBackedEmbeddings:
+    """Wrap an embeddings model with a cache that stores vectors as packed binary floats."""
+    serializer, deserializer = (
+        (serialize_float16, deserialize_float16) if float16 else (serialize_float32, deserialize_float32)
+    )
+    document_store = EncoderBackedStore[str, list[float]](
+        store,
+        _make_default_key_encoder(namespace, "sha1"),  # same keys as the legacy file store
+        serializer,
+        deserializer,
+    )
+    return CacheBackedEmbeddings(embeddings_model, document_store)
+
+
+def migrate_file_store(src_dir: str, store: EmbeddingCacheStore, float16: bool = True, remove: bool = True) -> int:
+    """
+    Move embeddings from a legacy LocalFileStore directory (one file per vector) into the packed store.
+    Returns the number of migrated entries. Migrated files are deleted unless remove is False.
+    """
+    if not os.path.isdir(src_dir):
+        return 0
+    serializer = serialize_float16 if float16 else serialize_float32
+
+    migrated = 0
+    batch: list[tuple[str, bytes]] = []
+    batch_files: list[str] = []
+
+    def flush():
+        nonlocal migrated
+        if not batch:
+            return
+        store.mset(batch)
+        migrated += len(batch)
+        if remove:
+            for path in batch_files:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+        batch.clear()
+        batch_files.clear()
+
+    for root, _dirs, file_names in os.walk(src_dir):
+        for name in file_names:
+            path = os.path.join(root, name)
+            key = os.path.relpath(path, src_dir).replace(os.sep, "/")
+            if os.path.abspath(path).startswith(os.path.abspath(store.path)):
+                continue  # the database itself and its WAL files
+            try:
+                with open(path, "rb") as f:
+                    value = json.loads(f.read().decode())
+                batch.append((key, serializer(value)))
+                batch_files.append(path)
+            except Exception as e:
+                PrintStyle.error(f"Skipping embedding cache file {path}: {e}")
+                continue
+            if len(batch) >= _BATCH_SIZE:
+                flush()
+    flush()
+    return migrated
+
+
+def _chunks(items: list[str]) -> Iterator[list[str]]:
+    for i in range(0, len(items), _BATCH_SIZE):
+        yield items[i : i + _BATCH_SIZE]
+
+
+if __name__ == "__main__":
+    # usage: python -m python.helpers.embedding_cache [legacy_dir] [db_file]
+    import sys
+    from python.helpers import files
+
+    src = sys.argv[1] if len(sys.argv) > 1 else files.get_abs_path("memory/embeddings")
+    dst = sys.argv[2] if len(sys.argv) > 2 else os.path.join(src, DB_FILE_NAME)
+    cache = EmbeddingCacheStore(dst)
+    count = migrate_file_store(src, cache)
+    PrintStyle.standard(f"Migrated {count} embeddings into {dst}")
+    cache.close()
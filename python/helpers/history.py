@@ -1,10 +1,12 @@
 from abc import abstractmethod
 import asyncio
 from collections.abc import Mapping
+from functools import partial
+import hashlib
 import json
 import math
-from typing import TypedDict, cast, Union, Dict, List
-from python.helpers import messages, tokens, settings
+from typing import Any, Awaitable, Callable, TypedDict, cast, Union, Dict, List
+from python.helpers import history_summary, messages, metrics, tokens, settings
 from langchain_core.messages import BaseMessage, HumanMessage, AIMessage
 
 BULK_MERGE_COUNT = 3
@@ -15,6 +17,10 @@ HISTORY_BULK_RATIO = 0.2
 TOPIC_COMPRESS_RATIO = 0.65
 LARGE_MESSAGE_TO_TOPIC_RATIO = 0.25
 RAW_MESSAGE_OUTPUT_TEXT_TRIM = 100
+SUMMARY_TOKENS_ESTIMATE = 200  # planned size of a summary, the prompt asks for about 100 words
+COMPRESSION_CONCURRENCY = 4  # summarizations running at once
+DEDUP_MIN_CHARS = 1000  # message contents at least this long are stored once per history
+DEDUP_RENDER = "reference"  # repeated contents in the prompt, "reference" or "full"
 
 
 class RawMessage(TypedDict):
@@ -38,8 +44,25 @@ class OutputMessage(TypedDict):
 
 
 class Record:
+    """
+    Part of the history, outputs are cached until the record changes.
+
+    Mutations invalidate the cached output of the record and of the records containing
+    it through parent. Cached outputs are shared, callers must not modify them.
+    """
+
     def __init__(self):
-        pass
+        self.parent: Record | None = None
+        self._output: list[OutputMessage] | None = None
+
+    def invalidate(self):
+        """Drop the cached output of this record and of the records containing it."""
+        self._output = None
+        if self.parent:
+            self.parent.child_changed(self)
+
+    def child_changed(self, child: "Record"):
+        self.invalidate()
 
     @abstractmethod
     def get_tokens(self) -> int:
@@ -74,12 +97,44 @@ class Record:
 
 
 class Message(Record):
-    def __init__(self, ai: bool, content: MessageContent, tokens: int = 0):
-        self.ai = ai
-        self.content = content
-        self.summary: str = ""
+    def __init__(
+        self, ai: bool, content: MessageContent, tokens: int = 0, summary: str = ""
+    ):
+        super().__init__()
+        self._ai = ai
+        self._content = content
+        self._summary: str = summary
+        # interned contents by key, "" for the whole content: key -> (hash, text)
+        self.refs: dict[str, tuple[str, str]] = {}
         self.tokens: int = tokens or self.calculate_tokens()
 
+    @property
+    def ai(self) -> bool:
+        return self._ai
+
+    @ai.setter
+    def ai(self, ai: bool):
+        self._ai = ai
+        self.invalidate()
+
+    @property
+    def content(self) -> MessageContent:
+        return self._content
+
+    @content.setter
+    def content(self, content: MessageContent):
+        self._content = content
+        self.invalidate()
+
+    @property
+    def summary(self) -> str:
+        return self._summary
+
+    @summary.setter
+    def summary(self, summary: str):
+        self._summary = summary
+        self.invalidate()
+
     def get_tokens(self) -> int:
         if not self.tokens:
             self.tokens = self.calculate_tokens()
@@ -97,7 +152,9 @@ class Message(Record):
         return False
 
     def output(self):
-        return [OutputMessage(ai=self.ai, content=self.summary or self.content)]
+        if self._output is None:
+            self._output = [OutputMessage(ai=self.ai, content=self.summary or self.content)]
+        return list(self._output)
 
     def output_langchain(self):
         return output_langchain(self.output())
@@ -109,25 +166,47 @@ class Message(Record):
         return {
             "_cls": "Message",
             "ai": self.ai,
-            "content": self.content,
+            "content": _reference_content(self.content, self.refs),
             "summary": self.summary,
             "tokens": self.tokens,
         }
 
     @staticmethod
     def from_dict(data: dict, history: "History"):
-        content = data.get("content", "Content lost")
-        msg = Message(ai=data["ai"], content=content)
-        msg.summary = data.get("summary", "")
+        content, refs = history.contents.resolve(data.get("content", "Content lost"))
+        msg = Message(ai=data["ai"], content=content, summary=data.get("summary", ""))
+        msg.refs = refs
         msg.tokens = data.get("tokens", 0)
         return msg
 
 
 class Topic(Record):
     def __init__(self, history: "History"):
+        super().__init__()
         self.history = history
-        self.summary: str = ""
-        self.messages: list[Message] = []
+        self.parent = history
+        self._summary: str = ""
+        self._messages: list[Message] = []
+
+    @property
+    def summary(self) -> str:
+        return self._summary
+
+    @summary.setter
+    def summary(self, summary: str):
+        self._summary = summary
+        self.invalidate()
+
+    @property
+    def messages(self) -> list[Message]:
+        return self._messages
+
+    @messages.setter
+    def messages(self, messages: list[Message]):
+        for msg in messages:
+            msg.parent = self
+        self._messages = messages
+        self.invalidate()
 
     def get_tokens(self):
         if self.summary:
@@ -136,31 +215,36 @@ class Topic(Record):
             return sum(msg.get_tokens() for msg in self.messages)
 
     def add_message(
-        self, ai: bool, content: MessageContent, tokens: int = 0
+        self, ai: bool, content: MessageContent, tokens: int = 0, summary: str = ""
     ) -> Message:
-        msg = Message(ai=ai, content=content, tokens=tokens)
+        msg = Message(ai=ai, content=content, tokens=tokens, summary=summary)
+        msg.parent = self
         self.messages.append(msg)
+        # appended to the cached output, only the new message is converted
+        if self._output is not None and not self.summary:
+            self._output += msg.output()
+        if self.parent:
+            self.parent.child_changed(self)
         return msg
 
     def output(self) -> list[OutputMessage]:
-        if self.summary:
-            return [OutputMessage(ai=False, content=self.summary)]
-        else:
-            msgs = [m for r in self.messages for m in r.output()]
-            return msgs
+        if self._output is None:
+            if self.summary:
+                self._output = [OutputMessage(ai=False, content=self.summary)]
+            else:
+                self._output = [m for r in self.messages for m in r.output()]
+        return list(self._output)
 
     async def summarize(self):
         self.summary = await self.summarize_messages(self.messages)
         return self.summary
 
-    async def compress_large_messages(self) -> bool:
-        set = settings.get_settings()
-        msg_max_size = (
-            set["chat_model_ctx_length"]
-            * set["chat_model_ctx_history"]
-            * CURRENT_TOPIC_RATIO
-            * LARGE_MESSAGE_TO_TOPIC_RATIO
-        )
+    def set_summary(self, summary: str):
+        self.summary = summary
+
+    def get_large_messages(self) -> list[tuple[Message, int, int, list[OutputMessage]]]:
+        """Messages over the size limit as (message, tokens, length, output), largest first."""
+        msg_max_size = _get_large_message_size()
         large_msgs = []
         for m in (m for m in self.messages if not m.summary):
             # TODO refactor this
@@ -171,57 +255,45 @@ class Topic(Record):
             if tok > msg_max_size:
                 large_msgs.append((m, tok, leng, out))
         large_msgs.sort(key=lambda x: x[1], reverse=True)
-        for msg, tok, leng, out in large_msgs:
-            trim_to_chars = leng * (msg_max_size / tok)
-            # raw messages will be replaced as a whole, they would become invalid when truncated
-            if _is_raw_message(out[0]["content"]):
-                msg.set_summary(
-                    "Message content replaced to save space in context window"
-                )
-
-            # regular messages will be truncated
-            else:
-                trunc = messages.truncate_dict_by_ratio(
-                    self.history.agent,
-                    out[0]["content"],
-                    trim_to_chars * 1.15,
-                    trim_to_chars * 0.85,
-                )
-                msg.set_summary(_json_dumps(trunc))
-
-            return True
-        return False
-
-    async def compress(self) -> bool:
-        compress = await self.compress_large_messages()
-        if not compress:
-            compress = await self.compress_attention()
-        return compress
+        return large_msgs
+
+    def truncate_message(self, msg: Message, tok: int, leng: int, out: list[OutputMessage]):
+        trim_to_chars = leng * (_get_large_message_size() / tok)
+        # raw messages will be replaced as a whole, they would become invalid when truncated
+        if _is_raw_message(out[0]["content"]):
+            msg.set_summary(
+                "Message content replaced to save space in context window"
+            )
 
-    async def compress_attention(self) -> bool:
+        # regular messages will be truncated
+        else:
+            trunc = messages.truncate_dict_by_ratio(
+                self.history.agent,
+                out[0]["content"],
+                trim_to_chars * 1.15,
+                trim_to_chars * 0.85,
+            )
+            msg.set_summary(_json_dumps(trunc))
 
+    def get_attention_count(self) -> int:
+        """Messages after the first one summarized by one attention compression."""
         if len(self.messages) > 2:
-            cnt_to_sum = math.ceil((len(self.messages) - 2) * TOPIC_COMPRESS_RATIO)
-            msg_to_sum = self.messages[1 : cnt_to_sum + 1]
-            summary = await self.summarize_messages(msg_to_sum)
-            sum_msg_content = self.history.agent.parse_prompt(
-                "fw.msg_summary.md", summary=summary
-            )
-            sum_msg = Message(False, sum_msg_content)
-            self.messages[1 : cnt_to_sum + 1] = [sum_msg]
-            return True
-        return False
+            return math.ceil((len(self.messages) - 2) * TOPIC_COMPRESS_RATIO)
+        return 0
+
+    def replace_with_summary(self, count: int, summary: str):
+        sum_msg_content = self.history.agent.parse_prompt(
+            "fw.msg_summary.md", summary=summary
+        )
+        sum_msg = Message(False, sum_msg_content)
+        sum_msg.parent = self
+        self.messages[1 : count + 1] = [sum_msg]
+        self.invalidate()
 
     async def summarize_messages(self, messages: list[Message]):
         # FIXME: vision bytes are sent to utility LLM, send summary instead
         msg_txt = [m.output_text() for m in messages]
-        summary = await self.history.agent.call_utility_model(
-            system=self.history.agent.read_prompt("fw.topic_summary.sys.md"),
-            message=self.history.agent.read_prompt(
-                "fw.topic_summary.msg.md", content=msg_txt
-            ),
-        )
-        return summary
+        return await history_summary.summarize(self.history.agent, msg_txt)
 
     def to_dict(self):
         return {
@@ -242,9 +314,31 @@ class Topic(Record):
 
 class Bulk(Record):
     def __init__(self, history: "History"):
+        super().__init__()
         self.history = history
-        self.summary: str = ""
-        self.records: list[Record] = []
+        self.parent = history
+        self._summary: str = ""
+        self._records: list[Record] = []
+
+    @property
+    def summary(self) -> str:
+        return self._summary
+
+    @summary.setter
+    def summary(self, summary: str):
+        self._summary = summary
+        self.invalidate()
+
+    @property
+    def records(self) -> list[Record]:
+        return self._records
+
+    @records.setter
+    def records(self, records: list[Record]):
+        for record in records:
+            record.parent = self
+        self._records = records
+        self.invalidate()
 
     def get_tokens(self):
         if self.summary:
@@ -255,24 +349,26 @@ class Bulk(Record):
     def output(
         self, human_label: str = "user", ai_label: str = "ai"
     ) -> list[OutputMessage]:
-        if self.summary:
-            return [OutputMessage(ai=False, content=self.summary)]
-        else:
-            msgs = [m for r in self.records for m in r.output()]
-            return msgs
+        if self._output is None:
+            if self.summary:
+                self._output = [OutputMessage(ai=False, content=self.summary)]
+            else:
+                self._output = [m for r in self.records for m in r.output()]
+        return list(self._output)
 
     async def compress(self):
         return False
 
     async def summarize(self):
-        self.summary = await self.history.agent.call_utility_model(
-            system=self.history.agent.read_prompt("fw.topic_summary.sys.md"),
-            message=self.history.agent.read_prompt(
-                "fw.topic_summary.msg.md", content=self.output_text()
-            ),
-        )
+        self.summary = await self.summarize_records()
         return self.summary
 
+    def set_summary(self, summary: str):
+        self.summary = summary
+
+    async def summarize_records(self) -> str:
+        return await history_summary.summarize(self.history.agent, self.output_text())
+
     def to_dict(self):
         return {
             "_cls": "Bulk",
@@ -293,11 +389,20 @@ class History(Record):
     def __init__(self, agent):
         from agent import Agent
 
+        super().__init__()
         self.counter = 0
         self.bulks: list[Bulk] = []
         self.topics: list[Topic] = []
         self.current = Topic(history=self)
         self.agent: Agent = agent
+        self.contents = ContentStore()
+        # records the cached output of bulks and topics was made of
+        self._output_records: list[Record] = []
+        # outputs with repeated contents replaced by references, by id of the output
+        self._referred: dict[int, tuple[OutputMessage, tuple[str, ...], OutputMessage, int]] = {}
+        # conversions of the last output_langchain call
+        self._langchain_inputs: list[_LangchainInput] = []
+        self._langchain_groups: list[tuple[int, int, BaseMessage]] = []
 
     def get_tokens(self) -> int:
         return (
@@ -324,7 +429,54 @@ class History(Record):
         self, ai: bool, content: MessageContent, tokens: int = 0
     ) -> Message:
         self.counter += 1
-        return self.current.add_message(ai, content=content, tokens=tokens)
+        # large contents are stored once, repeats are replaced by a reference when output
+        content, refs = self.contents.intern(content)
+        msg = self.current.add_message(ai, content=content, tokens=tokens)
+        msg.refs = refs
+        return msg
+
+    def _refer_repeats(self, outputs: list[OutputMessage]) -> list[OutputMessage]:
+        """
+        Outputs with contents rendered in full earlier in them replaced by references.
+
+        Resolved on every output, so a repeat is rendered in full again as soon as the
+        earlier occurrence is summarized, truncated or removed. Replaced outputs are
+        reused while their original output and repeated keys stay the same.
+        """
+        seen: set[str] = set()
+        referred: dict[int, tuple[OutputMessage, tuple[str, ...], OutputMessage, int]] = {}
+        result: list[OutputMessage] = []
+        for out in outputs:
+            repeats = self.contents.repeats(out["content"], seen)
+            if repeats:
+                cached = self._referred.get(id(out))
+                if cached is None or cached[0] is not out or cached[1] != repeats:
+                    cached = (out, repeats, *self._reference_output(out, repeats))
+                referred[id(out)] = cached
+                out = cached[2]
+            result.append(out)
+        self._referred = referred
+        self.contents.stats["duplicate_tokens_saved"] = sum(saved for *_, saved in referred.values())
+        return result
+
+    def _reference_output(self, out: OutputMessage, repeats: tuple[str, ...]) -> tuple[OutputMessage, int]:
+        # references of the same shape as the content, dict keys are kept
+        content = out["content"]
+        saved = 0
+
+        def reference(text: str) -> str:
+            nonlocal saved
+            text_reference = self.agent.read_prompt("fw.msg_duplicate.md", length=len(text))
+            saved += self.contents.saving(text, text_reference)
+            return text_reference
+
+        if isinstance(content, str):
+            content = reference(content)
+        else:
+            content = {
+                k: reference(v) if k in repeats else v for k, v in cast(dict, content).items()
+            }
+        return OutputMessage(ai=out["ai"], content=content), saved
 
     def new_topic(self):
         if self.current.messages:
@@ -332,24 +484,83 @@ class History(Record):
             self.current = Topic(history=self)
 
     def output(self) -> list[OutputMessage]:
-        result: list[OutputMessage] = []
-        result += [m for b in self.bulks for m in b.output()]
-        result += [m for t in self.topics for m in t.output()]
-        result += self.current.output()
-        return result
+        # bulks and topics rarely change, their output is cached apart from the current topic
+        records: list[Record] = [*self.bulks, *self.topics]
+        if self._output is None or not _same_records(records, self._output_records):
+            self._output = [m for r in records for m in r.output()]
+            self._output_records = records
+        outputs = self._output + self.current.output()
+        if DEDUP_RENDER == "reference":
+            outputs = self._refer_repeats(outputs)
+        return outputs
+
+    def child_changed(self, child: Record):
+        if child is not self.current:
+            self._output = None
+
+    def output_langchain(self, outputs: list[OutputMessage] | None = None) -> list[BaseMessage]:
+        """
+        LangChain messages of outputs, the history output by default, same as output_langchain.
+
+        Conversions of the longest unchanged prefix of the outputs of the previous call
+        are reused, outputs are compared by identity so cached history outputs match.
+        Only messages after the prefix, and the group of messages merged across it,
+        are rebuilt.
+        """
+        if outputs is None:
+            outputs = self.output()
+
+        same = 0
+        for out, cached in zip(outputs, self._langchain_inputs):
+            if out is not cached.output or out["content"] is not cached.content or out["ai"] != cached.ai:
+                break
+            same += 1
+        inputs = self._langchain_inputs[:same] + [_LangchainInput(out) for out in outputs[same:]]
+
+        # groups within the prefix are final unless the next message merges into them
+        groups = self._langchain_groups
+        keep = 0
+        while keep < len(groups):
+            end = groups[keep][1]
+            if end > same or (end == same < len(inputs) and inputs[end].ai == inputs[end - 1].ai):
+                break
+            keep += 1
+        groups = groups[:keep]
+
+        # merge the rest by message type, like group_messages_abab
+        start = groups[-1][1] if groups else 0
+        while start < len(inputs):
+            end = start + 1
+            content = inputs[start].converted
+            while end < len(inputs) and inputs[end].ai == inputs[start].ai:
+                content = _merge_outputs(content, inputs[end].converted)
+                end += 1
+            message = AIMessage(content) if inputs[start].ai else HumanMessage(content)  # type: ignore
+            groups.append((start, end, message))
+            start = end
+
+        self._langchain_inputs, self._langchain_groups = inputs, groups
+        return [message for _, _, message in groups]
 
     @staticmethod
     def from_dict(data: dict, history: "History"):
         history.counter = data.get("counter", 0)
+        history.contents.load(data.get("contents", {}))
         history.bulks = [Bulk.from_dict(b, history=history) for b in data["bulks"]]
         history.topics = [Topic.from_dict(t, history=history) for t in data["topics"]]
         history.current = Topic.from_dict(data["current"], history=history)
         return history
 
     def to_dict(self):
+        # contents no longer referenced by any message are dropped
+        refs = [
+            ref for m in _iter_messages([*self.bulks, *self.topics, self.current]) for ref in m.refs.values()
+        ]
+        self.contents.retain({key for key, _ in refs})
         return {
             "_cls": "History",
             "counter": self.counter,
+            "contents": dict(self.contents.contents),
             "bulks": [b.to_dict() for b in self.bulks],
             "topics": [t.to_dict() for t in self.topics],
             "current": self.current.to_dict(),
@@ -357,90 +568,150 @@ class History(Record):
 
     def serialize(self):
         data = self.to_dict()
-        return _json_dumps(data)
+        serialized = _json_dumps(data)
+        self.contents.track_serialization(serialized, data["contents"], self._count_refs())
+        return serialized
+
+    def _count_refs(self) -> dict[str, int]:
+        counts: dict[str, int] = {}
+        for m in _iter_messages([*self.bulks, *self.topics, self.current]):
+            for key, _ in m.refs.values():
+                counts[key] = counts.get(key, 0) + 1
+        return counts
 
     async def compress(self):
+        """
+        Compress the history until it fits the context window.
+
+        Each round plans every summarization needed to fit the budgets of the current
+        topic, older topics and bulks, runs them concurrently and applies all results
+        at once. Only work depending on fresh summaries, like merging bulks made from
+        topics moved in the round before, takes another round.
+        """
         compressed = False
         while True:
-            curr, hist, bulk = (
-                self.get_current_topic_tokens(),
-                self.get_topics_tokens(),
-                self.get_bulks_tokens(),
-            )
-            total = _get_ctx_size_for_history()
-            ratios = [
-                (curr, CURRENT_TOPIC_RATIO, "current_topic"),
-                (hist, HISTORY_TOPIC_RATIO, "history_topic"),
-                (bulk, HISTORY_BULK_RATIO, "history_bulk"),
-            ]
-            ratios = sorted(ratios, key=lambda x: (x[0] / total) / x[1], reverse=True)
-            compressed_part = False
-            for ratio in ratios:
-                if ratio[0] > ratio[1] * total:
-                    over_part = ratio[2]
-                    if over_part == "current_topic":
-                        compressed_part = await self.current.compress()
-                    elif over_part == "history_topic":
-                        compressed_part = await self.compress_topics()
-                    else:
-                        compressed_part = await self.compress_bulks()
-                    if compressed_part:
-                        break
-
-            if compressed_part:
-                compressed = True
-                continue
-            else:
+            state = self._compression_state()
+            steps = self.plan_compression()
+            if steps:
+                semaphore = asyncio.Semaphore(COMPRESSION_CONCURRENCY)
+
+                async def run(step: CompressionStep):
+                    if not step.run:
+                        return None
+                    async with semaphore:
+                        return await step.run()
+
+                results = await asyncio.gather(*[run(step) for step in steps])
+                # nothing is applied unless all summarizations succeeded
+                for step, result in zip(steps, results):
+                    step.apply(result)
+            if self._compression_state() == state:
                 return compressed
+            compressed = True
+
+    def plan_compression(self) -> list["CompressionStep"]:
+        """
+        Steps bringing each part of the history within its budget, summaries are assumed
+        to take SUMMARY_TOKENS_ESTIMATE tokens. Truncation of large messages needs no
+        model call and is applied right away.
+        """
+        total = _get_ctx_size_for_history()
+        return (
+            self._plan_current_topic(total * CURRENT_TOPIC_RATIO)
+            + self._plan_bulks(total * HISTORY_BULK_RATIO)
+            + self._plan_topics(total * HISTORY_TOPIC_RATIO)
+        )
+
+    def _plan_current_topic(self, budget: float) -> list["CompressionStep"]:
+        current = self.current
+        tokens = current.get_tokens()
+        # largest messages first, as many as needed
+        for large in current.get_large_messages():
+            if tokens <= budget:
+                return []
+            current.truncate_message(*large)
+            tokens = current.get_tokens()
+        if tokens <= budget:
+            return []
+
+        # one summary of as many messages as repeated attention compressions would fold
+        count = current.get_attention_count()
+        if not count:
+            return []
+        msgs = current.messages
+        folded = sum(m.get_tokens() for m in msgs[1 : count + 1])
+        while count < len(msgs) - 2 and tokens - folded + SUMMARY_TOKENS_ESTIMATE > budget:
+            count += 1
+            folded += msgs[count].get_tokens()
+        if folded <= SUMMARY_TOKENS_ESTIMATE:
+            return []  # a summary would not save anything
+        to_sum = msgs[1 : count + 1]
+        return [
+            CompressionStep(
+                run=lambda: current.summarize_messages(to_sum),
+                apply=lambda summary: current.replace_with_summary(count, summary),
+            )
+        ]
 
-    async def compress_topics(self) -> bool:
-        # summarize topics one by one
+    def _plan_topics(self, budget: float) -> list["CompressionStep"]:
+        steps: list[CompressionStep] = []
+        tokens = self.get_topics_tokens()
+        # summarize oldest topics first
         for topic in self.topics:
+            if tokens <= budget:
+                break
             if not topic.summary:
-                await topic.summarize()
-                return True
+                tokens -= topic.get_tokens() - min(topic.get_tokens(), SUMMARY_TOKENS_ESTIMATE)
+                steps.append(
+                    CompressionStep(
+                        run=partial(topic.summarize_messages, topic.messages),
+                        apply=topic.set_summary,
+                    )
+                )
+        # still too large when all are summarized, move oldest topics to bulks
+        if tokens > budget:
+            steps.append(CompressionStep(run=None, apply=lambda _: self._move_topics_to_bulks(budget)))
+        return steps
+
+    def _plan_bulks(self, budget: float) -> list["CompressionStep"]:
+        if self.get_bulks_tokens() <= budget or not self.bulks:
+            return []
+        snapshot = list(self.bulks)
+        # merge bulks in groups of BULK_MERGE_COUNT, even if there are fewer,
+        # a single bulk is summarized again
+        merged: list[Bulk] = []
+        steps: list[CompressionStep] = []
+        for i in range(0, len(snapshot), BULK_MERGE_COUNT):
+            bulk = Bulk(history=self)
+            bulk.records = cast(list[Record], snapshot[i : i + BULK_MERGE_COUNT])
+            merged.append(bulk)
+            steps.append(CompressionStep(run=bulk.summarize_records, apply=bulk.set_summary))
+        steps.append(
+            CompressionStep(run=None, apply=lambda _: self._replace_bulks(snapshot, merged))
+        )
+        return steps
 
-        # move oldest topic to bulks and summarize
-        for topic in self.topics:
+    def _move_topics_to_bulks(self, budget: float):
+        while self.topics and self.topics[0].summary and self.get_topics_tokens() > budget:
+            topic = self.topics.pop(0)
             bulk = Bulk(history=self)
-            bulk.records.append(topic)
-            if topic.summary:
-                bulk.summary = topic.summary
-            else:
-                await bulk.summarize()
+            bulk.records = [topic]
+            bulk.summary = topic.summary
             self.bulks.append(bulk)
-            self.topics.remove(topic)
-            return True
-        return False
 
-    async def compress_bulks(self):
-        # merge bulks if possible
-        compressed = await self.merge_bulks_by(BULK_MERGE_COUNT)
-        # remove oldest bulk if necessary
-        if not compressed:
-            self.bulks.pop(0)
-            return True
-        return compressed
-
-    async def merge_bulks_by(self, count: int):
-        # if bulks is empty, return False
-        if len(self.bulks) == 0:
-            return False
-        # merge bulks in groups of count, even if there are fewer than count
-        bulks = await asyncio.gather(
-            *[
-                self.merge_bulks(self.bulks[i : i + count])
-                for i in range(0, len(self.bulks), count)
-            ]
-        )
-        self.bulks = bulks
-        return True
+    def _replace_bulks(self, old: list[Bulk], new: list[Bulk]):
+        # bulks added after planning are kept
+        self.bulks = new + self.bulks[len(old) :]
 
-    async def merge_bulks(self, bulks: list[Bulk]) -> Bulk:
-        bulk = Bulk(history=self)
-        bulk.records = cast(list[Record], bulks)
-        await bulk.summarize()
-        return bulk
+    def _compression_state(self):
+        return (
+            self.get_current_topic_tokens(),
+            self.get_topics_tokens(),
+            self.get_bulks_tokens(),
+            len(self.current.messages),
+            len(self.topics),
+            len(self.bulks),
+        )
 
 
 def deserialize_history(json_data: str, agent) -> History:
@@ -451,11 +722,200 @@ def deserialize_history(json_data: str, agent) -> History:
     return history
 
 
+class ContentStore:
+    """
+    Large message contents of a history by hash, each distinct content is kept once.
+
+    Whole string contents and string values of dict contents are interned, like tool
+    results. Serialized histories store them once in a table, messages refer to them.
+    """
+
+    def __init__(self):
+        self.contents: dict[str, str] = {}
+        # hashes by stored text, the hash of a str object is computed once by python
+        self._refs: dict[str, str] = {}
+        self._tokens: dict[str, int] = {}  # of repeated contents
+        self.stats: dict[str, int] = {
+            "duplicates": 0,
+            "duplicate_bytes": 0,
+            "duplicate_tokens_saved": 0,
+            "serialized_bytes": 0,
+            "serialized_bytes_saved": 0,
+        }
+
+    def intern(
+        self, content: MessageContent
+    ) -> tuple[MessageContent, dict[str, tuple[str, str]]]:
+        """Content with interned texts and its references by key, "" for the whole content."""
+        refs: dict[str, tuple[str, str]] = {}
+
+        def intern_text(key: str, text: str) -> str:
+            if len(text) < DEDUP_MIN_CHARS:
+                return text
+            ref = _content_hash(text)
+            stored = self.contents.get(ref)
+            if stored is None:
+                self._store(ref, text)
+                stored = text
+            else:
+                self.stats["duplicates"] += 1
+                self.stats["duplicate_bytes"] += len(text.encode("utf-8"))
+            refs[key] = (ref, stored)
+            return stored
+
+        if isinstance(content, str):
+            content = intern_text("", content)
+        elif isinstance(content, dict) and not _is_raw_message(content):
+            content = {
+                k: intern_text(k, v) if isinstance(v, str) else v
+                for k, v in content.items()
+            }
+        return content, refs
+
+    def repeats(self, content: MessageContent, seen: set[str]) -> tuple[str, ...]:
+        """Keys of interned texts of content already in seen, the others are added to seen."""
+        if isinstance(content, str):
+            texts = [("", content)]
+        elif isinstance(content, dict) and not _is_raw_message(content):
+            texts = [(k, v) for k, v in content.items() if isinstance(v, str)]
+        else:
+            return ()
+        repeats: list[str] = []
+        for key, text in texts:
+            ref = self._refs.get(text) if len(text) >= DEDUP_MIN_CHARS else None
+            if ref is None:
+                continue  # not stored, like summaries and truncations
+            if ref in seen:
+                repeats.append(key)
+            else:
+                seen.add(ref)
+        return tuple(repeats)
+
+    def resolve(self, content: MessageContent) -> tuple[MessageContent, dict[str, tuple[str, str]]]:
+        """Serialized content with references replaced by the stored texts."""
+        refs: dict[str, tuple[str, str]] = {}
+
+        def resolve_value(key: str, value):
+            if isinstance(value, dict) and set(value) == {_CONTENT_REF}:
+                ref = value[_CONTENT_REF]
+                text = self.contents.get(ref, "Content lost")
+                refs[key] = (ref, text)
+                return text
+            return value
+
+        content = resolve_value("", content)
+        if isinstance(content, dict) and not refs:
+            content = {k: resolve_value(k, v) for k, v in content.items()}
+        return content, refs
+
+    def load(self, contents: dict[str, str]):
+        for ref, text in contents.items():
+            self._store(ref, text)
+
+    def retain(self, refs: set[str]):
+        self.contents = {k: v for k, v in self.contents.items() if k in refs}
+        self._refs = {text: ref for ref, text in self.contents.items()}
+        self._tokens = {k: v for k, v in self._tokens.items() if k in refs}
+
+    def saving(self, text: str, reference: str) -> int:
+        """Tokens saved by rendering an interned text as reference."""
+        ref = self._refs[text]
+        if ref not in self._tokens:
+            self._tokens[ref] = tokens.approximate_tokens(text)
+        return max(0, self._tokens[ref] - tokens.approximate_tokens(reference))
+
+    def _store(self, ref: str, text: str):
+        self.contents[ref] = text
+        self._refs[text] = ref
+
+    def track_serialization(self, serialized: str, contents: dict[str, str], counts: dict[str, int]):
+        self.stats["serialized_bytes"] = len(serialized.encode("utf-8"))
+        self.stats["serialized_bytes_saved"] = sum(
+            (counts.get(ref, 1) - 1) * len(_json_dumps(text).encode("utf-8"))
+            for ref, text in contents.items()
+        )
+
+    def get_stats(self) -> dict[str, int]:
+        return {
+            **self.stats,
+            "contents": len(self.contents),
+            "content_bytes": sum(len(text.encode("utf-8")) for text in self.contents.values()),
+        }
+
+
+class _LangchainInput:
+    """Output message with its LangChain content, cached by History.output_langchain."""
+
+    def __init__(self, output: OutputMessage):
+        self.output = output
+        self.content = output["content"]
+        self.ai = output["ai"]
+        self.converted = _output_content_langchain(self.content)
+
+
+class CompressionStep:
+    """Summarization planned by History.plan_compression, run may execute concurrently, apply must not wait."""
+
+    def __init__(
+        self,
+        run: Callable[[], Awaitable[Any]] | None,
+        apply: Callable[[Any], None],
+    ):
+        self.run = run
+        self.apply = apply
+
+
 def _get_ctx_size_for_history() -> int:
     set = settings.get_settings()
     return int(set["chat_model_ctx_length"] * set["chat_model_ctx_history"])
 
 
+def _get_large_message_size() -> float:
+    set = settings.get_settings()
+    return (
+        set["chat_model_ctx_length"]
+        * set["chat_model_ctx_history"]
+        * CURRENT_TOPIC_RATIO
+        * LARGE_MESSAGE_TO_TOPIC_RATIO
+    )
+
+
+_CONTENT_REF = "_content_ref"
+
+
+def _content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _reference_content(content: MessageContent, refs: dict[str, tuple[str, str]]) -> MessageContent:
+    # interned texts are serialized as references, unless the content changed since
+    if not refs:
+        return content
+    if "" in refs:
+        ref, text = refs[""]
+        return {_CONTENT_REF: ref} if content is text else content
+    if isinstance(content, dict):
+        return {
+            k: {_CONTENT_REF: refs[k][0]} if k in refs and v is refs[k][1] else v
+            for k, v in content.items()
+        }
+    return content
+
+
+def _iter_messages(records: list[Record]):
+    for record in records:
+        if isinstance(record, Message):
+            yield record
+        elif isinstance(record, Topic):
+            yield from record.messages
+        elif isinstance(record, Bulk):
+            yield from _iter_messages(record.records)
+
+
+def _same_records(a: list[Record], b: list[Record]) -> bool:
+    return len(a) == len(b) and all(x is y for x, y in zip(a, b))
+
+
 def _stringify_output(output: OutputMessage, ai_label="ai", human_label="human"):
     return f'{ai_label if output["ai"] else human_label}: {_stringify_content(output["content"])}'
 
@@ -573,3 +1033,22 @@ def _json_dumps(obj):
 
 def _json_loads(obj):
     return json.loads(obj)
+
+
+def get_dedup_stats() -> dict[str, dict[str, int]]:
+    """Content deduplication of the histories of all agents, by chat."""
+    from agent import Agent, AgentContext
+
+    result: dict[str, dict[str, int]] = {}
+    for context in AgentContext.all():
+        totals: dict[str, int] = {}
+        agent = context.agent0
+        while agent:
+            for key, value in agent.history.contents.get_stats().items():
+                totals[key] = totals.get(key, 0) + value
+            agent = agent.get_data(Agent.DATA_NAME_SUBORDINATE)
+        result[context.id] = totals
+    return result
+
+
+metrics.register("history_dedup", get_dedup_stats)
@@ -0,0 +1,223 @@
+import asyncio
+import math
+import re
+import threading
+import time
+from collections import Counter
+from typing import TYPE_CHECKING, Any, Callable, Protocol
+
+from python.helpers import metrics
+from python.helpers.print_style import PrintStyle
+
+if TYPE_CHECKING:
+    from agent import Agent
+
+# strategy used by history compression, a name from STRATEGIES
+SUMMARY_STRATEGY = "deadline"
+LLM_SUMMARY_DEADLINE = 45.0  # seconds before the deadline strategy falls back to the extractive summary
+EXTRACTIVE_SUMMARY_WORDS = 100  # length of extractive summaries, like the summary prompt asks for
+STAGED_INPUT_WORDS = 1500  # larger inputs are shrunk extractively before the staged llm summary
+SENTENCE_MAX_WORDS = 60  # longer sentences are cut in extractive summaries
+SENTENCE_MIN_TERMS = 5  # shorter sentences are scored as if this long, acknowledgements rank low
+
+_SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+|\n+")
+_WORD = re.compile(r"\w+")
+
+# words carrying no content, left out of sentence scores
+_STOP_WORDS = frozenset(
+    "a an and are as at be been but by for from has have he her his i if in into is it its "
+    "me my no not of on or our she so than that the their them then there these they this "
+    "to was we were what when which who will with you your ai user".split()
+)
+
+
+class SummaryStrategy(Protocol):
+    name: str
+
+    async def summarize(self, agent: "Agent", content: str | list[str]) -> str: ...
+
+
+class LlmSummary:
+    """Summary by the utility model, with the topic summary prompts."""
+
+    name = "llm"
+
+    async def summarize(self, agent: "Agent", content: str | list[str]) -> str:
+        start = time.perf_counter()
+        summary = await agent.call_utility_model(
+            system=agent.read_prompt("fw.topic_summary.sys.md"),
+            message=agent.read_prompt("fw.topic_summary.msg.md", content=content),
+        )
+        _track_llm(time.perf_counter() - start)
+        return summary
+
+
+class ExtractiveSummary:
+    """
+    Summary made of the most informative sentences of the content, on the CPU.
+
+    Sentences are scored by the TF-IDF weights of their words, with every sentence as
+    a document, and the best ones are kept in their original order.
+    """
+
+    name = "extractive"
+
+    def __init__(self, words: int | None = None):
+        self.words = words
+
+    async def summarize(self, agent: "Agent", content: str | list[str]) -> str:
+        _count("extractive")
+        return extract_summary(_join(content), self.words or EXTRACTIVE_SUMMARY_WORDS)
+
+
+class DeadlineSummary:
+    """Primary summary, replaced by the fallback when it takes longer than the deadline."""
+
+    name = "deadline"
+
+    def __init__(
+        self,
+        primary: SummaryStrategy | None = None,
+        fallback: SummaryStrategy | None = None,
+        deadline: float | None = None,
+    ):
+        self.primary = primary or LlmSummary()
+        self.fallback = fallback or ExtractiveSummary()
+        self.deadline = deadline
+
+    async def summarize(self, agent: "Agent", content: str | list[str]) -> str:
+        deadline = LLM_SUMMARY_DEADLINE if self.deadline is None else self.deadline
+        try:
+            return await asyncio.wait_for(self.primary.summarize(agent, content), deadline)
+        except asyncio.TimeoutError:
+            _count("deadline_fallbacks")
+            PrintStyle.warning(
+                f"History summary took over {deadline:.0f}s, using {self.fallback.name} summary"
+            )
+            return await self.fallback.summarize(agent, content)
+
+
+class StagedSummary:
+    """Content shrunk by the first strategy before the second one summarizes it."""
+
+    name = "staged"
+
+    def __init__(
+        self,
+        first: SummaryStrategy | None = None,
+        second: SummaryStrategy | None = None,
+        input_words: int | None = None,
+    ):
+        self.first = first or ExtractiveSummary(words=STAGED_INPUT_WORDS)
+        self.second = second or DeadlineSummary()
+        self.input_words = input_words
+
+    async def summarize(self, agent: "Agent", content: str | list[str]) -> str:
+        limit = self.input_words or STAGED_INPUT_WORDS
+        if len(_WORD.findall(_join(content))) > limit:
+            _count("staged_shrinks")
+            content = await self.first.summarize(agent, content)
+        return await self.second.summarize(agent, content)
+
+
+# named strategies, more can be registered by extensions
+STRATEGIES: dict[str, Callable[[], SummaryStrategy]] = {
+    "llm": LlmSummary,
+    "extractive": ExtractiveSummary,
+    "deadline": DeadlineSummary,
+    "staged": StagedSummary,
+}
+
+
+def get_strategy(name: str | None = None) -> SummaryStrategy:
+    name = name or SUMMARY_STRATEGY
+    if name not in STRATEGIES:
+        raise ValueError(f"Unknown history summary strategy: {name}")
+    return STRATEGIES[name]()
+
+
+async def summarize(agent: "Agent", content: str | list[str]) -> str:
+    """Summary of history records with the configured strategy."""
+    strategy = get_strategy()
+    _count("summaries")
+    return await strategy.summarize(agent, content)
+
+
+def extract_summary(text: str, words: int) -> str:
+    """The highest scoring sentences of text up to words, in their original order."""
+    sentences = [_cut(s.strip()) for s in _SENTENCE_SPLIT.split(text) if s.strip()]
+    if not sentences:
+        return ""
+    terms = [[w for w in _WORD.findall(s.lower()) if w not in _STOP_WORDS and not w.isdigit()] for s in sentences]
+    document_frequency = Counter(term for sentence_terms in terms for term in set(sentence_terms))
+    count = len(sentences)
+
+    scores: list[tuple[float, int]] = []
+    for index, sentence_terms in enumerate(terms):
+        if not sentence_terms:
+            continue
+        frequency = Counter(sentence_terms)
+        weight = sum(
+            (1 + math.log(tf)) * math.log(1 + count / document_frequency[term])
+            for term, tf in frequency.items()
+        )
+        # normalized for length, long sentences are not favoured by their size alone
+        length = max(len(sentence_terms), SENTENCE_MIN_TERMS)
+        scores.append((weight / math.sqrt(length), index))
+
+    # best first, lower ranked sentences do not fill up the rest of the budget
+    selected: list[int] = []
+    total = 0
+    for _, index in sorted(scores, key=lambda s: (-s[0], s[1])):
+        length = len(sentences[index].split())
+        if total + length > words and selected:
+            break
+        selected.append(index)
+        total += length
+    return " ".join(sentences[index] for index in sorted(selected))
+
+
+_stats_lock = threading.Lock()
+_stats: dict[str, Any] = {
+    "summaries": 0,
+    "llm": 0,
+    "llm_seconds": 0.0,
+    "max_llm_seconds": 0.0,
+    "extractive": 0,
+    "deadline_fallbacks": 0,
+    "staged_shrinks": 0,
+}
+
+
+def get_stats() -> dict[str, Any]:
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["avg_llm_seconds"] = stats["llm_seconds"] / stats["llm"] if stats["llm"] else 0
+    stats["strategy"] = SUMMARY_STRATEGY
+    return stats
+
+
+def _join(content: str | list[str]) -> str:
+    return content if isinstance(content, str) else "\n".join(content)
+
+
+def _cut(sentence: str) -> str:
+    words = sentence.split()
+    if len(words) <= SENTENCE_MAX_WORDS:
+        return sentence
+    return " ".join(words[:SENTENCE_MAX_WORDS]) + "..."
+
+
+def _count(key: str, value: int = 1):
+    with _stats_lock:
+        _stats[key] += value
+
+
+def _track_llm(seconds: float):
+    with _stats_lock:
+        _stats["llm"] += 1
+        _stats["llm_seconds"] += seconds
+        _stats["max_llm_seconds"] = max(_stats["max_llm_seconds"], seconds)
+
+
+metrics.register("history_summary", get_stats)
@@ -1,18 +1,50 @@
+import asyncio
+import fnmatch
 import glob
+import json
+import multiprocessing
 import os
 import hashlib
-from typing import Any, Dict, Literal, TypedDict
+import sqlite3
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Literal, NotRequired, TypedDict
 from langchain_community.document_loaders import (
     CSVLoader,
     PyPDFLoader,
     TextLoader,
     UnstructuredHTMLLoader,
 )
+from langchain_core.documents import Document
+from python.helpers import metrics
 from python.helpers.log import LogItem
 from python.helpers.print_style import PrintStyle
 
 text_loader_kwargs = {"autodetect_encoding": True}
 
+# Mapping file extensions to corresponding loader classes
+# Note: Using TextLoader for JSON and MD to avoid parsing issues with consolidation
+file_types_loaders = {
+    "txt": TextLoader,
+    "pdf": PyPDFLoader,
+    "csv": CSVLoader,
+    "html": UnstructuredHTMLLoader,
+    "json": TextLoader,  # Use TextLoader for better consolidation compatibility
+    "md": TextLoader,    # Use TextLoader for better consolidation compatibility
+}
+
+# import pipeline defaults
+PARSE_WORKERS = min(4, os.cpu_count() or 1)  # parser processes, 0 parses in threads
+HASH_WORKERS = 4
+QUEUE_SIZE = 16  # files buffered between stages
+EMBED_BATCH_SIZE = 256  # documents embedded and indexed together
+
+MANIFEST_FILE_NAME = "knowledge_import.db"
+HASH_BLOCK_SIZE = 1024 * 1024  # bytes read per hashing step
+CHECKSUM_ALGORITHM = "blake2b"  # unprefixed checksums are legacy md5
+
 
 class KnowledgeImport(TypedDict):
     file: str
@@ -20,51 +52,138 @@ class KnowledgeImport(TypedDict):
     ids: list[str]
     state: Literal["changed", "original", "removed"]
     documents: list[Any]
+    # stat of the file when it was last hashed, unchanged stat skips hashing
+    size: NotRequired[int]
+    mtime_ns: NotRequired[int]
+    inode: NotRequired[int]
+    # content hashes of the chunks, in the order of ids
+    chunks: NotRequired[list[str]]
+
+
+@dataclass
+class KnowledgeSource:
+    knowledge_dir: str
+    metadata: dict[str, Any]
+    filename_pattern: str = "**/*"
+    recursive: bool = True
+
+    def matches(self, file_path: str) -> bool:
+        """Whether discovery of this source would include the file."""
+        rel_path = os.path.relpath(file_path, self.knowledge_dir)
+        if rel_path.startswith(os.pardir + os.sep) or rel_path == os.pardir:
+            return False
+        if os.sep in rel_path and not (self.recursive and "**" in self.filename_pattern):
+            return False
+        name = os.path.basename(file_path)
+        return not name.startswith(".") and fnmatch.fnmatch(
+            name, self.filename_pattern.split("/")[-1]
+        )
 
 
-def calculate_checksum(file_path: str) -> str:
-    hasher = hashlib.md5()
+def calculate_checksum(file_path: str, algorithm: str = CHECKSUM_ALGORITHM) -> str:
+    hasher = hashlib.new(algorithm)
     with open(file_path, "rb") as f:
-        buf = f.read()
-        hasher.update(buf)
-    return hasher.hexdigest()
+        while block := f.read(HASH_BLOCK_SIZE):
+            hasher.update(block)
+    if algorithm == "md5":
+        return hasher.hexdigest()
+    return f"{algorithm}:{hasher.hexdigest()}"
 
 
-def load_knowledge(
-    log_item: LogItem | None,
-    knowledge_dir: str,
-    index: Dict[str, KnowledgeImport],
-    metadata: dict[str, Any] = {},
-    filename_pattern: str = "**/*",
-    recursive: bool = True,
-) -> Dict[str, KnowledgeImport]:
+def check_file(
+    file_path: str, file_data: "KnowledgeImport | None"
+) -> tuple[bool, "KnowledgeImport"]:
     """
-    Load knowledge files from a directory with change detection and metadata enhancement.
-
-    This function now includes enhanced error handling and compatibility with the
-    intelligent memory consolidation system.
+    Compare a file with its previous import, returns (changed, entry with current checksum and stat).
+    The file is only hashed when its size, mtime or inode differ from the previous import.
     """
+    stat = os.stat(file_path)
+    stat_fields = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "inode": stat.st_ino}
+    if file_data and all(file_data.get(k) == v for k, v in stat_fields.items()):
+        return False, file_data
+
+    checksum = calculate_checksum(file_path)
+    previous = file_data.get("checksum", "") if file_data else ""
+    if previous and ":" not in previous:
+        # legacy md5 checksum, compare once and upgrade
+        unchanged = calculate_checksum(file_path, "md5") == previous
+    else:
+        unchanged = checksum == previous
+
+    updated: KnowledgeImport = {
+        "file": file_path,
+        "checksum": checksum,
+        "ids": list(file_data.get("ids", [])) if file_data else [],
+        "state": "original" if unchanged else "changed",
+        "documents": [],
+        **stat_fields,  # type: ignore
+    }
+    if file_data and "chunks" in file_data:
+        updated["chunks"] = list(file_data["chunks"])
+    return not unchanged, updated
+
+
+def chunk_hash(document: Document) -> str:
+    """Hash of a chunk's content and metadata, equal hashes can keep their indexed version."""
+    hasher = hashlib.blake2b(digest_size=16)
+    hasher.update(document.page_content.encode("utf-8"))
+    hasher.update(json.dumps(document.metadata, sort_keys=True, default=str).encode("utf-8"))
+    return hasher.hexdigest()
+
 
-    # Mapping file extensions to corresponding loader classes
-    # Note: Using TextLoader for JSON and MD to avoid parsing issues with consolidation
-    file_types_loaders = {
-        "txt": TextLoader,
-        "pdf": PyPDFLoader,
-        "csv": CSVLoader,
-        "html": UnstructuredHTMLLoader,
-        "json": TextLoader,  # Use TextLoader for better consolidation compatibility
-        "md": TextLoader,    # Use TextLoader for better consolidation compatibility
+def get_file_type(file_path: str) -> str:
+    # Get file extension safely, empty for files without extension or unsupported types
+    file_parts = os.path.basename(file_path).split('.')
+    if len(file_parts) < 2:
+        return ""
+    ext = file_parts[-1].lower()
+    return ext if ext in file_types_loaders else ""
+
+
+def load_file_documents(file_path: str, ext: str, metadata: dict[str, Any]) -> list[Document]:
+    """Parse and split one knowledge file. Runs in parser processes, so it must stay picklable."""
+    loader_cls = file_types_loaders[ext]
+    loader = loader_cls(
+        file_path,
+        **(
+            text_loader_kwargs
+            if ext in ["txt", "csv", "html", "md"]
+            else {}
+        ),
+    )
+    documents = loader.load_and_split()
+
+    # Enhanced metadata for better consolidation compatibility
+    enhanced_metadata = {
+        **metadata,
+        "source_file": os.path.basename(file_path),
+        "source_path": file_path,
+        "file_type": ext,
+        "knowledge_source": True,  # Flag to distinguish from conversation memories
+        "import_timestamp": None,  # Will be set when inserted into memory
     }
 
-    cnt_files = 0
-    cnt_docs = 0
+    # Apply metadata to all documents
+    for doc in documents:
+        doc.metadata = {**doc.metadata, **enhanced_metadata}
+        doc.metadata["chunk_hash"] = chunk_hash(doc)
+    return documents
+
+
+def discover_files(
+    log_item: LogItem | None,
+    knowledge_dir: str,
+    filename_pattern: str = "**/*",
+    recursive: bool = True,
+) -> list[str] | None:
+    """List knowledge files of a directory, creating it if missing. Returns None on errors."""
 
     # Validate and create knowledge directory if needed
     if not knowledge_dir:
         if log_item:
             log_item.stream(progress="\nNo knowledge directory specified")
         PrintStyle(font_color="yellow").print("No knowledge directory specified")
-        return index
+        return None
 
     if not os.path.exists(knowledge_dir):
         try:
@@ -75,7 +194,7 @@ def load_knowledge(
                 if log_item:
                     log_item.stream(progress=f"\n{error_msg}")
                 PrintStyle(font_color="red").print(error_msg)
-                return index
+                return None
 
             if log_item:
                 log_item.stream(progress=f"\nCreated knowledge directory: {knowledge_dir}")
@@ -85,7 +204,7 @@ def load_knowledge(
             if log_item:
                 log_item.stream(progress=f"\n{error_msg}")
             PrintStyle(font_color="red").print(error_msg)
-            return index
+            return None
 
     # Final accessibility check for existing directories
     if not os.access(knowledge_dir, os.R_OK):
@@ -93,7 +212,7 @@ def load_knowledge(
         if log_item:
             log_item.stream(progress=f"\n{error_msg}")
         PrintStyle(font_color="red").print(error_msg)
-        return index
+        return None
 
     # Fetch all files in the directory with specified extensions
     try:
@@ -103,7 +222,7 @@ def load_knowledge(
         PrintStyle(font_color="red").print(f"Error scanning knowledge directory {knowledge_dir}: {e}")
         if log_item:
             log_item.stream(progress=f"\nError scanning directory: {e}")
-        return index
+        return None
 
     if kn_files:
         PrintStyle.standard(
@@ -113,98 +232,388 @@ def load_knowledge(
             log_item.stream(
                 progress=f"\nFound {len(kn_files)} knowledge files in {knowledge_dir}, processing...",
             )
+    return kn_files
 
-    for file_path in kn_files:
-        try:
-            # Get file extension safely
-            file_parts = os.path.basename(file_path).split('.')
-            if len(file_parts) < 2:
-                continue  # Skip files without extensions
-
-            ext = file_parts[-1].lower()
-            if ext not in file_types_loaders:
-                continue  # Skip unsupported file types
-
-            checksum = calculate_checksum(file_path)
-            if not checksum:
-                continue  # Skip files with checksum errors
-
-            file_key = file_path
-
-            # Load existing data from the index or create a new entry
-            file_data: KnowledgeImport = index.get(file_key, {
-                "file": file_key,
-                "checksum": "",
-                "ids": [],
-                "state": "changed",
-                "documents": []
-            })
-
-            # Check if file has changed
-            if file_data.get("checksum") == checksum:
-                file_data["state"] = "original"
-            else:
-                file_data["state"] = "changed"
-
-            # Process changed files
-            if file_data["state"] == "changed":
-                file_data["checksum"] = checksum
-                loader_cls = file_types_loaders[ext]
-
-                try:
-                    loader = loader_cls(
-                        file_path,
-                        **(
-                            text_loader_kwargs
-                            if ext in ["txt", "csv", "html", "md"]
-                            else {}
-                        ),
-                    )
-                    documents = loader.load_and_split()
-
-                    # Enhanced metadata for better consolidation compatibility
-                    enhanced_metadata = {
-                        **metadata,
-                        "source_file": os.path.basename(file_path),
-                        "source_path": file_path,
-                        "file_type": ext,
-                        "knowledge_source": True,  # Flag to distinguish from conversation memories
-                        "import_timestamp": None,  # Will be set when inserted into memory
-                    }
-
-                    # Apply metadata to all documents
-                    for doc in documents:
-                        doc.metadata = {**doc.metadata, **enhanced_metadata}
-
-                    file_data["documents"] = documents
-                    cnt_files += 1
-                    cnt_docs += len(documents)
-
-                except Exception as e:
-                    PrintStyle(font_color="red").print(f"Error loading {file_path}: {e}")
-                    if log_item:
-                        log_item.stream(progress=f"\nError loading {os.path.basename(file_path)}: {e}")
-                    continue
 
-            # Update the index
-            index[file_key] = file_data
+async def _run_concurrently(*coroutines: Awaitable[Any]) -> list[Any]:
+    """
+    Like asyncio.gather, but the first failure cancels the other coroutines, pipeline
+    stages would otherwise stay blocked on their full queues forever.
+    """
+    tasks = [asyncio.ensure_future(coroutine) for coroutine in coroutines]
+    try:
+        return await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+class KnowledgeImportPipeline:
+    """
+    Staged knowledge import: discover -> hash -> parse and split -> embed and index.
+
+    Stages run concurrently and are connected by bounded queues, so only a few files
+    worth of documents are held in memory at a time. Parsing runs in a process pool,
+    embedding and indexing in batches through the given insert/delete callbacks.
+    The returned index holds the KnowledgeImport state of every file, with ids
+    already assigned and documents released.
+    With paths given, only those files (or everything under those folders) are checked
+    and everything else in the index is left as it is.
+    """
+
+    def __init__(
+        self,
+        log_item: LogItem | None,
+        index: Dict[str, KnowledgeImport],
+        sources: list[KnowledgeSource],
+        insert_documents: Callable[[list[Document]], Awaitable[list[str]]],
+        delete_documents: Callable[[list[str]], Awaitable[Any]],
+        parse_workers: int = PARSE_WORKERS,
+        hash_workers: int = HASH_WORKERS,
+        queue_size: int = QUEUE_SIZE,
+        embed_batch_size: int = EMBED_BATCH_SIZE,
+        paths: list[str] | None = None,
+    ):
+        self.log_item = log_item
+        self.index = index
+        self.sources = sources
+        self.insert_documents = insert_documents
+        self.delete_documents = delete_documents
+        self.parse_workers = parse_workers
+        self.hash_workers = hash_workers
+        self.queue_size = queue_size
+        self.embed_batch_size = embed_batch_size
+        self.paths = paths
+        self.scope: set[str] | None = None  # files checked when limited to paths
+        self.stats: dict[str, dict[str, float]] = {
+            stage: {"items": 0, "seconds": 0.0} for stage in ["discover", "hash", "parse", "index"]
+        }
+        self.stats["hash"]["skipped"] = 0
+        self.stats["index"]["reused"] = 0
+        self._executor: Executor | None = None
+
+    async def run(self) -> Dict[str, KnowledgeImport]:
+        start = time.perf_counter()
+        hash_queue: asyncio.Queue = asyncio.Queue(self.queue_size)
+        parse_queue: asyncio.Queue = asyncio.Queue(self.queue_size)
+        index_queue: asyncio.Queue = asyncio.Queue(self.queue_size)
+        discovered: set[str] = set()
+        for file_data in self.index.values():
+            file_data["state"] = "original"  # until checked
 
+        try:
+            await _run_concurrently(
+                self._discover(hash_queue, discovered),
+                self._stage_workers(self._hash_worker, max(1, self.hash_workers), hash_queue, parse_queue),
+                self._stage_workers(self._parse_worker, max(1, self.parse_workers), parse_queue, index_queue),
+                self._index_stage(index_queue),
+            )
+        finally:
+            if self._executor:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+        # Mark removed files, their documents are removed by the caller
+        for file_key, file_data in self.index.items():
+            if file_key not in discovered and (self.scope is None or file_key in self.scope):
+                file_data["state"] = "removed"
+
+        self._report(time.perf_counter() - start)
+        return self.index
+
+    async def _discover(self, out: asyncio.Queue, discovered: set[str]):
+        if self.paths is not None:
+            await self._discover_paths(out, discovered)
+            return
+        for source in self.sources:
+            t = time.perf_counter()
+            kn_files = await asyncio.to_thread(
+                discover_files,
+                self.log_item,
+                source.knowledge_dir,
+                source.filename_pattern,
+                source.recursive,
+            )
+            self._track("discover", t, len(kn_files or []))
+            for file_path in kn_files or []:
+                if file_path in discovered or not get_file_type(file_path):
+                    continue
+                discovered.add(file_path)
+                await out.put((file_path, source.metadata))
+        await out.put(None)
+
+    async def _discover_paths(self, out: asyncio.Queue, discovered: set[str]):
+        t = time.perf_counter()
+        self.scope = await asyncio.to_thread(self._expand_paths, self.paths or [])
+        self._track("discover", t, len(self.scope))
+        for file_path in sorted(self.scope):
+            if not os.path.isfile(file_path) or not get_file_type(file_path):
+                continue
+            source = next((s for s in self.sources if s.matches(file_path)), None)
+            if source:
+                discovered.add(file_path)
+                await out.put((file_path, source.metadata))
+        await out.put(None)
+
+    def _expand_paths(self, paths: list[str]) -> set[str]:
+        # folders stand for all files inside, also the already indexed ones that are gone
+        files: set[str] = set()
+        for path in paths:
+            path = os.path.normpath(path)
+            if os.path.isdir(path):
+                files.update(
+                    f for f in glob.glob(os.path.join(path, "**/*"), recursive=True) if os.path.isfile(f)
+                )
+            else:
+                files.add(path)
+            prefix = path + os.sep
+            files.update(key for key in self.index if key.startswith(prefix))
+        return files
+
+    async def _stage_workers(self, worker, count: int, inp: asyncio.Queue, out: asyncio.Queue):
+        # run workers until the upstream end marker, then pass the marker downstream
+        done = asyncio.Event()
+
+        async def run_worker():
+            while not done.is_set():
+                item = await inp.get()
+                if item is None:
+                    done.set()
+                    await inp.put(None)  # wake up the other workers
+                    return
+                await worker(item, out)
+
+        await _run_concurrently(*[run_worker() for _ in range(count)])
+        await out.put(None)
+
+    async def _hash_worker(self, item, out: asyncio.Queue):
+        file_path, metadata = item
+        t = time.perf_counter()
+        existing = self.index.get(file_path)
+        try:
+            changed, file_data = await asyncio.to_thread(check_file, file_path, existing)
         except Exception as e:
             PrintStyle(font_color="red").print(f"Error processing {file_path}: {e}")
-            continue
+            return
+        self._track("hash", t)
+        if file_data is existing:
+            self.stats["hash"]["skipped"] += 1  # stat unchanged, not hashed
+
+        if not changed:
+            file_data["state"] = "original"
+            self.index[file_path] = file_data
+            return
+
+        # file_data is a copy, so a failed parse leaves the previous version indexed
+        if existing:
+            existing["state"] = "original"
+        await out.put((file_path, file_data, metadata))
+
+    async def _parse_worker(self, item, out: asyncio.Queue):
+        file_path, file_data, metadata = item
+        t = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            documents = await loop.run_in_executor(
+                self._get_executor(),
+                load_file_documents,
+                file_path,
+                get_file_type(file_path),
+                metadata,
+            )
+        except Exception as e:
+            PrintStyle(font_color="red").print(f"Error loading {file_path}: {e}")
+            if self.log_item:
+                self.log_item.stream(progress=f"\nError loading {os.path.basename(file_path)}: {e}")
+            return
+        self._track("parse", t)
+        file_data["documents"] = documents
+        await out.put((file_path, file_data))
+
+    async def _index_stage(self, inp: asyncio.Queue):
+        batch: list[tuple[str, KnowledgeImport]] = []
+        batch_docs = 0
+        while (item := await inp.get()) is not None:
+            batch.append(item)
+            batch_docs += len(item[1]["documents"])
+            if batch_docs >= self.embed_batch_size:
+                await self._index_batch(batch)
+                batch, batch_docs = [], 0
+        if batch:
+            await self._index_batch(batch)
+
+    async def _index_batch(self, batch: list[tuple[str, KnowledgeImport]]):
+        t = time.perf_counter()
+        # match chunks against the previous version of each file by content hash,
+        # unchanged chunks keep their ids and only the rest is deleted and embedded
+        old_ids: list[str] = []
+        documents: list[Document] = []
+        plans: list[list[str | None]] = []
+        for _, file_data in batch:
+            previous: dict[str, list[str]] = {}
+            for chunk, id in zip(file_data.get("chunks", []), file_data["ids"]):
+                previous.setdefault(chunk, []).append(id)
+            if len(file_data.get("chunks", [])) != len(file_data["ids"]):
+                previous = {}  # no usable chunk hashes, replace everything
+            plan: list[str | None] = []
+            for doc in file_data["documents"]:
+                reusable = previous.get(doc.metadata.get("chunk_hash", ""))
+                if reusable:
+                    plan.append(reusable.pop(0))
+                else:
+                    plan.append(None)
+                    documents.append(doc)
+            reused = {id for id in plan if id}
+            old_ids.extend(id for id in file_data["ids"] if id not in reused)
+            plans.append(plan)
+
+        if old_ids:
+            await self.delete_documents(old_ids)
+        inserted = iter(await self.insert_documents(documents) if documents else [])
+
+        for (file_path, file_data), plan in zip(batch, plans):
+            file_data["ids"] = [id or next(inserted) for id in plan]
+            file_data["chunks"] = [doc.metadata.get("chunk_hash", "") for doc in file_data["documents"]]
+            file_data["documents"] = []  # release parsed content
+            self.index[file_path] = file_data
+            self.stats["index"]["reused"] += sum(1 for id in plan if id)
+        self._track("index", t, len(batch))
+
+        if self.log_item:
+            self.log_item.stream(progress=f"\nIndexed {len(documents)} documents from {len(batch)} files")
+
+    def _get_executor(self) -> Executor | None:
+        if self.parse_workers <= 0:
+            return None  # default thread pool of the event loop
+        if not self._executor:
+            # spawn, the importing process runs many threads which does not mix well with fork
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.parse_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._executor
+
+    def _track(self, stage: str, started: float, items: int = 1):
+        self.stats[stage]["items"] += items
+        self.stats[stage]["seconds"] += time.perf_counter() - started
+
+    def _report(self, total_seconds: float):
+        report = {
+            stage: {
+                **values,
+                "per_second": values["items"] / values["seconds"] if values["seconds"] else 0,
+            }
+            for stage, values in self.stats.items()
+        }
+        report["total"] = {"items": len(self.index), "seconds": total_seconds, "per_second": 0}
+        metrics.register("knowledge_import/last_run", lambda: report)
+
+        summary = ", ".join(
+            f"{stage} {int(values['items'])} in {values['seconds']:.1f}s"
+            for stage, values in self.stats.items()
+        )
+        summary += f", {int(self.stats['hash']['skipped'])} unchanged by stat"
+        PrintStyle.standard(f"Knowledge import finished in {total_seconds:.1f}s ({summary})")
+        if self.log_item:
+            self.log_item.stream(progress=f"\nKnowledge import finished in {total_seconds:.1f}s")
 
-    # Mark removed files
-    current_files = set(kn_files)
-    for file_key, file_data in list(index.items()):
-        if file_key not in current_files and not file_data.get("state"):
-            index[file_key]["state"] = "removed"
 
-    # Log results
-    if cnt_files > 0 or cnt_docs > 0:
-        PrintStyle.standard(f"Processed {cnt_docs} documents from {cnt_files} files.")
-        if log_item:
-            log_item.stream(
-                progress=f"\nProcessed {cnt_docs} documents from {cnt_files} files."
-            )
+class KnowledgeManifest:
+    """
+    Persistent record of imported knowledge files: path, checksum, stat, document ids
+    and chunk hashes.
+
+    Stored in SQLite next to the memory index. Saving only writes the entries that differ
+    from what was loaded, all in one transaction, so an interrupted save never leaves
+    a partially written manifest behind.
+    """
+
+    _locks: dict[str, threading.Lock] = {}
+    _locks_lock = threading.Lock()
+
+    @staticmethod
+    def get_lock(path: str) -> threading.Lock:
+        """Lock serializing imports into one manifest, imports may run on different event loops."""
+        with KnowledgeManifest._locks_lock:
+            return KnowledgeManifest._locks.setdefault(os.path.abspath(path), threading.Lock())
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            "path TEXT PRIMARY KEY, checksum TEXT NOT NULL, ids TEXT NOT NULL, "
+            "size INTEGER, mtime_ns INTEGER, inode INTEGER, chunks TEXT)"
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(files)")}
+        if "chunks" not in columns:
+            self._conn.execute("ALTER TABLE files ADD COLUMN chunks TEXT")
+        self._loaded: dict[str, tuple] = {}
+
+    def load(self) -> Dict[str, KnowledgeImport]:
+        rows = self._conn.execute(
+            "SELECT path, checksum, ids, size, mtime_ns, inode, chunks FROM files"
+        ).fetchall()
+        self._loaded = {row[0]: row for row in rows}
+        index: Dict[str, KnowledgeImport] = {}
+        for path, checksum, ids, size, mtime_ns, inode, chunks in rows:
+            file_data: KnowledgeImport = {
+                "file": path,
+                "checksum": checksum,
+                "ids": json.loads(ids),
+                "state": "original",
+                "documents": [],
+            }
+            if size is not None:
+                file_data.update(size=size, mtime_ns=mtime_ns, inode=inode)
+            if chunks is not None:
+                file_data["chunks"] = json.loads(chunks)
+            index[path] = file_data
+        return index
 
-    return index
+    def save(self, index: Dict[str, KnowledgeImport]):
+        """Write the index, entries in state 'removed' or missing from it are deleted."""
+        rows = {
+            path: (
+                path,
+                file_data.get("checksum", ""),
+                json.dumps(file_data.get("ids", [])),
+                file_data.get("size"),
+                file_data.get("mtime_ns"),
+                file_data.get("inode"),
+                json.dumps(file_data["chunks"]) if "chunks" in file_data else None,
+            )
+            for path, file_data in index.items()
+            if file_data.get("state") != "removed"
+        }
+        upserts = [row for path, row in rows.items() if self._loaded.get(path) != row]
+        deletes = [(path,) for path in self._loaded if path not in rows]
+        if not upserts and not deletes:
+            return
+
+        self._conn.execute("BEGIN")
+        try:
+            self._conn.executemany("DELETE FROM files WHERE path = ?", deletes)
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO files (path, checksum, ids, size, mtime_ns, inode, chunks) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                upserts,
+            )
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._loaded = rows
+
+    def migrate_json(self, json_path: str):
+        """Import a legacy knowledge_import.json into the manifest and remove the file."""
+        with open(json_path, "r") as f:
+            legacy: Dict[str, KnowledgeImport] = json.load(f)
+        self.save({**self.load(), **legacy})
+        os.remove(json_path)
+
+    def close(self):
+        self._conn.close()
@@ -0,0 +1,307 @@
+import asyncio
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import threading
+import time
+from typing import Any, Awaitable, Callable
+
+from python.helpers import metrics
+from python.helpers.defer import DeferredTask
+from python.helpers.print_style import PrintStyle
+
+DEBOUNCE = 1.0  # seconds without new events before changed paths are indexed
+POLL_INTERVAL = 5.0  # seconds between scans of the polling fallback
+RETRY_INTERVAL = 10.0  # seconds before failed changes are applied again
+
+# inotify flags, see inotify(7)
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+WATCH_MASK = (
+    IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+    | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+)
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+class InotifyBackend:
+    """Recursive change notifications from the Linux kernel, via libc."""
+
+    name = "inotify"
+
+    def __init__(self, roots: list[str]):
+        if not sys.platform.startswith("linux"):
+            raise OSError("inotify is only available on Linux")
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self._fd = self._libc.inotify_init1(os.O_CLOEXEC | os.O_NONBLOCK)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._dirs: dict[int, str] = {}
+        for root in roots:
+            self._watch_tree(root)
+
+    def read(self, timeout: float) -> list[str] | None:
+        """Changed paths, empty after a timeout, None if events were lost and a rescan is needed."""
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+
+        paths: list[str] = []
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            wd, mask, _cookie, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset : offset + length].rstrip(b"\0").decode(errors="surrogateescape")
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                return None
+            if mask & IN_IGNORED:
+                self._dirs.pop(wd, None)
+                continue
+            parent = self._dirs.get(wd)
+            if parent is None:
+                continue
+            path = os.path.join(parent, name) if name else parent
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                # new folder, watch it and report what is already inside
+                paths.extend(self._watch_tree(path))
+            paths.append(path)
+        return paths
+
+    def close(self):
+        os.close(self._fd)
+
+    def _watch_tree(self, root: str) -> list[str]:
+        found: list[str] = []
+        if not os.path.isdir(root):
+            return found
+        for dir, _subdirs, file_names in os.walk(root):
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(dir), WATCH_MASK | IN_ONLYDIR)
+            if wd < 0:
+                raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {dir}")
+            self._dirs[wd] = dir
+            found.extend(os.path.join(dir, name) for name in file_names)
+        return found
+
+
+class PollingBackend:
+    """Fallback that compares periodic stat snapshots of the watched trees."""
+
+    name = "polling"
+
+    def __init__(self, roots: list[str], interval: float = POLL_INTERVAL):
+        self.roots = roots
+        self.interval = interval
+        self._snapshot = self._scan()
+        self._next = time.monotonic() + interval
+
+    def read(self, timeout: float) -> list[str] | None:
+        wait = self._next - time.monotonic()
+        if wait > timeout:
+            time.sleep(timeout)
+            return []
+        time.sleep(max(0, wait))
+        self._next = time.monotonic() + self.interval
+        snapshot = self._scan()
+        changed = [
+            path
+            for path in snapshot.keys() | self._snapshot.keys()
+            if snapshot.get(path) != self._snapshot.get(path)
+        ]
+        self._snapshot = snapshot
+        return changed
+
+    def close(self):
+        pass
+
+    def _scan(self) -> dict[str, tuple[int, int, int]]:
+        snapshot = {}
+        for root in self.roots:
+            for dir, _subdirs, file_names in os.walk(root):
+                for name in file_names:
+                    path = os.path.join(dir, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    snapshot[path] = (stat.st_size, stat.st_mtime_ns, stat.st_ino)
+        return snapshot
+
+
+def create_backend(roots: list[str]) -> InotifyBackend | PollingBackend:
+    try:
+        return InotifyBackend(roots)
+    except (OSError, AttributeError) as e:
+        PrintStyle.warning(f"Knowledge watcher falls back to polling: {e}")
+        return PollingBackend(roots)
+
+
+class KnowledgeWatcher:
+    """
+    Watches the knowledge folders of one memory subdir and indexes changes as they happen.
+
+    Events are debounced, so a file being written is indexed once after it settles.
+    Changed paths are handed to the apply callback, which re-imports just those files
+    (deleted paths and folders included). While the watcher runs and has nothing pending,
+    its memory is current and reloading it needs no full knowledge rescan.
+    """
+
+    watchers: dict[str, "KnowledgeWatcher"] = {}
+    _lock = threading.Lock()
+
+    @staticmethod
+    def start(
+        memory_subdir: str,
+        roots: list[str],
+        apply: Callable[[list[str]], Awaitable[Any]],
+    ) -> "KnowledgeWatcher":
+        with KnowledgeWatcher._lock:
+            watcher = KnowledgeWatcher.watchers.get(memory_subdir)
+            if watcher and watcher.roots == roots and not watcher._stopped.is_set():
+                watcher.apply = apply
+                return watcher
+            if watcher:
+                watcher.stop()
+            watcher = KnowledgeWatcher(memory_subdir, roots, apply)
+            KnowledgeWatcher.watchers[memory_subdir] = watcher
+        watcher.task = DeferredTask(thread_name="KnowledgeWatcher").start_task(watcher.run)
+        return watcher
+
+    @staticmethod
+    def stop_watching(memory_subdir: str):
+        with KnowledgeWatcher._lock:
+            watcher = KnowledgeWatcher.watchers.pop(memory_subdir, None)
+        if watcher:
+            watcher.stop()
+
+    @staticmethod
+    def is_current(memory_subdir: str) -> bool:
+        watcher = KnowledgeWatcher.watchers.get(memory_subdir)
+        return bool(watcher and watcher.running and not watcher.pending and not watcher.applying)
+
+    def __init__(
+        self,
+        memory_subdir: str,
+        roots: list[str],
+        apply: Callable[[list[str]], Awaitable[Any]],
+        debounce: float = DEBOUNCE,
+    ):
+        self.memory_subdir = memory_subdir
+        self.roots = roots
+        self.apply = apply
+        self.debounce = debounce
+        self.pending: dict[str, float] = {}  # path -> time of its first unapplied event
+        self.applying = False
+        self.running = False
+        self.task: DeferredTask | None = None
+        self._stopped = threading.Event()
+        self._last_event = 0.0
+        self._retry_at = 0.0
+
+        self.backend_name = ""
+        self.events = 0
+        self.applied = 0
+        self.failures = 0
+        self.lag_last = 0.0
+        self.lag_max = 0.0
+        metrics.register(f"knowledge_watcher/{memory_subdir}", self.get_stats)
+
+    def get_stats(self) -> dict[str, Any]:
+        now = time.monotonic()
+        return {
+            "backend": self.backend_name,
+            "running": self.running,
+            "queue_depth": len(self.pending),
+            "oldest_pending_s": now - min(self.pending.values()) if self.pending else 0,
+            "events": self.events,
+            "applied": self.applied,
+            "failures": self.failures,
+            "lag_last_s": self.lag_last,
+            "lag_max_s": self.lag_max,
+        }
+
+    def stop(self):
+        self._stopped.set()
+        self.running = False
+
+    async def run(self):
+        backend = None
+        try:
+            backend = await asyncio.to_thread(create_backend, self.roots)
+            self.backend_name = backend.name
+            self.running = True
+            while not self._stopped.is_set():
+                paths = await asyncio.to_thread(backend.read, self._wait_time())
+                now = time.monotonic()
+                if paths is None:
+                    # kernel queue overflowed, everything under the roots may have changed
+                    paths = list(self.roots)
+                if paths:
+                    self.events += len(paths)
+                    self._last_event = now
+                    for path in paths:
+                        self.pending.setdefault(path, now)
+                if self._due(now):
+                    await self._flush()
+        except Exception as e:
+            PrintStyle.error(f"Knowledge watcher of '{self.memory_subdir}' stopped: {e}")
+        finally:
+            self.running = False
+            if backend:
+                backend.close()
+            if KnowledgeWatcher.watchers.get(self.memory_subdir) in (None, self):
+                metrics.unregister(f"knowledge_watcher/{self.memory_subdir}")
+
+    def _wait_time(self) -> float:
+        if not self.pending:
+            return self.debounce * 5
+        # until the debounce window closes and failed changes are due again
+        due = max(self._last_event + self.debounce, self._retry_at)
+        return max(0.05, min(self.debounce * 5, due - time.monotonic()))
+
+    def _due(self, now: float) -> bool:
+        return (
+            bool(self.pending)
+            and now - self._last_event >= self.debounce
+            and now >= self._retry_at
+        )
+
+    async def _flush(self):
+        batch = dict(self.pending)
+        self.applying = True
+        try:
+            await self.apply(sorted(batch))
+        except Exception as e:
+            self.failures += 1
+            self._retry_at = time.monotonic() + RETRY_INTERVAL
+            PrintStyle.error(f"Knowledge watcher failed to index changes, retrying: {e}")
+            return
+        finally:
+            self.applying = False
+
+        done = time.monotonic()
+        for path, first_seen in batch.items():
+            if self.pending.get(path) == first_seen:
+                del self.pending[path]  # not touched again while applying
+        self.applied += len(batch)
+        self.lag_last = done - min(batch.values())
+        self.lag_max = max(self.lag_max, self.lag_last)
@@ -43,6 +43,15 @@ from python.helpers.print_style import PrintStyle
 from python.helpers.tool import Tool, Response
 
 
+# incremented whenever servers or their tools change, cached tools prompts are rendered again
+_tools_version = 0
+
+
+def _tools_changed():
+    global _tools_version
+    _tools_version += 1
+
+
 def normalize_name(name: str) -> str:
     # Lowercase and strip whitespace
     name = name.strip().lower()
@@ -615,6 +624,9 @@ class MCPConfig(BaseModel):
                     {"config": server_item, "error": error_msg, "name": server_name}
                 )
 
+        # servers replaced
+        _tools_changed()
+
     def get_server_log(self, server_name: str) -> str:
         with self.__lock:
             for server in self.servers:
@@ -684,6 +696,10 @@ class MCPConfig(BaseModel):
         with self.__lock:
             return self.__initialized
 
+    def get_tools_version(self) -> int:
+        """Version of the servers and their tools, changes whenever the tools prompt can"""
+        return _tools_version
+
     def get_tools(self) -> List[dict[str, dict[str, Any]]]:
         """Get all tools from all servers"""
         with self.__lock:
@@ -884,6 +900,7 @@ class MCPClientBase(ABC):
                     }
                     for tool in response.tools
                 ]
+                _tools_changed()
             PrintStyle(font_color="green").print(
                 f"MCPClientBase ({self.server.name}): Tools updated. Found {len(self.tools)} tools."
             )
@@ -906,6 +923,7 @@ class MCPClientBase(ABC):
             )
             with self.__lock:
                 self.tools = []  # Ensure tools are cleared on failure
+                _tools_changed()
                 self.error = f"Failed to initialize. {error_text[:200]}{'...' if len(error_text) > 200 else ''}"  # store error from tools fetch
         return self
 
@@ -1,8 +1,11 @@
+import asyncio
+import threading
 from datetime import datetime
 from typing import Any, List, Sequence
-from langchain_classic.storage import InMemoryByteStore, LocalFileStore
-from langchain_classic.embeddings import CacheBackedEmbeddings
 from python.helpers import guids
+from python.helpers import embedding_cache, embedding_batcher, memory_docstore, memory_quantization
+from python.helpers.memory_docstore import SQLiteDocstore
+from python.helpers.memory_quantization import ExactVectorStore
 
 # from langchain_chroma import Chroma
 from langchain_community.vectorstores import FAISS
@@ -17,7 +20,10 @@ from langchain_community.vectorstores.utils import (
 )
 
 import os
+import re
 import json
+import base64
+import operator
 
 import numpy as np
 
@@ -25,6 +31,8 @@ from python.helpers.print_style import PrintStyle
 from . import files
 from langchain_core.documents import Document
 from python.helpers import knowledge_import
+from python.helpers.knowledge_watcher import KnowledgeWatcher
+from python.helpers.defer import DeferredTask
 from python.helpers.log import LogItem
 from enum import Enum
 from agent import Agent, AgentContext
@@ -36,18 +44,145 @@ from simpleeval import simple_eval
 # Raise the log level so WARNING messages aren't shown
 logging.getLogger("langchain_core.vectorstores.base").setLevel(logging.ERROR)
 
+# size limit of the persistent embeddings cache, least recently used entries are evicted beyond it
+EMBEDDING_CACHE_MAX_BYTES = 2 * 1024 * 1024 * 1024
+# reciprocal rank fusion constant of hybrid search, damps the weight of top ranks
+RRF_K = 60
+
 
 class MyFaiss(FAISS):
+    # full precision vectors of a quantized index, None for float32 indexes
+    exact: ExactVectorStore | None = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # held while documents are added or deleted, the re-embedding job reads from another thread
+        self._docs_lock = threading.RLock()
+
     # override aget_by_ids
     def get_by_ids(self, ids: Sequence[str], /) -> List[Document]:
+        ids = ids if isinstance(ids, list) else [ids]  # type: ignore
+        if isinstance(self.docstore, SQLiteDocstore):
+            return self.docstore.mget(ids)
         # return all self.docstore._dict[id] in ids
-        return [self.docstore._dict[id] for id in (ids if isinstance(ids, list) else [ids]) if id in self.docstore._dict]  # type: ignore
+        return [self.docstore._dict[id] for id in ids if id in self.docstore._dict]  # type: ignore
 
     async def aget_by_ids(self, ids: Sequence[str], /) -> List[Document]:
         return self.get_by_ids(ids)
 
-    def get_all_docs(self):
-        return self.docstore._dict  # type: ignore
+    def get_all_docs(self) -> dict[str, Document]:
+        """Snapshot of all documents, safe to iterate while documents are added or deleted."""
+        if isinstance(self.docstore, SQLiteDocstore):
+            return dict(self.docstore.items())
+        with self._docs_lock:
+            return dict(self.docstore._dict)  # type: ignore
+
+    # all additions go through add_embeddings, so exact vectors are kept for every document
+    def add_texts(self, texts, metadatas=None, ids=None, **kwargs) -> List[str]:
+        texts = list(texts)
+        embeddings = self._embed_documents(texts)
+        return self.add_embeddings(zip(texts, embeddings), metadatas, ids, **kwargs)
+
+    async def aadd_texts(self, texts, metadatas=None, ids=None, **kwargs) -> List[str]:
+        texts = list(texts)
+        embeddings = await self._aembed_documents(texts)
+        return self.add_embeddings(zip(texts, embeddings), metadatas, ids, **kwargs)
+
+    def add_embeddings(self, text_embeddings, metadatas=None, ids=None, **kwargs) -> List[str]:
+        text_embeddings = list(text_embeddings)
+        with self._docs_lock:
+            ids = super().add_embeddings(text_embeddings, metadatas, ids, **kwargs)
+            if self.exact is not None:
+                self.exact.add(ids, np.array([e for _, e in text_embeddings], dtype=np.float32))
+        return ids
+
+    def delete(self, ids: List[str] | None = None, **kwargs) -> bool | None:
+        with self._docs_lock:
+            result = super().delete(ids, **kwargs)
+            if self.exact is not None and ids:
+                self.exact.delete(ids)
+        return result
+
+    def update_embeddings(self, text_embeddings, metadatas, ids: List[str]) -> List[str]:
+        """
+        Replace documents and their vectors in one step.
+
+        Documents of a SQLite docstore are upserted in a single transaction, they are
+        never missing from the store between removing the old vectors and adding the new.
+        """
+        text_embeddings = list(text_embeddings)
+        with self._docs_lock:
+            replaced = set(ids)
+            positions = [pos for pos, id in self.index_to_docstore_id.items() if id in replaced]
+            self.index.remove_ids(np.array(positions, dtype=np.int64))
+            remaining = [id for _, id in sorted(self.index_to_docstore_id.items()) if id not in replaced]
+            self.index_to_docstore_id = dict(enumerate(remaining))
+            if not isinstance(self.docstore, SQLiteDocstore):
+                # the in-memory docstore does not overwrite documents
+                self.docstore.delete([id for id in ids if id in self.docstore._dict])  # type: ignore
+            # add of the SQLite docstore upserts, exact vectors are replaced by id
+            return self.add_embeddings(text_embeddings, metadatas, ids)
+
+    def search_index(self, vectors: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        """Search the index like faiss, candidates of a quantized index are re-ranked by exact vectors."""
+        if self.exact is None:
+            return self.index.search(vectors, k)
+        _, candidates = self.index.search(vectors, memory_quantization.candidate_count(self.index, k))
+        return memory_quantization.rerank(vectors, candidates, k, self.get_vectors)
+
+    def get_vectors(self, positions: list[int]) -> np.ndarray:
+        """Stored vectors at index positions, exact where available."""
+        ids = [self.index_to_docstore_id[pos] for pos in positions]
+        exact = self.exact.get(ids) if self.exact is not None else {}
+        return np.stack([
+            exact[id] if id in exact else self.index.reconstruct(int(pos))
+            for id, pos in zip(ids, positions)
+        ]).astype(np.float32)
+
+    def similarity_search_with_score_by_vector(
+        self, embedding, k: int = 4, filter=None, fetch_k: int = 20, **kwargs
+    ) -> List[tuple[Document, float]]:
+        if self.exact is None:
+            return super().similarity_search_with_score_by_vector(embedding, k, filter, fetch_k, **kwargs)
+        # same as FAISS, with re-ranked candidates
+        vector = np.array([embedding], dtype=np.float32)
+        scores, indices = self.search_index(vector, k if filter is None else fetch_k)
+        filter_func = self._create_filter_func(filter) if filter is not None else None
+        docs = []
+        for score, i in zip(scores[0], indices[0]):
+            if i == -1:
+                continue
+            doc = self.docstore.search(self.index_to_docstore_id[i])
+            if not isinstance(doc, Document):
+                raise ValueError(f"Could not find document for id {self.index_to_docstore_id[i]}, got {doc}")
+            if filter_func is None or filter_func(doc.metadata):
+                docs.append((doc, float(score)))
+
+        score_threshold = kwargs.get("score_threshold")
+        if score_threshold is not None:
+            cmp = (
+                operator.ge
+                if self.distance_strategy
+                in (DistanceStrategy.MAX_INNER_PRODUCT, DistanceStrategy.JACCARD)
+                else operator.le
+            )
+            docs = [(doc, score) for doc, score in docs if cmp(score, score_threshold)]
+        return docs[:k]
+
+    @classmethod
+    def load_local(cls, folder_path: str, embeddings, index_name: str = "index", **kwargs):
+        db = super().load_local(folder_path, embeddings, index_name, **kwargs)
+        if isinstance(db.docstore, SQLiteDocstore):
+            # documents live next to the index, unless the folder only holds a
+            # checkpoint of an index sharing its documents (memory re-embedding)
+            local = os.path.join(folder_path, memory_docstore.DB_FILE_NAME)
+            if os.path.exists(local) or not os.path.exists(db.docstore.path):
+                db.docstore.set_path(local)
+        if memory_quantization.storage_mode(db.index) != memory_quantization.FLOAT32:
+            db.exact = ExactVectorStore(
+                os.path.join(folder_path, memory_quantization.VECTORS_FILE_NAME)
+            )
+        return db
 
 
 class Memory:
@@ -59,34 +194,115 @@ class Memory:
         INSTRUMENTS = "instruments"
 
     index: dict[str, "MyFaiss"] = {}
+    embeddings_store: embedding_cache.EmbeddingCacheStore | None = None
+
+    # background initializations by memory subdir, and events set once their index is searchable
+    warmups: dict[str, DeferredTask] = {}
+    warmups_ready: dict[str, threading.Event] = {}
 
     @staticmethod
     async def get(agent: Agent):
+        memory_subdir = get_agent_memory_subdir(agent)
+        if Memory.index.get(memory_subdir) is None or Memory.is_warming(memory_subdir):
+            # wait for the complete initialization, including knowledge
+            await Memory.warm_up(agent).result()
+        return Memory(
+            db=Memory.index[memory_subdir],
+            memory_subdir=memory_subdir,
+        )
+
+    @staticmethod
+    async def get_ready(agent: Agent, timeout: float) -> "Memory | None":
+        """
+        Memory of the agent as soon as its index is searchable, waiting at most timeout seconds.
+        Knowledge may still be loading (see is_warming), None if the index is not loaded in time.
+        """
         memory_subdir = get_agent_memory_subdir(agent)
         if Memory.index.get(memory_subdir) is None:
-            log_item = agent.context.log.log(
-                type="util",
-                heading=f"Initializing VectorDB in '/{memory_subdir}'",
-            )
-            db, created = Memory.initialize(
-                log_item,
-                agent.config.embeddings_model,
-                memory_subdir,
-                False,
-            )
-            Memory.index[memory_subdir] = db
-            wrap = Memory(db, memory_subdir=memory_subdir)
-            knowledge_subdirs = get_knowledge_subdirs_by_memory_subdir(
-                memory_subdir, agent.config.knowledge_subdirs or []
-            )
-            if knowledge_subdirs:
-                await wrap.preload_knowledge(log_item, knowledge_subdirs, memory_subdir)
-            return wrap
-        else:
-            return Memory(
-                db=Memory.index[memory_subdir],
-                memory_subdir=memory_subdir,
-            )
+            Memory.warm_up(agent)
+            ready = Memory.warmups_ready.get(memory_subdir)
+            if ready:
+                await asyncio.to_thread(ready.wait, timeout)
+        db = Memory.index.get(memory_subdir)
+        return Memory(db=db, memory_subdir=memory_subdir) if db else None
+
+    @staticmethod
+    def is_warming(memory_subdir: str) -> bool:
+        task = Memory.warmups.get(memory_subdir)
+        return bool(task and not task.is_ready())
+
+    @staticmethod
+    def warm_up(agent: Agent) -> DeferredTask:
+        """Start initializing the agent's memory in the background, if not loaded or loading yet."""
+        memory_subdir = get_agent_memory_subdir(agent)
+        task = Memory.warmups.get(memory_subdir)
+        if task and (Memory.is_warming(memory_subdir) or Memory.index.get(memory_subdir)):
+            return task
+        log_item = agent.context.log.log(
+            type="util",
+            heading=f"Initializing VectorDB in '/{memory_subdir}'",
+        )
+        knowledge_subdirs = get_knowledge_subdirs_by_memory_subdir(
+            memory_subdir, agent.config.knowledge_subdirs or []
+        )
+        return Memory._start_warmup(
+            memory_subdir, agent.config.embeddings_model, knowledge_subdirs, log_item
+        )
+
+    @staticmethod
+    def warm_up_subdir(memory_subdir: str, log_item: LogItem | None = None) -> DeferredTask:
+        """Background initialization of a memory subdir with the default agent configuration."""
+        task = Memory.warmups.get(memory_subdir)
+        if task and (Memory.is_warming(memory_subdir) or Memory.index.get(memory_subdir)):
+            return task
+        import initialize
+
+        agent_config = initialize.initialize_agent()
+        knowledge_subdirs = get_knowledge_subdirs_by_memory_subdir(
+            memory_subdir, agent_config.knowledge_subdirs or []
+        )
+        return Memory._start_warmup(
+            memory_subdir, agent_config.embeddings_model, knowledge_subdirs, log_item
+        )
+
+    @staticmethod
+    def _start_warmup(
+        memory_subdir: str,
+        model_config: models.ModelConfig,
+        knowledge_subdirs: list[str],
+        log_item: LogItem | None,
+    ) -> DeferredTask:
+        ready = threading.Event()
+        if Memory.index.get(memory_subdir) is not None:
+            ready.set()
+        Memory.warmups_ready[memory_subdir] = ready
+
+        async def warm_up():
+            try:
+                if Memory.index.get(memory_subdir) is None:
+                    db, _created = Memory.initialize(
+                        log_item, model_config, memory_subdir, False
+                    )
+                    Memory.index[memory_subdir] = db  # searchable from now on
+                ready.set()
+                if knowledge_subdirs:
+                    # a running watcher with nothing pending means knowledge is indexed already
+                    current = KnowledgeWatcher.is_current(memory_subdir)
+                    Memory._watch_knowledge(memory_subdir, knowledge_subdirs)
+                    if not current:
+                        wrap = Memory(Memory.index[memory_subdir], memory_subdir=memory_subdir)
+                        await wrap.preload_knowledge(log_item, knowledge_subdirs, memory_subdir)
+            except Exception:
+                # let the next access try again
+                if Memory.warmups.get(memory_subdir) is task:
+                    del Memory.warmups[memory_subdir]
+                raise
+            finally:
+                ready.set()
+
+        task = DeferredTask(thread_name="MemoryInit")
+        Memory.warmups[memory_subdir] = task
+        return task.start_task(warm_up)
 
     @staticmethod
     async def get_by_subdir(
@@ -94,6 +310,13 @@ class Memory:
         log_item: LogItem | None = None,
         preload_knowledge: bool = True,
     ):
+        if preload_knowledge and (
+            not Memory.index.get(memory_subdir) or Memory.is_warming(memory_subdir)
+        ):
+            await Memory.warm_up_subdir(memory_subdir, log_item).result()
+        elif not Memory.index.get(memory_subdir) and Memory.is_warming(memory_subdir):
+            # loading in the background already, the index is enough without knowledge
+            await asyncio.to_thread(Memory.warmups_ready[memory_subdir].wait)
         if not Memory.index.get(memory_subdir):
             import initialize
 
@@ -105,23 +328,19 @@ class Memory:
                 memory_subdir=memory_subdir,
                 in_memory=False,
             )
-            wrap = Memory(db, memory_subdir=memory_subdir)
-            if preload_knowledge:
-                knowledge_subdirs = get_knowledge_subdirs_by_memory_subdir(
-                    memory_subdir, agent_config.knowledge_subdirs or []
-                )
-                if knowledge_subdirs:
-                    await wrap.preload_knowledge(
-                        log_item, knowledge_subdirs, memory_subdir
-                    )
             Memory.index[memory_subdir] = db
         return Memory(db=Memory.index[memory_subdir], memory_subdir=memory_subdir)
 
     @staticmethod
-    async def reload(agent: Agent):
+    async def reload(agent: Agent, rescan: bool = True):
         memory_subdir = get_agent_memory_subdir(agent)
+        if Memory.is_warming(memory_subdir):
+            await Memory.warmups[memory_subdir].result()  # do not reload mid-initialization
         if Memory.index.get(memory_subdir):
             del Memory.index[memory_subdir]
+        if rescan:
+            # restarting the watcher forces a full knowledge scan
+            KnowledgeWatcher.stop_watching(memory_subdir)
         return await Memory.get(agent)
 
     @staticmethod
@@ -146,24 +365,16 @@ class Memory:
         os.makedirs(db_dir, exist_ok=True)
 
         if in_memory:
-            store = InMemoryByteStore()
+            store = embedding_cache.EmbeddingCacheStore()
         else:
-            os.makedirs(em_dir, exist_ok=True)
-            store = LocalFileStore(em_dir)
+            store = Memory._get_embedding_cache(em_dir)
 
-        embeddings_model = models.get_embedding_model(
+        embedder = Memory._create_embedder(
             model_config.provider,
             model_config.name,
+            store,
             **model_config.build_kwargs(),
         )
-        embeddings_model_id = files.safe_file_name(
-            model_config.provider + "_" + model_config.name
-        )
-
-        # here we setup the embeddings model with the chosen cache storage
-        embedder = CacheBackedEmbeddings.from_bytes_store(
-            embeddings_model, store, namespace=embeddings_model_id
-        )
 
         # initial DB and docs variables
         db: MyFaiss | None = None
@@ -171,19 +382,21 @@ class Memory:
 
         created = False
 
+        # complete a swap of a re-embedded index interrupted by a crash
+        from python.helpers.memory_reembed import finish_swap
+
+        finish_swap(db_dir)
+
         # if db folder exists and is not empty:
         if os.path.exists(db_dir) and files.exists(db_dir, "index.faiss"):
-            db = MyFaiss.load_local(
-                folder_path=db_dir,
-                embeddings=embedder,
-                allow_dangerous_deserialization=True,
-                distance_strategy=DistanceStrategy.COSINE,
-                # normalize_L2=True,
-                relevance_score_fn=Memory._cosine_normalizer,
-            )  # type: ignore
+            db = Memory.load_db(db_dir, embedder)
+            if not in_memory:
+                Memory._use_sqlite_docstore(db, db_dir, memory_subdir)
+                Memory._use_vector_storage(db, db_dir, memory_subdir)
 
             # if there is a mismatch in embeddings used, re-index the whole DB
             emb_ok = False
+            embedding_set = None
             emb_set_file = files.get_abs_path(db_dir, "embedding.json")
             if files.exists(emb_set_file):
                 embedding_set = json.loads(files.read_file(emb_set_file))
@@ -194,6 +407,23 @@ class Memory:
                     # model matches
                     emb_ok = True
 
+            # re-embed in background while the old index keeps serving with the previous model
+            if db and not emb_ok and embedding_set and not in_memory:
+                old_embedder = Memory._get_previous_embedder(embedding_set, store, db)
+                if old_embedder:
+                    from python.helpers.memory_reembed import ReembedJob
+
+                    db.embedding_function = old_embedder
+                    ReembedJob.start(
+                        memory_subdir,
+                        db,
+                        embedder,
+                        model_config.provider,
+                        model_config.name,
+                        log_item,
+                    )
+                    return db, False
+
             # re-index -  create new DB and insert existing docs
             if db and not emb_ok:
                 docs = db.get_all_docs()
@@ -201,17 +431,11 @@ class Memory:
 
         # DB not loaded, create one
         if not db:
-            index = faiss.IndexFlatIP(len(embedder.embed_query("example")))
-
-            db = MyFaiss(
-                embedding_function=embedder,
-                index=index,
-                docstore=InMemoryDocstore(),
-                index_to_docstore_id={},
-                distance_strategy=DistanceStrategy.COSINE,
-                # normalize_L2=True,
-                relevance_score_fn=Memory._cosine_normalizer,
-            )
+            docstore = None
+            if not in_memory:
+                docstore = SQLiteDocstore(os.path.join(db_dir, memory_docstore.DB_FILE_NAME))
+                docstore.clear()  # documents to keep are in docs
+            db = Memory.create_db(embedder, docstore)
 
             # insert docs if reindexing
             if docs:
@@ -220,6 +444,9 @@ class Memory:
                     log_item.stream(progress="\nIndexing memories")
                 db.add_documents(documents=list(docs.values()), ids=list(docs.keys()))
 
+            if not in_memory:
+                Memory._use_vector_storage(db, db_dir, memory_subdir, save=False)
+
             # save DB
             Memory._save_db_file(db, memory_subdir)
             # save meta file
@@ -238,6 +465,146 @@ class Memory:
 
         return db, created
 
+    @staticmethod
+    def _create_embedder(provider: str, name: str, store, **kwargs):
+        embeddings_model = models.get_embedding_model(provider, name, **kwargs)
+        embeddings_model_id = files.safe_file_name(provider + "_" + name)
+        # coalesce concurrent embedding calls of all contexts into batches
+        embeddings_model = embedding_batcher.batched(embeddings_model, embeddings_model_id)
+
+        # here we setup the embeddings model with the chosen cache storage
+        return embedding_cache.create_cached_embeddings(
+            embeddings_model, store, namespace=embeddings_model_id
+        )
+
+    @staticmethod
+    def _get_previous_embedder(embedding_set: dict, store, db: MyFaiss):
+        # the model the stored index was built with, if it is still usable
+        try:
+            embedder = Memory._create_embedder(
+                embedding_set["model_provider"], embedding_set["model_name"], store
+            )
+            if len(embedder.embed_query("example")) != db.index.d:
+                return None
+            return embedder
+        except Exception as e:
+            PrintStyle.error(f"Previous embedding model not available, re-indexing in place: {e}")
+            return None
+
+    @staticmethod
+    def create_db(embedder, docstore: SQLiteDocstore | None = None) -> MyFaiss:
+        index = faiss.IndexFlatIP(len(embedder.embed_query("example")))
+        return MyFaiss(
+            embedding_function=embedder,
+            index=index,
+            docstore=docstore if docstore is not None else InMemoryDocstore(),
+            index_to_docstore_id={},
+            distance_strategy=DistanceStrategy.COSINE,
+            # normalize_L2=True,
+            relevance_score_fn=Memory._cosine_normalizer,
+        )
+
+    @staticmethod
+    def load_db(folder_path: str, embedder) -> MyFaiss:
+        return MyFaiss.load_local(
+            folder_path=folder_path,
+            embeddings=embedder,
+            allow_dangerous_deserialization=True,
+            distance_strategy=DistanceStrategy.COSINE,
+            # normalize_L2=True,
+            relevance_score_fn=Memory._cosine_normalizer,
+        )  # type: ignore
+
+    @staticmethod
+    def _use_sqlite_docstore(db: MyFaiss, db_dir: str, memory_subdir: str):
+        if isinstance(db.docstore, SQLiteDocstore):
+            # drop what an interrupted save left inconsistent between index and documents
+            missing = db.docstore.reconcile(db.index_to_docstore_id.values())
+            if missing:
+                PrintStyle.error(f"Removing {len(missing)} memories without stored documents")
+                db.delete(ids=missing)
+                Memory._save_db_file(db, memory_subdir)
+            return
+        # move documents of a legacy in-memory docstore to disk
+        docstore = SQLiteDocstore(os.path.join(db_dir, memory_docstore.DB_FILE_NAME))
+        docstore.clear()
+        docstore.add(db.get_all_docs())
+        db.docstore = docstore
+        Memory._save_db_file(db, memory_subdir)
+
+    @staticmethod
+    def _use_vector_storage(db: MyFaiss, db_dir: str, memory_subdir: str, save: bool = True):
+        current = memory_quantization.storage_mode(db.index)
+        mode = memory_quantization.resolve_mode(
+            Memory._get_vector_storage(memory_subdir), current, db.index.ntotal
+        )
+        ids = [db.index_to_docstore_id[pos] for pos in range(db.index.ntotal)]
+        if mode == current:
+            if db.exact is not None:
+                # vectors left by an interrupted save, or missing after one
+                stored = set(db.exact.ids())
+                orphans = list(stored - set(ids))
+                if orphans:
+                    db.exact.delete(orphans)
+                missing = [pos for pos, id in enumerate(ids) if id not in stored]
+                if missing:
+                    db.exact.add([ids[pos] for pos in missing], db.get_vectors(missing))
+            return
+
+        # rebuild the index in the configured storage mode, from the most precise vectors at hand
+        PrintStyle.standard(f"Converting memory vectors of '{memory_subdir}' from {current} to {mode}")
+        vectors = (
+            db.get_vectors(list(range(db.index.ntotal)))
+            if db.index.ntotal
+            else np.zeros((0, db.index.d), dtype=np.float32)
+        )
+        index = memory_quantization.create_index(mode, db.index.d, vectors)
+        if len(vectors):
+            index.add(vectors)
+        vectors_file = os.path.join(db_dir, memory_quantization.VECTORS_FILE_NAME)
+        if mode != memory_quantization.FLOAT32:
+            exact = db.exact or ExactVectorStore(vectors_file)
+            exact.clear()
+            exact.add(ids, vectors)
+            db.index, db.exact = index, exact
+            if save:
+                Memory._save_db_file(db, memory_subdir)
+        else:
+            exact, db.index, db.exact = db.exact, index, None
+            if save:
+                Memory._save_db_file(db, memory_subdir)
+            if exact is not None:
+                exact.close()
+            for suffix in ["", "-wal", "-shm"]:
+                if os.path.exists(vectors_file + suffix):
+                    os.remove(vectors_file + suffix)
+
+    @staticmethod
+    def _get_vector_storage(memory_subdir: str) -> str:
+        from python.helpers import settings
+
+        storage = settings.get_settings().get("memory_vector_storage") or {}
+        mode = str(storage.get(memory_subdir, storage.get("*", memory_quantization.FLOAT32)))
+        if mode not in memory_quantization.MODES:
+            PrintStyle.error(f"Unknown vector storage '{mode}' for memory '{memory_subdir}', using float32")
+            return memory_quantization.FLOAT32
+        return mode
+
+    @staticmethod
+    def _get_embedding_cache(em_dir: str) -> embedding_cache.EmbeddingCacheStore:
+        # one packed cache shared by all memory subdirs, keys are namespaced by model
+        if Memory.embeddings_store is None:
+            store = embedding_cache.EmbeddingCacheStore(
+                os.path.join(em_dir, embedding_cache.DB_FILE_NAME),
+                max_bytes=EMBEDDING_CACHE_MAX_BYTES,
+            )
+            # move entries of the legacy one-file-per-vector cache into the packed store
+            migrated = embedding_cache.migrate_file_store(em_dir, store)
+            if migrated:
+                PrintStyle.standard(f"Migrated {migrated} cached embeddings")
+            Memory.embeddings_store = store
+        return Memory.embeddings_store
+
     def __init__(
         self,
         db: MyFaiss,
@@ -247,7 +614,11 @@ class Memory:
         self.memory_subdir = memory_subdir
 
     async def preload_knowledge(
-        self, log_item: LogItem | None, kn_dirs: list[str], memory_subdir: str
+        self,
+        log_item: LogItem | None,
+        kn_dirs: list[str],
+        memory_subdir: str,
+        paths: list[str] | None = None,
     ):
         if log_item:
             log_item.update(heading="Preloading knowledge...")
@@ -255,88 +626,171 @@ class Memory:
         # db abs path
         db_dir = abs_db_dir(memory_subdir)
 
-        # Load the index file if it exists
-        index_path = files.get_abs_path(db_dir, "knowledge_import.json")
-
         # make sure directory exists
         if not os.path.exists(db_dir):
             os.makedirs(db_dir)
 
-        index: dict[str, knowledge_import.KnowledgeImport] = {}
-        if os.path.exists(index_path):
-            with open(index_path, "r") as f:
-                index = json.load(f)
-
-        # preload knowledge folders
-        index = self._preload_knowledge_folders(log_item, kn_dirs, index)
-
-        for file in index:
-            if index[file]["state"] in ["changed", "removed"] and index[file].get(
-                "ids", []
-            ):  # for knowledge files that have been changed or removed and have IDs
-                await self.delete_documents_by_ids(
-                    index[file]["ids"]
-                )  # remove original version
-            if index[file]["state"] == "changed":
-                index[file]["ids"] = await self.insert_documents(
-                    index[file]["documents"]
-                )  # insert new version
-
-        # remove index where state="removed"
-        index = {k: v for k, v in index.items() if v["state"] != "removed"}
-
-        # strip state and documents from index and save it
-        for file in index:
-            if "documents" in index[file]:
-                del index[file]["documents"]  # type: ignore
-            if "state" in index[file]:
-                del index[file]["state"]  # type: ignore
-        with open(index_path, "w") as f:
-            json.dump(index, f)
-
-    def _preload_knowledge_folders(
+        # load the manifest of imported files, migrate the legacy json index
+        manifest_path = files.get_abs_path(db_dir, knowledge_import.MANIFEST_FILE_NAME)
+        lock = knowledge_import.KnowledgeManifest.get_lock(manifest_path)
+        await asyncio.to_thread(lock.acquire)
+        manifest = knowledge_import.KnowledgeManifest(manifest_path)
+        try:
+            legacy_path = files.get_abs_path(db_dir, "knowledge_import.json")
+            if os.path.exists(legacy_path):
+                manifest.migrate_json(legacy_path)
+            index = manifest.load()
+            await self._import_knowledge(log_item, kn_dirs, index, paths)
+            manifest.save(index)
+        finally:
+            manifest.close()
+            lock.release()
+
+    async def _import_knowledge(
         self,
         log_item: LogItem | None,
         kn_dirs: list[str],
         index: dict[str, knowledge_import.KnowledgeImport],
+        paths: list[str] | None = None,
     ):
+        # import changed knowledge files, removed ones are deleted below
+        index = await knowledge_import.KnowledgeImportPipeline(
+            log_item,
+            index,
+            self._get_knowledge_sources(kn_dirs),
+            insert_documents=lambda docs: self.insert_documents(docs, save=False),
+            delete_documents=lambda ids: self.delete_documents_by_ids(ids, save=False),
+            # a few changed files are not worth starting parser processes
+            parse_workers=0 if paths is not None else knowledge_import.PARSE_WORKERS,
+            paths=paths,
+        ).run()
+
+        removed_ids = [
+            id for file in index.values() if file["state"] == "removed" for id in file.get("ids", [])
+        ]
+        if removed_ids:
+            await self.delete_documents_by_ids(removed_ids, save=False)
+
+        if any(file["state"] != "original" for file in index.values()):
+            self._save_db()  # persist once for the whole import
+
+    @staticmethod
+    def _watch_knowledge(memory_subdir: str, kn_dirs: list[str]):
+        # live indexing of knowledge changes, limited to the files that changed
+        roots = [abs_knowledge_dir(kn_dir) for kn_dir in kn_dirs]
+        roots.append(files.get_abs_path("instruments"))
+
+        async def apply(paths: list[str]):
+            db = Memory.index.get(memory_subdir)
+            if db is None:
+                raise RuntimeError(f"memory '{memory_subdir}' is not loaded")
+            wrap = Memory(db, memory_subdir=memory_subdir)
+            await wrap.preload_knowledge(None, list(kn_dirs), memory_subdir, paths=paths)
+
+        KnowledgeWatcher.start(memory_subdir, roots, apply)
+
+    def _get_knowledge_sources(
+        self, kn_dirs: list[str]
+    ) -> list[knowledge_import.KnowledgeSource]:
+        sources: list[knowledge_import.KnowledgeSource] = []
         # load knowledge folders, subfolders by area
         for kn_dir in kn_dirs:
             # everything in the root of the knowledge goes to main
-            index = knowledge_import.load_knowledge(
-                log_item,
-                abs_knowledge_dir(kn_dir),
-                index,
-                {"area": Memory.Area.MAIN},
-                filename_pattern="*",
-                recursive=False,
+            sources.append(
+                knowledge_import.KnowledgeSource(
+                    abs_knowledge_dir(kn_dir),
+                    {"area": Memory.Area.MAIN.value},
+                    filename_pattern="*",
+                    recursive=False,
+                )
             )
             # subdirectories go to their folders
             for area in Memory.Area:
-                index = knowledge_import.load_knowledge(
-                    log_item,
-                    # files.get_abs_path("knowledge", kn_dir, area.value),
-                    abs_knowledge_dir(kn_dir, area.value),
-                    index,
-                    {"area": area.value},
-                    recursive=True,
+                sources.append(
+                    knowledge_import.KnowledgeSource(
+                        abs_knowledge_dir(kn_dir, area.value),
+                        {"area": area.value},
+                        recursive=True,
+                    )
                 )
 
         # load instruments descriptions
-        index = knowledge_import.load_knowledge(
-            log_item,
-            files.get_abs_path("instruments"),
-            index,
-            {"area": Memory.Area.INSTRUMENTS.value},
-            filename_pattern="**/*.md",
-            recursive=True,
+        sources.append(
+            knowledge_import.KnowledgeSource(
+                files.get_abs_path("instruments"),
+                {"area": Memory.Area.INSTRUMENTS.value},
+                filename_pattern="**/*.md",
+                recursive=True,
+            )
         )
-
-        return index
+        return sources
 
     def get_document_by_id(self, id: str) -> Document | None:
         return self.db.get_by_ids(id)[0]
 
+    def count_documents(self) -> int:
+        return len(self.db.index_to_docstore_id)
+
+    def get_document_counts(self) -> dict[tuple[str, bool], int]:
+        """Number of documents by (area, knowledge source)."""
+        if isinstance(self.db.docstore, SQLiteDocstore):
+            return self.db.docstore.counts()
+        counts: dict[tuple[str, bool], int] = {}
+        for doc in self.db.get_all_docs().values():
+            key = (doc.metadata.get("area", ""), bool(doc.metadata.get("knowledge_source")))
+            counts[key] = counts.get(key, 0) + 1
+        return counts
+
+    def browse_documents(
+        self,
+        limit: int,
+        area: str = "",
+        knowledge_source: bool | None = None,
+        cursor: str = "",
+    ) -> tuple[list[Document], str]:
+        """
+        Documents newest first, a page at a time.
+        Returns the page and the cursor of the next one, empty after the last page.
+        """
+        after = Memory._decode_cursor(cursor)
+        if isinstance(self.db.docstore, SQLiteDocstore):
+            docs, last = self.db.docstore.page(area, knowledge_source, limit, after)
+            return docs, Memory._encode_cursor(last)
+
+        # in-memory docstore, sort the matching documents
+        keys = sorted(
+            (
+                (str(doc.metadata.get("timestamp", "")), id)
+                for id, doc in self.db.get_all_docs().items()
+                if (not area or doc.metadata.get("area", "") == area)
+                and (
+                    knowledge_source is None
+                    or bool(doc.metadata.get("knowledge_source")) == knowledge_source
+                )
+            ),
+            reverse=True,
+        )
+        if after:
+            keys = [key for key in keys if key < after]
+        docs = self.db.get_by_ids([id for _, id in keys[:limit]])
+        return docs, Memory._encode_cursor(keys[limit - 1] if len(keys) > limit > 0 else None)
+
+    @staticmethod
+    def _encode_cursor(key: tuple[str, str] | None) -> str:
+        if not key:
+            return ""
+        return base64.urlsafe_b64encode(json.dumps(list(key)).encode()).decode()
+
+    @staticmethod
+    def _decode_cursor(cursor: str) -> tuple[str, str] | None:
+        if not cursor:
+            return None
+        try:
+            timestamp, id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            return str(timestamp), str(id)
+        except Exception as e:
+            raise ValueError(f"Invalid cursor: {cursor}") from e
+
     async def search_similarity_threshold(
         self, query: str, limit: int, threshold: float, filter: str = ""
     ):
@@ -350,6 +804,144 @@ class Memory:
             filter=comparator,
         )
 
+    async def search_similarity_multi(
+        self,
+        queries: list[str],
+        limit: int | list[int],
+        threshold: float,
+        filters: str | list[str] = "",
+        vectors: np.ndarray | None = None,
+    ) -> list[list[tuple[Document, float]]]:
+        """
+        Run several similarity searches at once.
+        Unique query texts are embedded in one call and the index is searched once
+        for the whole query matrix. Returns (document, similarity score) pairs per query.
+        Query vectors from embed_queries can be passed to skip embedding.
+        """
+        if not queries:
+            return []
+        limits = limit if isinstance(limit, list) else [limit] * len(queries)
+        conditions = filters if isinstance(filters, list) else [filters] * len(queries)
+        results: list[list[tuple[Document, float]]] = [[] for _ in queries]
+        if not self.db.index.ntotal:
+            return results
+
+        matrix = vectors if vectors is not None else await self.embed_queries(queries)
+
+        # filtered searches look deeper to still fill their limit after filtering
+        fetch_k = max(
+            lim * 4 if cond else lim for lim, cond in zip(limits, conditions)
+        )
+        fetch_k = min(max(fetch_k, 20), self.db.index.ntotal)
+        scores, indices = self.db.search_index(matrix, fetch_k)
+
+        comparators = {cond: Memory._get_comparator(cond) for cond in set(conditions) if cond}
+        for q, (lim, cond) in enumerate(zip(limits, conditions)):
+            comparator = comparators.get(cond)
+            for score, i in zip(scores[q], indices[q]):
+                if len(results[q]) >= lim:
+                    break
+                if i == -1:
+                    continue
+                similarity = Memory._cosine_normalizer(float(score))
+                if similarity < threshold:
+                    break  # results are ordered by score
+                doc = self.db.docstore.search(self.db.index_to_docstore_id[i])
+                if not isinstance(doc, Document):
+                    continue
+                if comparator and not comparator(doc.metadata):
+                    continue
+                results[q].append((doc, similarity))
+        return results
+
+    async def embed_queries(self, queries: list[str]) -> np.ndarray:
+        # embed each distinct text once, queries are not worth caching
+        texts = list(dict.fromkeys(queries))
+        embedder = self.db.embedding_function
+        embedder = getattr(embedder, "underlying_embeddings", embedder)
+        vectors = await embedder.aembed_documents(texts)  # type: ignore
+        return np.array(vectors, dtype=np.float32)[[texts.index(q) for q in queries]]
+
+    def has_text_index(self) -> bool:
+        return isinstance(self.db.docstore, SQLiteDocstore) and self.db.docstore.fts
+
+    def search_lexical(
+        self, query: str, limit: int, filter: str = "", match_all: bool = False
+    ) -> list[tuple[Document, float]]:
+        """
+        BM25 ranked full text search, no embedding involved. Empty if the docstore has no text index.
+        With match_all only documents containing every word of the query are returned.
+        """
+        if not isinstance(self.db.docstore, SQLiteDocstore):
+            return []
+        comparator = Memory._get_comparator(filter) if filter else None
+        hits = self.db.docstore.search_text(query, limit * 4 if comparator else limit, match_all)
+        docs = {doc.metadata.get("id"): doc for doc in self.db.get_by_ids([id for id, _ in hits])}
+        results = []
+        for id, score in hits:
+            doc = docs.get(id)
+            if doc and (not comparator or comparator(doc.metadata)):
+                results.append((doc, score))
+        return results[:limit]
+
+    def score_documents(self, docs: list[Document], vector: np.ndarray) -> list[float]:
+        """Similarity of indexed documents to a query vector, from their stored vectors."""
+        positions = {id: pos for pos, id in self.db.index_to_docstore_id.items()}
+        found = [positions.get(doc.metadata.get("id", "")) for doc in docs]
+        indexed = [pos for pos in found if pos is not None]
+        if not indexed:
+            return [0.0] * len(docs)
+        scores = dict(zip(indexed, self.db.get_vectors(indexed) @ vector))
+        return [
+            Memory._cosine_normalizer(float(scores[pos])) if pos is not None else 0.0
+            for pos in found
+        ]
+
+    async def search_hybrid(
+        self,
+        query: str,
+        limit: int,
+        threshold: float,
+        filter: str = "",
+        mode: str = "auto",
+    ) -> list[tuple[Document, float]]:
+        """
+        Lexical (BM25) and vector search merged by reciprocal rank fusion.
+        mode "lexical" or "vector" runs one side only, "auto" skips embedding for exact
+        lookups (identifiers, paths, quoted strings) that have lexical matches.
+        Lexical matches have to contain every word of the query, and when the query is
+        embedded their stored vectors have to pass threshold like the vector matches.
+        Returns (document, fusion score) pairs, best first.
+        """
+        fetch = max(limit * 2, 20)
+        lexical = [] if mode == "vector" else self.search_lexical(query, fetch, filter, match_all=True)
+        if mode == "lexical" or (mode == "auto" and lexical and Memory._is_exact_query(query)):
+            ranked = [lexical]
+        else:
+            vectors = await self.embed_queries([query])
+            semantic = (
+                await self.search_similarity_multi([query], fetch, threshold, filter, vectors)
+            )[0]
+            scores = self.score_documents([doc for doc, _ in lexical], vectors[0])
+            lexical = [hit for hit, score in zip(lexical, scores) if score >= threshold]
+            ranked = [lexical, semantic]
+
+        fused: dict[str, tuple[Document, float]] = {}
+        for results in ranked:
+            for rank, (doc, _score) in enumerate(results):
+                id = doc.metadata.get("id", "")
+                previous = fused.get(id, (doc, 0.0))[1]
+                fused[id] = (doc, previous + 1.0 / (RRF_K + rank + 1))
+        return sorted(fused.values(), key=lambda item: item[1], reverse=True)[:limit]
+
+    @staticmethod
+    def _is_exact_query(query: str) -> bool:
+        # quoted strings and single tokens like identifiers, paths or error codes
+        query = query.strip()
+        if len(query) > 1 and query[0] == query[-1] and query[0] in "\"'`":
+            return True
+        return " " not in query and bool(re.search(r"[_./:\\()\[\]-]|[a-z][A-Z]|\d", query))
+
     async def delete_documents_by_query(
         self, query: str, threshold: float, filter: str = ""
     ):
@@ -384,7 +976,7 @@ class Memory:
             self._save_db()  # persist
         return removed
 
-    async def delete_documents_by_ids(self, ids: list[str]):
+    async def delete_documents_by_ids(self, ids: list[str], save: bool = True):
         # aget_by_ids is not yet implemented in faiss, need to do a workaround
         rem_docs = await self.db.aget_by_ids(
             ids
@@ -393,7 +985,7 @@ class Memory:
             rem_ids = [doc.metadata["id"] for doc in rem_docs]  # ids to remove
             await self.db.adelete(ids=rem_ids)
 
-        if rem_docs:
+        if rem_docs and save:
             self._save_db()  # persist
         return rem_docs
 
@@ -402,7 +994,7 @@ class Memory:
         ids = await self.insert_documents([doc])
         return ids[0]
 
-    async def insert_documents(self, docs: list[Document]):
+    async def insert_documents(self, docs: list[Document], save: bool = True):
         ids = [self._generate_doc_id() for _ in range(len(docs))]
         timestamp = self.get_timestamp()
 
@@ -414,13 +1006,17 @@ class Memory:
                     doc.metadata["area"] = Memory.Area.MAIN.value
 
             await self.db.aadd_documents(documents=docs, ids=ids)
-            self._save_db()  # persist
+            if save:
+                self._save_db()  # persist
         return ids
 
     async def update_documents(self, docs: list[Document]):
         ids = [doc.metadata["id"] for doc in docs]
-        await self.db.adelete(ids=ids)  # delete originals
-        ins = await self.db.aadd_documents(documents=docs, ids=ids)  # add updated
+        texts = [doc.page_content for doc in docs]
+        embeddings = await self.db._aembed_documents(texts)
+        ins = self.db.update_embeddings(
+            zip(texts, embeddings), [doc.metadata for doc in docs], ids
+        )  # replace originals
         self._save_db()  # persist
         return ins
 
@@ -435,6 +1031,9 @@ class Memory:
 
     @staticmethod
     def _save_db_file(db: MyFaiss, memory_subdir: str):
+        current = Memory.index.get(memory_subdir)
+        if current is not None and current is not db:
+            return  # stale instance, replaced by a re-embedded index
         abs_dir = abs_db_dir(memory_subdir)
         db.save_local(folder_path=abs_dir)
 
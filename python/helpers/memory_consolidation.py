@@ -11,6 +11,7 @@ from python.helpers.memory import Memory
 from python.helpers.dirty_json import DirtyJson
 from python.helpers.log import LogItem
 from python.helpers.print_style import PrintStyle
+from python.helpers.tokens import approximate_tokens
 from python.tools.memory_load import DEFAULT_THRESHOLD as DEFAULT_MEMORY_THRESHOLD
 from agent import Agent
 
@@ -32,6 +33,8 @@ class ConsolidationConfig:
     consolidation_sys_prompt: str = "memory.consolidation.sys.md"
     consolidation_msg_prompt: str = "memory.consolidation.msg.md"
     max_llm_context_memories: int = 5
+    max_llm_context_tokens: int = 2000  # Token budget for similar memories in the analysis prompt
+    candidate_score_margin: float = 0.15  # Drop candidates scoring this far below the best match
     keyword_extraction_sys_prompt: str = "memory.keyword_extraction.sys.md"
     keyword_extraction_msg_prompt: str = "memory.keyword_extraction.msg.md"
     processing_timeout_seconds: int = 120
@@ -58,6 +61,7 @@ class MemoryAnalysisContext:
     area: str
     timestamp: str
     existing_metadata: Dict[str, Any]
+    candidate_scores: Dict[str, float] = field(default_factory=dict)  # real similarity by memory id
 
 
 class MemoryConsolidator:
@@ -211,7 +215,10 @@ class MemoryConsolidator:
             similar_memories=similar_memories,
             area=area,
             timestamp=self._get_timestamp(),
-            existing_metadata=metadata
+            existing_metadata=metadata,
+            candidate_scores={
+                doc.metadata['id']: doc.metadata['_consolidation_similarity'] for doc in similar_memories
+            },
         )
 
         consolidation_result = await self._analyze_memory_consolidation(analysis_context, log_item)
@@ -246,7 +253,8 @@ class MemoryConsolidator:
             consolidation_result,
             area,
             analysis_context.existing_metadata,  # Pass original metadata
-            log_item
+            log_item,
+            analysis_context.candidate_scores,
         )
 
         if log_item:
@@ -339,78 +347,83 @@ class MemoryConsolidator:
         # Step 1: Extract keywords/queries for enhanced search
         search_queries = await self._extract_search_keywords(new_memory, log_item)
 
-        all_similar = []
-
-        # Step 2: Semantic similarity search with scores
-        semantic_similar = await db.search_similarity_threshold(
-            query=new_memory,
-            limit=self.config.max_similar_memories,
-            threshold=self.config.similarity_threshold,
-            filter=f"area == '{area}'"
-        )
-        all_similar.extend(semantic_similar)
-
-        # Step 3: Keyword-based searches
-        for query in search_queries:
-            if query.strip():
-                # Fix division by zero: ensure len(search_queries) > 0
-                queries_count = max(1, len(search_queries))  # Prevent division by zero
-                keyword_similar = await db.search_similarity_threshold(
-                    query=query.strip(),
-                    limit=max(3, self.config.max_similar_memories // queries_count),
-                    threshold=self.config.similarity_threshold,
-                    filter=f"area == '{area}'"
-                )
-                all_similar.extend(keyword_similar)
-
-        # Step 4: Deduplicate by document ID and store similarity info
-        seen_ids = set()
-        unique_similar = []
-        for doc in all_similar:
-            doc_id = doc.metadata.get('id')
-            if doc_id and doc_id not in seen_ids:
-                seen_ids.add(doc_id)
-                unique_similar.append(doc)
-
-        # Step 5: Calculate similarity scores for replacement validation
-        # Since FAISS doesn't directly expose similarity scores, use ranking-based estimation
-        # CRITICAL: All documents must have similarity >= search_threshold since FAISS returned them
-        # FIXED: Use conservative scoring that keeps all scores in safe consolidation range
-        similarity_scores = {}
-        total_docs = len(unique_similar)
-        search_threshold = self.config.similarity_threshold
-        safety_threshold = self.config.replace_similarity_threshold
-
-        for i, doc in enumerate(unique_similar):
-            doc_id = doc.metadata.get('id')
-            if doc_id:
-                # Convert ranking to similarity score with conservative distribution
-                if total_docs == 1:
-                    ranking_similarity = 1.0  # Single document gets perfect score
-                else:
-                    # Use conservative scoring: distribute between safety_threshold and 1.0
-                    # This ensures all scores are suitable for consolidation
-                    # First document gets 1.0, last gets safety_threshold (0.9 by default)
-                    ranking_factor = 1.0 - (i / (total_docs - 1))
-                    score_range = 1.0 - safety_threshold  # e.g., 1.0 - 0.9 = 0.1
-                    ranking_similarity = safety_threshold + (score_range * ranking_factor)
-
-                    # Ensure minimum score is search_threshold for logical consistency
-                    ranking_similarity = max(ranking_similarity, search_threshold)
-
-                similarity_scores[doc_id] = ranking_similarity
-
-        # Step 6: Add similarity score to document metadata for LLM analysis
-        for doc in unique_similar:
-            doc_id = doc.metadata.get('id')
-            estimated_similarity = similarity_scores.get(doc_id, 0.7)
-            # Store for later validation
-            doc.metadata['_consolidation_similarity'] = estimated_similarity
+        # Step 2: Semantic similarity search for the new memory
+        keyword_queries = [query.strip() for query in search_queries if query.strip()]
+        queries_count = max(1, len(keyword_queries))  # Prevent division by zero
+        keyword_limit = max(3, self.config.max_similar_memories // queries_count)
+        area_filter = f"area == '{area}'"
+
+        if db.has_text_index():
+            vectors = await db.embed_queries([new_memory])
+            results = await db.search_similarity_multi(
+                queries=[new_memory],
+                limit=self.config.max_similar_memories,
+                threshold=self.config.similarity_threshold,
+                filters=area_filter,
+                vectors=vectors,
+            )
 
-        # Step 7: Limit to max context for LLM
-        limited_similar = unique_similar[:self.config.max_llm_context_memories]
+            # Step 3: Keyword lookups in the text index, no embedding calls,
+            # scored by similarity of the stored vectors to the new memory
+            for query in keyword_queries:
+                docs = [doc for doc, _ in db.search_lexical(query, keyword_limit, area_filter)]
+                scores = db.score_documents(docs, vectors[0])
+                results.append([
+                    (doc, score) for doc, score in zip(docs, scores)
+                    if score >= self.config.similarity_threshold
+                ])
+        else:
+            # Step 3 without a text index: keyword-based vector searches in the same batch
+            results = await db.search_similarity_multi(
+                queries=[new_memory] + keyword_queries,
+                limit=[self.config.max_similar_memories] + [keyword_limit] * len(keyword_queries),
+                threshold=self.config.similarity_threshold,
+                filters=area_filter,
+            )
 
-        return limited_similar
+        # Step 4: Deduplicate by document ID, keeping the best score across searches
+        best_scores: Dict[str, tuple[Document, float]] = {}
+        for result in results:
+            for doc, score in result:
+                doc_id = doc.metadata.get('id')
+                if doc_id and (doc_id not in best_scores or score > best_scores[doc_id][1]):
+                    best_scores[doc_id] = (doc, score)
+
+        # Step 5: Limit by score and token budget for the LLM
+        return self._select_candidates(list(best_scores.values()))
+
+    def _select_candidates(self, scored: List[tuple[Document, float]]) -> List[Document]:
+        """Pick the best scored candidates that fit the count and token budget of the analysis prompt."""
+        scored = sorted(scored, key=lambda item: item[1], reverse=True)
+        if not scored:
+            return []
+        min_score = scored[0][1] - self.config.candidate_score_margin
+
+        selected: List[Document] = []
+        used_tokens = 0
+        for doc, score in scored:
+            if len(selected) >= self.config.max_llm_context_memories or score < min_score:
+                break
+            candidate = Document(
+                page_content=doc.page_content,
+                # real cosine similarity, stored on a copy for replacement validation
+                metadata={**doc.metadata, '_consolidation_similarity': score},
+            )
+            doc_tokens = approximate_tokens(self._format_similar_memories([candidate]))
+            if selected and used_tokens + doc_tokens > self.config.max_llm_context_tokens:
+                continue  # a shorter, lower scored memory may still fit
+            selected.append(candidate)
+            used_tokens += doc_tokens
+        return selected
+
+    @staticmethod
+    def _format_similar_memories(docs: List[Document]) -> str:
+        similar_memories_text = ""
+        for i, doc in enumerate(docs):
+            timestamp = doc.metadata.get('timestamp', 'unknown')
+            doc_id = doc.metadata.get('id', f'doc_{i}')
+            similar_memories_text += f"ID: {doc_id}\nTimestamp: {timestamp}\nContent: {doc.page_content}\n\n"
+        return similar_memories_text
 
     async def _extract_search_keywords(
         self,
@@ -466,11 +479,7 @@ class MemoryConsolidator:
 
         try:
             # Prepare similar memories text
-            similar_memories_text = ""
-            for i, doc in enumerate(context.similar_memories):
-                timestamp = doc.metadata.get('timestamp', 'unknown')
-                doc_id = doc.metadata.get('id', f'doc_{i}')
-                similar_memories_text += f"ID: {doc_id}\nTimestamp: {timestamp}\nContent: {doc.page_content}\n\n"
+            similar_memories_text = self._format_similar_memories(context.similar_memories)
 
             # Build system prompt
             system_prompt = self.agent.read_prompt(
@@ -537,7 +546,8 @@ class MemoryConsolidator:
         result: ConsolidationResult,
         area: str,
         original_metadata: Dict[str, Any],  # Add original metadata parameter
-        log_item: Optional[LogItem] = None
+        log_item: Optional[LogItem] = None,
+        candidate_scores: Optional[Dict[str, float]] = None,
     ) -> list:
         """Apply the consolidation decisions to the memory database."""
 
@@ -555,7 +565,9 @@ class MemoryConsolidator:
                 return await self._handle_merge(db, result, area, consolidated_metadata, log_item)
 
             elif result.action == ConsolidationAction.REPLACE:
-                return await self._handle_replace(db, result, area, consolidated_metadata, log_item)
+                return await self._handle_replace(
+                    db, result, area, consolidated_metadata, log_item, candidate_scores
+                )
 
             elif result.action == ConsolidationAction.UPDATE:
                 return await self._handle_update(db, result, area, consolidated_metadata, log_item)
@@ -640,7 +652,8 @@ class MemoryConsolidator:
         result: ConsolidationResult,
         area: str,
         original_metadata: Dict[str, Any],  # Add original metadata parameter
-        log_item: Optional[LogItem] = None
+        log_item: Optional[LogItem] = None,
+        candidate_scores: Optional[Dict[str, float]] = None,
     ) -> list:
         """Handle REPLACE action: Remove old memories, insert new version with similarity validation."""
 
@@ -651,7 +664,10 @@ class MemoryConsolidator:
 
             unsafe_replacements = []
             for memory in memories_to_check:
-                similarity = memory.metadata.get('_consolidation_similarity', 0.7)
+                similarity = (candidate_scores or {}).get(
+                    memory.metadata.get('id', ''),
+                    memory.metadata.get('_consolidation_similarity', 0.7),
+                )
                 if similarity < self.config.replace_similarity_threshold:
                     unsafe_replacements.append({
                         'id': memory.metadata.get('id'),
@@ -790,6 +806,8 @@ def create_memory_consolidator(agent: Agent, **config_overrides) -> MemoryConsol
     - replace_similarity_threshold: Safety threshold for REPLACE actions (default 0.9)
     - max_similar_memories: Maximum memories to discover (default 10)
     - max_llm_context_memories: Maximum memories to send to LLM (default 5)
+    - max_llm_context_tokens: Token budget for memories sent to LLM (default 2000)
+    - candidate_score_margin: Max score distance of candidates from the best match (default 0.15)
     - processing_timeout_seconds: Timeout for consolidation processing (default 30)
     """
     config = ConsolidationConfig(**config_overrides)
@@ -0,0 +1,342 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Iterable, Iterator, Sequence
+
+from langchain_community.docstore.base import AddableMixin, Docstore
+from langchain_core.documents import Document
+
+DB_FILE_NAME = "docstore.db"
+CACHE_SIZE = 1024  # documents kept in the read cache
+
+# rows per IN (...) query, stays well below SQLite's host parameter limit
+_BATCH_SIZE = 500
+_MAX_QUERY_TOKENS = 32
+
+# words that match nearly every memory, left out of full text queries
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from had has have how i if in is it its me my "
+    "not of on or our so that the their them then there these this those to was we were what "
+    "when where which who why will with you your".split()
+)
+
+# full text index kept in sync with the documents by triggers, '_' keeps identifiers whole
+_FTS_SCHEMA = [
+    "CREATE VIRTUAL TABLE docs_fts USING fts5("
+    "content, content='docs', content_rowid='rowid', tokenize=\"unicode61 tokenchars '_'\")",
+    "CREATE TRIGGER docs_ai AFTER INSERT ON docs BEGIN "
+    "INSERT INTO docs_fts(rowid, content) VALUES (new.rowid, new.content); END",
+    "CREATE TRIGGER docs_ad AFTER DELETE ON docs BEGIN "
+    "INSERT INTO docs_fts(docs_fts, rowid, content) VALUES ('delete', old.rowid, old.content); END",
+    "CREATE TRIGGER docs_au AFTER UPDATE ON docs BEGIN "
+    "INSERT INTO docs_fts(docs_fts, rowid, content) VALUES ('delete', old.rowid, old.content); "
+    "INSERT INTO docs_fts(rowid, content) VALUES (new.rowid, new.content); END",
+    "INSERT INTO docs_fts(docs_fts) VALUES ('rebuild')",
+]
+
+# metadata fields of the browse indexes, queries have to use the same expressions
+_AREA = "coalesce(json_extract(metadata, '$.area'), '')"
+_TIMESTAMP = "coalesce(json_extract(metadata, '$.timestamp'), '')"
+_KNOWLEDGE = "(coalesce(json_extract(metadata, '$.knowledge_source'), 0) != 0)"
+_BROWSE_INDEXES = [
+    f"CREATE INDEX IF NOT EXISTS docs_timestamp ON docs({_TIMESTAMP}, id)",
+    f"CREATE INDEX IF NOT EXISTS docs_area_timestamp ON docs({_AREA}, {_TIMESTAMP}, id)",
+    f"CREATE INDEX IF NOT EXISTS docs_area_knowledge ON docs({_AREA}, {_KNOWLEDGE})",
+]
+
+
+class SQLiteDocstore(Docstore, AddableMixin):
+    """
+    Docstore keeping memory documents in SQLite instead of RAM.
+
+    Only the FAISS position to id mapping stays in memory, text and metadata are read
+    on demand through a small LRU cache. Every write is its own transaction, so the
+    store never needs to be rewritten in full. When pickled with the FAISS index,
+    only the database path is stored.
+    Document text is also indexed in FTS5 for BM25 ranked lexical search, if the
+    SQLite build supports it, and area, timestamp and knowledge source are indexed
+    for paging through documents newest first without loading them all.
+    """
+
+    def __init__(self, path: str, cache_size: int = CACHE_SIZE):
+        self.path = os.path.abspath(path)
+        self.cache_size = cache_size
+        self._cache: OrderedDict[str, Document] = OrderedDict()
+        self._lock = threading.RLock()
+        self._conn: sqlite3.Connection | None = None
+        self._fts = False
+        self._count: int | None = None  # kept up to date by every write
+        self._counts: dict[tuple[str, bool], int] | None = None  # recounted after writes
+
+    def __getstate__(self):
+        return {"path": self.path, "cache_size": self.cache_size}
+
+    def __setstate__(self, state):
+        self.__init__(state["path"], state.get("cache_size", CACHE_SIZE))
+
+    @property
+    def fts(self) -> bool:
+        """Whether the full text index is available."""
+        with self._lock:
+            self._connect()
+            return self._fts
+
+    def set_path(self, path: str):
+        """Point the store to another database file, e.g. after its folder was moved."""
+        with self._lock:
+            self.close()
+            self.path = os.path.abspath(path)
+            self._cache.clear()
+            self._count = self._counts = None
+
+    def add(self, texts: dict[str, Document]) -> None:
+        if not texts:
+            return
+        rows = [
+            (id, doc.page_content, json.dumps(doc.metadata, default=str))
+            for id, doc in texts.items()
+        ]
+        with self._lock:
+
+            def add(conn: sqlite3.Connection):
+                existing = self._count_ids(conn, list(texts))
+                # upsert instead of replace, so the update trigger keeps the text index in sync
+                conn.executemany(
+                    "INSERT INTO docs (id, content, metadata) VALUES (?, ?, ?) "
+                    "ON CONFLICT(id) DO UPDATE SET content = excluded.content, metadata = excluded.metadata",
+                    rows,
+                )
+                return len(rows) - existing
+
+            self._write(add)
+            for id, doc in texts.items():
+                self._remember(id, doc)
+
+    def upsert(self, id: str, document: Document) -> None:
+        self.add({id: document})
+
+    def delete(self, ids: list) -> None:
+        with self._lock:
+
+            def delete(conn: sqlite3.Connection):
+                deleted = 0
+                for chunk in _chunks(list(ids)):
+                    placeholders = ",".join("?" * len(chunk))
+                    cursor = conn.execute(f"DELETE FROM docs WHERE id IN ({placeholders})", chunk)
+                    deleted += cursor.rowcount
+                return -deleted
+
+            self._write(delete)
+            for id in ids:
+                self._cache.pop(id, None)
+
+    def search(self, search: str) -> Document | str:
+        found = self.mget([search])
+        return found[0] if found else f"ID {search} not found."
+
+    def mget(self, ids: Sequence[str]) -> list[Document]:
+        """Documents of the given ids in their order, unknown ids are skipped."""
+        with self._lock:
+            found: dict[str, Document] = {}
+            missing = []
+            for id in ids:
+                if id in self._cache:
+                    self._cache.move_to_end(id)
+                    found[id] = self._cache[id]
+                else:
+                    missing.append(id)
+            for chunk in _chunks(list(dict.fromkeys(missing))):
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._connect().execute(
+                    f"SELECT id, content, metadata FROM docs WHERE id IN ({placeholders})", chunk
+                )
+                for id, content, metadata in rows:
+                    found[id] = Document(page_content=content, metadata=json.loads(metadata))
+                    self._remember(id, found[id])
+        return [found[id] for id in ids if id in found]
+
+    def search_text(
+        self, query: str, limit: int, match_all: bool = False
+    ) -> list[tuple[str, float]]:
+        """
+        Ids of the best BM25 matches for the words of query, with scores (higher is better).
+        With match_all only documents containing every word (except stopwords) match.
+        """
+        match = fts_query(query, match_all)
+        with self._lock:
+            conn = self._connect()
+            if not match or not self._fts:
+                return []
+            rows = conn.execute(
+                "SELECT docs.id, bm25(docs_fts) FROM docs_fts "
+                "JOIN docs ON docs.rowid = docs_fts.rowid "
+                "WHERE docs_fts MATCH ? ORDER BY bm25(docs_fts) LIMIT ?",
+                (match, limit),
+            ).fetchall()
+        return [(id, -score) for id, score in rows]
+
+    def page(
+        self,
+        area: str = "",
+        knowledge_source: bool | None = None,
+        limit: int = 100,
+        after: tuple[str, str] | None = None,
+    ) -> tuple[list[Document], tuple[str, str] | None]:
+        """
+        Documents newest first, optionally of one area and knowledge or conversation only.
+        after is the (timestamp, id) key returned with the previous page, the key returned
+        with this page is None if there are no more documents.
+        """
+        conditions, params = [], []
+        if area:
+            conditions.append(f"{_AREA} = ?")
+            params.append(area)
+        if knowledge_source is not None:
+            conditions.append(f"{_KNOWLEDGE} = ?")
+            params.append(int(knowledge_source))
+        if after:
+            conditions.append(f"({_TIMESTAMP}, id) < (?, ?)")
+            params.extend(after)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        with self._lock:
+            rows = self._connect().execute(
+                f"SELECT id, content, metadata, {_TIMESTAMP} FROM docs {where} "
+                f"ORDER BY {_TIMESTAMP} DESC, id DESC LIMIT ?",
+                [*params, limit + 1],
+            ).fetchall()
+        docs = [
+            Document(page_content=content, metadata=json.loads(metadata))
+            for _id, content, metadata, _timestamp in rows[:limit]
+        ]
+        last = rows[limit - 1] if len(rows) > limit and limit > 0 else None
+        return docs, (last[3], last[0]) if last else None
+
+    def counts(self) -> dict[tuple[str, bool], int]:
+        """Number of documents by (area, knowledge source), cached until the next write."""
+        with self._lock:
+            if self._counts is None:
+                rows = self._connect().execute(
+                    f"SELECT {_AREA}, {_KNOWLEDGE}, COUNT(*) FROM docs GROUP BY 1, 2"
+                )
+                self._counts = {(area, bool(knowledge)): count for area, knowledge, count in rows}
+            return dict(self._counts)
+
+    def items(self) -> Iterator[tuple[str, Document]]:
+        """Stream all documents, without filling the read cache."""
+        with self._lock:
+            rows = self._connect().execute("SELECT id, content, metadata FROM docs").fetchall()
+        for id, content, metadata in rows:
+            yield id, Document(page_content=content, metadata=json.loads(metadata))
+
+    def ids(self) -> list[str]:
+        with self._lock:
+            return [row[0] for row in self._connect().execute("SELECT id FROM docs")]
+
+    def reconcile(self, ids: Iterable[str]) -> list[str]:
+        """Drop documents not in ids (left by an interrupted save), return ids without a document."""
+        expected = set(ids)
+        stored = set(self.ids())
+        orphans = list(stored - expected)
+        if orphans:
+            self.delete(orphans)
+        return list(expected - stored)
+
+    def clear(self):
+        with self._lock:
+            self._write(lambda conn: -conn.execute("DELETE FROM docs").rowcount)
+            self._cache.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            if self._count is None:
+                self._count = self._connect().execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+            return self._count
+
+    def close(self):
+        with self._lock:
+            if self._conn:
+                self._conn.close()
+                self._conn = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS docs ("
+                "id TEXT PRIMARY KEY, content TEXT NOT NULL, metadata TEXT NOT NULL)"
+            )
+            for statement in _BROWSE_INDEXES:
+                self._conn.execute(statement)
+            self._fts = self._ensure_fts(self._conn)
+        return self._conn
+
+    @staticmethod
+    def _ensure_fts(conn: sqlite3.Connection) -> bool:
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'docs_fts'").fetchone():
+            return True
+        conn.execute("BEGIN")
+        try:
+            for statement in _FTS_SCHEMA:  # the last one indexes existing documents
+                conn.execute(statement)
+            conn.execute("COMMIT")
+            return True
+        except sqlite3.OperationalError:
+            conn.execute("ROLLBACK")  # no FTS5 in this SQLite build
+            return False
+
+    def _write(self, operation):
+        # operation returns the change of the document count
+        conn = self._connect()
+        conn.execute("BEGIN")
+        try:
+            added = operation(conn)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        if self._count is not None:
+            self._count += added
+        self._counts = None
+
+    @staticmethod
+    def _count_ids(conn: sqlite3.Connection, ids: list[str]) -> int:
+        count = 0
+        for chunk in _chunks(ids):
+            placeholders = ",".join("?" * len(chunk))
+            count += conn.execute(
+                f"SELECT COUNT(*) FROM docs WHERE id IN ({placeholders})", chunk
+            ).fetchone()[0]
+        return count
+
+    def _remember(self, id: str, doc: Document):
+        self._cache[id] = doc
+        self._cache.move_to_end(id)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+
+def fts_query(text: str, match_all: bool = False) -> str:
+    """
+    FTS5 query matching any word of text, or every word with match_all, ranking the exact
+    phrase first. Stopwords are left out.
+    """
+    words = [w for w in re.findall(r"\w+", text.lower()) if w not in STOPWORDS][:_MAX_QUERY_TOKENS]
+    if not words:
+        return ""
+    terms = [f'"{word}"' for word in dict.fromkeys(words)]
+    if match_all and len(terms) > 1:
+        terms = ["(" + " AND ".join(terms) + ")"]
+    if len(words) > 1:
+        terms.insert(0, '"' + " ".join(words) + '"')
+    return " OR ".join(terms)
+
+
+def _chunks(items: list) -> Iterator[list]:
+    for i in range(0, len(items), _BATCH_SIZE):
+        yield items[i : i + _BATCH_SIZE]
@@ -0,0 +1,212 @@
+import os
+import sqlite3
+import threading
+from typing import Callable, Iterator, Sequence
+
+import faiss
+import numpy as np
+
+FLOAT32 = "float32"
+FLOAT16 = "float16"
+INT8 = "int8"
+PQ = "pq"
+MODES = (FLOAT32, FLOAT16, INT8, PQ)
+
+VECTORS_FILE_NAME = "vectors.db"
+# quantized candidates per requested result, re-ranked with exact vectors
+RERANK_FACTORS = {FLOAT16: 4, INT8: 4, PQ: 10}
+MIN_CANDIDATES = 40
+INT8_MIN_TRAINING = 1000  # below this, int8 ranges cover the whole unit sphere
+INT8_RANGE_MARGIN = 0.2  # widens trained ranges for vectors added later
+PQ_MIN_TRAINING = 4096  # smaller stores fall back to int8 until they grow
+PQ_SUBVECTOR_DIMS = 4  # dimensions per product quantizer code byte
+TRAINING_SAMPLE = 65536
+
+_BATCH_SIZE = 500
+_NO_SCORE = -np.finfo(np.float32).max  # what faiss reports for missing inner product results
+
+
+def storage_mode(index: faiss.Index) -> str:
+    """Storage mode of an index created by create_index."""
+    if isinstance(index, faiss.IndexScalarQuantizer):
+        return FLOAT16 if index.sq.qtype == faiss.ScalarQuantizer.QT_fp16 else INT8
+    if isinstance(index, faiss.IndexPQ):
+        return PQ
+    return FLOAT32
+
+
+def resolve_mode(mode: str, current: str, count: int) -> str:
+    """Mode to use for a store of count vectors, product quantization needs enough to train on."""
+    if mode == PQ and current != PQ and count < PQ_MIN_TRAINING:
+        return INT8
+    return mode
+
+
+def candidate_count(index: faiss.Index, k: int) -> int:
+    """How many quantized candidates to re-rank for k results."""
+    factor = RERANK_FACTORS.get(storage_mode(index), 1)
+    return min(index.ntotal, max(k * factor, MIN_CANDIDATES))
+
+
+def create_index(mode: str, dim: int, vectors: np.ndarray | None = None) -> faiss.Index:
+    """Empty inner product index of the given storage mode, trained on vectors if it needs training."""
+    if mode == FLOAT32:
+        return faiss.IndexFlatIP(dim)
+    if mode == FLOAT16:
+        return faiss.IndexScalarQuantizer(
+            dim, faiss.ScalarQuantizer.QT_fp16, faiss.METRIC_INNER_PRODUCT
+        )
+    if mode == INT8:
+        index = faiss.IndexScalarQuantizer(
+            dim, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT
+        )
+        if vectors is not None and len(vectors) >= INT8_MIN_TRAINING:
+            index.sq.rangestat_arg = INT8_RANGE_MARGIN
+            index.train(_sample(vectors))
+        else:
+            # embeddings are unit length, so no component leaves [-1, 1]
+            index.train(np.stack([-np.ones(dim), np.ones(dim)]).astype(np.float32))
+        return index
+    if mode == PQ:
+        if vectors is None or len(vectors) < PQ_MIN_TRAINING:
+            raise ValueError(f"Product quantization needs at least {PQ_MIN_TRAINING} vectors to train")
+        index = faiss.IndexPQ(dim, _subquantizers(dim), 8, faiss.METRIC_INNER_PRODUCT)
+        index.train(_sample(vectors))
+        return index
+    raise ValueError(f"Unknown vector storage mode '{mode}', use one of {', '.join(MODES)}")
+
+
+def rerank(
+    queries: np.ndarray,
+    candidates: np.ndarray,
+    k: int,
+    load: Callable[[list[int]], np.ndarray],
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Exact inner products of quantized search candidates, best k per query.
+    load returns the full precision vectors of index positions.
+    Returns (scores, positions) shaped like the result of faiss search.
+    """
+    scores = np.full((len(queries), k), _NO_SCORE, dtype=np.float32)
+    positions = np.full((len(queries), k), -1, dtype=np.int64)
+    unique = sorted({int(i) for i in candidates.flat if i != -1})
+    if not unique:
+        return scores, positions
+    vectors = load(unique)
+    rows = {pos: row for row, pos in enumerate(unique)}
+    for q, query in enumerate(queries):
+        found = [int(i) for i in candidates[q] if i != -1]
+        exact = vectors[[rows[i] for i in found]] @ query
+        best = np.argsort(-exact, kind="stable")[:k]
+        scores[q, : len(best)] = exact[best]
+        positions[q, : len(best)] = np.array(found)[best]
+    return scores, positions
+
+
+class ExactVectorStore:
+    """
+    Full precision vectors of a quantized index, kept on disk next to it.
+
+    Quantized codes only pick the search candidates, their final order comes from
+    these vectors. They are read by id for the few candidates of a search, so they
+    never need to be held in memory.
+    """
+
+    def __init__(self, path: str):
+        self.path = os.path.abspath(path)
+        self._lock = threading.RLock()
+        self._conn: sqlite3.Connection | None = None
+
+    def add(self, ids: Sequence[str], vectors: np.ndarray) -> None:
+        rows = [
+            (id, np.asarray(vector, dtype=np.float32).tobytes())
+            for id, vector in zip(ids, vectors)
+        ]
+        with self._lock:
+            self._write(
+                lambda conn: conn.executemany(
+                    "INSERT OR REPLACE INTO vectors (id, vector) VALUES (?, ?)", rows
+                )
+            )
+
+    def get(self, ids: Sequence[str]) -> dict[str, np.ndarray]:
+        found: dict[str, np.ndarray] = {}
+        with self._lock:
+            for chunk in _chunks(list(dict.fromkeys(ids))):
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._connect().execute(
+                    f"SELECT id, vector FROM vectors WHERE id IN ({placeholders})", chunk
+                )
+                for id, blob in rows:
+                    found[id] = np.frombuffer(blob, dtype=np.float32)
+        return found
+
+    def delete(self, ids: Sequence[str]) -> None:
+        with self._lock:
+
+            def delete(conn: sqlite3.Connection):
+                for chunk in _chunks(list(ids)):
+                    placeholders = ",".join("?" * len(chunk))
+                    conn.execute(f"DELETE FROM vectors WHERE id IN ({placeholders})", chunk)
+
+            self._write(delete)
+
+    def ids(self) -> list[str]:
+        with self._lock:
+            return [row[0] for row in self._connect().execute("SELECT id FROM vectors")]
+
+    def clear(self):
+        with self._lock:
+            self._write(lambda conn: conn.execute("DELETE FROM vectors"))
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connect().execute("SELECT COUNT(*) FROM vectors").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            if self._conn:
+                self._conn.close()
+                self._conn = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS vectors (id TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+            )
+        return self._conn
+
+    def _write(self, operation):
+        conn = self._connect()
+        conn.execute("BEGIN")
+        try:
+            operation(conn)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+
+def _subquantizers(dim: int) -> int:
+    # one code byte per PQ_SUBVECTOR_DIMS dimensions, the count has to divide dim
+    for m in range(max(1, dim // PQ_SUBVECTOR_DIMS), 0, -1):
+        if dim % m == 0:
+            return m
+    return 1
+
+
+def _sample(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    if len(vectors) <= TRAINING_SAMPLE:
+        return vectors
+    rng = np.random.default_rng(0)
+    return vectors[rng.choice(len(vectors), TRAINING_SAMPLE, replace=False)]
+
+
+def _chunks(items: list) -> Iterator[list]:
+    for i in range(0, len(items), _BATCH_SIZE):
+        yield items[i : i + _BATCH_SIZE]
@@ -0,0 +1,312 @@
+import asyncio
+import hashlib
+import json
+import os
+import shutil
+import time
+from typing import TYPE_CHECKING, Any
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from python.helpers import files, metrics
+from python.helpers.defer import DeferredTask
+from python.helpers.log import LogItem
+from python.helpers.print_style import PrintStyle
+
+if TYPE_CHECKING:
+    from python.helpers.memory import MyFaiss
+
+STAGING_DIR = "reembed"
+CHECKPOINT_FILE = "checkpoint.json"
+SWAP_FILE = "swap.json"  # written once staging holds the complete index, see finish_swap
+SWAPPED_FILES = ["index.faiss", "index.pkl", "embedding.json"]  # moved into the memory folder
+BATCH_SIZE = 64  # documents per embedding call
+PARALLEL_BATCHES = 4  # embedding calls in flight at once
+CHECKPOINT_INTERVAL = 30  # seconds between checkpoint saves
+
+
+class ReembedJob:
+    """
+    Background rebuild of a memory index after the embedding model has changed.
+
+    The new index is built next to the old one in a staging folder and checkpointed
+    periodically, so an interrupted job resumes where it stopped.
+    The old index keeps serving searches (with the old embedding model) until the
+    new one is complete and swapped in.
+    Documents are tracked by a fingerprint of their content, so memories updated in
+    place while the job runs are embedded again.
+    """
+
+    jobs: dict[str, "ReembedJob"] = {}
+
+    @staticmethod
+    def get(memory_subdir: str) -> "ReembedJob | None":
+        return ReembedJob.jobs.get(memory_subdir)
+
+    @staticmethod
+    def start(
+        memory_subdir: str,
+        old_db: "MyFaiss",
+        embedder: Embeddings,
+        model_provider: str,
+        model_name: str,
+        log_item: LogItem | None = None,
+    ) -> "ReembedJob":
+        job = ReembedJob.jobs.get(memory_subdir)
+        if job and job.model_provider == model_provider and job.model_name == model_name:
+            # already running for this model, follow the reloaded instance of the old index
+            job.old_db = old_db
+            return job
+        job = ReembedJob(memory_subdir, old_db, embedder, model_provider, model_name, log_item)
+        ReembedJob.jobs[memory_subdir] = job
+        job.task = DeferredTask(thread_name="MemoryReembed").start_task(job.run)
+        return job
+
+    def __init__(
+        self,
+        memory_subdir: str,
+        old_db: "MyFaiss",
+        embedder: Embeddings,
+        model_provider: str,
+        model_name: str,
+        log_item: LogItem | None = None,
+    ):
+        from python.helpers.memory import abs_db_dir
+
+        self.memory_subdir = memory_subdir
+        self.old_db = old_db
+        self.embedder = embedder
+        self.model_provider = model_provider
+        self.model_name = model_name
+        self.log_item = log_item
+        self.db_dir = abs_db_dir(memory_subdir)
+        self.staging_dir = files.get_abs_path(self.db_dir, STAGING_DIR)
+        self.task: DeferredTask | None = None
+        self.total = 0
+        self.done = 0
+        self.resumed = 0
+        # fingerprints of the documents as they were embedded into the new index
+        self.embedded: dict[str, str] = {}
+        self.finished = False
+        self.error = ""
+        metrics.register(f"memory_reembed/{memory_subdir}", self.get_stats)
+
+    def get_stats(self) -> dict[str, Any]:
+        return {
+            "model": f"{self.model_provider}/{self.model_name}",
+            "total": self.total,
+            "done": self.done,
+            "resumed": self.resumed,
+            "finished": self.finished,
+            "error": self.error,
+        }
+
+    async def run(self):
+        try:
+            new_db = self._load_checkpoint() or self._create_db()
+            self.resumed = len(new_db.index_to_docstore_id)
+            await self._fill(new_db)
+            self._swap(new_db)
+            self.finished = True
+            self._progress("Memory re-embedding finished")
+        except Exception as e:
+            self.error = str(e)
+            PrintStyle.error(f"Memory re-embedding of '{self.memory_subdir}' failed: {e}")
+            self._progress(f"Memory re-embedding failed: {e}")
+        finally:
+            if ReembedJob.jobs.get(self.memory_subdir) is self:
+                del ReembedJob.jobs[self.memory_subdir]
+            metrics.unregister(f"memory_reembed/{self.memory_subdir}")
+
+    async def _fill(self, new_db: "MyFaiss"):
+        # repeat until the new index holds exactly the documents of the old one,
+        # this also picks up memories inserted, updated or deleted while the job was running
+        while True:
+            old_docs, fingerprints, new_ids, pending = self._reconcile(new_db)
+            self.done = self.total - len(pending)
+            if not pending:
+                return
+
+            step = BATCH_SIZE * PARALLEL_BATCHES
+            last_checkpoint = time.monotonic()
+            for start in range(0, len(pending), step):
+                round_ids = pending[start : start + step]
+                batches = [
+                    round_ids[i : i + BATCH_SIZE] for i in range(0, len(round_ids), BATCH_SIZE)
+                ]
+                vectors = await asyncio.gather(
+                    *[
+                        self.embedder.aembed_documents([old_docs[id].page_content for id in batch])
+                        for batch in batches
+                    ]
+                )
+                with self.old_db._docs_lock:
+                    # skip documents deleted or updated meanwhile, adding them to a shared docstore
+                    # would restore them, the next round embeds the updated ones
+                    current = set(self.old_db.index_to_docstore_id.values())
+                    for batch, batch_vectors in zip(batches, vectors):
+                        kept = [
+                            (id, vector)
+                            for id, vector in zip(batch, batch_vectors)
+                            if id in current and self._fingerprint_of(id) == fingerprints[id]
+                        ]
+                        self._store(new_db, old_docs, fingerprints, new_ids, kept)
+                self.done += len(round_ids)
+                if time.monotonic() - last_checkpoint >= CHECKPOINT_INTERVAL:
+                    self._save_checkpoint(new_db)
+                    last_checkpoint = time.monotonic()
+                self._progress(
+                    f"Re-embedding memory '{self.memory_subdir}': {self.done}/{self.total}"
+                )
+
+    def _reconcile(
+        self, new_db: "MyFaiss"
+    ) -> tuple[dict[str, Document], dict[str, str], set[str], list[str]]:
+        # drop documents deleted from the old index, returns the documents of the old index,
+        # their fingerprints, the ids in the new index and those to embed (missing or changed)
+        old_docs = self._old_docs()
+        fingerprints = {id: _fingerprint(doc) for id, doc in old_docs.items()}
+        new_ids = set(new_db.index_to_docstore_id.values())
+        stale = [id for id in new_ids if id not in old_docs]
+        if stale:
+            new_db.delete(ids=stale)
+            new_ids.difference_update(stale)
+            for id in stale:
+                self.embedded.pop(id, None)
+        pending = [
+            id for id in old_docs if id not in new_ids or self.embedded.get(id) != fingerprints[id]
+        ]
+        self.total = len(old_docs)
+        return old_docs, fingerprints, new_ids, pending
+
+    def _store(
+        self,
+        new_db: "MyFaiss",
+        docs: dict[str, Document],
+        fingerprints: dict[str, str],
+        new_ids: set[str],
+        embedded: list[tuple[str, Any]],
+    ):
+        # documents already in the new index were updated, their vectors are replaced
+        for update in [True, False]:
+            items = [(id, vector) for id, vector in embedded if (id in new_ids) == update]
+            if not items:
+                continue
+            store = new_db.update_embeddings if update else new_db.add_embeddings
+            store(
+                [(docs[id].page_content, vector) for id, vector in items],
+                [docs[id].metadata for id, _ in items],
+                [id for id, _ in items],
+            )
+        for id, _ in embedded:
+            new_ids.add(id)
+            self.embedded[id] = fingerprints[id]
+
+    def _fingerprint_of(self, id: str) -> str | None:
+        doc = self.old_db.docstore.search(id)
+        return _fingerprint(doc) if isinstance(doc, Document) else None
+
+    def _old_docs(self) -> dict[str, Document]:
+        # documents of the old index only, a shared docstore also holds those added to the new one
+        with self.old_db._docs_lock:
+            docs = self.old_db.get_all_docs()
+            return {id: docs[id] for id in self.old_db.index_to_docstore_id.values() if id in docs}
+
+    def _create_db(self) -> "MyFaiss":
+        from python.helpers.memory import Memory
+        from python.helpers.memory_docstore import SQLiteDocstore
+
+        # the new index has the same documents, share the stored ones
+        docstore = self.old_db.docstore
+        return Memory.create_db(
+            self.embedder, docstore if isinstance(docstore, SQLiteDocstore) else None
+        )
+
+    def _load_checkpoint(self) -> "MyFaiss | None":
+        from python.helpers.memory import Memory
+
+        checkpoint_file = files.get_abs_path(self.staging_dir, CHECKPOINT_FILE)
+        if not files.exists(checkpoint_file) or not files.exists(self.staging_dir, "index.faiss"):
+            return None
+        try:
+            checkpoint = json.loads(files.read_file(checkpoint_file))
+            if (
+                checkpoint.get("model_provider") != self.model_provider
+                or checkpoint.get("model_name") != self.model_name
+            ):
+                return None  # checkpoint of a different target model
+            db = Memory.load_db(self.staging_dir, self.embedder)
+            self.embedded = checkpoint.get("embedded", {})
+            return db
+        except Exception as e:
+            PrintStyle.error(f"Discarding memory re-embedding checkpoint: {e}")
+            return None
+
+    def _save_checkpoint(self, new_db: "MyFaiss"):
+        os.makedirs(self.staging_dir, exist_ok=True)
+        new_db.save_local(folder_path=self.staging_dir)
+        files.write_file(
+            files.get_abs_path(self.staging_dir, CHECKPOINT_FILE),
+            json.dumps(
+                {
+                    "model_provider": self.model_provider,
+                    "model_name": self.model_name,
+                    "done": self.done,
+                    "total": self.total,
+                    "embedded": self.embedded,
+                }
+            ),
+        )
+
+    def _swap(self, new_db: "MyFaiss"):
+        from python.helpers.memory import Memory
+
+        # final catch-up, the old index takes no changes until it is replaced
+        with self.old_db._docs_lock:
+            old_docs, fingerprints, new_ids, pending = self._reconcile(new_db)
+            if pending:
+                vectors = new_db._embed_documents([old_docs[id].page_content for id in pending])
+                self._store(new_db, old_docs, fingerprints, new_ids, list(zip(pending, vectors)))
+
+            # write the complete index into staging, then mark it for the swap, a crash before
+            # the mark leads to a resume, after it startup finishes the swap (finish_swap)
+            self._save_checkpoint(new_db)
+            files.write_file(
+                files.get_abs_path(self.staging_dir, "embedding.json"),
+                json.dumps({"model_provider": self.model_provider, "model_name": self.model_name}),
+            )
+            swap_file = files.get_abs_path(self.staging_dir, SWAP_FILE)
+            files.write_file(swap_file + ".part", json.dumps(SWAPPED_FILES))
+            os.replace(swap_file + ".part", swap_file)
+            finish_swap(self.db_dir)
+            Memory.index[self.memory_subdir] = new_db
+
+    def _progress(self, text: str):
+        PrintStyle.standard(text)
+        if self.log_item:
+            self.log_item.update(heading=text, reembed=f"{self.done}/{self.total}")
+
+
+def finish_swap(db_dir: str) -> bool:
+    """
+    Move a re-embedded index marked for the swap from staging into the memory folder.
+    Called before an index is loaded, completes a swap interrupted by a crash.
+    Returns whether a swap was finished.
+    """
+    staging_dir = os.path.join(db_dir, STAGING_DIR)
+    swap_file = os.path.join(staging_dir, SWAP_FILE)
+    if not os.path.exists(swap_file):
+        return False
+    # files already moved before an interruption are no longer in staging
+    for name in json.loads(files.read_file(swap_file)):
+        source = os.path.join(staging_dir, name)
+        if os.path.exists(source):
+            os.replace(source, os.path.join(db_dir, name))
+    shutil.rmtree(staging_dir, ignore_errors=True)
+    return True
+
+
+def _fingerprint(doc: Document) -> str:
+    content = json.dumps([doc.page_content, doc.metadata], sort_keys=True, default=str)
+    return hashlib.sha256(content.encode()).hexdigest()[:16]
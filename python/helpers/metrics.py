@@ -0,0 +1,30 @@
+import threading
+from typing import Any, Callable
+
+from python.helpers.print_style import PrintStyle
+
+# named providers of runtime statistics, collected on demand by the metrics api
+_providers: dict[str, Callable[[], dict[str, Any]]] = {}
+_lock = threading.Lock()
+
+
+def register(name: str, provider: Callable[[], dict[str, Any]]):
+    with _lock:
+        _providers[name] = provider
+
+
+def unregister(name: str):
+    with _lock:
+        _providers.pop(name, None)
+
+
+def collect(prefix: str = "") -> dict[str, dict[str, Any]]:
+    with _lock:
+        providers = {k: v for k, v in _providers.items() if k.startswith(prefix)}
+    result = {}
+    for name, provider in providers.items():
+        try:
+            result[name] = provider()
+        except Exception as e:
+            PrintStyle.error(f"Failed to collect metrics '{name}': {e}")
+    return result
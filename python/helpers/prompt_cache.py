@@ -0,0 +1,182 @@
+import hashlib
+import threading
+from typing import Any
+
+from langchain_core.messages import BaseMessage, HumanMessage
+
+from python.helpers import metrics
+
+# prompt assembly of the agent loop:
+# "cache" - stable system prompt, append-only history, volatile extras as a separate tail
+# "merged" - extras merged into the last history message
+PROMPT_LAYOUT = "cache"
+
+# providers taking cache_control markers, with model name parts when only some of their models do
+CACHE_MARKER_PROVIDERS: dict[str, tuple[str, ...]] = {
+    "anthropic": (),
+    "bedrock": ("claude", "nova"),
+    "vertex_ai": ("claude",),
+    "openrouter": ("claude", "anthropic"),
+}
+
+# providers asked to report usage in the last chunk of streamed responses
+STREAM_USAGE_PROVIDERS = frozenset(
+    {"anthropic", "bedrock", "vertex_ai", "openrouter", "openai", "deepseek"}
+)
+
+# additional_kwargs key of messages ending with volatile content, the number of trailing content blocks
+TAIL_KEY = "prompt_cache_tail"
+
+# agent data key of the fingerprint of the last system prompt, not persisted
+DATA_NAME_PREFIX = "_prompt_cache_prefix"
+
+_CACHE_CONTROL = {"type": "ephemeral"}
+
+
+def append_tail(messages: list[BaseMessage], content: str) -> list[BaseMessage]:
+    """
+    Messages with volatile content appended after them, without changing their content.
+
+    The tail is a separate content block of the last human message, or a new human
+    message after an ai message, so the roles keep alternating.
+    """
+    if messages and isinstance(messages[-1], HumanMessage):
+        last = messages[-1]
+        blocks = [*_blocks(last.content), {"type": "text", "text": content}]
+        tail = HumanMessage(content=blocks, additional_kwargs={TAIL_KEY: 1})  # type: ignore
+        return [*messages[:-1], tail]
+    return [*messages, HumanMessage(content=content, additional_kwargs={TAIL_KEY: 1})]
+
+
+def supports_markers(provider: str, model: str) -> bool:
+    if provider not in CACHE_MARKER_PROVIDERS:
+        return False
+    parts = CACHE_MARKER_PROVIDERS[provider]
+    return not parts or any(part in model.lower() for part in parts)
+
+
+def breakpoints(messages: list[BaseMessage]) -> list[tuple[int, int]]:
+    """
+    Cache breakpoints of messages as (message index, trailing blocks skipped).
+
+    One at the end of the leading system messages and one at the end of the content
+    before the volatile tail.
+    """
+    result: list[tuple[int, int]] = []
+    system = -1
+    while system + 1 < len(messages) and messages[system + 1].type == "system":
+        system += 1
+    if system >= 0:
+        result.append((system, 0))
+
+    for index, message in enumerate(messages):
+        tail = message.additional_kwargs.get(TAIL_KEY)
+        if not tail:
+            continue
+        if len(_blocks(message.content)) > tail:
+            result.append((index, tail))
+        elif index - 1 > system:
+            result.append((index - 1, 0))
+        break
+    return result
+
+
+def add_markers(messages: list[BaseMessage], converted: list[dict]) -> list[dict]:
+    """Converted messages with cache_control markers at the breakpoints of messages."""
+    marked = False
+    for index, skip in breakpoints(messages):
+        message = converted[index]
+        blocks = _blocks(message["content"])
+        position = len(blocks) - 1 - skip
+        # empty text blocks can not be cached
+        if position < 0 or blocks[position].get("text") == "":
+            continue
+        blocks[position] = {**blocks[position], "cache_control": _CACHE_CONTROL}
+        converted[index] = {**message, "content": blocks}
+        marked = True
+    if marked:
+        _count("marked_requests")
+    return converted
+
+
+def merge_tails(messages: list[BaseMessage], converted: list[dict]) -> list[dict]:
+    """Converted messages with text only tails joined into plain text, for providers without markers."""
+    for index, message in enumerate(messages):
+        content = converted[index]["content"]
+        if not message.additional_kwargs.get(TAIL_KEY) or not isinstance(content, list):
+            continue
+        blocks = _blocks(content)
+        if all(block.get("type") == "text" for block in blocks):
+            converted[index] = {**converted[index], "content": "\n".join(b["text"] for b in blocks)}
+    return converted
+
+
+def track_prefix(agent: Any, system_text: str):
+    """Counts prompts of the agent whose system prompt changed since its previous one."""
+    fingerprint = hashlib.sha1(system_text.encode("utf-8", "replace")).hexdigest()
+    previous = agent.get_data(DATA_NAME_PREFIX)
+    if previous is not None:
+        _count("prefix_reuses" if previous == fingerprint else "prefix_changes")
+    agent.set_data(DATA_NAME_PREFIX, fingerprint)
+
+
+def get_usage(chunk: Any) -> Any:
+    return _get(chunk, "usage")
+
+
+def track_usage(usage: Any):
+    """Adds prompt and cached token counts of a response usage, in any provider format."""
+    if not usage:
+        return
+    prompt = _get(usage, "prompt_tokens") or 0
+    details = _get(usage, "prompt_tokens_details")
+    cached = (_get(details, "cached_tokens") if details else 0) or _get(usage, "cache_read_input_tokens") or 0
+    written = _get(usage, "cache_creation_input_tokens") or 0
+    with _stats_lock:
+        _stats["usage_reports"] += 1
+        _stats["prompt_tokens"] += prompt
+        _stats["cached_tokens"] += cached
+        _stats["cache_write_tokens"] += written
+        if cached:
+            _stats["cache_hits"] += 1
+
+
+_stats_lock = threading.Lock()
+_stats: dict[str, Any] = {
+    "marked_requests": 0,
+    "prefix_reuses": 0,
+    "prefix_changes": 0,
+    "usage_reports": 0,
+    "cache_hits": 0,
+    "prompt_tokens": 0,
+    "cached_tokens": 0,
+    "cache_write_tokens": 0,
+}
+
+
+def get_stats() -> dict[str, Any]:
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["cached_ratio"] = stats["cached_tokens"] / stats["prompt_tokens"] if stats["prompt_tokens"] else 0
+    stats["layout"] = PROMPT_LAYOUT
+    return stats
+
+
+def _blocks(content: Any) -> list:
+    if isinstance(content, list):
+        return [{"type": "text", "text": b} if isinstance(b, str) else b for b in content]
+    return [{"type": "text", "text": content}]
+
+
+def _get(obj: Any, key: str) -> Any:
+    if isinstance(obj, dict):
+        return obj.get(key)
+    return getattr(obj, key, None)
+
+
+def _count(key: str, value: int = 1):
+    with _stats_lock:
+        _stats[key] += value
+
+
+metrics.register("prompt_cache", get_stats)
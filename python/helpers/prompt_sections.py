@@ -0,0 +1,123 @@
+import os
+import stat
+import threading
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Callable, Hashable
+
+from python.helpers import files, metrics
+
+if TYPE_CHECKING:
+    from agent import Agent
+
+SECTIONS_CACHE_SIZE = 64  # rendered sections kept, for all agents, profiles and projects
+
+
+class SectionCache:
+    """
+    Rendered system prompt sections keyed by the fingerprint of their inputs.
+
+    A section is rendered again only when its fingerprint changes, the fingerprint
+    has to cover everything the rendered text depends on.
+    """
+
+    def __init__(self, size: int | None = None):
+        self.size = size
+        self._lock = threading.Lock()
+        self._sections: OrderedDict[tuple[str, Hashable], str] = OrderedDict()
+        self._stats: dict[str, dict[str, Any]] = {}
+
+    def get(self, name: str, fingerprint: Hashable, render: Callable[[], str]) -> str:
+        key = (name, fingerprint)
+        with self._lock:
+            stats = self._stats.setdefault(name, {"hits": 0, "misses": 0, "render_seconds": 0.0})
+            if key in self._sections:
+                self._sections.move_to_end(key)
+                stats["hits"] += 1
+                return self._sections[key]
+
+        # rendered outside of the lock, sections of other agents are not blocked
+        start = time.perf_counter()
+        text = render()
+        seconds = time.perf_counter() - start
+
+        with self._lock:
+            stats["misses"] += 1
+            stats["render_seconds"] += seconds
+            self._sections[key] = text
+            self._sections.move_to_end(key)
+            while len(self._sections) > (self.size or SECTIONS_CACHE_SIZE):
+                self._sections.popitem(last=False)
+        return text
+
+    def clear(self):
+        with self._lock:
+            self._sections.clear()
+
+    def get_stats(self) -> dict[str, Any]:
+        with self._lock:
+            sections = {name: dict(stats) for name, stats in self._stats.items()}
+            cached = len(self._sections)
+        for stats in sections.values():
+            total = stats["hits"] + stats["misses"]
+            stats["hit_rate"] = stats["hits"] / total if total else 0
+        hits = sum(s["hits"] for s in sections.values())
+        total = hits + sum(s["misses"] for s in sections.values())
+        return {
+            "cached": cached,
+            "hit_rate": hits / total if total else 0,
+            "sections": sections,
+        }
+
+
+_cache = SectionCache()
+
+
+def get_section(name: str, fingerprint: Hashable, render: Callable[[], str]) -> str:
+    """Section text from the shared cache, rendered when its fingerprint is new."""
+    return _cache.get(name, fingerprint, render)
+
+
+def paths_state(*paths: str) -> tuple:
+    """Modification times and sizes of paths, and of the files directly in directories."""
+    state: list[tuple] = []
+    for path in paths:
+        try:
+            path_stat = os.stat(path)
+        except OSError:
+            state.append((path, None))
+            continue
+        state.append((path, path_stat.st_mtime_ns, path_stat.st_size))
+        if stat.S_ISDIR(path_stat.st_mode):
+            with os.scandir(path) as entries:
+                for entry in sorted(entries, key=lambda e: e.name):
+                    try:
+                        entry_stat = entry.stat()
+                    except OSError:
+                        continue
+                    if stat.S_ISREG(entry_stat.st_mode):
+                        state.append((entry.name, entry_stat.st_mtime_ns, entry_stat.st_size))
+    return tuple(state)
+
+
+def prompt_files_state(agent: "Agent") -> tuple:
+    """
+    State of the prompt files an agent reads, its profile and default prompt folders.
+
+    Includes the agent profile descriptions listed by the subordinate tool prompt.
+    """
+    folders = [files.get_abs_path("prompts")]
+    if agent.config.profile:
+        folders.insert(0, files.get_abs_path("agents", agent.config.profile, "prompts"))
+    profiles = [
+        files.get_abs_path("agents", profile, "_context.md")
+        for profile in sorted(files.get_subdirectories("agents", exclude=["_example"]))
+    ]
+    return paths_state(*folders, files.get_abs_path("agents"), *profiles)
+
+
+def get_stats() -> dict[str, Any]:
+    return _cache.get_stats()
+
+
+metrics.register("system_prompt_sections", get_stats)
@@ -145,6 +145,10 @@ class SecretsManager:
         self._secrets_cache = None
         self._last_raw_text = None
 
+    def get_files(self) -> Tuple[str, ...]:
+        """Secrets files of this manager, in merge order."""
+        return self._files
+
     def read_secrets_raw(self) -> str:
         """Read raw secrets file content from local filesystem (same system)."""
         parts: List[str] = []
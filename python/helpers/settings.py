@@ -72,6 +72,7 @@ class Settings(TypedDict):
     memory_memorize_enabled: bool
     memory_memorize_consolidation: bool
     memory_memorize_replace_threshold: float
+    memory_vector_storage: dict[str, str]
 
     api_keys: dict[str, str]
 
@@ -161,6 +162,7 @@ API_KEY_PLACEHOLDER = "************"
 
 SETTINGS_FILE = files.get_abs_path("tmp/settings.json")
 _settings: Settings | None = None
+_version: str | None = None
 
 
 def convert_out(settings: Settings) -> SettingsOutput:
@@ -835,6 +837,16 @@ def convert_out(settings: Settings) -> SettingsOutput:
         }
     )
 
+    memory_fields.append(
+        {
+            "id": "memory_vector_storage",
+            "title": "Vector storage",
+            "description": "How memory vectors are stored, per memory subdirectory. Format is SUBDIR=MODE on individual lines, * applies to all others. Modes: float32 (exact), float16 (half size), int8 (quarter size) and pq (product quantization, smallest, used from 4096 memories on). Quantized vectors are re-ranked with exact ones kept on disk. Existing memories are converted on next load.",
+            "type": "textarea",
+            "value": _dict_to_env(settings["memory_vector_storage"]),
+        }
+    )
+
     memory_section: SettingsSection = {
         "id": "memory",
         "title": "Memory",
@@ -1323,7 +1335,10 @@ def convert_in(settings: dict) -> Settings:
 
                 if not should_skip:
                     # Special handling for browser_http_headers
-                    if field["id"] == "browser_http_headers" or field["id"].endswith("_kwargs"):
+                    if (
+                        field["id"] in ("browser_http_headers", "memory_vector_storage")
+                        or field["id"].endswith("_kwargs")
+                    ):
                         current[field["id"]] = _env_to_dict(field["value"])
                     elif field["id"].startswith("api_key_"):
                         current["api_keys"][field["id"]] = field["value"]
@@ -1502,6 +1517,7 @@ def get_default_settings() -> Settings:
         memory_memorize_enabled=True,
         memory_memorize_consolidation=True,
         memory_memorize_replace_threshold=0.9,
+        memory_vector_storage={"*": "float32"},
         api_keys={},
         auth_login="",
         auth_password="",
@@ -1555,11 +1571,12 @@ def _apply_settings(previous: Settings | None):
                 whisper.preload, _settings["stt_model_size"]
             )  # TODO overkill, replace with background task
 
-        # force memory reload on embedding model change
+        # force memory reload on embedding model or vector storage change
         if not previous or (
             _settings["embed_model_name"] != previous["embed_model_name"]
             or _settings["embed_model_provider"] != previous["embed_model_provider"]
             or _settings["embed_model_kwargs"] != previous["embed_model_kwargs"]
+            or _settings["memory_vector_storage"] != previous.get("memory_vector_storage")
         ):
             from python.helpers.memory import reload as memory_reload
 
@@ -1735,4 +1752,8 @@ def create_auth_token() -> str:
 
 
 def _get_version():
-    return git.get_version()
+    # read from git once, the version does not change while running
+    global _version
+    if _version is None:
+        _version = git.get_version()
+    return _version
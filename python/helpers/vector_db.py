@@ -1,13 +1,17 @@
+from collections import OrderedDict
 from typing import Any, List, Sequence
+import hashlib
+import threading
 import uuid
+import weakref
 from langchain_community.vectorstores import FAISS
 
 # faiss needs to be patched for python 3.12 on arm #TODO remove once not needed
 import faiss
+import numpy as np
 
 
 from langchain_core.documents import Document
-from langchain_classic.storage import InMemoryByteStore
 from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain_community.vectorstores.utils import (
     DistanceStrategy,
@@ -16,6 +20,17 @@ from langchain_classic.embeddings import CacheBackedEmbeddings
 from simpleeval import simple_eval
 
 from agent import Agent
+from python.helpers import files, metrics
+from python.helpers.embedding_cache import EmbeddingCacheStore, create_cached_embeddings
+from python.helpers.embedding_batcher import batched
+
+# in-memory embedding cache per model, least recently used vectors beyond it are evicted
+EMBEDDING_CACHE_MAX_BYTES = 256 * 1024 * 1024
+# evicted vectors spill into a disk cache of this size, 0 disables the disk tier
+EMBEDDING_SPILL_MAX_BYTES = 1024 * 1024 * 1024
+EMBEDDING_SPILL_DIR = "tmp/document_query"
+# indexes of recently queried documents kept for reuse after no query holds them anymore
+SHARED_INDEXES = 16
 
 
 class MyFaiss(FAISS):
@@ -34,33 +49,94 @@ class MyFaiss(FAISS):
 class VectorDB:
 
     _cached_embeddings: dict[str, CacheBackedEmbeddings] = {}
+    _dimensions: dict[str, int] = {}
+
+    # indexes of whole documents by content hash, shared by all contexts querying them
+    _shared: "weakref.WeakValueDictionary[str, VectorDB]" = weakref.WeakValueDictionary()
+    _recent: "OrderedDict[str, VectorDB]" = OrderedDict()
+    _shared_lock = threading.Lock()
+    _shared_hits = 0
+    _shared_misses = 0
+
+    @staticmethod
+    def _get_namespace(agent: Agent) -> str:
+        config = agent.config.embeddings_model
+        return files.safe_file_name(config.provider + "_" + config.name)
 
     @staticmethod
     def _get_embeddings(agent: Agent, cache: bool = True):
-        model = agent.get_embedding_model()
         if not cache:
-            return model  # return raw embeddings if cache is False
-        namespace = getattr(
-            model,
-            "model_name",
-            "default",
-        )
+            return agent.get_embedding_model()  # return raw embeddings if cache is False
+        namespace = VectorDB._get_namespace(agent)
         if namespace not in VectorDB._cached_embeddings:
-            store = InMemoryByteStore()
-            VectorDB._cached_embeddings[namespace] = (
-                CacheBackedEmbeddings.from_bytes_store(
-                    model,
-                    store,
-                    namespace=namespace,
+            model = agent.get_embedding_model()
+            spill = None
+            if EMBEDDING_SPILL_MAX_BYTES:
+                spill = EmbeddingCacheStore(
+                    files.get_abs_path(EMBEDDING_SPILL_DIR, namespace + ".db"),
+                    max_bytes=EMBEDDING_SPILL_MAX_BYTES,
                 )
+            # packed in-memory store, bounded
+            store = EmbeddingCacheStore(max_bytes=EMBEDDING_CACHE_MAX_BYTES, spill=spill)
+            VectorDB._cached_embeddings[namespace] = create_cached_embeddings(
+                batched(model, namespace),
+                store,
+                namespace=namespace,
             )
+            metrics.register(f"vector_db/embeddings/{namespace}", store.get_stats)
         return VectorDB._cached_embeddings[namespace]
 
+    @staticmethod
+    def document_key(agent: Agent, *parts: str) -> str:
+        """Key of a document index, from the embedding model and everything the index is built from."""
+        hash = hashlib.sha256(VectorDB._get_namespace(agent).encode())
+        for part in parts:
+            hash.update(b"\0" + part.encode())
+        return hash.hexdigest()
+
+    @staticmethod
+    def get_shared(key: str) -> "VectorDB | None":
+        with VectorDB._shared_lock:
+            db = VectorDB._shared.get(key)
+            if db is None:
+                VectorDB._shared_misses += 1
+                return None
+            VectorDB._shared_hits += 1
+            VectorDB._remember(key, db)
+            return db
+
+    @staticmethod
+    def share(key: str, db: "VectorDB") -> "VectorDB":
+        """Make db the shared index of key, or return the one shared meanwhile. Shared indexes must not change."""
+        with VectorDB._shared_lock:
+            db = VectorDB._shared.setdefault(key, db)
+            VectorDB._remember(key, db)
+            return db
+
+    @staticmethod
+    def get_shared_stats() -> dict[str, Any]:
+        return {
+            "indexes": len(VectorDB._shared),
+            "recent": len(VectorDB._recent),
+            "hits": VectorDB._shared_hits,
+            "misses": VectorDB._shared_misses,
+        }
+
+    @staticmethod
+    def _remember(key: str, db: "VectorDB"):
+        VectorDB._recent[key] = db
+        VectorDB._recent.move_to_end(key)
+        while len(VectorDB._recent) > SHARED_INDEXES:
+            VectorDB._recent.popitem(last=False)
+
     def __init__(self, agent: Agent, cache: bool = True):
         self.agent = agent
         self.cache = cache  # store cache preference
         self.embeddings = self._get_embeddings(agent, cache=cache)
-        self.index = faiss.IndexFlatIP(len(self.embeddings.embed_query("example")))
+        namespace = VectorDB._get_namespace(agent)
+        if namespace not in VectorDB._dimensions:
+            VectorDB._dimensions[namespace] = len(self.embeddings.embed_query("example"))
+        self.index = faiss.IndexFlatIP(VectorDB._dimensions[namespace])
 
         self.db = MyFaiss(
             embedding_function=self.embeddings,
@@ -85,6 +161,49 @@ class VectorDB:
             filter=comparator,
         )
 
+    def search_by_vector(
+        self, embedding: list[float], limit: int, threshold: float, filter: str = ""
+    ) -> list[tuple[Document, float]]:
+        """Similarity search with an embedded query, returns (document, relevance score) pairs."""
+        comparator = get_comparator(filter) if filter else None
+        results = self.db.similarity_search_with_score_by_vector(
+            embedding, k=limit, filter=comparator, fetch_k=max(limit * 4, 20)
+        )
+        return [
+            (doc, relevance)
+            for doc, score in results
+            if (relevance := cosine_normalizer(float(score))) >= threshold
+        ]
+
+    async def embed_queries(self, queries: Sequence[str]) -> list[list[float]]:
+        # one batch, past the cache: queries are not worth caching and would come back as float16
+        embedder = getattr(self.embeddings, "underlying_embeddings", self.embeddings)
+        return await embedder.aembed_documents(list(queries))
+
+    def search_by_vectors(
+        self, embeddings: Sequence[Sequence[float]], limit: int, threshold: float
+    ) -> list[list[tuple[Document, float]]]:
+        """
+        Similarity search of several embedded queries in one index call.
+        Returns (document, relevance score) pairs per query, best first.
+        """
+        results: list[list[tuple[Document, float]]] = [[] for _ in embeddings]
+        k = min(limit, self.db.index.ntotal)
+        if not k or not len(embeddings):
+            return results
+        scores, positions = self.db.index.search(np.asarray(embeddings, dtype=np.float32), k)
+        for found, row_scores, row_positions in zip(results, scores, positions):
+            for score, position in zip(row_scores, row_positions):
+                if position == -1:
+                    continue
+                relevance = cosine_normalizer(float(score))
+                if relevance < threshold:
+                    continue
+                doc = self.db.docstore.search(self.db.index_to_docstore_id[int(position)])
+                if isinstance(doc, Document):
+                    found.append((doc, relevance))
+        return results
+
     async def search_by_metadata(self, filter: str, limit: int = 0) -> list[Document]:
         comparator = get_comparator(filter)
         all_docs = self.db.get_all_docs()
@@ -118,6 +237,9 @@ class VectorDB:
         return rem_docs
 
 
+metrics.register("vector_db/shared_indexes", VectorDB.get_shared_stats)
+
+
 def format_docs_plain(docs: list[Document]) -> list[str]:
     result = []
     for doc in docs:
@@ -140,7 +262,7 @@ def cosine_normalizer(val: float) -> float:
 def get_comparator(condition: str):
     def comparator(data: dict[str, Any]):
         try:
-            result = simple_eval(condition, {}, data)
+            result = simple_eval(condition, names=data)
             return result
         except Exception:
             # PrintStyle.error(f"Error evaluating condition: {e}")
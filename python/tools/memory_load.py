@@ -9,7 +9,9 @@ class MemoryLoad(Tool):
 
     async def execute(self, query="", threshold=DEFAULT_THRESHOLD, limit=DEFAULT_LIMIT, filter="", **kwargs):
         db = await Memory.get(self.agent)
-        docs = await db.search_similarity_threshold(query=query, limit=limit, threshold=threshold, filter=filter)
+        # exact strings like error messages, names or paths are matched lexically as well
+        results = await db.search_hybrid(query=query, limit=limit, threshold=threshold, filter=filter)
+        docs = [doc for doc, _score in results]
 
         if len(docs) == 0:
             result = self.agent.read_prompt("fw.memories_not_found.md", query=query)
@@ -0,0 +1,110 @@
+"""
+Benchmark: prompt tokens spent on candidate memories per consolidation.
+
+Compares the legacy candidate selection (first seen across keyword searches, rank based
+scores, fixed count) with the score and token budget based selection of MemoryConsolidator.
+Uses synthetic memories and hashed bag-of-words embeddings, no models or LLM calls.
+
+Run: python tests/benchmarks/bench_consolidation_prompt.py
+"""
+
+import sys
+import os
+import asyncio
+import random
+import zlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from python.helpers.memory import Memory
+from python.helpers.memory_consolidation import MemoryConsolidator, ConsolidationConfig
+from python.helpers.tokens import approximate_tokens
+
+DIM = 256
+MEMORIES = 2000
+CONSOLIDATIONS = 100
+TOPICS = 40
+
+
+class HashedEmbeddings(Embeddings):
+    def embed_documents(self, texts):
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+    def _embed(self, text):
+        vector = [0.0] * DIM
+        for word in text.lower().split():
+            vector[zlib.crc32(word.encode()) % DIM] += 1.0
+        norm = sum(v * v for v in vector) ** 0.5 or 1.0
+        return [v / norm for v in vector]
+
+
+def make_text(rng: random.Random, topic_words: list[str], common: list[str]) -> str:
+    length = rng.choice([12, 20, 40, 120, 300])  # some memories are long
+    return " ".join(rng.choice(topic_words if rng.random() < 0.6 else common) for _ in range(length))
+
+
+def legacy_select(results, max_count: int) -> list[Document]:
+    seen, selected = set(), []
+    for result in results:
+        for doc, _score in result:
+            if doc.metadata["id"] not in seen:
+                seen.add(doc.metadata["id"])
+                selected.append(doc)
+    return selected[:max_count]
+
+
+async def main():
+    rng = random.Random(42)
+    common = [f"common{i}" for i in range(200)]
+    topics = [[f"t{t}w{i}" for i in range(30)] for t in range(TOPICS)]
+
+    db = Memory.create_db(HashedEmbeddings())
+    docs = []
+    for i in range(MEMORIES):
+        docs.append(Document(make_text(rng, rng.choice(topics), common), metadata={"id": f"m{i}", "area": "main"}))
+    db.add_documents(docs, ids=[d.metadata["id"] for d in docs])
+    memory = Memory(db, memory_subdir="benchmark")
+
+    config = ConsolidationConfig(similarity_threshold=0.6, max_similar_memories=8, max_llm_context_memories=5)
+    consolidator = MemoryConsolidator(None, config)  # type: ignore
+
+    legacy_tokens, new_tokens, legacy_count, new_count = 0, 0, 0, 0
+    for _ in range(CONSOLIDATIONS):
+        topic = rng.choice(topics)
+        new_memory = make_text(rng, topic, common)
+        keywords = [" ".join(rng.sample(topic, 3)) for _ in range(3)]
+        results = await memory.search_similarity_multi(
+            [new_memory] + keywords,
+            limit=[config.max_similar_memories] + [3] * len(keywords),
+            threshold=config.similarity_threshold,
+            filters="area == 'main'",
+        )
+
+        legacy = legacy_select(results, config.max_llm_context_memories)
+        best: dict[str, tuple[Document, float]] = {}
+        for result in results:
+            for doc, score in result:
+                if doc.metadata["id"] not in best or score > best[doc.metadata["id"]][1]:
+                    best[doc.metadata["id"]] = (doc, score)
+        selected = consolidator._select_candidates(list(best.values()))
+
+        legacy_tokens += approximate_tokens(consolidator._format_similar_memories(legacy))
+        new_tokens += approximate_tokens(consolidator._format_similar_memories(selected))
+        legacy_count += len(legacy)
+        new_count += len(selected)
+
+    print(f"consolidations: {CONSOLIDATIONS}, memories in store: {MEMORIES}")
+    print(f"legacy selection: {legacy_count / CONSOLIDATIONS:.2f} candidates, {legacy_tokens / CONSOLIDATIONS:.0f} prompt tokens per consolidation")
+    print(f"scored selection: {new_count / CONSOLIDATIONS:.2f} candidates, {new_tokens / CONSOLIDATIONS:.0f} prompt tokens per consolidation")
+    if legacy_tokens:
+        print(f"reduction: {100 * (1 - new_tokens / legacy_tokens):.1f}%")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,65 @@
+"""
+Benchmark: cost of storing the context window snapshot in each agent iteration.
+
+Compares formatting the full prompt and counting its tokens every iteration with the
+lazy snapshot, which counts only new messages and renders the text on request.
+Each iteration adds a tool call and its result to a prompt of about 100k tokens.
+
+Run: python tests/benchmarks/bench_context_window.py
+"""
+
+import sys
+import os
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import litellm  # noqa: F401  # bundles the tiktoken encodings, no download
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from langchain_core.prompts import ChatPromptTemplate
+
+from python.helpers import context_window, tokens
+
+ITERATIONS = 20
+PROMPT_TOKENS = 100000
+MESSAGE_TOKENS = 500
+
+
+def message(i: int):
+    body = f"iteration {i} " + "tool output line with some words " * (MESSAGE_TOKENS // 6)
+    return AIMessage(content=body) if i % 2 else HumanMessage(content=body)
+
+
+def main():
+    system = "You are an agent. " * 500
+    history = [message(i) for i in range(PROMPT_TOKENS // MESSAGE_TOKENS)]
+
+    tracker = context_window.ContextWindowTracker()
+    legacy, lazy = [], []
+    for i in range(ITERATIONS):
+        history.append(message(len(history)))
+        prompt = [SystemMessage(content=system), *history]
+
+        start = time.perf_counter()
+        full_text = ChatPromptTemplate.from_messages(prompt).format()
+        legacy_tokens = tokens.approximate_tokens(full_text)
+        legacy.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        window = tracker.snapshot(prompt)
+        lazy.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    same = window.text == full_text
+    render = time.perf_counter() - start
+
+    print(f"prompt of ~{legacy_tokens} tokens, {len(prompt)} messages, {ITERATIONS} iterations")
+    print(f"format and count every iteration: {sum(legacy) / ITERATIONS * 1000:.2f} ms")
+    print(f"lazy snapshot (after the first):  {sum(lazy[1:]) / (ITERATIONS - 1) * 1000:.2f} ms")
+    print(f"render on request:                {render * 1000:.2f} ms, same text: {same}")
+    print(f"token count {window.tokens} vs {legacy_tokens} ({window.tokens / legacy_tokens - 1:+.2%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Benchmark: latency of DocumentQueryHelper.document_qa before the answering call.
+
+Compares the legacy pipeline (one utility model call, embedding and filtered search per
+question, one after another) with the concurrent one (all query optimizations at once,
+one embedding batch, one multi-query search per document index).
+Uses a local fake LLM with a fixed response delay and hashed bag-of-words embeddings,
+no models or network calls.
+
+Run: python tests/benchmarks/bench_document_qa.py
+"""
+
+import sys
+import os
+import asyncio
+import random
+import time
+import zlib
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from langchain_core.embeddings import Embeddings
+
+from python.helpers import vector_db
+from python.helpers.print_style import PrintStyle
+from python.helpers.document_query import (
+    DEFAULT_SEARCH_THRESHOLD,
+    DocumentQueryHelper,
+    DocumentQueryStore,
+)
+
+DIM = 256
+DOCUMENTS = 4
+WORDS_PER_DOCUMENT = 20000
+LLM_DELAY = 0.2  # seconds per fake utility model response
+RUNS = 3
+
+
+class HashedEmbeddings(Embeddings):
+    def embed_documents(self, texts):
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+    def _embed(self, text):
+        vector = [0.0] * DIM
+        for word in text.lower().split():
+            vector[zlib.crc32(word.encode()) % DIM] += 1.0
+        norm = sum(v * v for v in vector) ** 0.5 or 1.0
+        return [v / norm for v in vector]
+
+
+class FakeLLMAgent:
+    """Agent stand-in whose models answer after a fixed delay."""
+
+    def __init__(self):
+        self.config = SimpleNamespace(embeddings_model=SimpleNamespace(provider="bench", name="hashed"))
+        self.utility_calls = 0
+
+    def get_embedding_model(self):
+        return HashedEmbeddings()
+
+    def parse_prompt(self, name: str, **kwargs) -> str:
+        return name
+
+    async def handle_intervention(self):
+        pass
+
+    async def call_utility_model(self, system: str, message: str) -> str:
+        self.utility_calls += 1
+        await asyncio.sleep(LLM_DELAY)
+        return message.split('"')[1] + " keywords"
+
+    async def call_chat_model(self, messages):
+        return "answer", ""
+
+
+async def legacy_search(helper: DocumentQueryHelper, document_uris: list[str], questions: list[str]):
+    selected = {}
+    for question in questions:
+        query = await helper.optimize_query(question)
+        uris = [helper.store.normalize_uri(uri) for uri in document_uris]
+        chunks = await helper.store.search_documents(
+            query=query,
+            limit=100,
+            threshold=DEFAULT_SEARCH_THRESHOLD,
+            filter=" or ".join(f"document_uri == '{uri}'" for uri in uris),
+        )
+        for chunk in chunks:
+            selected[chunk.metadata["id"]] = chunk
+    return selected
+
+
+async def main():
+    vector_db.EMBEDDING_SPILL_MAX_BYTES = 0
+    PrintStyle.standard = staticmethod(lambda text: None)  # type: ignore  # per search logs
+    rng = random.Random(1)
+    vocabulary = [f"word{i}" for i in range(3000)]
+    agent = FakeLLMAgent()
+    store = DocumentQueryStore(agent)  # type: ignore
+    uris = [f"/bench/doc{i}.txt" for i in range(DOCUMENTS)]
+    texts = {uri: " ".join(rng.choice(vocabulary) for _ in range(WORDS_PER_DOCUMENT)) for uri in uris}
+    for uri in uris:
+        await store.add_document(texts[uri], uri)
+
+    helper = DocumentQueryHelper(agent)  # type: ignore
+    helper.store = store
+
+    async def get_content(uri: str, add_to_db: bool = False) -> str:
+        await store.add_document(texts[uri], uri)  # a shared index lookup after the first run
+        return texts[uri]
+
+    helper.document_get_content = get_content  # type: ignore
+
+    print(f"{DOCUMENTS} documents, fake utility model delay {LLM_DELAY * 1000:.0f}ms, best of {RUNS}")
+    print(f"{'questions':>10}{'legacy ms':>12}{'concurrent ms':>15}{'same chunks':>13}")
+    for count in (1, 4, 8, 16):
+        questions = [" ".join(rng.sample(vocabulary, 6)) for _ in range(count)]
+        legacy, concurrent = [], []
+        for _ in range(RUNS):
+            start = time.perf_counter()
+            expected = await legacy_search(helper, uris, questions)
+            legacy.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            await helper.document_qa(uris, questions)
+            concurrent.append(time.perf_counter() - start)
+        queries = [await helper.optimize_query(question) for question in questions]
+        found = await store.search_documents_multi(queries, uris, 100, DEFAULT_SEARCH_THRESHOLD)
+        same = {chunk.metadata["id"] for chunks in found for chunk in chunks} == set(expected)
+        print(f"{count:>10}{min(legacy) * 1000:>12.1f}{min(concurrent) * 1000:>15.1f}{str(same):>13}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,83 @@
+"""
+Benchmark: wall time and utility model calls of History.compress on a large history.
+
+Compares the legacy loop (one compression step at a time, each waiting for its
+summary before the next part is measured again) with the planner (all summaries of a
+round concurrently, applied at once).
+Uses a local fake LLM with a fixed response delay, no models or network calls.
+
+Run: python tests/benchmarks/bench_history_compression.py
+"""
+
+import sys
+import os
+import asyncio
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from python.helpers import history as history_module
+from python.helpers.history import History
+from tests.test_history import legacy_compress
+
+CTX_LENGTH = 128000
+CTX_HISTORY = 0.7
+HISTORY_TOKENS = 200000  # size of the history before compression
+MESSAGE_TOKENS = 400
+MESSAGES_PER_TOPIC = 10
+LLM_DELAY = 0.2  # seconds per fake utility model response
+
+
+class FakeLLMAgent:
+    """Agent stand-in whose utility model answers after a fixed delay."""
+
+    def __init__(self):
+        self.utility_calls = 0
+
+    async def call_utility_model(self, system: str, message: str) -> str:
+        self.utility_calls += 1
+        await asyncio.sleep(LLM_DELAY)
+        return "summary " + "word " * 100
+
+    def read_prompt(self, file: str, **kwargs) -> str:
+        return f"{file} {kwargs.get('content', '')}"
+
+    def parse_prompt(self, file: str, **kwargs) -> str:
+        return f"summary: {kwargs.get('summary', '')}"
+
+
+def build_history(agent: FakeLLMAgent) -> History:
+    history = History(agent)  # type: ignore
+    body = "lorem ipsum " * (MESSAGE_TOKENS // 2)
+    messages = HISTORY_TOKENS // MESSAGE_TOKENS
+    for i in range(messages):
+        history.add_message(i % 2 == 1, f"message {i} {body}")
+        if i % MESSAGES_PER_TOPIC == MESSAGES_PER_TOPIC - 1 and i < messages - 3 * MESSAGES_PER_TOPIC:
+            history.new_topic()
+    return history
+
+
+async def measure(compress) -> tuple[float, int, int, bool]:
+    agent = FakeLLMAgent()
+    history = build_history(agent)
+    start = time.perf_counter()
+    await compress(history)
+    seconds = time.perf_counter() - start
+    return seconds, agent.utility_calls, history.get_tokens(), history.is_over_limit()
+
+
+async def main():
+    history_module.settings.get_settings = lambda: {  # type: ignore
+        "chat_model_ctx_length": CTX_LENGTH,
+        "chat_model_ctx_history": CTX_HISTORY,
+    }
+    budget = int(CTX_LENGTH * CTX_HISTORY)
+    print(f"history of {HISTORY_TOKENS} tokens into {budget}, fake utility model delay {LLM_DELAY * 1000:.0f}ms")
+    print(f"{'':>10}{'seconds':>10}{'calls':>8}{'tokens':>9}{'over limit':>12}")
+    for name, compress in (("legacy", lambda h: legacy_compress(h, budget)), ("planned", History.compress)):
+        seconds, calls, tokens, over = await measure(compress)
+        print(f"{name:>10}{seconds:>10.2f}{calls:>8}{tokens:>9}{str(over):>12}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
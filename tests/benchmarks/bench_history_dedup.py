@@ -0,0 +1,69 @@
+"""
+Benchmark: history size with and without deduplication of repeated contents.
+
+Simulates an agent session reading the same files and listings repeatedly, like
+re-running cat or ls between edits. Reports prompt tokens of the history, serialized
+chat size and serialization time, with deduplication off (contents always kept) and
+with repeated contents rendered as references.
+
+Run: python tests/benchmarks/bench_history_dedup.py
+"""
+
+import sys
+import os
+import random
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import litellm  # noqa: F401  # bundles the tiktoken encodings, no download
+
+from python.helpers import history as history_module, tokens
+from python.helpers.history import History
+
+TOOL_RESULTS = 300
+FILES = 20
+FILE_LINES = 150
+REPEAT_RATIO = 0.5  # share of tool results repeating an earlier read
+
+
+class Agent:
+    def read_prompt(self, file: str, **kwargs) -> str:
+        return f"<<\n{kwargs.get('length')} CHARACTERS OMITTED, SAME CONTENT AS EARLIER IN THE CONVERSATION\n>>"
+
+
+def build_history() -> History:
+    rng = random.Random(1)
+    files = [
+        "\n".join(f"def function_{f}_{i}(value): return value * {i}  # line {i}" for i in range(FILE_LINES))
+        for f in range(FILES)
+    ]
+    history = History(Agent())
+    for i in range(TOOL_RESULTS):
+        history.add_message(True, {"thoughts": [f"step {i}"], "tool_name": "code_execution_tool"})
+        if rng.random() < REPEAT_RATIO:
+            result = rng.choice(files)
+        else:
+            result = f"unique output {i}\n" + files[i % FILES].replace("value", f"v{i}")
+        history.add_message(False, {"tool_name": "code_execution_tool", "tool_result": result})
+        if i % 10 == 9:
+            history.new_topic()
+    return history
+
+
+def main():
+    print(f"{TOOL_RESULTS} tool results, {REPEAT_RATIO:.0%} repeating one of {FILES} files")
+    print(f"{'':>12}{'tokens':>10}{'serialized KB':>15}{'serialize ms':>14}")
+    for name, min_chars in (("no dedup", 10**9), ("dedup", history_module.DEDUP_MIN_CHARS)):
+        history_module.DEDUP_MIN_CHARS = min_chars
+        history = build_history()
+        start = time.perf_counter()
+        serialized = history.serialize()
+        seconds = time.perf_counter() - start
+        prompt_tokens = tokens.approximate_tokens(history.output_text())
+        print(f"{name:>12}{prompt_tokens:>10}{len(serialized.encode()) / 1024:>15.1f}{seconds * 1000:>14.2f}")
+    print(history.contents.get_stats())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Benchmark: cost of converting the history to LangChain messages in each agent iteration.
+
+Compares the uncached conversion (walk every bulk, topic and message, convert all
+outputs and group them) with History.output and History.output_langchain, which reuse
+the cached output and conversions of the unchanged prefix. Each iteration adds a tool
+call and its result to the current topic and a fresh extras message, like
+Agent.prepare_prompt.
+
+Run: python tests/benchmarks/bench_history_output.py
+"""
+
+import sys
+import os
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from python.helpers.history import (
+    History,
+    Message,
+    OutputMessage,
+    Topic,
+    output_langchain,
+)
+
+ITERATIONS = 50
+
+
+def uncached_output(record) -> list[OutputMessage]:
+    if isinstance(record, Message):
+        return [OutputMessage(ai=record.ai, content=record.summary or record.content)]
+    if isinstance(record, History):
+        records = [*record.bulks, *record.topics, record.current]
+        return [m for r in records for m in uncached_output(r)]
+    if record.summary:
+        return [OutputMessage(ai=False, content=record.summary)]
+    children = record.messages if isinstance(record, Topic) else record.records
+    return [m for r in children for m in uncached_output(r)]
+
+
+def build_history(topics: int, messages: int) -> History:
+    history = History(None)
+    for t in range(topics):
+        for m in range(messages):
+            if m % 2:
+                history.add_message(False, {"tool_name": "code", "result": f"output {t}.{m} " * 40})
+            else:
+                history.add_message(True, {"thoughts": [f"step {t}.{m}"] * 5, "tool_name": "code"})
+        history.new_topic()
+    return history
+
+
+def run(history: History, cached: bool) -> float:
+    start = time.perf_counter()
+    for i in range(ITERATIONS):
+        history.add_message(True, {"thoughts": [f"iteration {i}"], "tool_name": "code"})
+        history.add_message(False, {"tool_name": "code", "result": f"result {i} " * 40})
+        extras = [OutputMessage(ai=False, content=f"extras of iteration {i}")]
+        if cached:
+            history.output_langchain(history.output() + extras)
+        else:
+            output_langchain(uncached_output(history) + extras)
+    return (time.perf_counter() - start) / ITERATIONS
+
+
+def main():
+    print(f"ms per iteration, average of {ITERATIONS}")
+    print(f"{'messages':>10}{'uncached':>10}{'cached':>10}")
+    for topics in (10, 50, 200):
+        uncached = run(build_history(topics, 20), cached=False)
+        cached = run(build_history(topics, 20), cached=True)
+        print(f"{topics * 20:>10}{uncached * 1000:>10.2f}{cached * 1000:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Benchmark: history compression with a slow utility model, by summary strategy.
+
+Compresses the same history with the llm, deadline, staged and extractive strategies.
+The fake utility model answers after a delay growing with the input size, like a
+rate limited or overloaded provider. No models or network calls.
+
+Run: python tests/benchmarks/bench_history_summary.py
+"""
+
+import sys
+import os
+import asyncio
+import random
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from python.helpers import history as history_module
+from python.helpers import history_summary
+from python.helpers.history import History
+from python.helpers.print_style import PrintStyle
+
+CTX_LENGTH = 32000
+CTX_HISTORY = 0.7
+TOPICS = 30
+MESSAGES_PER_TOPIC = 10
+LLM_DELAY = 0.5  # seconds per utility model call
+LLM_DELAY_PER_1K_WORDS = 0.5  # additional seconds per 1000 input words
+DEADLINE = 1.0
+
+
+class SlowLLMAgent:
+    def __init__(self):
+        self.utility_calls = 0
+        self.input_words = 0
+
+    async def call_utility_model(self, system: str, message: str) -> str:
+        self.utility_calls += 1
+        words = len(message.split())
+        self.input_words += words
+        await asyncio.sleep(LLM_DELAY + LLM_DELAY_PER_1K_WORDS * words / 1000)
+        return "summary " + "word " * 100
+
+    def read_prompt(self, file: str, **kwargs) -> str:
+        content = kwargs.get("content", "")
+        return f"{file} {content if isinstance(content, str) else chr(10).join(content)}"
+
+    def parse_prompt(self, file: str, **kwargs) -> str:
+        return f"summary: {kwargs.get('summary', '')}"
+
+
+def build_history(agent: SlowLLMAgent) -> History:
+    rng = random.Random(1)
+    vocabulary = [f"term{i}" for i in range(2000)]
+    history = History(agent)  # type: ignore
+    for t in range(TOPICS):
+        for m in range(MESSAGES_PER_TOPIC):
+            sentences = [" ".join(rng.choices(vocabulary, k=12)) + "." for _ in range(20)]
+            history.add_message(m % 2 == 1, " ".join(sentences))
+        history.new_topic()
+    return history
+
+
+async def main():
+    history_module.settings.get_settings = lambda: {  # type: ignore
+        "chat_model_ctx_length": CTX_LENGTH,
+        "chat_model_ctx_history": CTX_HISTORY,
+    }
+    PrintStyle.warning = staticmethod(lambda text: None)  # type: ignore  # per fallback logs
+    history_summary.LLM_SUMMARY_DEADLINE = DEADLINE
+    history_summary.STAGED_INPUT_WORDS = 500
+
+    print(f"{TOPICS * MESSAGES_PER_TOPIC} messages, utility model {LLM_DELAY}s + {LLM_DELAY_PER_1K_WORDS}s per 1k words, deadline {DEADLINE}s")
+    print(f"{'strategy':>12}{'seconds':>10}{'llm calls':>11}{'llm words':>11}{'fallbacks':>11}")
+    for strategy in ("llm", "deadline", "staged", "extractive"):
+        history_summary.SUMMARY_STRATEGY = strategy
+        agent = SlowLLMAgent()
+        history = build_history(agent)
+        fallbacks = history_summary.get_stats()["deadline_fallbacks"]
+        start = time.perf_counter()
+        await history.compress()
+        seconds = time.perf_counter() - start
+        assert not history.is_over_limit()
+        fallbacks = history_summary.get_stats()["deadline_fallbacks"] - fallbacks
+        print(f"{strategy:>12}{seconds:>10.2f}{agent.utility_calls:>11}{agent.input_words:>11}{fallbacks:>11}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,99 @@
+"""
+Benchmark: resident memory and save time of the memory index by docstore backend.
+
+Builds a memory index of synthetic documents with random vectors, once with the legacy
+in-memory docstore (documents pickled with every save) and once with SQLiteDocstore
+(documents on disk, only ids pickled). Each variant runs in its own process, so RSS
+figures are not mixed.
+
+Run: python tests/benchmarks/bench_memory_docstore.py
+"""
+
+import sys
+import os
+import multiprocessing
+import random
+import string
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+DOCUMENTS = 20000
+TEXT_LENGTH = 1500  # characters per document, a typical knowledge chunk
+DIM = 64
+SAVES = 5
+
+
+def rss_mb() -> float:
+    with open("/proc/self/statm") as f:
+        pages = int(f.read().split()[1])
+    return pages * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+
+
+def run_variant(backend: str, queue):
+    import gc
+    import numpy as np
+    from langchain_core.embeddings import Embeddings
+    from python.helpers.memory import Memory
+    from python.helpers.memory_docstore import DB_FILE_NAME, SQLiteDocstore
+
+    class RandomEmbeddings(Embeddings):
+        def embed_documents(self, texts):
+            return np.random.rand(len(texts), DIM).tolist()
+
+        def embed_query(self, text):
+            return self.embed_documents([text])[0]
+
+    folder = tempfile.mkdtemp()
+    rng = random.Random(1)
+    docstore = SQLiteDocstore(os.path.join(folder, DB_FILE_NAME)) if backend == "sqlite" else None
+    db = Memory.create_db(RandomEmbeddings(), docstore)
+    gc.collect()
+    baseline = rss_mb()
+
+    batch = 1000
+    for start in range(0, DOCUMENTS, batch):
+        texts = [
+            "".join(rng.choices(string.ascii_lowercase + " ", k=TEXT_LENGTH)) for _ in range(batch)
+        ]
+        vectors = np.random.rand(batch, DIM).astype("float32").tolist()
+        ids = [f"id{start + i}" for i in range(batch)]
+        db.add_embeddings(
+            list(zip(texts, vectors)),
+            metadatas=[{"id": id, "area": "main"} for id in ids],
+            ids=ids,
+        )
+        del texts, vectors
+    gc.collect()
+    resident = rss_mb() - baseline
+
+    # each save follows a single inserted memory, as in normal use
+    timings = []
+    for i in range(SAVES):
+        db.add_texts(["one more memory"], metadatas=[{"id": f"extra{i}"}], ids=[f"extra{i}"])
+        t = time.perf_counter()
+        db.save_local(folder)
+        timings.append(time.perf_counter() - t)
+    pkl_mb = os.path.getsize(os.path.join(folder, "index.pkl")) / 1024 / 1024
+    queue.put((backend, resident, sum(timings) / len(timings), pkl_mb))
+
+
+def main():
+    ctx = multiprocessing.get_context("spawn")
+    results = []
+    for backend in ["memory", "sqlite"]:
+        queue = ctx.Queue()
+        process = ctx.Process(target=run_variant, args=(backend, queue))
+        process.start()
+        results.append(queue.get())
+        process.join()
+
+    print(f"{DOCUMENTS} documents of {TEXT_LENGTH} characters, {DIM} dimensions")
+    print(f"{'docstore':<10}{'RSS growth MB':>16}{'save ms':>12}{'index.pkl MB':>16}")
+    for backend, resident, save, pkl_mb in results:
+        print(f"{backend:<10}{resident:>16.1f}{save * 1000:>12.1f}{pkl_mb:>16.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Benchmark: footprint, search latency and recall@10 of memory vector storage modes.
+
+Builds one memory index of clustered synthetic unit vectors (embeddings of related texts
+are clustered, uniformly random vectors would understate quantization quality), converts
+it to each storage mode and searches it with noisy copies of stored vectors.
+Recall@10 is measured against exact float32 search, both for the raw quantized index
+and with re-ranking by the exact vectors kept on disk.
+
+Run: python tests/benchmarks/bench_memory_quantization.py
+"""
+
+import sys
+import os
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import faiss
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from python.helpers import memory_quantization as mq
+from python.helpers.memory import Memory
+from python.helpers.memory_docstore import DB_FILE_NAME, SQLiteDocstore
+
+VECTORS = 20000
+DIM = 384
+CLUSTERS = 200
+QUERIES = 200
+K = 10
+
+
+class RandomEmbeddings(Embeddings):
+    def embed_documents(self, texts):
+        return np.random.rand(len(texts), DIM).tolist()
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+
+def recall(found: np.ndarray, truth: np.ndarray) -> float:
+    return float(np.mean([len(set(f) & set(t)) / K for f, t in zip(found, truth)]))
+
+
+def main():
+    rng = np.random.default_rng(1)
+    centers = rng.normal(size=(CLUSTERS, DIM))
+    vectors = normalize(centers[rng.integers(CLUSTERS, size=VECTORS)] + rng.normal(scale=0.6, size=(VECTORS, DIM)))
+    queries = normalize(vectors[rng.integers(VECTORS, size=QUERIES)] + rng.normal(scale=0.3, size=(QUERIES, DIM)))
+    truth = np.argsort(-(queries @ vectors.T), axis=1)[:, :K]
+
+    folder = tempfile.mkdtemp()
+    db = Memory.create_db(RandomEmbeddings(), SQLiteDocstore(os.path.join(folder, DB_FILE_NAME)))
+    ids = [f"id{i}" for i in range(VECTORS)]
+    db.add_embeddings(zip(["" for _ in ids], vectors.tolist()), metadatas=[{"id": id} for id in ids], ids=ids)
+    Memory._save_db_file = staticmethod(lambda db, subdir: db.save_local(folder))  # type: ignore
+
+    print(f"{VECTORS} vectors of {DIM} dimensions in {CLUSTERS} clusters, {QUERIES} queries")
+    print(f"{'storage':<10}{'index MB':>10}{'disk MB':>10}{'search ms':>11}{'raw recall':>12}{'recall@10':>11}")
+    for mode in mq.MODES:
+        Memory._get_vector_storage = staticmethod(lambda subdir: mode)  # type: ignore
+        Memory._use_vector_storage(db, folder, "bench")
+        index_mb = faiss.serialize_index(db.index).nbytes / 1024 / 1024
+        vectors_file = os.path.join(folder, mq.VECTORS_FILE_NAME)
+        disk_mb = os.path.getsize(vectors_file) / 1024 / 1024 if os.path.exists(vectors_file) else 0
+
+        _, raw = db.index.search(queries, K)
+        found = []
+        start = time.perf_counter()
+        for query in queries:
+            found.append(db.search_index(query[None, :], K)[1][0])
+        search_ms = (time.perf_counter() - start) / QUERIES * 1000
+        print(
+            f"{mode:<10}{index_mb:>10.2f}{disk_mb:>10.2f}{search_ms:>11.2f}"
+            f"{recall(raw, truth):>12.3f}{recall(np.array(found), truth):>11.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
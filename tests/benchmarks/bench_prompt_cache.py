@@ -0,0 +1,108 @@
+"""
+Benchmark: provider prompt cache hits of the agent loop, by prompt layout.
+
+Runs agent loop iterations against a fake provider caching prompts up to cache_control
+markers, like Anthropic. Each iteration adds a tool call and its result to the history,
+the extras change every iteration like the current datetime does. Reports the share of
+prompt tokens read from the cache with extras merged into the history and with the
+cache layout. No models or network calls.
+
+Run: python tests/benchmarks/bench_prompt_cache.py
+"""
+
+import sys
+import os
+import asyncio
+import json
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import litellm  # noqa: F401  # bundles the tiktoken encodings, no download
+
+from langchain_core.messages import SystemMessage
+
+import models
+from python.helpers import prompt_cache
+from python.helpers.history import History, Message
+
+ITERATIONS = 30
+SYSTEM_WORDS = 6000
+RESULT_WORDS = 300
+
+
+class Agent:
+    def __init__(self):
+        self.data = {}
+
+    def get_data(self, key):
+        return self.data.get(key)
+
+    def set_data(self, key, value):
+        self.data[key] = value
+
+
+class CachingProvider:
+    def __init__(self):
+        self.cached: set[str] = set()
+        self.prompt_chars = 0
+        self.cached_chars = 0
+
+    async def acompletion(self, model, messages, stream=False, **kwargs):
+        blocks = [
+            json.dumps({"role": m["role"], **{k: v for k, v in b.items() if k != "cache_control"}})
+            for m in messages
+            for b in prompt_cache._blocks(m["content"])
+        ]
+        text = "".join(blocks)
+        for end in range(len(blocks), 0, -1):
+            if "".join(blocks[:end]) in self.cached:
+                self.cached_chars += len("".join(blocks[:end]))
+                break
+        marked = [
+            "cache_control" in b for m in messages for b in prompt_cache._blocks(m["content"])
+        ]
+        for end, is_marked in enumerate(marked, 1):
+            if is_marked:
+                self.cached.add("".join(blocks[:end]))
+        self.prompt_chars += len(text)
+        return {"choices": [{"message": {"content": "ok"}}]}
+
+
+async def run(layout: str) -> CachingProvider:
+    provider = CachingProvider()
+    models.acompletion = provider.acompletion  # type: ignore
+    model = models.LiteLLMChatWrapper(model="claude-sonnet-4", provider="anthropic")
+    agent = Agent()
+    history = History(agent)  # type: ignore
+    history.add_message(False, "Refactor the billing service")
+    system = "You are an agent with tools. " * (SYSTEM_WORDS // 6)
+    for i in range(ITERATIONS):
+        extras = f"[EXTRAS]\n{{\"current_datetime\": \"2025-01-01 10:{i:02d}:00\"}}"
+        if layout == "cache":
+            prompt = prompt_cache.append_tail(
+                [SystemMessage(content=system), *history.output_langchain()], extras
+            )
+        else:
+            prompt = [
+                SystemMessage(content=system),
+                *history.output_langchain(history.output() + Message(False, extras).output()),
+            ]
+        await model.unified_call(messages=prompt)
+        history.add_message(True, {"tool_name": "code_execution_tool", "step": i})
+        history.add_message(False, {"tool_result": f"step {i} " + "output line " * (RESULT_WORDS // 2)})
+    return provider
+
+
+async def main():
+    print(f"{ITERATIONS} iterations, system prompt ~{SYSTEM_WORDS} words, tool results ~{RESULT_WORDS} words")
+    print(f"{'layout':>10}{'prompt KB':>12}{'cached KB':>12}{'cached':>9}")
+    for layout in ("merged", "cache"):
+        provider = await run(layout)
+        print(
+            f"{layout:>10}{provider.prompt_chars / 1024:>12.1f}{provider.cached_chars / 1024:>12.1f}"
+            f"{provider.cached_chars / provider.prompt_chars:>9.1%}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
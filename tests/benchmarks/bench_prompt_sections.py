@@ -0,0 +1,94 @@
+"""
+Benchmark: system prompt assembly per agent loop iteration, with and without section caching.
+
+Builds the system prompt with the default system_prompt extensions, the default
+prompts and 3 fake MCP servers with 20 tools each. Without caching every section
+is rendered in every iteration, with caching only the fingerprints of the section
+inputs are checked.
+
+Run: python tests/benchmarks/bench_prompt_sections.py
+"""
+
+import sys
+import os
+import asyncio
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from agent import Agent
+from python.helpers import prompt_sections
+from python.helpers.mcp_handler import MCPConfig
+from python.extensions.system_prompt import _10_system_prompt, _20_behaviour_prompt
+
+ITERATIONS = 50
+MCP_SERVERS = 3
+MCP_TOOLS = 20
+
+
+def fake_server(index: int):
+    tools = [
+        {
+            "name": f"tool_{t}",
+            "description": f"Tool {t} of server {index}. " * 5,
+            "input_schema": {
+                "type": "object",
+                "properties": {f"arg_{a}": {"type": "string", "description": f"argument {a}"} for a in range(8)},
+                "required": ["arg_0"],
+            },
+        }
+        for t in range(MCP_TOOLS)
+    ]
+    return SimpleNamespace(name=f"server_{index}", description=f"Fake server {index}", get_tools=lambda: tools)
+
+
+def make_agent():
+    agent = SimpleNamespace(
+        config=SimpleNamespace(profile="", chat_model=SimpleNamespace(vision=False)),
+        context=SimpleNamespace(
+            get_data=lambda key: None,
+            log=SimpleNamespace(progress="", set_progress=lambda *args: None),
+        ),
+    )
+    agent.read_prompt = lambda file, **kwargs: Agent.read_prompt(agent, file, **kwargs)  # type: ignore
+    return agent
+
+
+async def build(agent) -> str:
+    system_prompt: list[str] = []
+    for extension in (_10_system_prompt.SystemPrompt, _20_behaviour_prompt.BehaviourPrompt):
+        await extension(agent).execute(system_prompt=system_prompt)  # type: ignore
+    return "\n\n".join(system_prompt)
+
+
+async def run(cached: bool, agent) -> tuple[float, str]:
+    # a fresh fingerprint every call renders every section, like before caching
+    get_section = prompt_sections.get_section
+    if not cached:
+        prompt_sections.get_section = lambda name, fingerprint, render: render()  # type: ignore
+    try:
+        await build(agent)  # first render is the same for both
+        start = time.perf_counter()
+        for _ in range(ITERATIONS):
+            text = await build(agent)
+        return (time.perf_counter() - start) / ITERATIONS, text
+    finally:
+        prompt_sections.get_section = get_section
+
+
+async def main():
+    MCPConfig.get_instance().servers = [fake_server(i) for i in range(MCP_SERVERS)]  # type: ignore
+    _20_behaviour_prompt.get_custom_rules_file = lambda agent: "/nonexistent/behaviour.md"  # type: ignore
+    agent = make_agent()
+
+    uncached, uncached_text = await run(False, agent)
+    cached, cached_text = await run(True, agent)
+    print(f"system prompt of {len(cached_text)} chars, {MCP_SERVERS}x{MCP_TOOLS} MCP tools, {ITERATIONS} iterations")
+    print(f"render every section: {uncached * 1000:.2f} ms per iteration")
+    print(f"cached sections:      {cached * 1000:.2f} ms per iteration, same text: {cached_text == uncached_text}")
+    print(prompt_sections.get_stats())
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
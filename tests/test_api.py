@@ -9,6 +9,7 @@ Tests cover API endpoints using Flask test client with mocked dependencies:
 - mcp_servers_status.py: MCP servers status endpoint
 - notifications_history.py: Notifications history endpoint
 - history_get.py: Chat history endpoint
+- ctx_window_get.py: Context window endpoint
 
 These tests focus on endpoint behavior, response structure, and error handling.
 Mocking is used to isolate API handler logic from external dependencies.
@@ -100,6 +101,7 @@ def mock_settings():
         "memory_memorize_enabled": True,
         "memory_memorize_consolidation": True,
         "memory_memorize_replace_threshold": 0.9,
+        "memory_vector_storage": {"*": "float32"},
         "api_keys": {},
         "auth_login": "",
         "auth_password": "",
@@ -609,5 +611,51 @@ class TestHistoryGetAPI:
             assert result["tokens"] == mock_tokens
 
 
+
+# =============================================================================
+# Context Window GET API Tests
+# =============================================================================
+
+class TestCtxWindowGetAPI:
+    """Tests for the /ctx_window_get endpoint."""
+
+    @pytest.fixture
+    def ctx_window_handler(self, app, lock):
+        """Create a GetCtxWindow handler instance."""
+        from python.api.ctx_window_get import GetCtxWindow
+        return GetCtxWindow(app, lock)
+
+    async def get_window(self, handler, window):
+        mock_agent = MagicMock()
+        mock_agent.get_data.return_value = window
+        mock_context = MagicMock()
+        mock_context.streaming_agent = None
+        mock_context.agent0 = mock_agent
+        with patch.object(handler, "use_context", return_value=mock_context):
+            return await handler.process({"context": "test-context"}, MagicMock())
+
+    @pytest.mark.asyncio
+    async def test_ctx_window_renders_snapshot(self, ctx_window_handler):
+        """Context window GET should render the stored snapshot."""
+        from langchain_core.messages import HumanMessage, SystemMessage
+        from python.helpers.context_window import ContextWindowTracker
+
+        with patch("python.helpers.context_window.tokens.approximate_tokens", side_effect=lambda t: len(t)):
+            window = ContextWindowTracker().snapshot(
+                [SystemMessage(content="system"), HumanMessage(content="hello")]
+            )
+        result = await self.get_window(ctx_window_handler, window)
+        assert result["content"] == "System: system\nHuman: hello"
+        assert result["tokens"] == window.tokens
+
+    @pytest.mark.asyncio
+    async def test_ctx_window_stored_text_and_empty(self, ctx_window_handler):
+        """Context window GET should accept windows stored as text and missing windows."""
+        result = await self.get_window(ctx_window_handler, {"text": "stored", "tokens": 3})
+        assert result == {"content": "stored", "tokens": 3}
+        result = await self.get_window(ctx_window_handler, None)
+        assert result == {"content": "", "tokens": 0}
+
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
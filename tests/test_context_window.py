@@ -0,0 +1,103 @@
+"""
+Unit tests for python/helpers/context_window.py
+
+- snapshots render the same text as the formatted prompt template, only on request
+- token counts of unchanged messages are reused, per owner
+- rendered texts are kept in a bounded LRU per context
+"""
+
+import sys
+import os
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from langchain_core.prompts import ChatPromptTemplate
+
+from python.helpers import context_window
+
+
+@pytest.fixture
+def counted(monkeypatch):
+    # word counts instead of the tiktoken encoding, texts counted are recorded
+    texts: list[str] = []
+    monkeypatch.setattr(
+        context_window.tokens,
+        "approximate_tokens",
+        lambda text: texts.append(text) or len(text.split()),
+    )
+    return texts
+
+
+def prompt(turns: int) -> list:
+    messages: list = [SystemMessage(content="You are an agent. {not a template}")]
+    for i in range(turns):
+        messages.append(HumanMessage(content=f"question {i}"))
+        messages.append(AIMessage(content=[{"type": "text", "text": f"answer {i}"}]))
+    return messages
+
+
+def test_text_rendered_on_demand(monkeypatch, counted):
+    renders = []
+    original = context_window.get_buffer_string
+    monkeypatch.setattr(
+        context_window, "get_buffer_string", lambda messages: renders.append(len(messages)) or original(messages)
+    )
+    tracker = context_window.ContextWindowTracker()
+    messages = prompt(3)
+    window = tracker.snapshot(messages)
+    assert 7 not in renders  # only single messages for token counts
+
+    assert window.text == ChatPromptTemplate.from_messages(messages).format()
+    assert window.text == window.text
+    assert renders.count(7) == 1
+    assert window.tokens == len(window.text.split())
+
+
+def test_token_counts_reused(counted):
+    tracker = context_window.ContextWindowTracker()
+    messages = prompt(3)
+    first = tracker.snapshot(messages)
+    assert len(counted) == 7
+
+    # next iteration, rebuilt system prompt with the same text and one new turn
+    counted.clear()
+    next_messages = [SystemMessage(content=messages[0].content), *messages[1:], *prompt(4)[-2:]]
+    second = tracker.snapshot(next_messages)
+    assert len(counted) == 2
+    assert second.tokens > first.tokens
+
+    # another agent of the context does not evict the counts
+    tracker.snapshot(prompt(1), owner=1)
+    counted.clear()
+    tracker.snapshot(next_messages)
+    assert counted == []
+
+
+def test_rendered_lru(monkeypatch, counted):
+    monkeypatch.setattr(context_window, "RENDERED_SNAPSHOTS", 2)
+    tracker = context_window.ContextWindowTracker()
+    windows = [tracker.snapshot(prompt(i)) for i in range(3)]
+    texts = [window.text for window in windows]
+    assert list(tracker._rendered) == [windows[1].id, windows[2].id]
+    assert windows[0].text == texts[0]  # rendered again after eviction
+    assert list(tracker._rendered) == [windows[2].id, windows[0].id]
+
+
+def test_tracker_per_context():
+    class Context:
+        def __init__(self):
+            self.data = {}
+
+        def get_data(self, key):
+            return self.data.get(key)
+
+        def set_data(self, key, value):
+            self.data[key] = value
+
+    a, b = Context(), Context()
+    assert context_window.get_tracker(a) is context_window.get_tracker(a)
+    assert context_window.get_tracker(a) is not context_window.get_tracker(b)
+    assert all(key.startswith("_") for key in a.data)  # not persisted with the chat
@@ -0,0 +1,139 @@
+"""
+Unit tests for python/helpers/document_extraction.py
+
+- extract_pdf: pages in order, OCR only for pages without a text layer, process pool workers
+- cancellation: pending pages are dropped when the check raises
+- run: blocking functions off the event loop
+- crashed workers: the broken pool is replaced, later extractions succeed
+"""
+
+import sys
+import os
+import asyncio
+import io
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import aclosing
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fitz
+import pytest
+from PIL import Image
+
+from python.helpers import document_extraction
+
+
+def make_pdf(path: str, pages: list[str | None]) -> str:
+    """PDF with a text page per string and an image only page per None."""
+    image = io.BytesIO()
+    Image.new("RGB", (40, 20), "white").save(image, format="PNG")
+    with fitz.open() as document:
+        for text in pages:
+            page = document.new_page()
+            if text is None:
+                page.insert_image(fitz.Rect(72, 72, 272, 172), stream=image.getvalue())
+            else:
+                page.insert_text((72, 72), text)
+        document.save(path)
+    return path
+
+
+async def extract(path: str, **kwargs) -> list[document_extraction.ExtractedPage]:
+    async with aclosing(document_extraction.extract_pdf(path, **kwargs)) as pages:
+        return [page async for page in pages]
+
+
+@pytest.mark.asyncio
+async def test_pages_in_order_and_ocr_only_without_text(tmp_path, monkeypatch):
+    monkeypatch.setattr(document_extraction, "PAGES_PER_TASK", 2)
+    monkeypatch.setattr(document_extraction, "ocr_page", lambda page: f"scanned {page.number}")
+    texts = [f"page number {i} of the document" for i in range(5)]
+    path = make_pdf(str(tmp_path / "doc.pdf"), texts[:3] + [None] + texts[4:])
+
+    pages = await extract(path, workers=0)
+    assert [page.number for page in pages] == [0, 1, 2, 3, 4]
+    assert all(page.pages == 5 for page in pages)
+    assert [page.ocr for page in pages] == [False, False, False, True, False]
+    assert pages[3].text == "scanned 3"
+    assert pages[0].text == texts[0] and pages[4].text == texts[4]
+
+    stats = document_extraction.get_stats()
+    assert stats["ocr_pages"] >= 1
+    assert stats["recent_pages"][-1] == {"page": 4, "seconds": pytest.approx(pages[4].seconds, abs=1e-3), "ocr": False}
+
+
+@pytest.mark.asyncio
+async def test_process_pool_workers(tmp_path):
+    texts = [f"page number {i} of the document" for i in range(9)]
+    path = make_pdf(str(tmp_path / "doc.pdf"), texts)
+    pages = await extract(path, workers=2)
+    assert [page.text for page in pages] == texts
+
+
+@pytest.mark.asyncio
+async def test_check_cancels_pending_pages(tmp_path, monkeypatch):
+    monkeypatch.setattr(document_extraction, "PAGES_PER_TASK", 1)
+    monkeypatch.setattr(document_extraction, "CHECK_INTERVAL", 0.01)
+    executor = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(document_extraction, "get_executor", lambda workers: executor)
+    extracted: list[int] = []
+
+    def slow_pages(path, start, end):
+        time.sleep(0.05)
+        extracted.append(start)
+        return [document_extraction.ExtractedPage(start, 10, "text", 0.05)]
+
+    monkeypatch.setattr(document_extraction, "extract_pdf_pages", slow_pages)
+    monkeypatch.setattr(document_extraction, "pdf_page_count", lambda path: 10)
+
+    class Intervention(Exception):
+        pass
+
+    checks = 0
+
+    async def check():
+        nonlocal checks
+        checks += 1
+        if checks > 3:
+            raise Intervention()
+
+    cancelled = document_extraction.get_stats()["cancelled"]
+    with pytest.raises(Intervention):
+        await extract("unused.pdf", check=check)
+    executor.shutdown(wait=True)
+    assert 0 < len(extracted) < 10
+    assert document_extraction.get_stats()["cancelled"] == cancelled + 1
+
+
+@pytest.mark.asyncio
+async def test_run_off_loop():
+    ticks = 0
+
+    async def ticker():
+        nonlocal ticks
+        while True:
+            ticks += 1
+            await asyncio.sleep(0.01)
+
+    task = asyncio.create_task(ticker())
+    result = await document_extraction.run(time.sleep, 0.2, workers=0)
+    task.cancel()
+    assert result is None
+    assert ticks > 5  # the event loop kept running
+
+
+@pytest.mark.asyncio
+async def test_pool_replaced_after_worker_crash(tmp_path):
+    # a worker killed mid task, like an OCR process killed for running out of memory
+    with pytest.raises(BrokenProcessPool):
+        await document_extraction.run(os._exit, 1, workers=1)
+    assert await document_extraction.run(len, "abc", workers=1) == 3
+
+    with pytest.raises(BrokenProcessPool):
+        await document_extraction.run(os._exit, 1, workers=1)
+    path = make_pdf(str(tmp_path / "doc.pdf"), ["first page", "second page"])
+    assert [page.text for page in await extract(path, workers=1)] == ["first page", "second page"]
+    document_extraction.get_executor(1).shutdown()
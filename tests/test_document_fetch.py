@@ -0,0 +1,253 @@
+"""
+Unit tests for python/helpers/document_fetch.py, against a local HTTP server
+
+- fetch: streaming download, incremental parsing while the body arrives
+- conditional requests: ETag revalidation served from the download cache
+- download cache: concurrent stores, store failures and pruned bodies do not fail fetches
+- size caps, spooling of large bodies to disk, retries of server errors
+- HtmlParser: same markdown as markdownify of the whole page
+"""
+
+import sys
+import os
+import io
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from markdownify import markdownify
+
+from python.helpers import document_fetch
+
+PAGE = (
+    "<html><head><title>Test</title></head><body>"
+    "<h1>Heading</h1><p>First <b>bold</b> paragraph with a <a href='https://example.com'>link</a>.</p>"
+    + "".join(f"<p>Paragraph {i} with café text.</p>" for i in range(200))
+    + "<ul><li>one</li><li>two</li></ul></body></html>"
+).encode("utf-8")
+
+
+class Handler(BaseHTTPRequestHandler):
+    requests: list[tuple[str, dict]] = []
+    failures = 0
+
+    def do_GET(self):
+        Handler.requests.append((self.path, dict(self.headers)))
+        if self.path == "/page.html":
+            if self.headers.get("If-None-Match") == '"v1"':
+                self.send_response(304)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("ETag", '"v1"')
+            self.send_header("Content-Length", str(len(PAGE)))
+            self.end_headers()
+            self.wfile.write(PAGE)
+        elif self.path == "/slow.txt":
+            # chunked, with pauses, so parsing can be observed before the end
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; charset=utf-8")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for i in range(5):
+                data = f"line {i}\n".encode()
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                self.wfile.flush()
+                time.sleep(0.05)
+            self.wfile.write(b"0\r\n\r\n")
+        elif self.path == "/big.bin":
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.end_headers()  # no length, the cap applies while streaming
+            self.wfile.write(b"x" * 3000)
+        elif self.path == "/flaky.txt":
+            if Handler.failures < 1:
+                Handler.failures += 1
+                self.send_response(503)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain")
+            self.send_header("Content-Length", "2")
+            self.end_headers()
+            self.wfile.write(b"ok")
+        else:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    Handler.requests = []
+    Handler.failures = 0
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(document_fetch, "CACHE_DIR", str(tmp_path / "downloads"))
+    monkeypatch.setattr(document_fetch, "RETRY_DELAY", 0)
+
+
+def test_html_parser_matches_markdownify():
+    expected = markdownify(PAGE.decode(), heading_style="ATX", autolinks=True).strip()
+    parser = document_fetch.HtmlParser("utf-8")
+    for i in range(0, len(PAGE), 7):  # split inside tags and multibyte characters
+        parser.feed(PAGE[i : i + 7])
+    text = parser.close()
+    assert text == document_fetch.html_to_markdown(PAGE.decode())
+    assert text.split() == expected.split()
+    assert "# Heading" in text and "café" in text and "[link](https://example.com)" in text
+
+
+@pytest.mark.asyncio
+async def test_fetch_html_and_revalidate(server):
+    try:
+        first = await document_fetch.fetch(f"{server}/page.html", parser=document_fetch.get_parser)
+        assert first.content_type == "text/html" and first.charset == "utf-8"
+        assert first.size == len(PAGE) and first.read() == PAGE
+        assert first.text and "# Heading" in first.text
+        assert not first.not_modified
+        first.close()
+
+        second = await document_fetch.fetch(f"{server}/page.html", parser=document_fetch.get_parser)
+        assert second.not_modified
+        assert second.text == first.text and second.read() == PAGE
+        second.close()
+        assert Handler.requests[-1][1].get("If-None-Match") == '"v1"'
+    finally:
+        await document_fetch.close_session()
+
+
+@pytest.mark.asyncio
+async def test_parsing_starts_while_downloading(server):
+    fed: list[tuple[float, bytes]] = []
+
+    class Recorder(document_fetch.TextParser):
+        def feed(self, data: bytes):
+            fed.append((time.perf_counter(), data))
+            super().feed(data)
+
+    try:
+        start = time.perf_counter()
+        document = await document_fetch.fetch(
+            f"{server}/slow.txt", parser=lambda content_type, charset: Recorder(charset)
+        )
+        end = time.perf_counter()
+    finally:
+        await document_fetch.close_session()
+    assert document.text == "".join(f"line {i}\n" for i in range(5))
+    assert len(fed) > 1
+    assert fed[0][0] - start < (end - start) / 2  # first chunk parsed early
+
+
+@pytest.mark.asyncio
+async def test_size_cap_and_spooling(server, monkeypatch):
+    try:
+        with pytest.raises(ValueError, match="exceeds"):
+            await document_fetch.fetch(f"{server}/big.bin", max_bytes=1000)
+        with pytest.raises(ValueError, match="exceeds"):
+            await document_fetch.fetch(f"{server}/page.html", max_bytes=1000)
+
+        monkeypatch.setattr(document_fetch, "SPOOL_BYTES", 1000)
+        spooled = document_fetch.get_stats()["spooled"]
+        document = await document_fetch.fetch(f"{server}/big.bin")
+        assert document.size == 3000 and document.text is None
+        assert document_fetch.get_stats()["spooled"] == spooled + 1
+        path = os.path.join(os.path.dirname(document_fetch.files.get_abs_path(document_fetch.CACHE_DIR)), "big.bin")
+        document.save(path)
+        assert os.path.getsize(path) == 3000
+        document.close()
+    finally:
+        await document_fetch.close_session()
+
+
+@pytest.mark.asyncio
+async def test_retries_server_errors(server):
+    try:
+        document = await document_fetch.fetch(f"{server}/flaky.txt", parser=document_fetch.get_parser)
+        assert document.text == "ok"
+        with pytest.raises(ValueError, match="404"):
+            await document_fetch.fetch(f"{server}/missing")
+    finally:
+        await document_fetch.close_session()
+    assert [path for path, _ in Handler.requests].count("/missing") == 1  # client errors are not retried
+
+
+def test_concurrent_cache_stores():
+    def store(i):
+        document = document_fetch.RemoteDocument(
+            url="http://example.com/a", content_type="text/plain", charset=None,
+            size=len(PAGE), body=io.BytesIO(PAGE),
+        )
+        document_fetch._cache_store(document.url, document, f'"v{i}"', None)
+
+    errors = document_fetch.get_stats()["cache_errors"]
+    threads = [threading.Thread(target=store, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert document_fetch.get_stats()["cache_errors"] == errors
+    folder = document_fetch.files.get_abs_path(document_fetch.CACHE_DIR)
+    assert not [name for name in os.listdir(folder) if name.endswith(".part")]
+    entry = document_fetch._cache_entry("http://example.com/a")
+    assert entry and entry["size"] == len(PAGE)
+    with open(document_fetch._cache_path("http://example.com/a", ".body"), "rb") as file:
+        assert file.read() == PAGE
+
+
+@pytest.mark.asyncio
+async def test_cache_store_failure_does_not_fail_fetch(server, tmp_path, monkeypatch):
+    blocked = tmp_path / "blocked"
+    blocked.write_text("a file where the cache folder should be")
+    monkeypatch.setattr(document_fetch, "CACHE_DIR", str(blocked / "downloads"))
+    errors = document_fetch.get_stats()["cache_errors"]
+    try:
+        document = await document_fetch.fetch(f"{server}/page.html")
+    finally:
+        await document_fetch.close_session()
+    assert document.read() == PAGE
+    document.close()
+    assert document_fetch.get_stats()["cache_errors"] == errors + 1
+
+
+@pytest.mark.asyncio
+async def test_pruned_cache_body_is_downloaded_again(server, monkeypatch):
+    cache_entry = document_fetch._cache_entry
+
+    def pruned_after_check(url):
+        # a concurrent prune removes the body between the check and the revalidation
+        entry = cache_entry(url)
+        if entry:
+            os.remove(document_fetch._cache_path(url, ".body"))
+        return entry
+
+    try:
+        first = await document_fetch.fetch(f"{server}/page.html")
+        first.close()
+        monkeypatch.setattr(document_fetch, "_cache_entry", pruned_after_check)
+        second = await document_fetch.fetch(f"{server}/page.html", parser=document_fetch.get_parser)
+    finally:
+        await document_fetch.close_session()
+    assert not second.not_modified
+    assert second.read() == PAGE and second.text and "# Heading" in second.text
+    second.close()
+    # revalidated, then downloaded without validators
+    assert [headers.get("If-None-Match") for _, headers in Handler.requests] == [None, '"v1"', None]
@@ -0,0 +1,104 @@
+"""
+Unit tests for python/helpers/embedding_batcher.py
+
+Tests for:
+- EmbeddingBatcher: coalescing of concurrent requests, batch size cap, fairness, errors
+- BatchedEmbeddings: sync and async Embeddings interface
+"""
+
+import sys
+import os
+import asyncio
+import threading
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from langchain_core.embeddings import Embeddings
+
+from python.helpers.embedding_batcher import EmbeddingBatcher, BatchedEmbeddings
+
+
+class RecordingEmbeddings(Embeddings):
+    """Embeds text as [len(text)] and records the size of every call."""
+
+    def __init__(self, fail: bool = False, bad: str = ""):
+        self.batches: list[list[str]] = []
+        self.fail = fail
+        self.bad = bad  # calls containing this text fail
+        self.lock = threading.Lock()
+
+    def embed_documents(self, texts):
+        with self.lock:
+            self.batches.append(list(texts))
+        if self.fail or (self.bad and self.bad in texts):
+            raise RuntimeError("provider down")
+        return [[float(len(t))] for t in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+class TestEmbeddingBatcher:
+    """Tests for request coalescing."""
+
+    @pytest.mark.asyncio
+    async def test_concurrent_queries_are_coalesced(self):
+        model = RecordingEmbeddings()
+        embedder = BatchedEmbeddings(model, "test-coalesce")
+        embedder.batcher.max_wait = 0.05
+        texts = ["a" * i for i in range(1, 11)]
+
+        results = await asyncio.gather(*[embedder.aembed_query(t) for t in texts])
+
+        assert results == [[float(i)] for i in range(1, 11)]
+        assert len(model.batches) < len(texts)
+        stats = embedder.batcher.get_stats()
+        assert stats["texts"] == 10
+        assert stats["max_batch_size"] > 1
+
+    def test_batch_size_cap(self):
+        model = RecordingEmbeddings()
+        batcher = EmbeddingBatcher("test-cap", model, max_batch_size=4, max_wait=0.01)
+        result = batcher.submit([str(i) for i in range(10)]).result(timeout=5)
+        assert len(result) == 10
+        assert max(len(b) for b in model.batches) <= 4
+
+    def test_round_robin_fairness(self):
+        model = RecordingEmbeddings()
+        batcher = EmbeddingBatcher("test-fair", model, max_batch_size=4, max_wait=0.05)
+        big = batcher.submit(["big"] * 20)
+        small = batcher.submit(["q"])
+        small.result(timeout=5)
+        big.result(timeout=5)
+        # the short query rides along in the first batch instead of waiting for the import
+        assert "q" in model.batches[0]
+
+    def test_errors_propagate(self):
+        batcher = EmbeddingBatcher("test-error", RecordingEmbeddings(fail=True), max_wait=0.01)
+        with pytest.raises(RuntimeError):
+            batcher.submit(["x"]).result(timeout=5)
+
+    def test_failed_batch_retries_requests_on_their_own(self):
+        model = RecordingEmbeddings(bad="bad")
+        batcher = EmbeddingBatcher("test-retry", model, max_batch_size=8, max_wait=0.05)
+        good = batcher.submit(["a", "bb"])
+        bad = batcher.submit(["ccc", "bad", "dd", "e", "ff", "ggg", "h"])
+        other = batcher.submit(["iiii"])
+
+        # only the request with the bad text fails, the others get their vectors
+        assert good.result(timeout=5) == [[1.0], [2.0]]
+        assert other.result(timeout=5) == [[4.0]]
+        with pytest.raises(RuntimeError):
+            bad.result(timeout=5)
+        assert ["a", "bb"] in model.batches and ["iiii"] in model.batches
+        # the rest of the failed request is not embedded
+        assert not any("h" in batch for batch in model.batches)
+        assert batcher.get_stats()["queued_texts"] == 0
+
+    def test_sync_interface(self):
+        embedder = BatchedEmbeddings(RecordingEmbeddings(), "test-sync")
+        assert embedder.embed_query("abc") == [3.0]
+        assert embedder.embed_documents(["a", "bb"]) == [[1.0], [2.0]]
+        assert embedder.embed_documents([]) == []
@@ -0,0 +1,135 @@
+"""
+Unit tests for python/helpers/embedding_cache.py
+
+Tests for:
+- EmbeddingCacheStore: batched get/set/delete, size accounting, LRU eviction, disk spill tier
+- create_cached_embeddings: float16 round trip through CacheBackedEmbeddings
+- migrate_file_store: migration from the legacy one-file-per-vector layout
+"""
+
+import sys
+import os
+import json
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from langchain_core.embeddings import Embeddings
+
+from python.helpers import embedding_cache
+from python.helpers.embedding_cache import EmbeddingCacheStore
+
+
+class CountingEmbeddings(Embeddings):
+    """Deterministic embeddings that count how many texts were embedded."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def embed_documents(self, texts):
+        self.calls += len(texts)
+        return [[float(len(t)), 0.5, -0.25] for t in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+class TestEmbeddingCacheStore:
+    """Tests for the packed SQLite byte store."""
+
+    def test_mset_mget_roundtrip(self):
+        store = EmbeddingCacheStore()
+        store.mset([("a", b"111"), ("b", b"22")])
+        assert store.mget(["a", "missing", "b"]) == [b"111", None, b"22"]
+        assert store.count == 2
+        assert store.total_bytes == 5
+
+    def test_replace_updates_size(self):
+        store = EmbeddingCacheStore()
+        store.mset([("a", b"111")])
+        store.mset([("a", b"1")])
+        assert store.count == 1
+        assert store.total_bytes == 1
+
+    def test_mdelete_and_yield_keys(self):
+        store = EmbeddingCacheStore()
+        store.mset([("ns_a", b"1"), ("ns_b", b"2"), ("other", b"3")])
+        store.mdelete(["ns_a", "missing"])
+        assert sorted(store.yield_keys()) == ["ns_b", "other"]
+        assert list(store.yield_keys(prefix="ns_")) == ["ns_b"]
+        assert store.count == 2
+
+    def test_eviction_by_size(self):
+        store = EmbeddingCacheStore(max_bytes=100)
+        for i in range(20):
+            store.mset([(f"k{i}", b"x" * 10)])
+        assert store.total_bytes <= 100
+        assert store.evictions > 0
+        # the most recent entry survives
+        assert store.mget(["k19"]) == [b"x" * 10]
+
+    def test_persistence(self, tmp_path):
+        path = str(tmp_path / "cache.db")
+        store = EmbeddingCacheStore(path)
+        store.mset([("a", b"abc")])
+        store.close()
+        reopened = EmbeddingCacheStore(path)
+        assert reopened.mget(["a"]) == [b"abc"]
+        assert reopened.total_bytes == 3
+
+    def test_eviction_spills_and_promotes(self, tmp_path):
+        spill = EmbeddingCacheStore(str(tmp_path / "spill.db"), max_bytes=1000)
+        store = EmbeddingCacheStore(max_bytes=100, spill=spill)
+        for i in range(20):
+            store.mset([(f"k{i}", b"x" * 10)])
+        assert spill.count == store.evictions > 0
+
+        # a spilled entry is served from disk and moves back to memory
+        assert store.mget(["k0", "missing"]) == [b"x" * 10, None]
+        assert spill.mget(["k0"]) == [None]
+        assert store.mget(["k0"]) == [b"x" * 10]
+        stats = store.get_stats()
+        assert stats["spill_hits"] == 1
+        assert stats["hits"] == 2 and stats["misses"] == 1
+        assert stats["spill"]["count"] == spill.count
+        store.close()
+
+
+class TestCachedEmbeddings:
+    """Tests for the float16 cache wrapper."""
+
+    def test_cache_hit_skips_model(self):
+        model = CountingEmbeddings()
+        embedder = embedding_cache.create_cached_embeddings(model, EmbeddingCacheStore(), "ns_")
+        first = embedder.embed_documents(["hello", "world!"])
+        second = embedder.embed_documents(["hello", "world!"])
+        assert model.calls == 2
+        for cached, fresh in zip(second, first):
+            assert cached == pytest.approx(fresh, rel=1e-3)
+        assert first[0] == pytest.approx([5.0, 0.5, -0.25], rel=1e-3)
+
+    def test_float16_halves_storage(self):
+        store = EmbeddingCacheStore()
+        embedder = embedding_cache.create_cached_embeddings(CountingEmbeddings(), store, "ns_")
+        embedder.embed_documents(["text"])
+        assert store.total_bytes == 3 * 2
+
+
+class TestMigrateFileStore:
+    """Tests for migration from the legacy LocalFileStore directory."""
+
+    def test_migrates_and_removes_files(self, tmp_path):
+        legacy = tmp_path / "embeddings"
+        legacy.mkdir()
+        (legacy / "ns_one").write_text(json.dumps([1.0, 2.0]))
+        (legacy / "ns_two").write_text(json.dumps([3.0, 4.0]))
+        store = EmbeddingCacheStore(str(legacy / embedding_cache.DB_FILE_NAME))
+
+        assert embedding_cache.migrate_file_store(str(legacy), store) == 2
+        assert not (legacy / "ns_one").exists()
+        value = store.mget(["ns_one"])[0]
+        assert value is not None
+        assert embedding_cache.deserialize_float16(value) == [1.0, 2.0]
+        # second run finds nothing left to migrate
+        assert embedding_cache.migrate_file_store(str(legacy), store) == 0
@@ -0,0 +1,534 @@
+"""
+Unit tests for python/helpers/history.py compression
+
+- History.compress: fits all parts into their budgets with the layout of the step by step
+  compression (first message, summary, latest messages; oldest topics summarized and moved
+  to bulks first; bulks merged in groups)
+- summarizations of one round run concurrently up to COMPRESSION_CONCURRENCY
+- results are applied only when all summarizations succeed
+- output and output_langchain caches: same result as the uncached conversion after any
+  sequence of mutations, unchanged prefixes are not converted again
+- content deduplication: repeated large contents stored and serialized once, rendered
+  as a reference or in full
+"""
+
+import sys
+import os
+import asyncio
+import json
+import random
+from types import SimpleNamespace
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from python.helpers import history as history_module
+from python.helpers.history import (
+    CURRENT_TOPIC_RATIO,
+    HISTORY_BULK_RATIO,
+    HISTORY_TOPIC_RATIO,
+    Bulk,
+    History,
+    Message,
+    Topic,
+    deserialize_history,
+    output_langchain,
+)
+
+CTX_LENGTH = 20000
+CTX_HISTORY = 0.5
+BUDGET = int(CTX_LENGTH * CTX_HISTORY)
+
+
+class FakeAgent:
+    """Utility model answering with a fixed size summary after a delay."""
+
+    def __init__(self, delay: float = 0.0, fail: bool = False):
+        self.delay = delay
+        self.fail = fail
+        self.calls = 0
+        self.active = 0
+        self.max_active = 0
+
+    async def call_utility_model(self, system: str, message: str) -> str:
+        self.calls += 1
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await asyncio.sleep(self.delay)
+            if self.fail:
+                raise RuntimeError("utility model failed")
+            return f"summary {self.calls} " + "word " * 100
+        finally:
+            self.active -= 1
+
+    def read_prompt(self, file: str, **kwargs) -> str:
+        return f"{file} {kwargs.get('content', '')}"
+
+    def parse_prompt(self, file: str, **kwargs) -> str:
+        return f"summary message: {kwargs.get('summary', '')}"
+
+
+@pytest.fixture(autouse=True)
+def ctx_settings(monkeypatch):
+    monkeypatch.setattr(
+        history_module.settings,
+        "get_settings",
+        lambda: {"chat_model_ctx_length": CTX_LENGTH, "chat_model_ctx_history": CTX_HISTORY},
+    )
+
+
+def text(tokens: int, label: str) -> str:
+    return f"{label} " + "lorem ipsum " * (tokens // 2)
+
+
+def make_history(agent, topics: int = 40, messages: int = 8, tokens: int = 300) -> History:
+    history = History(agent)
+    for t in range(topics):
+        for m in range(messages):
+            history.add_message(m % 2 == 1, text(tokens, f"topic {t} message {m}"))
+        history.new_topic()
+    for m in range(messages * 3):
+        history.add_message(m % 2 == 1, text(tokens, f"current message {m}"))
+    return history
+
+
+def assert_within_budgets(history: History):
+    assert history.get_current_topic_tokens() <= BUDGET * CURRENT_TOPIC_RATIO
+    assert history.get_topics_tokens() <= BUDGET * HISTORY_TOPIC_RATIO
+    assert history.get_bulks_tokens() <= BUDGET * HISTORY_BULK_RATIO
+
+
+@pytest.mark.asyncio
+async def test_compress_fits_budget_with_layout():
+    agent = FakeAgent()
+    history = make_history(agent)
+    first, last = history.current.messages[0], history.current.messages[-1]
+    assert history.is_over_limit()
+
+    assert await history.compress()
+    assert_within_budgets(history)
+    assert not history.is_over_limit()
+
+    # current topic keeps its first and latest messages around one summary
+    messages = history.current.messages
+    assert messages[0] is first and messages[-1] is last
+    assert isinstance(messages[1].content, str) and messages[1].content.startswith("summary message:")
+    assert sum(str(m.content).startswith("summary message:") for m in messages) == 1
+
+    # the newest topics stay, the oldest went to bulks first
+    remaining = [t.messages[0].content for t in history.topics]
+    assert remaining and all(isinstance(c, str) for c in remaining)
+    assert remaining[-1].startswith("topic 39 ")  # type: ignore
+    assert all(topic.summary for topic in history.topics)
+    assert history.bulks
+
+    # nothing left to do
+    calls = agent.calls
+    assert not await history.compress()
+    assert agent.calls == calls
+
+
+async def legacy_compress(history: History, total: int):
+    """The sequential loop the planner replaced, one compression step at a time."""
+
+    async def compress_current() -> bool:
+        topic = history.current
+        large = topic.get_large_messages()
+        if large:
+            topic.truncate_message(*large[0])
+            return True
+        count = topic.get_attention_count()
+        if count:
+            topic.replace_with_summary(count, await topic.summarize_messages(topic.messages[1 : count + 1]))
+            return True
+        return False
+
+    async def compress_topics() -> bool:
+        # summarize topics one by one
+        for topic in history.topics:
+            if not topic.summary:
+                await topic.summarize()
+                return True
+        # move oldest topic to bulks
+        if history.topics:
+            topic = history.topics.pop(0)
+            bulk = Bulk(history=history)
+            bulk.records = [topic]
+            bulk.summary = topic.summary
+            history.bulks.append(bulk)
+            return True
+        return False
+
+    async def compress_bulks() -> bool:
+        # merge bulks in groups of BULK_MERGE_COUNT, even if there are fewer
+        if not history.bulks:
+            return False
+
+        async def merge(bulks: list[Bulk]) -> Bulk:
+            bulk = Bulk(history=history)
+            bulk.records = list(bulks)
+            await bulk.summarize()
+            return bulk
+
+        count = history_module.BULK_MERGE_COUNT
+        history.bulks = list(
+            await asyncio.gather(
+                *[merge(history.bulks[i : i + count]) for i in range(0, len(history.bulks), count)]
+            )
+        )
+        return True
+
+    while True:
+        parts = [
+            (history.get_current_topic_tokens(), CURRENT_TOPIC_RATIO, compress_current),
+            (history.get_topics_tokens(), HISTORY_TOPIC_RATIO, compress_topics),
+            (history.get_bulks_tokens(), HISTORY_BULK_RATIO, compress_bulks),
+        ]
+        parts.sort(key=lambda p: (p[0] / total) / p[1], reverse=True)
+        for tokens, ratio, compress in parts:
+            if tokens > ratio * total and await compress():
+                break
+        else:
+            return
+
+
+@pytest.mark.asyncio
+async def test_matches_step_by_step_compression():
+    legacy_agent, agent = FakeAgent(), FakeAgent()
+    legacy, planned = make_history(legacy_agent), make_history(agent)
+    await legacy_compress(legacy, BUDGET)
+    await planned.compress()
+
+    assert_within_budgets(legacy)
+    assert_within_budgets(planned)
+    # the same topics survive, summarized, and the same ones were moved to bulks
+    assert [t.messages[0].content for t in planned.topics] == [t.messages[0].content for t in legacy.topics]
+    assert planned.current.messages[0].content == legacy.current.messages[0].content
+    assert planned.current.messages[-1].content == legacy.current.messages[-1].content
+    assert agent.calls <= legacy_agent.calls
+
+
+@pytest.mark.asyncio
+async def test_single_bulk_summarized_again(monkeypatch):
+    monkeypatch.setattr(history_module, "HISTORY_BULK_RATIO", 0.015)
+    agent = FakeAgent()
+    history = History(agent)
+    bulk = Bulk(history=history)
+    bulk.summary = "oldest summary " * 150
+    history.bulks = [bulk]
+    history.add_message(False, "task")
+
+    assert await history.compress()
+    # merged into a new bulk and summarized, not dropped
+    assert len(history.bulks) == 1
+    assert history.bulks[0].records == [bulk]
+    assert history.bulks[0].summary and agent.calls == 1
+
+
+@pytest.mark.asyncio
+async def test_summaries_run_concurrently(monkeypatch):
+    monkeypatch.setattr(history_module, "COMPRESSION_CONCURRENCY", 3)
+    agent = FakeAgent(delay=0.02)
+    history = make_history(agent)
+    await history.compress()
+    assert agent.max_active == 3
+
+
+@pytest.mark.asyncio
+async def test_failed_summary_applies_nothing():
+    agent = FakeAgent(fail=True)
+    history = make_history(agent)
+    before = history.serialize()
+    with pytest.raises(RuntimeError):
+        await history.compress()
+    assert history.serialize() == before
+
+
+@pytest.mark.asyncio
+async def test_large_messages_truncated_without_model():
+    agent = FakeAgent()
+    history = History(agent)
+    history.add_message(False, "task")
+    for i in range(3):
+        history.add_message(True, text(2500, f"huge tool output {i}"))
+    history.add_message(False, "ok")
+    assert await history.compress()
+    assert agent.calls == 0
+    assert all(m.summary for m in history.current.messages[1:3])
+    assert history.get_current_topic_tokens() <= BUDGET * CURRENT_TOPIC_RATIO
+
+
+def uncached_output(record) -> list[dict]:
+    if isinstance(record, Message):
+        return [{"ai": record.ai, "content": record.summary or record.content}]
+    if isinstance(record, History):
+        records = [*record.bulks, *record.topics, record.current]
+        return [m for r in records for m in uncached_output(r)]
+    if record.summary:
+        return [{"ai": False, "content": record.summary}]
+    children = record.messages if isinstance(record, Topic) else record.records
+    return [m for r in children for m in uncached_output(r)]
+
+
+def dedup_output(outputs: list[dict], stored: set[str]) -> list[dict]:
+    # repeated stored texts replaced by references, compared by value
+    seen: set[str] = set()
+    result = []
+    for out in outputs:
+        content = out["content"]
+        if isinstance(content, dict) and "raw_content" not in content:
+            texts = {k: v for k, v in content.items() if isinstance(v, str)}
+        else:
+            texts = {"": content} if isinstance(content, str) else {}
+        replaced = {}
+        for key, text in texts.items():
+            if text not in stored:
+                continue
+            if text in seen:
+                replaced[key] = "fw.msg_duplicate.md "
+            seen.add(text)
+        if "" in replaced:
+            content = replaced[""]
+        elif replaced:
+            content = {**content, **replaced}
+        result.append({"ai": out["ai"], "content": content})
+    return result
+
+
+LARGE_TEXTS = [f"large output {n}\n" * 100 for n in range(3)]
+
+
+def random_content(rng: random.Random, i: int):
+    kind = rng.randrange(6)
+    if kind == 4:
+        return rng.choice(LARGE_TEXTS)
+    if kind == 5:
+        return {"tool_name": "code", "tool_result": rng.choice(LARGE_TEXTS)}
+    if kind == 0:
+        return {"tool_name": "code", "result": f"output {i}"}
+    if kind == 1:
+        return {"raw_content": [{"type": "text", "text": f"raw {i}"}], "preview": f"raw {i}"}
+    if kind == 2:
+        return [{"type": "text", "text": f"part {i}"}]
+    return f"text {i}"
+
+
+def mutate(rng: random.Random, history: History, i: int) -> History:
+    topics = [t for t in [*history.topics, history.current] if t.messages]
+    messages = [m for t in topics for m in t.messages]
+    op = rng.randrange(12)
+    if op < 4 or not messages:
+        history.add_message(rng.random() < 0.5, random_content(rng, i))
+    elif op == 4:
+        history.new_topic()
+    elif op == 5:
+        rng.choice(messages).set_summary(f"message summary {i}")
+    elif op == 6:
+        rng.choice(messages).content = random_content(rng, i)
+    elif op == 7:
+        rng.choice(messages).ai = rng.random() < 0.5
+    elif op == 8 and history.topics:
+        rng.choice(history.topics).summary = rng.choice(["", f"topic summary {i}"])
+    elif op == 9 and history.topics:
+        topic = history.topics.pop(0)
+        bulk = Bulk(history=history)
+        bulk.records = [topic]
+        bulk.summary = rng.choice(["", f"bulk summary {i}"])
+        history.bulks.append(bulk)
+    elif op == 10 and len(history.bulks) > 1:
+        bulk = Bulk(history=history)
+        bulk.records = history.bulks[:2]  # type: ignore
+        history.bulks = [bulk] + history.bulks[2:]
+        if rng.random() < 0.5:
+            bulk.records[0].summary = f"changed inside bulk {i}"  # type: ignore
+    elif op == 11:
+        if len(history.current.messages) > 3 and rng.random() < 0.5:
+            history.current.replace_with_summary(2, f"attention summary {i}")
+        else:
+            history = deserialize_history(history.serialize(), history.agent)
+    return history
+
+
+def langchain_data(messages) -> list[tuple[str, object]]:
+    return [(type(m).__name__, m.content) for m in messages]
+
+
+@pytest.mark.parametrize("seed", range(25))
+def test_cached_output_matches_uncached(seed):
+    rng = random.Random(seed)
+    history = History(FakeAgent())
+    for i in range(150):
+        history = mutate(rng, history, i)
+        if rng.random() < 0.3:
+            continue  # several mutations between outputs
+        outputs = history.output()
+        assert outputs == dedup_output(uncached_output(history), set(history.contents.contents.values()))
+        extras = [{"ai": False, "content": f"extras {i}"}] if rng.random() < 0.8 else []
+        assert langchain_data(history.output_langchain(outputs + extras)) == langchain_data(
+            output_langchain(dedup_output(uncached_output(history), set(history.contents.contents.values())) + extras)  # type: ignore
+        )
+
+
+def test_unchanged_prefix_is_reused(monkeypatch):
+    history = make_history(FakeAgent(), topics=5)
+    outputs = history.output()
+    history.output_langchain(outputs)
+
+    converted = []
+    original = history_module._output_content_langchain
+    monkeypatch.setattr(
+        history_module,
+        "_output_content_langchain",
+        lambda content: converted.append(content) or original(content),
+    )
+    prefix = history.output()[: len(outputs) - 1]
+    history.add_message(True, "new message")
+    again = history.output()
+    # the same cached objects, not rebuilt
+    assert all(a is b for a, b in zip(again, prefix))
+    history.output_langchain(again + [{"ai": False, "content": "extras"}])
+    assert converted == ["new message", "extras"]
+
+    # a change in an older topic rebuilds from there
+    converted.clear()
+    history.topics[3].summary = "summary of topic 3"
+    history.output_langchain(history.output())
+    assert converted[0] == "summary of topic 3"
+    assert len(converted) == 1 + len(history.topics[4].messages) + len(history.current.messages)
+
+
+def tool_result(text: str, number: int) -> dict:
+    return {"tool_name": "code_execution_tool", "tool_result": text, "file": f"/msgs/{number}.txt"}
+
+
+def test_repeated_tool_results_referenced():
+    history = History(FakeAgent())
+    listing = "\n".join(f"file_{i}.py" for i in range(200))
+    first = history.add_message(False, tool_result(listing, 1))
+    history.add_message(True, "again")
+    second = history.add_message(False, tool_result("".join(listing), 2))
+    small = history.add_message(False, tool_result("short output", 3))
+
+    # stored once, the repeat is a reference in the prompt with the shape of its content
+    assert second.content["tool_result"] is first.content["tool_result"]  # type: ignore
+    assert not second.summary and not small.refs
+    outputs = history.output()
+    assert outputs[0]["content"]["tool_result"] == listing  # type: ignore
+    assert outputs[2]["content"] == {
+        "tool_name": "code_execution_tool",
+        "tool_result": "fw.msg_duplicate.md ",
+        "file": "/msgs/2.txt",
+    }
+    assert history.output()[2] is outputs[2]  # references are reused between outputs
+
+    stats = history.contents.get_stats()
+    assert stats["duplicates"] == 1 and stats["contents"] == 1
+    assert stats["duplicate_bytes"] == len(listing)
+    assert stats["duplicate_tokens_saved"] > 0
+
+
+def test_repeated_contents_in_full(monkeypatch):
+    monkeypatch.setattr(history_module, "DEDUP_RENDER", "full")
+    history = History(FakeAgent())
+    text = "x" * 2000
+    history.add_message(False, text)
+    repeated = history.add_message(False, text)
+    assert not repeated.summary and repeated.content is text
+    assert [o["content"] for o in history.output()] == [text, text]
+    assert history.contents.get_stats()["duplicates"] == 1
+
+
+def full_texts(history: History, text: str) -> int:
+    outputs = history.output()
+    assert outputs == dedup_output(uncached_output(history), set(history.contents.contents.values()))
+    return sum(
+        o["content"] == text or (isinstance(o["content"], dict) and o["content"].get("tool_result") == text)
+        for o in outputs
+    )
+
+
+def test_repeat_rendered_in_full_when_original_leaves_prompt():
+    history = History(FakeAgent())
+    text = "line of a source file\n" * 200
+    history.add_message(False, tool_result(text, 1))
+    history.new_topic()
+    second = history.add_message(False, tool_result(text, 2))
+    history.add_message(False, text)
+    assert full_texts(history, text) == 1
+
+    # original topic summarized after the repeats were added, the first repeat takes its place
+    history.topics[0].set_summary("summary of topic 1")
+    outputs = history.output()
+    assert outputs[0]["content"] == "summary of topic 1"
+    assert outputs[1]["content"]["tool_result"] == text  # type: ignore
+    assert outputs[2]["content"] == "fw.msg_duplicate.md "
+
+    # truncated, attention compressed or moved into a summarized bulk
+    second.set_summary("truncated")
+    assert full_texts(history, text) == 1 and history.output()[-1]["content"] == text
+    third = history.add_message(False, tool_result(text, 3))
+    history.current.replace_with_summary(1, "summary")
+    assert full_texts(history, text) == 1 and history.output()[-1] is third.output()[0]
+    history.new_topic()
+    history.add_message(False, tool_result(text, 4))
+    bulk = Bulk(history=history)
+    bulk.records = [history.topics.pop()]
+    history.bulks.append(bulk)
+    assert full_texts(history, text) == 1
+    bulk.set_summary("summary of the bulk")
+    assert full_texts(history, text) == 1
+    assert history.output()[-1]["content"]["tool_result"] == text  # type: ignore
+
+    # removed from the history, and restored
+    history.add_message(False, tool_result(text, 5))
+    restored = deserialize_history(history.serialize(), history.agent)
+    assert restored.output() == history.output()
+    history.current.messages = history.current.messages[-1:]
+    assert full_texts(history, text) == 1
+
+
+def test_serialized_once_and_restored():
+    agent = FakeAgent()
+    history = History(agent)
+    text = "line of output\n" * 200
+    for i in range(3):
+        history.add_message(False, tool_result(text, i))
+        history.add_message(True, "ok")
+        history.new_topic()
+    history.add_message(False, "y" * 1500)
+
+    serialized = history.serialize()
+    assert serialized.count(json.dumps(text)[1:-1]) == 1
+    stats = history.contents.get_stats()
+    assert stats["serialized_bytes"] == len(serialized.encode())
+    assert stats["serialized_bytes_saved"] >= 2 * len(text)
+
+    restored = deserialize_history(serialized, agent)
+    assert restored.output() == history.output()
+    assert restored.topics[2].messages[0].content["tool_result"] is restored.topics[0].messages[0].content["tool_result"]  # type: ignore
+    assert restored.serialize() == serialized
+
+    # contents of removed messages are dropped
+    history.topics = []
+    history.serialize()
+    assert history.contents.get_stats()["contents"] == 1
+
+
+def test_dedup_stats_by_chat(monkeypatch):
+    import agent as agent_module
+
+    def make_agent(text: str, subordinate=None):
+        a = SimpleNamespace(history=History(FakeAgent()))
+        a.get_data = lambda key: subordinate
+        for _ in range(3):
+            a.history.add_message(False, text)
+        return a
+
+    context = SimpleNamespace(id="chat1", agent0=make_agent("a" * 1000, make_agent("b" * 1000)))
+    monkeypatch.setattr(agent_module.AgentContext, "all", staticmethod(lambda: [context]))
+    stats = history_module.get_dedup_stats()
+    assert stats["chat1"]["duplicates"] == 4
+    assert stats["chat1"]["duplicate_bytes"] == 4000
@@ -0,0 +1,131 @@
+"""
+Unit tests for python/helpers/history_summary.py
+
+- extract_summary: informative sentences within the word budget, in original order
+- strategies: llm, extractive as primary, deadline fallback, staged input shrinking
+- history compression through the configured strategy
+"""
+
+import sys
+import os
+import asyncio
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from python.helpers import history as history_module
+from python.helpers import history_summary
+from python.helpers.history import History
+
+TEXT = (
+    "The user asked to deploy the billing service to the staging cluster. "
+    "Okay. "
+    "The agent built the docker image for the billing service and pushed it to the registry. "
+    "Deployment failed because the staging cluster rejected the image pull secret. "
+    "The agent rotated the pull secret and the billing service deployment succeeded. "
+    "Thanks."
+)
+
+
+class FakeAgent:
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.messages: list[str] = []
+
+    async def call_utility_model(self, system: str, message: str) -> str:
+        self.messages.append(message)
+        await asyncio.sleep(self.delay)
+        return "llm summary"
+
+    def read_prompt(self, file: str, **kwargs) -> str:
+        content = kwargs.get("content", "")
+        return f"{file} {content if isinstance(content, str) else chr(10).join(content)}"
+
+    def parse_prompt(self, file: str, **kwargs) -> str:
+        return f"summary message: {kwargs.get('summary', '')}"
+
+
+def test_extract_summary_budget_and_order():
+    summary = history_summary.extract_summary(TEXT, 30)
+    sentences = [s for s in TEXT.split(". ") if s.rstrip(".") in summary]
+    assert 0 < len(summary.split()) <= 30
+    assert "Okay." not in summary and "Thanks." not in summary
+    # original order is kept
+    positions = [TEXT.index(s) for s in sentences]
+    assert positions == sorted(positions)
+    assert history_summary.extract_summary(TEXT, 1000) == TEXT
+    assert history_summary.extract_summary("", 10) == ""
+
+
+def test_extract_summary_cuts_long_sentences(monkeypatch):
+    monkeypatch.setattr(history_summary, "SENTENCE_MAX_WORDS", 5)
+    summary = history_summary.extract_summary("one two three four five six seven eight", 100)
+    assert summary == "one two three four five..."
+
+
+@pytest.mark.asyncio
+async def test_deadline_falls_back_to_extractive():
+    fast, slow = FakeAgent(), FakeAgent(delay=1)
+    strategy = history_summary.DeadlineSummary(deadline=0.05)
+    assert await strategy.summarize(fast, TEXT) == "llm summary"  # type: ignore
+
+    fallbacks = history_summary.get_stats()["deadline_fallbacks"]
+    summary = await strategy.summarize(slow, [TEXT])  # type: ignore
+    assert summary == history_summary.extract_summary(TEXT, history_summary.EXTRACTIVE_SUMMARY_WORDS)
+    assert history_summary.get_stats()["deadline_fallbacks"] == fallbacks + 1
+
+
+@pytest.mark.asyncio
+async def test_staged_shrinks_large_input():
+    agent = FakeAgent()
+    strategy = history_summary.StagedSummary(
+        first=history_summary.ExtractiveSummary(words=20),
+        second=history_summary.LlmSummary(),
+        input_words=100,
+    )
+    assert await strategy.summarize(agent, TEXT) == "llm summary"  # type: ignore
+    assert TEXT in agent.messages[-1]  # small enough, unchanged
+
+    long_text = " ".join([TEXT] * 3)
+    await strategy.summarize(agent, long_text)  # type: ignore
+    sent = agent.messages[-1].removeprefix("fw.topic_summary.msg.md ")
+    assert len(sent.split()) <= 20
+
+
+def test_strategy_registry(monkeypatch):
+    assert isinstance(history_summary.get_strategy("extractive"), history_summary.ExtractiveSummary)
+    with pytest.raises(ValueError, match="Unknown"):
+        history_summary.get_strategy("missing")
+
+    class Fixed:
+        name = "fixed"
+
+        async def summarize(self, agent, content):
+            return "fixed"
+
+    monkeypatch.setitem(history_summary.STRATEGIES, "fixed", Fixed)
+    monkeypatch.setattr(history_summary, "SUMMARY_STRATEGY", "fixed")
+    assert asyncio.run(history_summary.summarize(FakeAgent(), TEXT)) == "fixed"  # type: ignore
+
+
+@pytest.mark.asyncio
+async def test_history_compression_without_model(monkeypatch):
+    monkeypatch.setattr(history_summary, "SUMMARY_STRATEGY", "extractive")
+    monkeypatch.setattr(
+        history_module.settings,
+        "get_settings",
+        lambda: {"chat_model_ctx_length": 8000, "chat_model_ctx_history": 0.5},
+    )
+    agent = FakeAgent()
+    history = History(agent)
+    for t in range(20):
+        for m in range(6):
+            history.add_message(m % 2 == 1, f"Topic {t} step {m}. {TEXT}")
+        history.new_topic()
+
+    assert await history.compress()
+    assert not history.is_over_limit()
+    assert agent.messages == []
+    assert all(topic.summary for topic in history.topics)
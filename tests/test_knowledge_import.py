@@ -0,0 +1,267 @@
+"""
+Unit tests for python/helpers/knowledge_import.py
+
+- KnowledgeImportPipeline: staged import with change detection, batching and removal
+- KnowledgeImportPipeline: chunk-level re-indexing, only edited chunks are embedded again
+- KnowledgeImportPipeline: imports limited to changed paths, as reported by the watcher
+- KnowledgeImportPipeline: a failing stage cancels the others instead of leaving them blocked
+- check_file: stat based change detection, hashing only when stat changed
+- KnowledgeManifest: incremental transactional persistence and legacy json migration
+"""
+
+import sys
+import os
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asyncio
+import json
+
+import pytest
+
+from python.helpers import knowledge_import
+from python.helpers.knowledge_import import (
+    KnowledgeImportPipeline,
+    KnowledgeManifest,
+    KnowledgeSource,
+    check_file,
+)
+
+
+class FakeIndex:
+    """Collects inserted documents like Memory.insert_documents does."""
+
+    def __init__(self):
+        self.docs = {}
+        self.inserts = 0
+        self.inserted_docs = 0
+        self.next_id = 0
+
+    async def insert(self, docs):
+        self.inserts += 1
+        self.inserted_docs += len(docs)
+        ids = []
+        for doc in docs:
+            self.next_id += 1
+            ids.append(f"id{self.next_id}")
+            self.docs[ids[-1]] = doc
+        return ids
+
+    async def delete(self, ids):
+        for id in ids:
+            self.docs.pop(id, None)
+
+
+def write(path, text):
+    with open(path, "w") as f:
+        f.write(text)
+
+
+async def run_import(folder, index, fake, **kwargs):
+    kwargs.setdefault("parse_workers", 0)
+    return await KnowledgeImportPipeline(
+        None,
+        index,
+        [KnowledgeSource(str(folder), {"area": "main"})],
+        fake.insert,
+        fake.delete,
+        **kwargs,
+    ).run()
+
+
+@pytest.mark.asyncio
+async def test_imports_files_in_batches(tmp_path):
+    for i in range(5):
+        write(tmp_path / f"file{i}.txt", f"content {i}")
+    write(tmp_path / "ignored.bin", "binary")
+    fake = FakeIndex()
+
+    index = await run_import(tmp_path, {}, fake, embed_batch_size=2)
+
+    assert len(index) == 5
+    assert all(f["state"] == "changed" and len(f["ids"]) == 1 for f in index.values())
+    assert all(f["documents"] == [] for f in index.values())
+    assert fake.inserts == 3  # 2 + 2 + 1 documents
+    doc = fake.docs[index[str(tmp_path / "file3.txt")]["ids"][0]]
+    assert doc.page_content == "content 3"
+    assert doc.metadata["area"] == "main"
+    assert doc.metadata["source_file"] == "file3.txt"
+
+
+@pytest.mark.asyncio
+async def test_detects_changed_and_removed_files(tmp_path):
+    write(tmp_path / "keep.txt", "keep")
+    write(tmp_path / "edit.txt", "old")
+    write(tmp_path / "drop.txt", "drop")
+    fake = FakeIndex()
+    index = await run_import(tmp_path, {}, fake)
+    old_edit_ids = index[str(tmp_path / "edit.txt")]["ids"]
+
+    write(tmp_path / "edit.txt", "new")
+    os.remove(tmp_path / "drop.txt")
+    index = await run_import(tmp_path, index, fake)
+
+    assert index[str(tmp_path / "keep.txt")]["state"] == "original"
+    assert index[str(tmp_path / "edit.txt")]["state"] == "changed"
+    assert index[str(tmp_path / "drop.txt")]["state"] == "removed"
+    assert not any(id in fake.docs for id in old_edit_ids)
+    assert fake.docs[index[str(tmp_path / "edit.txt")]["ids"][0]].page_content == "new"
+
+
+@pytest.mark.asyncio
+async def test_parses_in_process_pool(tmp_path):
+    for i in range(3):
+        write(tmp_path / f"doc{i}.md", f"# heading {i}")
+    fake = FakeIndex()
+
+    index = await run_import(tmp_path, {}, fake, parse_workers=2)
+
+    assert sorted(d.page_content for d in fake.docs.values()) == [
+        "# heading 0",
+        "# heading 1",
+        "# heading 2",
+    ]
+    assert len(index) == 3
+
+
+@pytest.mark.asyncio
+async def test_failing_stage_cancels_the_others(tmp_path):
+    for i in range(20):
+        write(tmp_path / f"file{i}.txt", f"content {i}")
+
+    class FailingIndex(FakeIndex):
+        async def insert(self, docs):
+            raise RuntimeError("index failed")
+
+    # small queues, upstream stages are blocked on full queues when indexing fails
+    with pytest.raises(RuntimeError, match="index failed"):
+        await run_import(tmp_path, {}, FailingIndex(), queue_size=1, embed_batch_size=1, hash_workers=2)
+    assert asyncio.all_tasks() == {asyncio.current_task()}
+
+
+@pytest.mark.asyncio
+async def test_reembeds_only_changed_chunks(tmp_path):
+    # paragraphs larger than half the splitter chunk size end up in separate chunks
+    paragraphs = [f"paragraph {i} " + "x" * 3000 for i in range(5)]
+    write(tmp_path / "manual.txt", "\n\n".join(paragraphs))
+    fake = FakeIndex()
+    index = await run_import(tmp_path, {}, fake)
+    entry = index[str(tmp_path / "manual.txt")]
+    old_ids = list(entry["ids"])
+    assert len(old_ids) == 5 and fake.inserted_docs == 5
+
+    paragraphs[2] = "paragraph 2 " + "y" * 3000
+    write(tmp_path / "manual.txt", "\n\n".join(paragraphs))
+    index = await run_import(tmp_path, index, fake)
+
+    new_ids = index[str(tmp_path / "manual.txt")]["ids"]
+    assert fake.inserted_docs == 6  # one chunk embedded again
+    assert new_ids[:2] == old_ids[:2] and new_ids[3:] == old_ids[3:]
+    assert new_ids[2] != old_ids[2] and old_ids[2] not in fake.docs
+    assert fake.docs[new_ids[2]].page_content.startswith("paragraph 2 y")
+    assert len(fake.docs) == 5
+
+
+@pytest.mark.asyncio
+async def test_imports_only_given_paths(tmp_path):
+    write(tmp_path / "a.txt", "a")
+    os.makedirs(tmp_path / "sub")
+    write(tmp_path / "sub" / "b.txt", "b")
+    write(tmp_path / "sub" / "c.txt", "c")
+    fake = FakeIndex()
+    index = await run_import(tmp_path, {}, fake)
+
+    write(tmp_path / "a.txt", "a2")  # changed, but not reported
+    os.remove(tmp_path / "sub" / "b.txt")
+    write(tmp_path / "sub" / "d.txt", "d")
+    index = await run_import(tmp_path, index, fake, paths=[str(tmp_path / "sub")])
+
+    assert index[str(tmp_path / "a.txt")]["state"] == "original"
+    assert index[str(tmp_path / "sub" / "b.txt")]["state"] == "removed"
+    assert index[str(tmp_path / "sub" / "c.txt")]["state"] == "original"
+    assert index[str(tmp_path / "sub" / "d.txt")]["state"] == "changed"
+
+
+def test_source_matches_discovery_rules(tmp_path):
+    root = KnowledgeSource(str(tmp_path), {}, filename_pattern="*", recursive=False)
+    md = KnowledgeSource(str(tmp_path), {}, filename_pattern="**/*.md", recursive=True)
+
+    assert root.matches(str(tmp_path / "a.txt"))
+    assert not root.matches(str(tmp_path / "sub" / "a.txt"))
+    assert not root.matches(str(tmp_path / ".hidden"))
+    assert md.matches(str(tmp_path / "sub" / "a.md"))
+    assert not md.matches(str(tmp_path / "sub" / "a.txt"))
+    assert not md.matches(str(tmp_path.parent / "a.md"))
+
+
+def test_check_file_skips_hash_when_stat_unchanged(tmp_path, monkeypatch):
+    path = str(tmp_path / "a.txt")
+    write(path, "hello")
+    changed, entry = check_file(path, None)
+    assert changed and entry["checksum"].startswith("blake2b:")
+
+    def fail(*args, **kwargs):
+        raise AssertionError("file should not be hashed")
+
+    monkeypatch.setattr(knowledge_import, "calculate_checksum", fail)
+    changed, same = check_file(path, entry)
+    assert not changed and same is entry
+
+
+def test_check_file_hashes_on_stat_change(tmp_path):
+    path = str(tmp_path / "a.txt")
+    write(path, "hello")
+    _, entry = check_file(path, None)
+
+    os.utime(path, ns=(1, 1))  # touched, content unchanged
+    changed, touched = check_file(path, entry)
+    assert not changed and touched["mtime_ns"] == 1
+
+    write(path, "hello world")
+    changed, edited = check_file(path, touched)
+    assert changed and edited["checksum"] != entry["checksum"]
+
+
+def test_check_file_accepts_legacy_md5(tmp_path):
+    path = str(tmp_path / "a.txt")
+    write(path, "hello")
+    legacy = {"file": path, "checksum": "5d41402abc4b2a76b9719d911017c592", "ids": ["x"]}
+
+    changed, entry = check_file(path, legacy)  # type: ignore
+
+    assert not changed
+    assert entry["checksum"].startswith("blake2b:") and entry["ids"] == ["x"]
+
+
+def test_manifest_saves_only_differences(tmp_path):
+    manifest = KnowledgeManifest(str(tmp_path / "manifest.db"))
+    index = {
+        "a": {"file": "a", "checksum": "1", "ids": ["i1"], "state": "changed", "documents": []},
+        "b": {"file": "b", "checksum": "2", "ids": ["i2"], "state": "changed", "documents": []},
+    }
+    manifest.save(index)  # type: ignore
+    manifest.close()
+
+    manifest = KnowledgeManifest(str(tmp_path / "manifest.db"))
+    loaded = manifest.load()
+    assert loaded["a"]["ids"] == ["i1"] and loaded["b"]["checksum"] == "2"
+
+    loaded["b"]["state"] = "removed"
+    loaded["a"]["ids"] = ["i3"]
+    manifest.save(loaded)
+    assert manifest.load().keys() == {"a"}
+    assert manifest.load()["a"]["ids"] == ["i3"]
+    manifest.close()
+
+
+def test_manifest_migrates_legacy_json(tmp_path):
+    legacy = tmp_path / "knowledge_import.json"
+    legacy.write_text(json.dumps({"a": {"file": "a", "checksum": "1", "ids": ["i1"]}}))
+    manifest = KnowledgeManifest(str(tmp_path / "manifest.db"))
+
+    manifest.migrate_json(str(legacy))
+
+    assert not legacy.exists()
+    assert manifest.load()["a"]["ids"] == ["i1"]
+    manifest.close()
@@ -0,0 +1,110 @@
+"""
+Unit tests for python/helpers/knowledge_watcher.py
+
+- InotifyBackend / PollingBackend: report created, modified and deleted files
+- KnowledgeWatcher: debounces events and applies changed paths, reports lag and queue depth,
+  waits for the retry of failed changes
+"""
+
+import sys
+import os
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import time
+
+import pytest
+
+from python.helpers import metrics
+from python.helpers.knowledge_watcher import InotifyBackend, KnowledgeWatcher, PollingBackend
+
+
+def write(path, text):
+    with open(path, "w") as f:
+        f.write(text)
+
+
+def collect(backend, until, timeout=5.0):
+    seen = set()
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline and not until <= seen:
+        paths = backend.read(0.1)
+        seen.update(paths or [])
+    return seen
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="inotify is Linux only")
+def test_inotify_reports_changes(tmp_path):
+    existing = str(tmp_path / "old.txt")
+    write(existing, "old")
+    backend = InotifyBackend([str(tmp_path)])
+    try:
+        write(tmp_path / "new.txt", "new")
+        os.remove(existing)
+        os.makedirs(tmp_path / "sub")
+        write(tmp_path / "sub" / "nested.md", "nested")
+
+        expected = {str(tmp_path / "new.txt"), existing, str(tmp_path / "sub" / "nested.md")}
+        assert expected <= collect(backend, expected)
+    finally:
+        backend.close()
+
+
+def test_polling_reports_changes(tmp_path):
+    existing = str(tmp_path / "old.txt")
+    write(existing, "old")
+    backend = PollingBackend([str(tmp_path)], interval=0.05)
+
+    write(tmp_path / "new.txt", "new")
+    os.remove(existing)
+
+    expected = {str(tmp_path / "new.txt"), existing}
+    assert expected <= collect(backend, expected)
+
+
+def test_watcher_debounces_and_applies(tmp_path):
+    applied: list[list[str]] = []
+
+    async def apply(paths):
+        applied.append(paths)
+
+    watcher = KnowledgeWatcher.start("test_watcher", [str(tmp_path)], apply)
+    watcher.debounce = 0.2
+    try:
+        deadline = time.monotonic() + 5
+        while not watcher.running and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert KnowledgeWatcher.is_current("test_watcher")
+
+        path = str(tmp_path / "doc.txt")
+        for i in range(5):
+            write(path, f"version {i}")  # rapid edits of one file
+
+        while watcher.applied == 0 and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+        assert applied and path in applied[0]
+        assert sum(p == path for batch in applied for p in batch) == 1
+        stats = metrics.collect("knowledge_watcher/test_watcher")["knowledge_watcher/test_watcher"]
+        assert stats["queue_depth"] == 0 and stats["lag_last_s"] >= 0.2
+        assert KnowledgeWatcher.is_current("test_watcher")
+    finally:
+        KnowledgeWatcher.stop_watching("test_watcher")
+    assert not KnowledgeWatcher.is_current("test_watcher")
+
+
+def test_wait_time_until_retry(monkeypatch):
+    watcher = KnowledgeWatcher("test_wait", [], lambda paths: None, debounce=1.0)  # type: ignore
+    metrics.unregister("knowledge_watcher/test_wait")
+    monkeypatch.setattr(time, "monotonic", lambda: 100.0)
+    assert watcher._wait_time() == 5.0  # idle
+
+    watcher.pending["doc.txt"] = 99.5
+    watcher._last_event = 99.5
+    assert watcher._wait_time() == 0.5
+
+    # failed changes wait for their retry, not for the closed debounce window
+    watcher._retry_at = 103.0
+    assert watcher._wait_time() == 3.0
+    assert not watcher._due(100.0) and watcher._due(103.0)
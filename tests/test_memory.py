@@ -0,0 +1,160 @@
+"""
+Unit tests for python/helpers/memory.py
+
+Tests use an in-process FAISS index with deterministic fake embeddings, no model downloads:
+- Memory.search_similarity_multi: batched multi-query search with real scores
+- Memory.get_ready / warm_up: background initialization with a bounded wait
+"""
+
+import sys
+import os
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import threading
+from types import SimpleNamespace
+
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from python.helpers import memory as memory_module
+from python.helpers.memory import Memory
+
+
+VOCABULARY = ["python", "docker", "memory", "error", "network", "file", "test", "agent"]
+
+
+class KeywordEmbeddings(Embeddings):
+    """Bag-of-words embeddings over a tiny vocabulary, normalized to unit length."""
+
+    def __init__(self):
+        self.calls: list[list[str]] = []
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+    def _embed(self, text):
+        words = text.lower().split()
+        vector = [float(words.count(w)) for w in VOCABULARY] + [0.1]
+        norm = sum(v * v for v in vector) ** 0.5
+        return [v / norm for v in vector]
+
+
+@pytest.fixture
+def embeddings():
+    return KeywordEmbeddings()
+
+
+@pytest.fixture
+def memory(embeddings):
+    db = Memory.create_db(embeddings)
+    texts = [
+        ("python error in file", "main"),
+        ("docker network error", "main"),
+        ("agent memory test", "fragments"),
+        ("python test file", "solutions"),
+        ("docker python agent", "solutions"),
+    ]
+    docs = [Document(t, metadata={"id": f"id{i}", "area": area}) for i, (t, area) in enumerate(texts)]
+    db.add_documents(docs, ids=[d.metadata["id"] for d in docs])
+    embeddings.calls.clear()
+    return Memory(db, memory_subdir="test")
+
+
+class TestSearchSimilarityMulti:
+    """Tests for the batched multi-query search."""
+
+    @pytest.mark.asyncio
+    async def test_matches_single_searches(self, memory):
+        queries = ["python error", "docker network"]
+        batched = await memory.search_similarity_multi(queries, limit=3, threshold=0.5)
+        for query, result in zip(queries, batched):
+            single = memory.db.similarity_search_with_relevance_scores(query, k=3, score_threshold=0.5)
+            # equal scores may come in any order, compare the score sequence and the best hit
+            assert [s for _, s in result] == pytest.approx([s for _, s in single], abs=1e-5)
+            assert result[0][0].metadata["id"] == single[0][0].metadata["id"]
+
+    @pytest.mark.asyncio
+    async def test_embeds_distinct_queries_once(self, memory, embeddings):
+        await memory.search_similarity_multi(
+            ["python test", "python test", "docker"],
+            limit=2,
+            threshold=0.0,
+            filters=["area == 'main'", "area == 'solutions'", ""],
+        )
+        assert embeddings.calls == [["python test", "docker"]]
+
+    @pytest.mark.asyncio
+    async def test_filters_limits_and_scores(self, memory):
+        mems, sols = await memory.search_similarity_multi(
+            ["python test file", "python test file"],
+            limit=[1, 5],
+            threshold=0.5,
+            filters=["area == 'main'", "area == 'solutions'"],
+        )
+        assert len(mems) == 1
+        assert mems[0][0].metadata["area"] == "main"
+        assert all(doc.metadata["area"] == "solutions" for doc, _ in sols)
+        assert sols[0][0].metadata["id"] == "id3"
+        assert sols[0][1] == pytest.approx(1.0, abs=1e-3)
+        scores = [score for _, score in sols]
+        assert scores == sorted(scores, reverse=True)
+        assert all(0.5 <= score <= 1.0 for score in scores)
+
+    @pytest.mark.asyncio
+    async def test_empty(self, memory):
+        assert await memory.search_similarity_multi([], limit=3, threshold=0.5) == []
+
+
+class TestWarmUp:
+    """Tests for the non-blocking memory initialization."""
+
+    @pytest.fixture
+    def slow_init(self, monkeypatch):
+        release = threading.Event()
+        subdir = "warm_up_test"
+
+        def initialize(log_item, model_config, memory_subdir, in_memory=False):
+            release.wait(5)
+            return Memory.create_db(KeywordEmbeddings()), True
+
+        monkeypatch.setattr(Memory, "initialize", staticmethod(initialize))
+        monkeypatch.setattr(memory_module, "get_agent_memory_subdir", lambda agent: subdir)
+        agent = SimpleNamespace(
+            context=SimpleNamespace(log=SimpleNamespace(log=lambda **kwargs: None)),
+            config=SimpleNamespace(embeddings_model=None, knowledge_subdirs=[]),
+        )
+        yield agent, subdir, release
+        release.set()
+        Memory.index.pop(subdir, None)
+        Memory.warmups.pop(subdir, None)
+        Memory.warmups_ready.pop(subdir, None)
+
+    @pytest.mark.asyncio
+    async def test_get_ready_times_out_while_loading(self, slow_init):
+        agent, subdir, release = slow_init
+
+        assert await Memory.get_ready(agent, timeout=0.1) is None  # type: ignore
+        assert Memory.is_warming(subdir)
+
+        release.set()
+        ready = await Memory.get_ready(agent, timeout=5)  # type: ignore
+        assert ready is not None and ready.memory_subdir == subdir
+
+    @pytest.mark.asyncio
+    async def test_get_waits_for_completion_and_reuses_task(self, slow_init):
+        agent, subdir, release = slow_init
+
+        task = Memory.warm_up(agent)  # type: ignore
+        assert Memory.warm_up(agent) is task  # type: ignore
+        release.set()
+        db = await Memory.get(agent)  # type: ignore
+
+        assert db.db is Memory.index[subdir]
+        assert not Memory.is_warming(subdir)
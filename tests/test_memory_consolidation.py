@@ -0,0 +1,173 @@
+"""
+Unit tests for python/helpers/memory_consolidation.py
+
+- _find_similar_memories: candidates found by several searches keep their best score
+- _select_candidates: score margin, count and token caps of the analysis prompt
+- REPLACE validation: real similarity scores of the consolidation context, memories
+  without a score fall back to 0.7 and block the replacement
+"""
+
+import sys
+import os
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asyncio
+
+import pytest
+from langchain_core.documents import Document
+
+from python.helpers import memory_consolidation
+from python.helpers.memory import Memory
+from python.helpers.memory_consolidation import (
+    ConsolidationAction,
+    ConsolidationConfig,
+    ConsolidationResult,
+    MemoryConsolidator,
+)
+
+
+class FakeMemory:
+    def __init__(self, docs: list[Document], results: list[list[tuple[Document, float]]] | None = None):
+        self.docs = {doc.metadata["id"]: doc for doc in docs}
+        self.results = results or []
+        self.deleted: list[str] = []
+        self.inserted: list[tuple[str, dict]] = []
+        self.db = self
+
+    async def aget_by_ids(self, ids):
+        return [self.docs[id] for id in ids if id in self.docs]
+
+    def has_text_index(self):
+        return False
+
+    async def search_similarity_multi(self, queries, limit, threshold, filters, vectors=None):
+        return self.results
+
+    async def delete_documents_by_ids(self, ids):
+        self.deleted.extend(ids)
+
+    async def insert_text(self, text, metadata):
+        self.inserted.append((text, metadata))
+        return f"new{len(self.inserted)}"
+
+
+def doc(id: str, text: str = "memory") -> Document:
+    return Document(text, metadata={"id": id, "area": "main"})
+
+
+@pytest.fixture
+def consolidator(monkeypatch):
+    monkeypatch.setattr(memory_consolidation, "approximate_tokens", lambda text: len(text.split()))
+    config = ConsolidationConfig(
+        max_llm_context_memories=3, max_llm_context_tokens=40, candidate_score_margin=0.15
+    )
+    return MemoryConsolidator(agent=None, config=config)  # type: ignore
+
+
+def selected(candidates: list[Document]) -> list[tuple[str, float]]:
+    return [(d.metadata["id"], d.metadata["_consolidation_similarity"]) for d in candidates]
+
+
+def test_select_candidates_score_margin(consolidator):
+    scored = [(doc("low"), 0.7), (doc("best"), 0.9), (doc("close"), 0.8)]
+    assert selected(consolidator._select_candidates(scored)) == [("best", 0.9), ("close", 0.8)]
+    assert consolidator._select_candidates([]) == []
+
+
+def test_select_candidates_count_and_token_caps(consolidator):
+    long = "word " * 30
+    scored = [
+        (doc("a"), 0.95),
+        (doc("long", long), 0.94),  # over the remaining token budget, skipped
+        (doc("b"), 0.93),
+        (doc("c"), 0.92),
+        (doc("d"), 0.91),  # over the count cap
+    ]
+    assert [id for id, _ in selected(consolidator._select_candidates(scored))] == ["a", "b", "c"]
+
+    # the best candidate is kept even if it alone exceeds the budget
+    scored = [(doc("huge", long * 3), 0.9), (doc("small"), 0.85)]
+    assert [id for id, _ in selected(consolidator._select_candidates(scored))] == ["huge"]
+
+    # candidates are copies, stored documents are not changed
+    original = doc("x")
+    consolidator._select_candidates([(original, 0.9)])
+    assert "_consolidation_similarity" not in original.metadata
+
+
+def test_find_similar_keeps_best_score_across_searches(consolidator, monkeypatch):
+    shared, other = doc("shared"), doc("other")
+    fake = FakeMemory([shared, other], results=[
+        [(shared, 0.8), (other, 0.85)],  # search for the new memory
+        [(doc("shared"), 0.92)],  # keyword search finds it again with a better score
+        [(shared, 0.75)],
+    ])
+
+    async def get(agent):
+        return fake
+
+    async def keywords(new_memory, log_item=None):
+        return ["first keyword", "second keyword"]
+
+    monkeypatch.setattr(Memory, "get", staticmethod(get))
+    monkeypatch.setattr(consolidator, "_extract_search_keywords", keywords)
+    candidates = asyncio.run(consolidator._find_similar_memories("new memory", "main"))
+    assert selected(candidates) == [("shared", 0.92), ("other", 0.85)]
+
+
+def replace_result(*ids: str) -> ConsolidationResult:
+    return ConsolidationResult(
+        action=ConsolidationAction.REPLACE,
+        memories_to_remove=list(ids),
+        new_memory_content="replacement",
+    )
+
+
+def test_replace_with_real_scores(consolidator):
+    fake = FakeMemory([doc("a"), doc("b")])
+    ids = asyncio.run(consolidator._handle_replace(
+        fake, replace_result("a", "b"), "main", {}, None, {"a": 0.95, "b": 0.91}  # type: ignore
+    ))
+    assert ids == ["new1"]
+    assert fake.deleted == ["a", "b"]
+    assert fake.inserted[0][1]["consolidation_action"] == "replace"
+
+
+@pytest.mark.parametrize("scores", [
+    {"a": 0.95, "b": 0.85},  # real score below the replace threshold
+    {"a": 0.95},  # no score for b, falls back to 0.7
+    None,
+])
+def test_replace_blocked_below_threshold(consolidator, scores):
+    fake = FakeMemory([doc("a"), doc("b")])
+    ids = asyncio.run(consolidator._handle_replace(
+        fake, replace_result("a", "b"), "main", {}, None, scores  # type: ignore
+    ))
+    assert ids == ["new1"]
+    assert fake.deleted == []
+    metadata = fake.inserted[0][1]
+    assert metadata["consolidation_action"] == "keep_separate_safety"
+    assert metadata["original_action"] == "replace"
+
+
+def test_concurrent_replacements_use_their_own_scores(consolidator):
+    safe, unsafe = FakeMemory([doc("a")]), FakeMemory([doc("a")])
+
+    async def both():
+        return await asyncio.gather(
+            consolidator._apply_consolidation_result(replace_result("a"), "main", {}, None, {"a": 0.95}),
+            consolidator._apply_consolidation_result(replace_result("a"), "main", {}, None, {"a": 0.5}),
+        )
+
+    dbs = iter([safe, unsafe])
+
+    async def get(agent):
+        return next(dbs)
+
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(Memory, "get", staticmethod(get))
+        asyncio.run(both())
+    assert safe.deleted == ["a"]
+    assert unsafe.deleted == [] and unsafe.inserted[0][1]["consolidation_action"] == "keep_separate_safety"
@@ -0,0 +1,333 @@
+"""
+Unit tests for python/helpers/memory_docstore.py
+
+- SQLiteDocstore: upserts, deletes, batched reads, LRU cache, pickling by path
+- MyFaiss with SQLiteDocstore: search, save and load (also from a moved folder), reconcile
+- FTS5 text index: BM25 ranking, incremental updates, migration of older databases
+- Memory.search_hybrid: lexical lookups without embedding, reciprocal rank fusion,
+  lexical matches need every query word and pass the similarity threshold
+- Browse indexes: newest first pages with cursors, counts kept up to date by writes
+"""
+
+import sys
+import os
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pickle
+import shutil
+import sqlite3
+
+import pytest
+from langchain_core.documents import Document
+
+from python.helpers.memory import Memory
+from python.helpers.memory_docstore import DB_FILE_NAME, SQLiteDocstore, fts_query
+from tests.test_memory import KeywordEmbeddings
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = SQLiteDocstore(str(tmp_path / DB_FILE_NAME), cache_size=2)
+    yield store
+    store.close()
+
+
+def test_add_search_delete(store):
+    store.add({"a": Document("alpha", metadata={"area": "main"}), "b": Document("beta")})
+
+    found = store.search("a")
+    assert isinstance(found, Document)
+    assert found.page_content == "alpha" and found.metadata == {"area": "main"}
+    assert store.search("x") == "ID x not found."
+    assert [d.page_content for d in store.mget(["b", "x", "a"])] == ["beta", "alpha"]
+
+    store.delete(["a"])
+    assert len(store) == 1 and store.mget(["a"]) == []
+
+
+def test_upsert_replaces_document(store):
+    store.upsert("a", Document("v1"))
+    store.upsert("a", Document("v2", metadata={"n": 2}))
+    reopened = SQLiteDocstore(store.path)
+    assert reopened.mget(["a"])[0].page_content == "v2"
+    assert len(reopened) == 1
+    reopened.close()
+
+
+def test_cache_is_bounded(store):
+    store.add({str(i): Document(f"doc {i}") for i in range(5)})
+    store.mget(["0", "1", "2"])
+    assert len(store._cache) == 2
+    assert list(store._cache) == ["1", "2"]
+
+
+def test_pickles_path_only(store):
+    store.add({"a": Document("alpha")})
+    data = pickle.dumps(store)
+    assert b"alpha" not in data
+    restored = pickle.loads(data)
+    assert restored.mget(["a"])[0].page_content == "alpha"
+    restored.close()
+
+
+def test_reconcile(store):
+    store.add({"a": Document("a"), "orphan": Document("o")})
+    missing = store.reconcile(["a", "gone"])
+    assert missing == ["gone"]
+    assert store.ids() == ["a"]
+
+
+def test_faiss_with_sqlite_docstore(tmp_path):
+    folder = tmp_path / "memory"
+    embeddings = KeywordEmbeddings()
+    db = Memory.create_db(embeddings, SQLiteDocstore(str(folder / DB_FILE_NAME)))
+    docs = [
+        Document("python error", metadata={"id": "1"}),
+        Document("docker network", metadata={"id": "2"}),
+    ]
+    db.add_documents(docs, ids=["1", "2"])
+    db.save_local(str(folder))
+    assert len(db.get_all_docs()) == 2
+
+    # the folder moves, documents are found next to the index
+    moved = tmp_path / "moved"
+    db.docstore.close()  # type: ignore
+    shutil.move(str(folder), str(moved))
+    loaded = Memory.load_db(str(moved), embeddings)
+
+    assert isinstance(loaded.docstore, SQLiteDocstore)
+    assert loaded.docstore.path == str(moved / DB_FILE_NAME)
+    assert loaded.similarity_search("docker", k=1)[0].page_content == "docker network"
+    assert [d.page_content for d in loaded.get_by_ids(["1"])] == ["python error"]
+
+    loaded.delete(ids=["1"])
+    assert list(loaded.get_all_docs()) == ["2"]
+    loaded.docstore.close()  # type: ignore
+
+
+@pytest.fixture
+def hybrid(tmp_path):
+    embeddings = KeywordEmbeddings()
+    db = Memory.create_db(embeddings, SQLiteDocstore(str(tmp_path / DB_FILE_NAME)))
+    texts = [
+        ("python error ERR_CONN_RESET in network file", "main"),
+        ("docker network error on restart", "main"),
+        ("agent memory test notes", "fragments"),
+        ("python test file for config_loader.py", "solutions"),
+    ]
+    docs = [Document(t, metadata={"id": f"id{i}", "area": area}) for i, (t, area) in enumerate(texts)]
+    db.add_documents(docs, ids=[d.metadata["id"] for d in docs])
+    embeddings.calls.clear()
+    yield Memory(db, memory_subdir="test"), embeddings
+    db.docstore.close()  # type: ignore
+
+
+def test_fts_query():
+    assert fts_query("") == ""
+    assert fts_query("Docker") == '"docker"'
+    assert fts_query('docker "network" docker') == '"docker network docker" OR "docker" OR "network"'
+    # stopwords never match on their own
+    assert fts_query("what is the") == ""
+    assert fts_query("the docker network", match_all=True) == '"docker network" OR ("docker" AND "network")'
+
+
+def test_search_text_ranks_and_updates(store):
+    store.add({
+        "a": Document("docker network error"),
+        "b": Document("docker docker docker network"),
+        "c": Document("unrelated text"),
+    })
+    assert store.fts
+    hits = store.search_text("docker network", 10)
+    assert {id for id, _ in hits} == {"a", "b"}
+    assert hits[0][1] >= hits[1][1]
+    assert store.search_text("ERR_CONN_RESET", 5) == []
+
+    # upserts and deletes keep the index in sync
+    store.upsert("c", Document("failed with ERR_CONN_RESET"))
+    assert [id for id, _ in store.search_text("ERR_CONN_RESET", 5)] == ["c"]
+    assert store.search_text("unrelated", 5) == []
+    store.delete(["c"])
+    assert store.search_text("ERR_CONN_RESET", 5) == []
+
+
+def test_text_index_added_to_older_database(tmp_path):
+    path = str(tmp_path / DB_FILE_NAME)
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE docs (id TEXT PRIMARY KEY, content TEXT NOT NULL, metadata TEXT NOT NULL)")
+    conn.execute("INSERT INTO docs VALUES ('old', 'legacy memory_key value', '{}')")
+    conn.commit()
+    conn.close()
+
+    store = SQLiteDocstore(path)
+    assert [id for id, _ in store.search_text("memory_key", 5)] == ["old"]
+    store.close()
+
+
+@pytest.mark.asyncio
+async def test_hybrid_exact_lookup_skips_embedding(hybrid):
+    memory, embeddings = hybrid
+    results = await memory.search_hybrid("ERR_CONN_RESET", limit=3, threshold=0.5)
+    assert [doc.metadata["id"] for doc, _ in results] == ["id0"]
+    assert embeddings.calls == []
+
+    # no lexical match within the area, falls back to vector search
+    results = await memory.search_hybrid("config_loader.py", limit=3, threshold=0.5, filter="area == 'main'")
+    assert all(doc.metadata["area"] == "main" for doc, _ in results)
+    assert len(embeddings.calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_hybrid_fuses_lexical_and_vector(hybrid):
+    memory, embeddings = hybrid
+    results = await memory.search_hybrid("docker network", limit=3, threshold=0.5)
+    assert len(embeddings.calls) == 1
+    ids = [doc.metadata["id"] for doc, _ in results]
+    # top ranked on both sides, so first after fusion
+    assert ids[0] == "id1"
+    scores = [score for _, score in results]
+    assert scores == sorted(scores, reverse=True)
+
+    vector_only = await memory.search_hybrid("docker network", limit=3, threshold=0.5, mode="vector")
+    lexical_only = await memory.search_hybrid("docker network", limit=3, threshold=0.5, mode="lexical")
+    assert len(embeddings.calls) == 2
+    assert vector_only[0][0].metadata["id"] == lexical_only[0][0].metadata["id"] == "id1"
+
+
+@pytest.mark.asyncio
+async def test_hybrid_lexical_matches_are_relevant(hybrid):
+    memory, embeddings = hybrid
+    # a shared common word is no match, every word of the query has to be found
+    assert [doc.metadata["id"] for doc, _ in memory.search_lexical("network restart", 5)] == ["id1", "id0"]
+    results = await memory.search_hybrid("network restart", limit=3, threshold=0.7, mode="lexical")
+    assert [doc.metadata["id"] for doc, _ in results] == ["id1"]
+
+    # lexical matches of an embedded query face the same threshold as vector matches
+    assert await memory.search_hybrid("docker restart", limit=3, threshold=0.9) == []
+    results = await memory.search_hybrid("docker restart", limit=3, threshold=0.7)
+    assert [doc.metadata["id"] for doc, _ in results] == ["id1"]
+
+
+def test_score_documents(hybrid):
+    memory, embeddings = hybrid
+    docs = [doc for doc, _ in memory.search_lexical("docker", 5)]
+    vector = memory.db.embedding_function.embed_query("docker network")  # type: ignore
+    scores = memory.score_documents(docs, vector)
+    assert scores[0] == pytest.approx(max(scores))
+    assert all(0 <= score <= 1 for score in scores)
+
+
+def browse_docs():
+    docs = {}
+    for i in range(7):
+        area = "main" if i % 2 == 0 else "fragments"
+        metadata = {"id": f"d{i}", "area": area, "timestamp": f"2024-01-0{i + 1} 10:00:00"}
+        if i in (2, 5):
+            metadata["knowledge_source"] = True
+        docs[f"d{i}"] = Document(f"doc {i}", metadata=metadata)
+    docs["old"] = Document("no timestamp", metadata={"id": "old", "area": "main"})
+    return docs
+
+
+def test_page_with_cursor(store):
+    store.add(browse_docs())
+    seen, after = [], None
+    while True:
+        docs, after = store.page(limit=3, after=after)
+        seen.extend(d.metadata["id"] for d in docs)
+        if not after:
+            break
+    assert seen == ["d6", "d5", "d4", "d3", "d2", "d1", "d0", "old"]
+
+    docs, after = store.page(area="main", limit=2)
+    assert [d.metadata["id"] for d in docs] == ["d6", "d4"]
+    docs, after = store.page(area="main", limit=2, after=after)
+    assert [d.metadata["id"] for d in docs] == ["d2", "d0"]
+    docs, after = store.page(area="main", limit=2, after=after)
+    assert [d.metadata["id"] for d in docs] == ["old"] and after is None
+
+    docs, _ = store.page(knowledge_source=True, limit=10)
+    assert [d.metadata["id"] for d in docs] == ["d5", "d2"]
+
+
+def test_page_uses_index(store):
+    store.add(browse_docs())
+    conn = store._connect()
+    from python.helpers.memory_docstore import _AREA, _TIMESTAMP
+
+    plan = " ".join(
+        str(row) for row in conn.execute(
+            f"EXPLAIN QUERY PLAN SELECT id FROM docs WHERE {_AREA} = 'main' "
+            f"ORDER BY {_TIMESTAMP} DESC, id DESC LIMIT 3"
+        )
+    )
+    assert "docs_area_timestamp" in plan and "TEMP B-TREE" not in plan
+
+
+def test_counts_follow_writes(store):
+    store.add(browse_docs())
+    assert len(store) == 8
+    assert store.counts() == {("main", False): 4, ("main", True): 1, ("fragments", False): 2, ("fragments", True): 1}
+
+    store.upsert("d0", Document("changed", metadata={"area": "fragments"}))
+    store.delete(["d1", "missing"])
+    store.add({"new": Document("new")})
+    assert len(store) == 8
+    assert store.counts()[("main", False)] == 3 and store.counts()[("fragments", False)] == 2
+    assert store.counts()[("", False)] == 1
+    reopened = SQLiteDocstore(store.path)
+    assert len(reopened) == 8
+    reopened.close()
+
+    store.clear()
+    assert len(store) == 0 and store.counts() == {}
+
+
+@pytest.mark.parametrize("backend", ["memory", "sqlite"])
+def test_browse_documents(tmp_path, backend):
+    docstore = SQLiteDocstore(str(tmp_path / DB_FILE_NAME)) if backend == "sqlite" else None
+    db = Memory.create_db(KeywordEmbeddings(), docstore)
+    docs = browse_docs()
+    db.add_documents(list(docs.values()), ids=list(docs))
+    memory = Memory(db, memory_subdir="test")
+
+    docs, cursor = memory.browse_documents(limit=3, area="main")
+    assert [d.metadata["id"] for d in docs] == ["d6", "d4", "d2"]
+    docs, cursor = memory.browse_documents(limit=3, area="main", cursor=cursor)
+    assert [d.metadata["id"] for d in docs] == ["d0", "old"] and cursor == ""
+    docs, _ = memory.browse_documents(limit=5, knowledge_source=False, area="fragments")
+    assert [d.metadata["id"] for d in docs] == ["d3", "d1"]
+
+    assert memory.count_documents() == 8
+    assert memory.get_document_counts()[("main", True)] == 1
+    with pytest.raises(ValueError):
+        memory.browse_documents(limit=3, cursor="not a cursor")
+    if docstore:
+        docstore.close()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("backend", ["memory", "sqlite"])
+async def test_update_documents_replaces_in_place(tmp_path, backend, monkeypatch):
+    docstore = SQLiteDocstore(str(tmp_path / DB_FILE_NAME)) if backend == "sqlite" else None
+    db = Memory.create_db(KeywordEmbeddings(), docstore)
+    docs = [Document(t, metadata={"id": id}) for id, t in [("a", "python error"), ("b", "docker network")]]
+    db.add_documents(docs, ids=["a", "b"])
+    monkeypatch.setattr(Memory, "_save_db_file", staticmethod(lambda db, subdir: None))
+    memory = Memory(db, memory_subdir="test")
+    if docstore:
+        # documents are upserted, never deleted and added again
+        monkeypatch.setattr(docstore, "delete", lambda ids: pytest.fail("document deleted"))
+
+    ids = await memory.update_documents([Document("agent memory test", metadata={"id": "a", "area": "main"})])
+    assert ids == ["a"]
+    assert db.index.ntotal == 2 and sorted(db.index_to_docstore_id.values()) == ["a", "b"]
+    assert len(db.get_all_docs()) == 2
+    found = db.similarity_search_with_score("agent memory", k=1)[0]
+    assert found[0].page_content == "agent memory test" and found[0].metadata["area"] == "main"
+    assert db.similarity_search("docker", k=1)[0].metadata["id"] == "b"
+    if docstore:
+        assert docstore.mget(["a"])[0].page_content == "agent memory test"
+        docstore.close()
@@ -0,0 +1,148 @@
+"""
+Unit tests for python/helpers/memory_quantization.py
+
+- create_index / storage_mode / resolve_mode: float16, int8 and product quantized indexes
+- rerank: exact ordering of quantized candidates
+- MyFaiss with a quantized index: exact vectors follow adds and deletes, search re-ranks
+- Memory._use_vector_storage: converts stored indexes between modes and back
+"""
+
+import sys
+import os
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+
+from python.helpers import memory_quantization as mq
+from python.helpers.memory import Memory
+from python.helpers.memory_docstore import DB_FILE_NAME, SQLiteDocstore
+from tests.test_memory import KeywordEmbeddings
+
+
+def unit_vectors(count: int, dim: int, seed: int = 0) -> np.ndarray:
+    vectors = np.random.default_rng(seed).normal(size=(count, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+@pytest.fixture
+def folder(tmp_path):
+    return str(tmp_path / "memory")
+
+
+@pytest.fixture
+def db(folder):
+    db = Memory.create_db(KeywordEmbeddings(), SQLiteDocstore(os.path.join(folder, DB_FILE_NAME)))
+    texts = [
+        "python error in file",
+        "docker network error",
+        "agent memory test",
+        "python test file",
+        "docker python agent",
+    ]
+    db.add_texts(texts, metadatas=[{"id": f"id{i}"} for i in range(5)], ids=[f"id{i}" for i in range(5)])
+    yield db
+    db.docstore.close()  # type: ignore
+    if db.exact:
+        db.exact.close()
+
+
+def use_storage(monkeypatch, db, folder, mode):
+    monkeypatch.setattr(Memory, "_get_vector_storage", staticmethod(lambda subdir: mode))
+    monkeypatch.setattr(
+        Memory, "_save_db_file", staticmethod(lambda db, subdir: db.save_local(folder))
+    )
+    Memory._use_vector_storage(db, folder, "test")
+
+
+class TestCreateIndex:
+    @pytest.mark.parametrize("mode", [mq.FLOAT32, mq.FLOAT16, mq.INT8])
+    def test_modes(self, mode):
+        vectors = unit_vectors(50, 16)
+        index = mq.create_index(mode, 16, vectors)
+        index.add(vectors)
+        assert mq.storage_mode(index) == mode
+        _, found = index.search(vectors[:5], 1)
+        assert list(found[:, 0]) == [0, 1, 2, 3, 4]
+
+    def test_product_quantization(self, monkeypatch):
+        monkeypatch.setattr(mq, "PQ_MIN_TRAINING", 300)
+        with pytest.raises(ValueError):
+            mq.create_index(mq.PQ, 16, unit_vectors(299, 16))
+        vectors = unit_vectors(300, 16)
+        index = mq.create_index(mq.PQ, 16, vectors)
+        index.add(vectors)
+        assert mq.storage_mode(index) == mq.PQ
+        assert index.sa_code_size() == 4  # one byte per 4 dimensions
+
+    def test_resolve_mode(self):
+        assert mq.resolve_mode(mq.PQ, mq.FLOAT32, mq.PQ_MIN_TRAINING - 1) == mq.INT8
+        assert mq.resolve_mode(mq.PQ, mq.FLOAT32, mq.PQ_MIN_TRAINING) == mq.PQ
+        assert mq.resolve_mode(mq.PQ, mq.PQ, 10) == mq.PQ  # no switching back after deletes
+        assert mq.resolve_mode(mq.INT8, mq.FLOAT32, 0) == mq.INT8
+
+    def test_unknown_mode(self):
+        with pytest.raises(ValueError):
+            mq.create_index("int4", 8)
+
+
+def test_rerank_orders_by_exact_scores():
+    vectors = unit_vectors(10, 8)
+    queries = vectors[[3, 7]]
+    candidates = np.array([[0, 3, 5, -1], [7, 1, -1, -1]])
+    scores, positions = mq.rerank(queries, candidates, 2, lambda pos: vectors[pos])
+    assert positions[0, 0] == 3 and positions[1, 0] == 7
+    assert scores[0, 0] == pytest.approx(1.0, abs=1e-5)
+    assert scores[0, 0] >= scores[0, 1]
+
+    # fewer candidates than requested are padded like faiss
+    _, positions = mq.rerank(queries[:1], np.array([[4, -1]]), 3, lambda pos: vectors[pos])
+    assert list(positions[0]) == [4, -1, -1]
+
+
+class TestQuantizedMemory:
+    @pytest.mark.asyncio
+    async def test_search_matches_float32(self, monkeypatch, db, folder):
+        memory = Memory(db, memory_subdir="test")
+        expected = await memory.search_similarity_multi(["python error", "docker"], limit=3, threshold=0.5)
+
+        use_storage(monkeypatch, db, folder, mq.INT8)
+        assert mq.storage_mode(db.index) == mq.INT8 and len(db.exact) == 5  # type: ignore
+
+        found = await memory.search_similarity_multi(["python error", "docker"], limit=3, threshold=0.5)
+        for exact, quantized in zip(expected, found):
+            # re-ranked scores are the exact ones
+            assert [s for _, s in quantized] == pytest.approx([s for _, s in exact], abs=1e-5)
+        hits = db.similarity_search_with_relevance_scores("python error", k=2)
+        assert hits[0][0].page_content == "python error in file"
+
+    def test_exact_vectors_follow_changes(self, monkeypatch, db, folder):
+        use_storage(monkeypatch, db, folder, mq.FLOAT16)
+        db.add_documents([Document("docker memory", metadata={"id": "new"})], ids=["new"])
+        db.delete(ids=["id0"])
+        assert sorted(db.exact.ids()) == ["id1", "id2", "id3", "id4", "new"]  # type: ignore
+        assert db.similarity_search("docker memory", k=1)[0].page_content == "docker memory"
+
+    def test_conversion_survives_reload(self, monkeypatch, db, folder):
+        use_storage(monkeypatch, db, folder, mq.INT8)
+        db.exact.close()  # type: ignore
+        loaded = Memory.load_db(folder, db.embedding_function)
+        assert mq.storage_mode(loaded.index) == mq.INT8
+        assert loaded.exact is not None and len(loaded.exact) == 5
+
+        # an interrupted save left an orphan and lost a vector
+        loaded.exact.delete(["id2"])
+        loaded.exact.add(["orphan"], unit_vectors(1, loaded.index.d))
+        Memory._use_vector_storage(loaded, folder, "test")
+        assert sorted(loaded.exact.ids()) == [f"id{i}" for i in range(5)]
+
+        # and back to exact storage, the vector file is removed
+        monkeypatch.setattr(Memory, "_get_vector_storage", staticmethod(lambda subdir: mq.FLOAT32))
+        Memory._use_vector_storage(loaded, folder, "test")
+        assert loaded.exact is None and mq.storage_mode(loaded.index) == mq.FLOAT32
+        assert not os.path.exists(os.path.join(folder, mq.VECTORS_FILE_NAME))
+        assert loaded.similarity_search("agent memory", k=1)[0].page_content == "agent memory test"
+        loaded.docstore.close()  # type: ignore
@@ -0,0 +1,238 @@
+"""
+Unit tests for python/helpers/memory_reembed.py
+
+- ReembedJob: an interrupted job resumes from its checkpoint without embedding again
+- memories inserted, updated and deleted in the old index while the job runs are reconciled
+- the swapped index is loadable from the memory folder with the new embedding model,
+  a swap interrupted by a crash is finished before the index is loaded
+"""
+
+import sys
+import os
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import json
+
+import pytest
+from langchain_core.documents import Document
+
+from python.helpers import memory as memory_module
+from python.helpers import memory_reembed
+from python.helpers.memory import Memory
+from python.helpers.memory_docstore import DB_FILE_NAME, SQLiteDocstore
+from python.helpers.memory_reembed import ReembedJob, finish_swap
+from tests.test_memory import VOCABULARY, KeywordEmbeddings
+
+TEXTS = [f"{word} note {i}" for i, word in enumerate(VOCABULARY)]
+
+
+class NewModelEmbeddings(KeywordEmbeddings):
+    """Embeddings of the new model, one dimension more than the old ones, with a hook per call."""
+
+    def __init__(self, before_call=None):
+        super().__init__()
+        self.before_call = before_call
+        self.batches = 0
+
+    def _embed(self, text):
+        return super()._embed(text) + [0.0]
+
+    async def aembed_documents(self, texts):
+        if self.before_call:
+            self.before_call(self.batches)
+        self.batches += 1
+        return self.embed_documents(texts)
+
+
+@pytest.fixture
+def db_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(memory_module, "abs_db_dir", lambda subdir: str(tmp_path / subdir))
+    monkeypatch.setattr(Memory, "index", {})
+    monkeypatch.setattr(memory_reembed, "BATCH_SIZE", 2)
+    monkeypatch.setattr(memory_reembed, "PARALLEL_BATCHES", 1)
+    path = tmp_path / "test"
+    path.mkdir()
+    return path
+
+
+def make_old_db(db_dir, sqlite: bool):
+    docstore = SQLiteDocstore(str(db_dir / DB_FILE_NAME)) if sqlite else None
+    db = Memory.create_db(KeywordEmbeddings(), docstore)
+    ids = [f"id{i}" for i in range(len(TEXTS))]
+    db.add_texts(TEXTS, metadatas=[{"id": id, "area": "main"} for id in ids], ids=ids)
+    db.save_local(folder_path=str(db_dir))
+    Memory.index["test"] = db
+    return db
+
+
+def make_job(old_db, embedder):
+    return ReembedJob("test", old_db, embedder, "test", "new-model")
+
+
+def indexed_texts(db) -> dict[str, str]:
+    docs = db.get_all_docs()
+    return {id: docs[id].page_content for id in db.index_to_docstore_id.values()}
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("sqlite", [False, True])
+async def test_resumes_from_checkpoint(db_dir, sqlite, monkeypatch):
+    monkeypatch.setattr(memory_reembed, "CHECKPOINT_INTERVAL", 0)  # checkpoint every round
+    old_db = make_old_db(db_dir, sqlite)
+
+    def fail_third_call(calls):
+        if calls == 2:
+            raise RuntimeError("provider down")
+
+    interrupted = make_job(old_db, NewModelEmbeddings(fail_third_call))
+    await interrupted.run()
+    assert interrupted.error == "provider down" and not interrupted.finished
+    assert json.loads((db_dir / "reembed" / "checkpoint.json").read_text())["done"] == 4
+    assert Memory.load_db(str(db_dir), KeywordEmbeddings()).index.d == len(VOCABULARY) + 1  # old index untouched
+
+    embedder = NewModelEmbeddings()
+    job = make_job(old_db, embedder)
+    await job.run()
+    assert job.finished and job.error == ""
+    assert job.resumed == 4
+    # only documents missing from the checkpoint are embedded again
+    assert embedder.batches == 2
+    assert sorted(t for call in embedder.calls for t in call) == sorted(TEXTS[4:])
+    assert indexed_texts(Memory.index["test"]) == indexed_texts(old_db)
+
+
+@pytest.mark.asyncio
+async def test_checkpoint_of_other_model_is_discarded(db_dir):
+    old_db = make_old_db(db_dir, sqlite=False)
+    job = make_job(old_db, NewModelEmbeddings())
+    job._save_checkpoint(job._create_db())
+
+    other = ReembedJob("test", old_db, NewModelEmbeddings(), "test", "other-model")
+    assert other._load_checkpoint() is None
+    assert job._load_checkpoint() is not None
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("sqlite", [False, True])
+async def test_reconciles_changes_during_job(db_dir, sqlite):
+    old_db = make_old_db(db_dir, sqlite)
+
+    def change_old_index(calls):
+        # memories saved and forgotten by the agent while the job is embedding
+        if calls == 1:
+            old_db.add_texts(["docker inserted"], metadatas=[{"id": "new1"}], ids=["new1"])
+            old_db.delete(ids=["id0", "id5"])
+        elif calls == 3:
+            old_db.delete(ids=["id1"])  # already in the new index
+            old_db.add_texts(["agent inserted"], metadatas=[{"id": "new2"}], ids=["new2"])
+
+    job = make_job(old_db, NewModelEmbeddings(change_old_index))
+    await job.run()
+    assert job.finished and job.error == ""
+
+    new_db = Memory.index["test"]
+    expected = indexed_texts(old_db)
+    assert set(expected) == {f"id{i}" for i in (2, 3, 4, 6, 7)} | {"new1", "new2"}
+    assert indexed_texts(new_db) == expected
+    assert new_db.index.ntotal == len(expected)
+    assert (job.done, job.total) == (len(expected), len(expected))
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("sqlite", [False, True])
+async def test_updates_during_job_are_embedded_again(db_dir, sqlite):
+    old_db = make_old_db(db_dir, sqlite)
+    old_embedder = KeywordEmbeddings()
+
+    def update(id, text):
+        # in place like Memory.update_documents, the id stays the same
+        old_db.update_embeddings(
+            [(text, old_embedder.embed_query(text))], [{"id": id, "area": "main"}], [id]
+        )
+
+    def update_old_index(calls):
+        if calls == 1:
+            update("id0", "agent updated")  # already in the new index
+            update("id2", "file updated")  # in the batch being embedded
+        elif calls == 3:
+            update("id0", "python updated again")
+
+    embedder = NewModelEmbeddings(update_old_index)
+    job = make_job(old_db, embedder)
+    await job.run()
+    assert job.finished and job.error == ""
+
+    new_db = Memory.index["test"]
+    expected = indexed_texts(old_db)
+    assert expected["id0"] == "python updated again" and expected["id2"] == "file updated"
+    assert indexed_texts(new_db) == expected
+    assert new_db.index.ntotal == len(expected)
+    # vectors of the current texts, not of those read before the update
+    positions = {id: pos for pos, id in new_db.index_to_docstore_id.items()}
+    for id in ["id0", "id2"]:
+        vector = new_db.get_vectors([positions[id]])[0]
+        assert vector == pytest.approx(embedder._embed(expected[id]), abs=1e-6)
+
+
+def test_get_all_docs_is_a_snapshot():
+    db = Memory.create_db(KeywordEmbeddings())
+    db.add_texts(["python a", "docker b"], ids=["a", "b"])
+    docs = db.get_all_docs()
+    db.add_texts(["agent c"], ids=["c"])
+    db.delete(ids=["a"])
+    # iterating the snapshot is not affected by later changes
+    assert list(docs) == ["a", "b"]
+    assert sorted(db.get_all_docs()) == ["b", "c"]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("sqlite", [False, True])
+async def test_swap_leaves_loadable_index(db_dir, sqlite):
+    old_db = make_old_db(db_dir, sqlite)
+    embedder = NewModelEmbeddings()
+    job = make_job(old_db, embedder)
+    await job.run()
+    assert job.finished
+
+    assert not (db_dir / "reembed").exists()
+    assert json.loads((db_dir / "embedding.json").read_text()) == {
+        "model_provider": "test",
+        "model_name": "new-model",
+    }
+
+    loaded = Memory.load_db(str(db_dir), embedder)
+    assert indexed_texts(loaded) == indexed_texts(old_db)
+    assert loaded.index.d == len(VOCABULARY) + 2  # vectors of the new model
+    assert isinstance(loaded.docstore, SQLiteDocstore) == sqlite
+    found = loaded.similarity_search("network", k=1)
+    assert found[0].metadata["id"] == f"id{VOCABULARY.index('network')}"
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("sqlite", [False, True])
+async def test_swap_interrupted_by_crash_is_finished(db_dir, sqlite, monkeypatch):
+    old_db = make_old_db(db_dir, sqlite)
+    replace = os.replace
+
+    def crash_after_first_file(source, target):
+        if target.endswith("index.pkl"):
+            raise OSError("crashed")
+        replace(source, target)
+
+    monkeypatch.setattr(os, "replace", crash_after_first_file)
+    job = make_job(old_db, NewModelEmbeddings())
+    await job.run()
+    assert job.error == "crashed" and not job.finished
+    monkeypatch.setattr(os, "replace", replace)
+
+    # the new index.faiss is in place, the rest is still in staging
+    assert not (db_dir / "embedding.json").exists()
+    assert finish_swap(str(db_dir))
+    assert not finish_swap(str(db_dir))
+    assert not (db_dir / "reembed").exists()
+    assert json.loads((db_dir / "embedding.json").read_text())["model_name"] == "new-model"
+    loaded = Memory.load_db(str(db_dir), NewModelEmbeddings())
+    assert loaded.index.d == len(VOCABULARY) + 2
+    assert indexed_texts(loaded) == indexed_texts(old_db)
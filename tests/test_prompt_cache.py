@@ -0,0 +1,155 @@
+"""
+Unit tests for python/helpers/prompt_cache.py
+
+- append_tail: volatile content after the history without changing it, roles alternate
+- cache_control markers at the end of the system prompt and before the tail, only for
+  providers supporting them, tails merged into plain text for the others
+- agent loop iterations against a fake provider caching marked prefixes: the prefix of
+  each request is byte-identical to the previous request, cache hits are tracked
+"""
+
+import sys
+import os
+import json
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+import models
+from python.helpers import prompt_cache
+from python.helpers.history import History
+
+
+class FakeAgent:
+    def __init__(self):
+        self.data = {}
+
+    def get_data(self, key):
+        return self.data.get(key)
+
+    def set_data(self, key, value):
+        self.data[key] = value
+
+
+class FakeCachingProvider:
+    """Provider caching prompts up to cache_control markers, like Anthropic."""
+
+    def __init__(self):
+        self.cached: set[str] = set()
+        self.requests: list[list[dict]] = []
+
+    async def acompletion(self, model, messages, stream=False, **kwargs):
+        self.requests.append(messages)
+        blocks = _request_blocks(messages)
+        cached = 0
+        for end in range(len(blocks), 0, -1):
+            prefix = json.dumps(blocks[:end])
+            if prefix in self.cached:
+                cached = len(prefix) // 4
+                break
+        for end, block in enumerate(blocks, 1):
+            if "cache_control" in block:
+                self.cached.add(json.dumps(blocks[:end]))
+        prompt = len(json.dumps(blocks)) // 4
+        return {
+            "choices": [{"message": {"content": "ok"}}],
+            "usage": {
+                "prompt_tokens": prompt,
+                "prompt_tokens_details": {"cached_tokens": cached},
+            },
+        }
+
+
+def _request_blocks(messages: list[dict]) -> list[dict]:
+    # text blocks with roles, string contents are single blocks like the provider sees them
+    blocks = []
+    for message in messages:
+        for block in prompt_cache._blocks(message["content"]):
+            blocks.append({"role": message["role"], **block})
+    return blocks
+
+
+def _unmarked(blocks: list[dict]) -> list[dict]:
+    return [{k: v for k, v in block.items() if k != "cache_control"} for block in blocks]
+
+
+def test_append_tail_keeps_history_and_alternation():
+    history = [SystemMessage(content="system"), HumanMessage(content="hi"), AIMessage(content="hello")]
+    prompt = prompt_cache.append_tail(history, "extras")
+    assert prompt[:3] == history
+    assert isinstance(prompt[3], HumanMessage) and prompt[3].content == "extras"
+
+    history.append(HumanMessage(content="tool result"))
+    prompt = prompt_cache.append_tail(history, "extras")
+    assert len(prompt) == 4 and history[3].content == "tool result"
+    assert prompt[3].content == [
+        {"type": "text", "text": "tool result"},
+        {"type": "text", "text": "extras"},
+    ]
+    assert prompt_cache.breakpoints(prompt) == [(0, 0), (3, 1)]
+
+
+def test_markers_only_for_supporting_providers():
+    prompt = prompt_cache.append_tail(
+        [SystemMessage(content="system"), HumanMessage(content="hi"), AIMessage(content="hello")],
+        "extras",
+    )
+    anthropic = models.LiteLLMChatWrapper(model="claude-sonnet-4", provider="anthropic")
+    converted = anthropic._convert_messages(prompt)
+    assert converted[0]["content"][-1]["cache_control"] == {"type": "ephemeral"}
+    assert converted[2]["content"] == [
+        {"type": "text", "text": "hello", "cache_control": {"type": "ephemeral"}}
+    ]
+    assert converted[3]["content"] == "extras"
+    assert prompt[0].content == "system"  # messages are not changed
+
+    assert prompt_cache.supports_markers("bedrock", "bedrock/anthropic.claude-3-haiku")
+    assert not prompt_cache.supports_markers("openrouter", "openrouter/openai/gpt-4o")
+
+    prompt = prompt_cache.append_tail([SystemMessage(content="system"), HumanMessage(content="hi")], "extras")
+    openai = models.LiteLLMChatWrapper(model="gpt-4o", provider="openai")
+    converted = openai._convert_messages(prompt)
+    # same text as extras merged into the last history message
+    assert converted == [
+        {"role": "system", "content": "system"},
+        {"role": "user", "content": "hi\nextras"},
+    ]
+
+
+@pytest.mark.asyncio
+async def test_prefix_byte_identical_across_iterations(monkeypatch):
+    monkeypatch.setattr("python.helpers.tokens.approximate_tokens", lambda text: len(text.split()))
+    provider = FakeCachingProvider()
+    monkeypatch.setattr(models, "acompletion", provider.acompletion)
+    model = models.LiteLLMChatWrapper(model="claude-sonnet-4", provider="anthropic")
+    agent = FakeAgent()
+    history = History(agent)  # type: ignore
+    history.add_message(False, "Deploy the billing service")
+    stats = prompt_cache.get_stats()
+
+    system = "You are an agent. " * 50
+    for i in range(6):
+        prompt_cache.track_prefix(agent, system)
+        prompt = prompt_cache.append_tail(
+            [SystemMessage(content=system), *history.output_langchain()],
+            f"[EXTRAS]\n{{\"current_datetime\": \"2025-01-01 10:00:0{i}\"}}",
+        )
+        await model.unified_call(messages=prompt)
+        history.add_message(True, {"tool_name": "code_execution_tool", "step": i})
+        history.add_message(False, {"tool_result": f"output of step {i}"})
+
+    requests = [_request_blocks(r) for r in provider.requests]
+    for previous, current in zip(requests, requests[1:]):
+        # everything before the tail of the previous request is sent again unchanged
+        stable = _unmarked(previous[:-1])
+        assert _unmarked(current[: len(stable)]) == stable
+        assert current[-1]["text"] != previous[-1]["text"]
+
+    after = prompt_cache.get_stats()
+    assert after["usage_reports"] - stats["usage_reports"] == 6
+    assert after["cache_hits"] - stats["cache_hits"] == 5
+    assert after["prefix_reuses"] - stats["prefix_reuses"] == 5
+    assert after["marked_requests"] - stats["marked_requests"] == 6
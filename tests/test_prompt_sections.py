@@ -0,0 +1,118 @@
+"""
+Unit tests for python/helpers/prompt_sections.py
+
+- SectionCache: rendered once per fingerprint, least recently used sections evicted,
+  hit rates per section
+- paths_state: changes when files are edited, added or removed
+- system prompt extension: same prompt as rendering every section, only sections with
+  changed inputs are rendered again
+"""
+
+import sys
+import os
+import asyncio
+from types import SimpleNamespace
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from agent import Agent
+from python.helpers import mcp_handler, prompt_sections
+from python.extensions.system_prompt import _10_system_prompt, _20_behaviour_prompt
+
+
+def test_section_cache_renders_once_per_fingerprint():
+    cache = prompt_sections.SectionCache(size=2)
+    renders = []
+
+    def render(text):
+        return lambda: renders.append(text) or text
+
+    assert cache.get("main", 1, render("a")) == "a"
+    assert cache.get("main", 1, render("b")) == "a"
+    assert cache.get("main", 2, render("b")) == "b"
+    assert cache.get("tools", 1, render("c")) == "c"  # evicts ("main", 1)
+    assert cache.get("main", 1, render("d")) == "d"
+    assert renders == ["a", "b", "c", "d"]
+
+    stats = cache.get_stats()
+    assert stats["cached"] == 2
+    assert stats["sections"]["main"]["hits"] == 1
+    assert stats["sections"]["main"]["misses"] == 3
+    assert stats["sections"]["main"]["hit_rate"] == 0.25
+    assert stats["hit_rate"] == 0.2
+
+
+def test_paths_state_tracks_changes(tmp_path):
+    folder = tmp_path / "prompts"
+    folder.mkdir()
+    (folder / "a.md").write_text("a")
+    missing = str(tmp_path / "missing.md")
+    state = prompt_sections.paths_state(str(folder), missing)
+    assert prompt_sections.paths_state(str(folder), missing) == state
+
+    (folder / "a.md").write_text("changed")
+    edited = prompt_sections.paths_state(str(folder), missing)
+    assert edited != state
+
+    (folder / "b.md").write_text("b")
+    assert prompt_sections.paths_state(str(folder), missing) != edited
+
+    (tmp_path / "missing.md").write_text("now exists")
+    assert prompt_sections.paths_state(missing) != ((missing, None),)
+
+
+def make_agent():
+    agent = SimpleNamespace(
+        config=SimpleNamespace(profile="", chat_model=SimpleNamespace(vision=False)),
+        context=SimpleNamespace(get_data=lambda key: None),
+    )
+    agent.read_prompt = lambda file, **kwargs: Agent.read_prompt(agent, file, **kwargs)  # type: ignore
+    return agent
+
+
+async def build_system_prompt(agent) -> list[str]:
+    system_prompt: list[str] = []
+    for extension in (_10_system_prompt.SystemPrompt, _20_behaviour_prompt.BehaviourPrompt):
+        await extension(agent).execute(system_prompt=system_prompt)  # type: ignore
+    return system_prompt
+
+
+@pytest.fixture
+def section_cache(monkeypatch):
+    cache = prompt_sections.SectionCache()
+    monkeypatch.setattr(prompt_sections, "_cache", cache)
+    monkeypatch.setattr(
+        _20_behaviour_prompt, "get_custom_rules_file", lambda agent: "/nonexistent/behaviour.md"
+    )
+    return cache
+
+
+def test_system_prompt_sections_rendered_on_change(section_cache, monkeypatch):
+    agent = make_agent()
+    first = asyncio.run(build_system_prompt(agent))
+    assert first[0] == _20_behaviour_prompt.read_rules(agent)  # type: ignore
+    assert first[1] == _10_system_prompt.get_main_prompt(agent)  # type: ignore
+    assert first[2] == _10_system_prompt.get_tools_prompt(agent)  # type: ignore
+
+    assert asyncio.run(build_system_prompt(agent)) == first
+    stats = section_cache.get_stats()["sections"]
+    assert all(s["hits"] == 1 and s["misses"] == 1 for s in stats.values())
+
+    # new mcp tools re-render only their section
+    renders = []
+    monkeypatch.setattr(_10_system_prompt, "get_mcp_tools_prompt", lambda agent: renders.append(1) or "")
+    monkeypatch.setattr(mcp_handler, "_tools_version", mcp_handler._tools_version + 1)
+    asyncio.run(build_system_prompt(agent))
+    stats = section_cache.get_stats()["sections"]
+    assert renders == [1]
+    assert stats["mcp_tools"]["misses"] == 2
+    assert stats["main"]["misses"] == 1 and stats["tools"]["hits"] == 2
+
+    # vision changes the tools prompt
+    agent.config.chat_model.vision = True
+    vision = asyncio.run(build_system_prompt(agent))
+    assert vision[2] == _10_system_prompt.get_tools_prompt(agent)  # type: ignore
+    assert section_cache.get_stats()["sections"]["tools"]["misses"] == 2
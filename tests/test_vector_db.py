@@ -0,0 +1,129 @@
+"""
+Unit tests for python/helpers/vector_db.py
+
+- VectorDB embeddings: one bounded cache and one model instance per embedding model
+- shared document indexes: keyed by content, reused while held or recently used
+- search_by_vector / search_by_vectors: relevance scores, threshold, batched queries, metadata filters
+"""
+
+import sys
+import os
+import gc
+from types import SimpleNamespace
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from langchain_core.documents import Document
+
+from python.helpers import vector_db
+from python.helpers.vector_db import VectorDB
+from tests.test_memory import KeywordEmbeddings
+
+
+class FakeAgent:
+    def __init__(self, name: str = "keywords"):
+        self.config = SimpleNamespace(embeddings_model=SimpleNamespace(provider="test", name=name))
+        self.models_created = 0
+
+    def get_embedding_model(self):
+        self.models_created += 1
+        return KeywordEmbeddings()
+
+
+@pytest.fixture(autouse=True)
+def isolated(monkeypatch):
+    monkeypatch.setattr(VectorDB, "_cached_embeddings", {})
+    monkeypatch.setattr(VectorDB, "_dimensions", {})
+    monkeypatch.setattr(VectorDB, "_recent", vector_db.OrderedDict())
+    monkeypatch.setattr(vector_db, "EMBEDDING_SPILL_MAX_BYTES", 0)
+    monkeypatch.setattr(vector_db.metrics, "register", lambda name, collector: None)
+
+
+def test_embeddings_created_once_per_model():
+    agent = FakeAgent()
+    first, second = VectorDB(agent), VectorDB(agent)
+    assert agent.models_created == 1
+    assert first.embeddings is second.embeddings
+    assert first.index.d == second.index.d == len(KeywordEmbeddings().embed_query("x"))
+
+    VectorDB(FakeAgent("other"))
+    assert len(VectorDB._cached_embeddings) == 2
+
+
+@pytest.mark.asyncio
+async def test_shared_index_reused_until_released(monkeypatch):
+    monkeypatch.setattr(vector_db, "SHARED_INDEXES", 1)
+    agent = FakeAgent()
+    key = VectorDB.document_key(agent, "file.txt", "python error")
+    assert key != VectorDB.document_key(agent, "file.txt", "docker error")
+    assert key != VectorDB.document_key(FakeAgent("other"), "file.txt", "python error")
+    assert VectorDB.get_shared(key) is None
+
+    db = VectorDB(agent)
+    await db.insert_documents([Document("python error")])
+    assert VectorDB.share(key, db) is db
+    # a concurrent build of the same document yields the first one
+    assert VectorDB.share(key, VectorDB(agent)) is db
+    assert VectorDB.get_shared(key) is db
+
+    # pushed out of the recent list and no longer held, the index is released
+    VectorDB.share("other", VectorDB(agent))
+    del db
+    gc.collect()
+    assert VectorDB.get_shared(key) is None
+    stats = VectorDB.get_shared_stats()
+    assert stats["hits"] >= 1 and stats["misses"] >= 2
+
+
+@pytest.mark.asyncio
+async def test_search_by_vector():
+    agent = FakeAgent()
+    db = VectorDB(agent)
+    await db.insert_documents(
+        [Document("python error in file"), Document("docker network"), Document("agent memory")]
+    )
+    embedding = db.embeddings.embed_query("python error")
+    results = db.search_by_vector(embedding, limit=3, threshold=0.6)
+    assert [doc.page_content for doc, _ in results] == ["python error in file"]
+    assert 0.6 <= results[0][1] <= 1
+
+
+@pytest.mark.asyncio
+async def test_search_by_vectors_matches_single_searches():
+    db = VectorDB(FakeAgent())
+    await db.insert_documents(
+        [
+            Document("python error in file"),
+            Document("docker network error"),
+            Document("agent memory test"),
+            Document("python test file"),
+        ]
+    )
+    queries = ["python error", "docker", "memory test"]
+    embeddings = await db.embed_queries(queries)
+    assert embeddings == [db.embeddings.embed_query(query) for query in queries]
+
+    results = db.search_by_vectors(embeddings, limit=2, threshold=0.55)
+    assert len(results) == 3
+    for embedding, found in zip(embeddings, results):
+        expected = db.search_by_vector(embedding, limit=2, threshold=0.55)
+        assert [(doc.page_content, score) for doc, score in found] == [
+            (doc.page_content, pytest.approx(score)) for doc, score in expected
+        ]
+    assert db.search_by_vectors([], limit=2, threshold=0) == []
+
+
+@pytest.mark.asyncio
+async def test_metadata_filter():
+    db = VectorDB(FakeAgent())
+    await db.insert_documents(
+        [Document("python error", metadata={"area": "main"}), Document("python test", metadata={"area": "fragments"})]
+    )
+    found = await db.search_by_metadata("area == 'main'")
+    assert [doc.page_content for doc in found] == ["python error"]
+    embedding = db.embeddings.embed_query("python")
+    assert [doc.page_content for doc, _ in db.search_by_vector(embedding, 2, 0, "area == 'fragments'")] == [
+        "python test"
+    ]